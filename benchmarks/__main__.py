@@ -0,0 +1,62 @@
+"""
+Run all offline benchmarks and compare the results with a baseline
+
+Usage:
+    python -m benchmarks [--repeat 5] [--json results.json] [--compare baseline.json] [--tolerance 1.25]
+
+The results are written to a JSON file by --json. With --compare the results are
+compared with a previous JSON file by names of benchmarks and the exit code
+is 1 if some benchmark is slower than `tolerance` times the baseline.
+The number of rows and pages are the defaults of every benchmark module.
+"""
+import argparse
+import json
+import sys
+from typing import List
+
+from benchmarks import bench_compile, bench_iterator, bench_parse, bench_write
+from benchmarks.common import add_arguments, print_results, Result, write_json
+
+MODULES = [bench_compile, bench_parse, bench_write, bench_iterator]
+
+
+def compare(results: List[Result], baseline_path: str, tolerance: float) -> List[str]:
+    """Report regressions in comparison to the baseline"""
+    with open(baseline_path) as f:
+        baseline = {x['name']: x for x in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        old = baseline.get(result['name'])
+        if old is None:
+            continue
+        ratio = result['time'] / old['time']
+        print("{:60} {:10.4f} {:10.4f} {:6.2f}x".format(result['name'], old['time'], result['time'], ratio))
+        if ratio > tolerance:
+            regressions.append("{}: {:.4f} {} -> {:.4f} {} ({:.2f}x)".format(
+                result['name'], old['time'], old['unit'], result['time'], result['unit'], ratio))
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    add_arguments(parser)
+    parser.add_argument('--compare', metavar='FILE', help="a JSON file with baseline results")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="the maximal allowed ratio of the time to the baseline (default 1.25)")
+    args = parser.parse_args()
+    results = []  # type: List[Result]
+    for module in MODULES:
+        results.extend(module.run(args))  # type: ignore[attr-defined]
+    if args.json != '-':
+        print_results(results)
+    if args.json:
+        write_json(results, args.json)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print("Regressions:\n    " + "\n    ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Micro-benchmark of compiling querysets to SOQL by SQLCompiler.as_sql
+
+Querysets of typical shapes are compiled with new values of parameters
+every time, without the compile cache and with it (a hit after the first
+compilation of every shape).
+
+Usage:
+    python -m benchmarks.bench_compile [--number 1000] [--repeat 5] [--json FILE]
+"""
+import argparse
+from typing import Any, Callable, List, Tuple
+
+from benchmarks.common import main, measure, Result, setup_django
+
+setup_django()
+
+from django.db import connections  # noqa pylint:disable=wrong-import-position
+from salesforce.backend import compile_cache  # noqa pylint:disable=wrong-import-position
+from salesforce.testrunner.example.models import (  # noqa pylint:disable=wrong-import-position
+    Contact, OpportunityContactRole)
+
+SF_ALIAS = 'salesforce'
+
+SHAPES = [
+    ('filter by pk', lambda i: Contact.objects.filter(pk='003A0000001{:07d}'.format(i))),
+    ('values_list + 2 filters', lambda i: Contact.objects.filter(last_name='x%d' % i, email__isnull=False)
+     .values_list('pk', 'first_name')),
+    ('related filter + order', lambda i: OpportunityContactRole.objects.filter(
+        contact__last_name='x%d' % i, opportunity__name__startswith='a').order_by('contact__first_name')[:10]),
+    ('select_related + IN', lambda i: OpportunityContactRole.objects.select_related('contact').filter(
+        role__in=['a%d' % i, 'b', 'c'])),
+]  # type: List[Tuple[str, Callable[[int], Any]]]
+
+
+def compile_all(querysets: List[Any]) -> None:
+    for qs in querysets:
+        qs.query.get_compiler(SF_ALIAS).as_sql()
+
+
+def set_cache_size(size: int) -> None:
+    connections[SF_ALIAS].settings_dict.setdefault('OPTIONS', {})['COMPILE_CACHE_SIZE'] = size
+    compile_cache.reset_compile_caches()
+
+
+def add_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--number', type=int, default=1000)
+
+
+def run(args: argparse.Namespace) -> List[Result]:
+    number = getattr(args, 'number', 1000)
+    ret = []
+    for name, make_qs in SHAPES:
+        querysets = [make_qs(i) for i in range(number)]  # only the compilation is measured
+        soql = []
+        for size in (0, compile_cache.DEFAULT_COMPILE_CACHE_SIZE):
+            set_cache_size(size)
+            ret.append(measure('as_sql {} ({})'.format(name, 'cached' if size else 'uncached'),
+                               lambda: compile_all(querysets),  # pylint:disable=cell-var-from-loop
+                               repeat=args.repeat, ops=number))
+            # a check that the SOQL is the same with and without the cache
+            soql.append(str(make_qs(number).query))
+        assert soql[0] == soql[1], soql
+    set_cache_size(compile_cache.DEFAULT_COMPILE_CACHE_SIZE)
+    return ret
+
+
+if __name__ == '__main__':
+    main(run, __doc__, add_args)
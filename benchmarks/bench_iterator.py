@@ -0,0 +1,89 @@
+"""
+End-to-end benchmark of QuerySet.iterator() over more pages of a query result
+
+Requests are played back from synthetic pages by the mock session of
+`tests.test_mock.mocksf` (SF_MOCK_MODE="playback"), therefore the whole path
+of the driver is measured without network: compilation, the request, JSON
+decode, parsing of rows and creating model instances or tuples.
+The pages are made from the recorded page of `bench_parse`.
+
+Usage:
+    python -m benchmarks.bench_iterator [--pages 5] [--rows 2000] [--repeat 5] [--json FILE]
+"""
+import argparse
+import json
+import unittest
+from typing import Any, List
+
+from benchmarks.common import main, measure, Result, setup_django
+
+setup_django()
+
+from django.db import connections  # noqa pylint:disable=wrong-import-position
+from salesforce.dbapi import driver  # noqa pylint:disable=wrong-import-position
+from salesforce.testrunner.example.models import Contact  # noqa pylint:disable=wrong-import-position
+from tests.test_mock.mocksf import MockJsonRequest, MockRequestsSession  # noqa pylint:disable=wrong-import-position
+from benchmarks.bench_parse import load_page  # noqa pylint:disable=wrong-import-position
+
+SF_ALIAS = 'salesforce'
+API_VERSION = '52.0'
+
+
+def make_pages(pages: int, rows: int) -> List[str]:
+    """Responses of a query with `pages` pages of `rows` rows"""
+    page = load_page(rows)
+    ret = []
+    for i in range(pages):
+        page.update(totalSize=pages * rows, done=i == pages - 1)
+        page.pop('nextRecordsUrl', None)
+        if i < pages - 1:
+            page['nextRecordsUrl'] = '/services/data/v{}/query/01gD0000002HU6KIAW-{}'.format(
+                API_VERSION, (i + 1) * rows)
+        ret.append(json.dumps(page))
+    return ret
+
+
+def playback(responses: List[str]) -> None:
+    """Replace the session of the connection by a playback of responses (without checking requests)"""
+    connection = connections[SF_ALIAS]
+    if not connection.connection:
+        connection.settings_dict['AUTH'] = 'salesforce.auth.MockAuth'  # offline, without credentials
+        connection.connect()
+    raw_connection = connection.connection
+    raw_connection._sf_session = MockRequestsSession(  # pylint:disable=protected-access
+        testcase=unittest.TestCase(),
+        expected=[MockJsonRequest('GET mock:///', resp=resp, check_request=False) for resp in responses])
+    raw_connection.sf_auth = raw_connection._sf_session.auth  # pylint:disable=protected-access
+    raw_connection._api_version = API_VERSION  # pylint:disable=protected-access
+    driver.time_statistics.expiration = 1E10  # no check of a broken connection
+
+
+def iterate(queryset: Any, responses: List[str]) -> int:
+    playback(responses)
+    return sum(1 for _ in queryset.iterator())
+
+
+def add_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=2000)
+
+
+def run(args: argparse.Namespace) -> List[Result]:
+    pages, rows = getattr(args, 'pages', 5), getattr(args, 'rows', 2000)
+    responses = make_pages(pages, rows)
+    querysets = [
+        ('models', Contact.objects.db_manager(SF_ALIAS).only('first_name', 'last_name', 'email')),
+        ('values_list', Contact.objects.db_manager(SF_ALIAS).values_list(
+            'pk', 'first_name', 'last_name', 'email', 'account__Name', 'account__Owner__Username')),
+    ]
+    ret = []
+    for name, queryset in querysets:
+        assert iterate(queryset, responses) == pages * rows
+        ret.append(measure('iterator {} pages of {} rows ({})'.format(pages, rows, name),
+                           lambda: iterate(queryset, responses),  # pylint:disable=cell-var-from-loop
+                           repeat=args.repeat))
+    return ret
+
+
+if __name__ == '__main__':
+    main(run, __doc__, add_args)
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of parsing query results by QQuery.parse_rest_response
+
+A recorded page of Contacts with nested Account and Owner relationships
+(including empty outer joins) is replicated to the size of a normal
+query page (2000 rows) and parsed to tuples, lists and dicts, with values
+converted by guessing (raw SOQL) or by known column types (compiled queries).
+
+Usage:
+    python -m benchmarks.bench_parse [--rows 2000] [--repeat 5] [--json FILE]
+"""
+import argparse
+import json
+import os
+from typing import Any, Dict, List
+
+from benchmarks.common import main, measure, Result, setup_django
+
+setup_django()  # the cache of query plans is configured by settings
+
+from salesforce.dbapi.subselect import QQuery  # noqa pylint:disable=wrong-import-position
+
+SOQL = ("SELECT Contact.Id, Contact.FirstName, Contact.LastName, Contact.Email, Contact.LastModifiedDate, "
+        "Contact.Account.Name, Contact.Account.Owner.Username FROM Contact")
+COLUMN_TYPES = ['AutoField', 'CharField', 'CharField', 'EmailField', 'DateTimeField', 'CharField', 'CharField']
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def load_page(rows: int) -> Dict[str, Any]:
+    """Read the recorded page and replicate the records to the required number of rows"""
+    with open(os.path.join(DATA_DIR, 'query_contact_page.json')) as f:
+        page = json.load(f)
+    records = page['records']
+    page['records'] = [records[i % len(records)] for i in range(rows)]
+    page['totalSize'] = rows
+    return page
+
+
+def add_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--rows', type=int, default=2000)
+
+
+def run(args: argparse.Namespace) -> List[Result]:
+    rows = getattr(args, 'rows', 2000)
+    records = load_page(rows)['records']
+    ret = []
+    for typed in (False, True):
+        for row_type in (tuple, list, dict):
+            qquery = QQuery(SOQL)
+            if typed:
+                qquery.set_column_types(COLUMN_TYPES)
+            # the first pass is also a check that the result is complete
+            assert len(list(qquery.parse_rest_response(records, len(records), row_type))) == rows
+            name = 'parse_rest_response {} rows to {} ({})'.format(
+                rows, row_type.__name__, 'typed' if typed else 'guess')
+            ret.append(measure(
+                name,
+                lambda: list(qquery.parse_rest_response(  # pylint:disable=cell-var-from-loop
+                    records, len(records), row_type)),  # pylint:disable=cell-var-from-loop
+                repeat=args.repeat))
+    return ret
+
+
+if __name__ == '__main__':
+    main(run, __doc__, add_args)
@@ -0,0 +1,63 @@
+"""
+Micro-benchmark of preparing records for writes by extract_insert_values and arg_to_json
+
+A batch of 200 objects (the size of one SObject Collections request) is converted
+to JSON-ready records like by bulk_create, and values of typical types
+(str, int, float, Decimal, bool, date, datetime, None) are converted by arg_to_json.
+
+Usage:
+    python -m benchmarks.bench_write [--rows 200] [--repeat 5] [--json FILE]
+"""
+import argparse
+import datetime
+import decimal
+from typing import Any, List
+
+from benchmarks.common import main, measure, Result, setup_django
+
+setup_django()
+
+from django.db.models.sql import InsertQuery  # noqa pylint:disable=wrong-import-position
+from salesforce.backend.utils import extract_insert_values  # noqa pylint:disable=wrong-import-position
+from salesforce.dbapi.driver import arg_to_json  # noqa pylint:disable=wrong-import-position
+from salesforce.testrunner.example.models import Contact  # noqa pylint:disable=wrong-import-position
+
+VALUES = ['some text', 12345, 3.14159, decimal.Decimal('1234.50'), True, datetime.date(2021, 3, 19),
+          datetime.datetime(2021, 3, 19, 12, 5, 33, tzinfo=datetime.timezone.utc), None]
+
+
+def make_insert_query(rows: int) -> InsertQuery:
+    objs = [Contact(last_name='Name %d' % i, first_name='First', email='x%d@example.com' % i,
+                    email_bounced_date=datetime.datetime(2021, 3, 19, 12, 5, i % 60, tzinfo=datetime.timezone.utc),
+                    account_id='001A0000001{:07d}'.format(i))
+            for i in range(rows)]
+    fields = [f for f in Contact._meta.concrete_fields if not f.primary_key]
+    query = InsertQuery(Contact)
+    query.insert_values(fields, objs)
+    return query
+
+
+def convert_values(values: List[Any]) -> None:
+    for value in values:
+        arg_to_json(value)
+
+
+def add_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--rows', type=int, default=200)
+
+
+def run(args: argparse.Namespace) -> List[Result]:
+    rows = getattr(args, 'rows', 200)
+    query = make_insert_query(rows)
+    assert len(extract_insert_values(query)) == rows
+    values = [VALUES[i % len(VALUES)] for i in range(rows * len(VALUES))]
+    return [
+        measure('extract_insert_values {} rows'.format(rows), lambda: extract_insert_values(query),
+                repeat=args.repeat, number=10),
+        measure('arg_to_json {} values of {} types'.format(len(values), len(VALUES)),
+                lambda: convert_values(values), repeat=args.repeat, number=10),
+    ]
+
+
+if __name__ == '__main__':
+    main(run, __doc__, add_args)
@@ -0,0 +1,69 @@
+"""
+Common parts of offline benchmarks: Django setup, measurement and machine-readable results
+
+Every benchmark module has a function `run(args) -> List[Result]` used by
+`python -m benchmarks` and a function `main()` for running it alone.
+A result is a dict {'name': ..., 'time': ..., 'unit': 'ms', ...} where "time"
+is the minimum of repeated measurements of one operation.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from typing import Any, Callable, Dict, List
+
+Result = Dict[str, Any]
+
+
+def setup_django() -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'salesforce.testrunner.settings')
+    import django  # pylint:disable=import-outside-toplevel
+    django.setup()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', metavar='FILE', help="write results also to a JSON file ('-' = stdout)")
+
+
+def measure(name: str, func: Callable[[], Any], repeat: int, number: int = 1, ops: int = 1, **info: Any
+            ) -> Result:
+    """Measure the minimal time of one operation in milliseconds, if one call of func does `ops` operations"""
+    times = timeit.repeat(func, repeat=repeat, number=number)
+    return dict(name=name, time=min(times) / number / ops * 1000, unit='ms', repeat=repeat, number=number,
+                ops=ops, **info)
+
+
+def print_results(results: List[Result]) -> None:
+    for result in results:
+        print("{:60} {:10.4f} {}".format(result['name'], result['time'], result['unit']))
+
+
+def write_json(results: List[Result], path: str) -> None:
+    data = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if path == '-':
+        json.dump(data, sys.stdout, indent=2)
+        print()
+    else:
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+def main(run: Callable[[argparse.Namespace], List[Result]], doc: str,
+         add_args: Callable[[argparse.ArgumentParser], None] = lambda parser: None) -> None:
+    """Command line interface of one benchmark module"""
+    parser = argparse.ArgumentParser(description=doc.strip().split('\n')[0])
+    add_arguments(parser)
+    add_args(parser)
+    args = parser.parse_args()
+    results = run(args)
+    if args.json != '-':
+        print_results(results)
+    if args.json:
+        write_json(results, args.json)
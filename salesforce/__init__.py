@@ -19,6 +19,8 @@ from salesforce.dbapi.exceptions import (  # NOQA pylint:disable=unused-import,u
     IntegrityError as IntegrityError, DatabaseError as DatabaseError, SalesforceError as SalesforceError,
 )
 
+from salesforce.batch import batch_writes  # NOQA pylint:disable=unused-import,wrong-import-position
+
 __version__ = "6.0"
 
 log = logging.getLogger(__name__)
@@ -0,0 +1,137 @@
+"""
+Cache of compiled SOQL by a structural fingerprint of the query (like a prepared statement)
+
+Querysets with the same shape and different values of parameters are compiled
+to the same SOQL template. The expensive part of `SQLCompiler.as_sql`
+(`pre_sql_setup`, the topology of joins and the translation of all select and
+order columns by `sf_fix_field`) is done only once for every shape. A hit
+compiles only the WHERE clause to get the new parameters and the result is used
+only if the compiled WHERE clause is the same as the cached one.
+
+The fingerprint consists of the model, the alias map, the select columns,
+the shape of the WHERE tree (lookup types, columns and types of values),
+ordering, limits and `sf_params`. Queries with annotations, extra, subqueries,
+expressions in filters or ordering and other uncommon features have no
+fingerprint and they are compiled normally.
+
+It is configured by ``OPTIONS['COMPILE_CACHE_SIZE']`` in settings_dict, the maximal
+number of cached query shapes for the database (default 256, 0 = disabled).
+"""
+import threading
+from typing import Any, Dict, Hashable, NamedTuple, Optional, Tuple
+
+from django.db.models.expressions import Col
+from django.db.models.lookups import Lookup
+
+from salesforce.backend.query_cache import LRUCache
+
+DEFAULT_COMPILE_CACHE_SIZE = 256
+
+# attributes of the compiler set by pre_sql_setup() that are used after as_sql() by querysets
+COMPILER_STATE = ('select', 'klass_info', 'annotation_col_map', 'col_count', 'has_extra_select')
+
+
+class CompiledQuery(NamedTuple):
+    sql: str
+    where_sql: str
+    state: Dict[str, Any]
+
+
+def query_fingerprint(compiler: Any, with_limits: bool, with_col_aliases: bool) -> Optional[Tuple[Hashable, ...]]:
+    """A hashable structure of a query that determines the compiled SOQL, None if it can not be cached"""
+    # pylint:disable=too-many-return-statements
+    query = compiler.query
+    if (query.annotations or query.extra or query.extra_tables or query.extra_order_by or query.combinator
+            or query.group_by is not None or query.distinct_fields or query.select_for_update
+            or query.external_aliases or getattr(query, 'explain_info', None)
+            or getattr(query, 'explain_query', None)):
+        return None
+    if not all(isinstance(x, str) for x in query.order_by):
+        return None
+    alias_map = []
+    for alias, join in query.alias_map.items():
+        if getattr(join, 'filtered_relation', None) is not None:
+            return None
+        alias_map.append((alias, join.table_name, getattr(join, 'parent_alias', None),
+                          getattr(join, 'join_cols', None), getattr(join, 'join_type', None),
+                          getattr(join, 'nullable', None), query.alias_refcount.get(alias)))
+    select = []
+    for col in query.select:
+        if not isinstance(col, Col):
+            return None
+        select.append((col.alias, col.target))
+    where = _where_shape(query.where)
+    if where is None:
+        return None
+    deferred_names, defer = query.deferred_loading
+    return (type(compiler), compiler.connection.alias, query.model, with_limits, with_col_aliases,
+            tuple(alias_map), tuple(select), query.default_cols, query.values_select,
+            _freeze(query.select_related), query.max_depth, (frozenset(deferred_names), defer),
+            where, query.order_by, query.default_ordering, query.standard_ordering,
+            query.low_mark, query.high_mark, query.distinct, query.subquery,
+            tuple(sorted(vars(compiler.sf_params).items())))
+
+
+def _where_shape(node: Any) -> Optional[Tuple[Hashable, ...]]:
+    if isinstance(node, Lookup):
+        lhs, rhs = node.lhs, node.rhs
+        if not isinstance(lhs, Col) or hasattr(rhs, 'resolve_expression'):
+            return None
+        if isinstance(rhs, (list, tuple, set, frozenset)):
+            if any(hasattr(x, 'resolve_expression') for x in rhs):
+                return None
+            rhs_shape = ('seq', len(rhs))  # type: Hashable
+        elif rhs is None or isinstance(rhs, bool):
+            rhs_shape = rhs  # e.g. "IS NULL" and "IS NOT NULL" are different
+        else:
+            rhs_shape = type(rhs)
+        return (type(node), lhs.alias, lhs.target, rhs_shape)
+    if type(node).__name__.endswith('WhereNode'):
+        children = []
+        for child in node.children:
+            shape = _where_shape(child)
+            if shape is None:
+                return None
+            children.append(shape)
+        return ('node', node.connector, node.negated, tuple(children))
+    return None  # e.g. NothingNode, ExtraWhere, SubqueryConstraint
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+_compile_caches = {}  # type: Dict[str, Optional[LRUCache]]
+_compile_caches_lock = threading.Lock()
+
+
+def get_compile_cache(alias: str, settings_dict: Dict[str, Any]) -> Optional[LRUCache]:
+    """Get the cache of compiled queries of the database alias or None if it is disabled"""
+    try:
+        return _compile_caches[alias]
+    except KeyError:
+        pass
+    size = settings_dict.get('OPTIONS', {}).get('COMPILE_CACHE_SIZE', DEFAULT_COMPILE_CACHE_SIZE)
+    with _compile_caches_lock:
+        if alias not in _compile_caches:
+            _compile_caches[alias] = LRUCache(max_entries=size) if size else None
+        return _compile_caches[alias]
+
+
+def reset_compile_caches() -> None:
+    """Forget all cached compiled queries and the configuration, e.g. after a change of settings"""
+    with _compile_caches_lock:
+        _compile_caches.clear()
+
+
+def compiler_state(compiler: Any) -> Dict[str, Any]:
+    state = {name: getattr(compiler, name) for name in COMPILER_STATE if hasattr(compiler, name)}
+    state['select'] = list(state['select'])
+    return state
+
+
+def set_compiler_state(compiler: Any, state: Dict[str, Any]) -> None:
+    for name, value in state.items():
+        setattr(compiler, name, list(value) if isinstance(value, list) else value)
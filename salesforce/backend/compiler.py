@@ -7,10 +7,12 @@
 """
 Generate queries using the SOQL dialect.  (like django.db.models.sql.compiler and  django.db.models.sql.where)
 """
+from itertools import islice
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 import re
+import time
 import warnings
-from django.core.exceptions import EmptyResultSet
+from django.core.exceptions import EmptyResultSet, FieldError
 from django.db import NotSupportedError
 from django.db.models.sql import compiler as sql_compiler, where as sql_where, datastructures
 from django.db.models.sql.constants import CURSOR, GET_ITERATOR_CHUNK_SIZE, MULTI, NO_RESULTS, SINGLE
@@ -19,6 +21,9 @@ from django.db.transaction import TransactionManagementError
 
 import salesforce.backend.models_lookups   # noqa pylint:disable=unused-import # required for activation of lookups
 from salesforce.backend import DJANGO_40_PLUS, DJANGO_42_PLUS, DJANGO_52_PLUS, DJANGO_60_PLUS
+from salesforce.backend.compile_cache import (
+    CompiledQuery, compiler_state, get_compile_cache, query_fingerprint, set_compiler_state,
+)
 from salesforce.backend.utils import FullResultSet
 from salesforce.dbapi import DatabaseError
 from salesforce.dbapi.exceptions import SalesforceWarning
@@ -47,6 +52,12 @@ class SfParams:  # like an immutable DataClass: clone when updating
         self.all_or_none = None  # type: Optional[bool]
         self.edge_updates = False
         self.minimal_aliases = False
+        self.parallel_workers = 0  # type: int
+        self.parallel_ordered = True
+        self.bulk_api = None  # type: Optional[bool]
+        self.bulk_query = False
+        self.concurrency = None  # type: Optional[int]
+        self.priority = None  # type: Optional[str]
 
 
 class SQLCompiler(sql_compiler.SQLCompiler):
@@ -59,6 +70,7 @@ class SQLCompiler(sql_compiler.SQLCompiler):
         super().__init__(*args, **kwargs)
         self.sf_params = SfParams()
         self.root_aliases = []  # type: List[str]
+        self.compiled_where = ('', [])  # type: Tuple[str, List[Any]]
 
     def set_sf_params(self, sf_params: SfParams) -> 'SQLCompiler':
         self.sf_params = sf_params
@@ -155,6 +167,17 @@ class SQLCompiler(sql_compiler.SQLCompiler):
         returned, to avoid any unnecessary database interaction.
         """
         result_type = result_type or NO_RESULTS
+        prefetched_rows = getattr(self.query, 'prefetched_rows', None)
+        if prefetched_rows is not None:
+            # rows of a page fetched by the asynchronous driver (SalesforceQuerySet.aiterator)
+            # The SQL has been compiled for the query, only the selected columns are set up for the page.
+            self.setup_query()
+            if result_type == MULTI:
+                return iter([prefetched_rows] if prefetched_rows else [])
+            assert result_type == SINGLE
+            return prefetched_rows[0] if prefetched_rows else None
+
+        t_0 = time.perf_counter()
         try:
             sql, params = self.as_sql()
             if not sql:
@@ -166,7 +189,8 @@ class SQLCompiler(sql_compiler.SQLCompiler):
                 return
 
         cursor = self.connection.cursor()
-        cursor.prepare_query(self.query)
+        cursor.prepare_query(self.query, column_types=self.get_column_types(),
+                             compile_time=time.perf_counter() - t_0)
         cursor.execute(sql, params)
 
         if not result_type or result_type == 'cursor':
@@ -189,8 +213,14 @@ class SQLCompiler(sql_compiler.SQLCompiler):
             return
 
         # The MULTI case.
-        result: Iterable[Any] = iter(lambda: cursor.fetchmany(chunk_size),
-                                     self.connection.features.empty_fetchmany_value)
+        if self.sf_params.parallel_workers and not self.sf_params.bulk_query:
+            rows = cursor.cursor.fetch_parallel(workers=self.sf_params.parallel_workers,
+                                                ordered=self.sf_params.parallel_ordered)
+            result: Iterable[Any] = iter(lambda: list(islice(rows, chunk_size)),
+                                         self.connection.features.empty_fetchmany_value)
+        else:
+            result = iter(lambda: cursor.fetchmany(chunk_size),
+                          self.connection.features.empty_fetchmany_value)
         if not chunked_fetch and not self.connection.features.can_use_chunked_reads:
             # If we are using non-chunked reads, we return the same data
             # structure as normally, but ensure it is all read into memory
@@ -199,8 +229,61 @@ class SQLCompiler(sql_compiler.SQLCompiler):
         return result
         # pylint:enable=no-else-return
 
+    def get_column_types(self) -> List[Optional[str]]:
+        """Internal types of fields of the selected columns, known after as_sql(), None if unknown
+
+        They are used by the driver to convert values without guessing the type.
+        """
+        out = []  # type: List[Optional[str]]
+        for col, _, _ in self.select or ():
+            try:
+                out.append(col.output_field.get_internal_type())
+            except (AttributeError, FieldError):
+                out.append(None)
+        return out
+
     def as_sql(self, with_limits=True, with_col_aliases=False
                ) -> Tuple[str, Tuple[Any, ...]]:  # pylint:disable=arguments-differ
+        """
+        Creates the SQL for this query. Returns the SQL string and list of
+        parameters.
+
+        The SQL of queries with the same structure is reused from the compile cache.
+        """
+        cache = get_compile_cache(self.connection.alias, self.connection.settings_dict)
+        key = query_fingerprint(self, with_limits, with_col_aliases) if cache is not None else None
+        if key is not None:
+            assert cache is not None
+            compiled = cache.get(key)
+            if compiled is not None:
+                ret = self.as_sql_from_cache(compiled)
+                if ret is not None:
+                    return ret
+        sql, params = self.as_sql_uncached(with_limits, with_col_aliases)
+        if key is not None and sql:
+            assert cache is not None
+            where, w_params = self.compiled_where
+            if len(w_params) == len(params):  # all parameters are in the WHERE clause
+                cache.set(key, CompiledQuery(sql, where, compiler_state(self)))
+        return sql, params
+
+    def as_sql_from_cache(self, compiled: CompiledQuery) -> Optional[Tuple[str, Tuple[Any, ...]]]:
+        """Get the SQL from the cache with parameters from the current WHERE clause or None if it is different"""
+        # queries with a fingerprint have no aggregates, therefore no HAVING
+        self.where, self.having = self.query.where, None
+        if DJANGO_42_PLUS:
+            self.qualify = None
+        try:
+            where, w_params = self.compile(self.where)
+        except FullResultSet:
+            where, w_params = "", []
+        if where != compiled.where_sql:
+            return None
+        set_compiler_state(self, compiled.state)
+        return compiled.sql, tuple(w_params)
+
+    def as_sql_uncached(self, with_limits=True, with_col_aliases=False
+                        ) -> Tuple[str, Tuple[Any, ...]]:
 
         # pylint:disable=too-many-locals,too-many-branches,too-many-statements
         """
@@ -231,6 +314,7 @@ class SQLCompiler(sql_compiler.SQLCompiler):
                 where, w_params = self.compile(self.where) if self.where is not None else ("", [])
             except FullResultSet:
                 where, w_params = "", []
+            self.compiled_where = (where, w_params)
             try:
                 having, h_params = self.compile(self.having) if self.having is not None else ("", [])
             except FullResultSet:
@@ -0,0 +1,176 @@
+"""
+Save new objects with references between them by Composite Graph requests (a unit of work)
+
+Example: an Account with its Contacts are inserted by one request
+
+    account = Account(name='Acme')
+    contacts = [Contact(account=account, last_name='Smith'), Contact(account=account, last_name='Jones')]
+    save_graph([account] + contacts)
+
+Every unsaved related object is referenced by "@{refN.id}" inside the same graph.
+Objects that are not related are packed together into graphs of up to 500 nodes
+and all graphs are sent by one request. A group of related objects bigger than
+500 nodes is split into more graphs that are sent by sequential requests and the
+later graphs use the saved ids.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import NotSupportedError, connections, models, router
+from django.db.models import Model
+
+from salesforce.backend.query_cache import invalidate_table
+from salesforce.backend.utils import extract_insert_values, fix_database_default
+from salesforce.router import is_sf_database
+
+MAX_GRAPH_NODES = 500
+
+
+def save_graph(objs: Iterable[Model], using: Optional[str] = None, max_nodes: int = MAX_GRAPH_NODES) -> None:
+    """Insert new objects of any models by Composite Graph requests and assign their primary keys
+
+    ForeignKey values that are unsaved objects from `objs` are resolved by references
+    between nodes of a graph. Every graph is an all-or-none transaction. An error of a graph
+    is reported by an exception after the objects of the successful graphs are assigned
+    their primary key.
+    """
+    objs = list(objs)
+    if not objs:
+        return
+    if using is None:
+        using = router.db_for_write(type(objs[0]), instance=objs[0])
+    if not is_sf_database(using):
+        raise NotSupportedError("save_graph() is supported only on Salesforce databases")
+    parents = _get_parents(objs)
+    order = _sorted_nodes(parents)
+    graphs = _split_graphs(order, parents, max_nodes)
+
+    db_wrapper = connections[using]
+    db_wrapper.ensure_connection()
+    connection = db_wrapper.connection
+    # graphs of one request can not refer to each other
+    batches = []  # type: List[List[List[int]]]
+    batch_of_node = {}  # type: Dict[int, int]
+    for graph in graphs:
+        if not batches or any(batch_of_node.get(j) == len(batches) - 1 for i in graph for _, j in parents[i]):
+            batches.append([])
+        batches[-1].append(graph)
+        batch_of_node.update((i, len(batches) - 1) for i in graph)
+
+    for request_graphs in batches:
+        graphs_data = [[_node_data(objs, i, parents[i], connection) for i in graph] for graph in request_graphs]
+        try:
+            graph_responses = connection.composite_graph_request(graphs_data)
+        finally:
+            for table in {objs[i]._meta.db_table for graph in request_graphs for i in graph}:
+                invalidate_table(using, db_wrapper.settings_dict, table)
+        failed = None  # type: Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]
+        for data, graph_response in zip(graphs_data, graph_responses):
+            comp_resp = graph_response['graphResponse']['compositeResponse']
+            if not graph_response['isSuccessful']:
+                failed = failed or (comp_resp, data)
+                continue
+            for x in comp_resp:
+                obj = objs[int(x['referenceId'][len('ref'):])]
+                obj.pk = x['body']['id']
+                obj._state.adding = False  # pylint:disable=protected-access
+                obj._state.db = using  # pylint:disable=protected-access
+        for i, obj_parents in enumerate(parents):
+            for field, j in obj_parents:
+                if objs[j].pk is not None:
+                    setattr(objs[i], field.attname, objs[j].pk)
+        if failed:
+            comp_resp, data = failed
+            data_by_ref = {x['referenceId']: x for x in data}
+            connection.raise_composite_errors(comp_resp, [data_by_ref[x['referenceId']] for x in comp_resp])
+
+
+def _get_parents(objs: List[Model]) -> List[List[Tuple[models.ForeignKey, int]]]:
+    """Find ForeignKey fields of objects that refer to other unsaved objects from the list"""
+    indexes = {id(obj): i for i, obj in enumerate(objs)}
+    if len(indexes) < len(objs):
+        raise ValueError("save_graph() got the same object more times.")
+    parents = []  # type: List[List[Tuple[models.ForeignKey, int]]]
+    for obj in objs:
+        if obj.pk is not None:
+            raise ValueError("save_graph() can insert only new objects without a primary key, not %r." % obj)
+        obj_parents = []
+        for field in obj._meta.concrete_fields:
+            if not (field.is_relation and field.many_to_one and field.is_cached(obj)):
+                continue
+            parent = field.get_cached_value(obj)
+            if parent is None:
+                continue
+            if parent.pk is None:
+                if id(parent) not in indexes:
+                    raise ValueError(
+                        "save_graph() prohibited to prevent data loss due to unsaved related object '%s' "
+                        "that is not in the saved objects." % field.name)
+                obj_parents.append((field, indexes[id(parent)]))
+            elif getattr(obj, field.attname) in field.empty_values:
+                setattr(obj, field.attname, parent.pk)
+        parents.append(obj_parents)
+    return parents
+
+
+def _sorted_nodes(parents: List[List[Tuple[models.ForeignKey, int]]]) -> List[int]:
+    """Indexes of objects sorted that every parent is before its children (stable topological sort)"""
+    order = []  # type: List[int]
+    state = {}  # type: Dict[int, bool]  # False: in progress, True: done
+
+    def visit(i: int) -> None:
+        if state.get(i) is False:
+            raise ValueError("save_graph() can not save objects with a cycle of references.")
+        if i in state:
+            return
+        state[i] = False
+        for _, j in parents[i]:
+            visit(j)
+        state[i] = True
+        order.append(i)
+
+    for i in range(len(parents)):
+        visit(i)
+    return order
+
+
+def _split_graphs(order: List[int], parents: List[List[Tuple[models.ForeignKey, int]]], max_nodes: int
+                  ) -> List[List[int]]:
+    """Split sorted nodes to graphs of max_nodes, with related objects in the same graph if possible"""
+    # find components of related objects
+    root = list(range(len(parents)))
+
+    def find(i: int) -> int:
+        while root[i] != i:
+            root[i] = root[root[i]]
+            i = root[i]
+        return i
+
+    for i, obj_parents in enumerate(parents):
+        for _, j in obj_parents:
+            root[find(i)] = find(j)
+    components = {}  # type: Dict[int, List[int]]
+    for i in order:
+        components.setdefault(find(i), []).append(i)
+
+    graphs = []  # type: List[List[int]]
+    for nodes in components.values():
+        if graphs and len(graphs[-1]) + len(nodes) <= max_nodes:
+            graphs[-1].extend(nodes)
+        else:
+            graphs.extend(nodes[k:k + max_nodes] for k in range(0, len(nodes), max_nodes))
+    return graphs
+
+
+def _node_data(objs: List[Model], i: int, obj_parents: List[Tuple[models.ForeignKey, int]], connection: Any
+               ) -> Dict[str, Any]:
+    """Subrequest of a graph that inserts one object"""
+    obj = objs[i]
+    query = models.sql.InsertQuery(type(obj))
+    query.insert_values(obj._meta.concrete_fields, [obj])
+    record = extract_insert_values(query)[0]
+    fix_database_default(record)
+    for field, j in obj_parents:
+        # the parent is in the same graph or it has been saved by a previous request
+        record[field.column] = objs[j].pk or '@{ref%d.id}' % j
+    return {'method': 'POST', 'url': connection.rest_api_url('sobjects', obj._meta.db_table, relative=True),
+            'referenceId': 'ref%d' % i, 'body': record}
@@ -12,7 +12,8 @@ import json
 import logging
 import re
 from collections import OrderedDict, namedtuple
-from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 from django.conf import settings
 from django.db.backends.base.introspection import (
@@ -22,6 +23,7 @@ from django.utils.text import camel_case_to_spaces
 from django.db.backends.utils import CursorWrapper as _Cursor  # for typing
 
 from salesforce.backend import DJANGO_50_PLUS
+from salesforce.dbapi.describe_cache import cached_describe
 import salesforce.fields
 
 log = logging.getLogger(__name__)
@@ -60,6 +62,8 @@ PROBLEMATIC_OBJECTS = [
 # this global variable is for `salesforce.management.commands.inspectdb`
 last_introspection = None
 
+DEFAULT_DESCRIBE_JOBS = 8  # the default number of concurrent describe requests by inspectdb
+
 
 class LastIntrospection:
     def __init__(self, model_name: str, important_related_names: List[str],
@@ -147,9 +151,7 @@ class DatabaseIntrospection(BaseDatabaseIntrospection):
             log.debug('Request API URL: GET sobjects')
             if not self.connection.connection:
                 self.connection.connect()
-            response = self.connection.connection.handle_api_exceptions('GET', self.sobjects_prefix + '/')
-            # charset is detected from headers by requests package
-            self._table_list_cache = response.json(object_pairs_hook=OrderedDict)
+            self._table_list_cache = cached_describe(self.connection.connection, tooling_api=self.is_tooling_api)
             self._table_list_cache['sobjects'] = [
                 x for x in self._table_list_cache['sobjects']
                 if x['name'] not in PROBLEMATIC_OBJECTS and not x['name'].endswith('ChangeEvent')
@@ -162,19 +164,47 @@ class DatabaseIntrospection(BaseDatabaseIntrospection):
             if table == 'django_migrations':
                 raise ValueError("The internal table 'django_migrations' is not a normal Model.")
             log.debug('Request API URL: GET sobjects/%s/describe', table)
-            response = self.connection.connection.handle_api_exceptions('GET', self.sobjects_prefix, table, 'describe/'
-                                                                        )
-            self._table_description_cache[table] = response.json(object_pairs_hook=OrderedDict)
-            field_list = self._table_description_cache[table]['fields']
-            # 'Id' field is sometimes not the first field in tooling metadata SObjects
-            id_fields = [x for x in field_list if x['name'] == 'Id']
-            assert len(id_fields) == 1, "Table {!r} must contain one field named 'Id'".format(table)
-            id_field, = id_fields
-            assert id_field['type'] == 'id', (
-                "Invalid type of the field 'Id' in table '{}'".format(table))
-            del field_list[field_list.index(id_field)]
+            self._set_table_description(table, cached_describe(self.connection.connection, table,
+                                                               tooling_api=self.is_tooling_api))
         return self._table_description_cache[table]
 
+    def prefetch_table_descriptions(self, tables: Iterable[str], jobs: int = DEFAULT_DESCRIBE_JOBS,
+                                    progress: Optional[Callable[[int, int, str], None]] = None) -> None:
+        """Fill the cache of table descriptions by concurrent describe requests
+
+        tables:   names of tables; tables that are already cached are skipped
+        jobs:     the maximal number of requests in progress
+        progress: an optional function called by `progress(count_done, count_total, table_name)`
+        """
+        tables = [x for x in tables if x not in self._table_description_cache]
+        if not self.connection.connection:
+            self.connection.connect()
+        connection = self.connection.connection
+        executor = ThreadPoolExecutor(max_workers=max(jobs, 1), thread_name_prefix='salesforce-describe')
+        futures = {executor.submit(cached_describe, connection, table, tooling_api=self.is_tooling_api): table
+                   for table in tables}
+        try:
+            for count_done, future in enumerate(as_completed(futures), 1):
+                table = futures[future]
+                self._set_table_description(table, future.result())
+                if progress:
+                    progress(count_done, len(tables), table)
+        finally:
+            for future in futures:
+                future.cancel()  # requests not started after an error
+            executor.shutdown(wait=True)
+
+    def _set_table_description(self, table: str, description: Dict[str, Any]) -> None:
+        field_list = description['fields']
+        # 'Id' field is sometimes not the first field in tooling metadata SObjects
+        id_fields = [x for x in field_list if x['name'] == 'Id']
+        assert len(id_fields) == 1, "Table {!r} must contain one field named 'Id'".format(table)
+        id_field, = id_fields
+        assert id_field['type'] == 'id', (
+            "Invalid type of the field 'Id' in table '{}'".format(table))
+        del field_list[field_list.index(id_field)]
+        self._table_description_cache[table] = description
+
     # -- standard methods
 
     def identifier_converter(self, name: str) -> str:
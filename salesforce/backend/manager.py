@@ -12,7 +12,7 @@ Use a custom QuerySet to generate SOQL queries and results.
 This module requires a customized package django-stubs (django-salesforce-stubs)
 """
 
-from typing import Generic, Optional, TypeVar
+from typing import Generic, Iterator, Optional, TypeVar
 from django.db.models import manager, Model
 from django.db.models.query import QuerySet  # pylint:disable=unused-import
 
@@ -54,7 +54,14 @@ class SalesforceManager(manager.Manager, Generic[_T]):
            query_all: Optional[bool] = None,
            all_or_none: Optional[bool] = None,
            edge_updates: Optional[bool] = None,
-           minimal_aliases: Optional[bool] = None) -> 'query.SalesforceQuerySet[_T]':
+           minimal_aliases: Optional[bool] = None,
+           parallel_workers: Optional[int] = None,
+           parallel_ordered: Optional[bool] = None,
+           bulk_api: Optional[bool] = None,
+           bulk_query: Optional[bool] = None,
+           concurrency: Optional[int] = None,
+           priority: Optional[str] = None,
+           ) -> 'query.SalesforceQuerySet[_T]':
         # not dry, but explicit due to preferring type check of user code
         qs = self.get_queryset()
         assert isinstance(qs, query.SalesforceQuerySet)
@@ -63,4 +70,16 @@ class SalesforceManager(manager.Manager, Generic[_T]):
             all_or_none=all_or_none,
             edge_updates=edge_updates,
             minimal_aliases=minimal_aliases,
+            parallel_workers=parallel_workers,
+            parallel_ordered=parallel_ordered,
+            bulk_api=bulk_api,
+            bulk_query=bulk_query,
+            concurrency=concurrency,
+            priority=priority,
         )
+
+    def sf_parallel_iterator(self, workers: int = 4, ordered: bool = True, chunk_size: Optional[int] = None
+                             ) -> Iterator[_T]:
+        qs = self.get_queryset()
+        assert isinstance(qs, query.SalesforceQuerySet)
+        return qs.sf_parallel_iterator(workers=workers, ordered=ordered, chunk_size=chunk_size)
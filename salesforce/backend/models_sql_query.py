@@ -2,7 +2,7 @@
 Customized Query, RawQuery  (like django.db.models.sql.query)
 """
 import copy
-from typing import Any, cast, Generic, Optional, Sequence, Tuple, Type, TypeVar
+from typing import Any, cast, Generic, List, Optional, Sequence, Tuple, Type, TypeVar
 from django.conf import settings
 from django.db.models import Count, Model
 from django.db.models.sql import Query, RawQuery, constants
@@ -51,6 +51,8 @@ class SalesforceQuery(Query, Generic[_T]):
         super().__init__(model, *args, **kwargs)
         self.max_depth = 1
         self.sf_params = SfParams()  # paramaters for Salesforce query instead of transaction control
+        # rows fetched by the asynchronous driver that are used instead of a request by the compiler
+        self.prefetched_rows = None  # type: Optional[List[Any]]
 
     def __str__(self) -> str:
         """Return the query as merged SOQL for Salesforce"""
@@ -86,7 +88,13 @@ class SalesforceQuery(Query, Generic[_T]):
            query_all: Optional[bool] = None,
            all_or_none: Optional[bool] = None,
            edge_updates: Optional[bool] = None,
-           minimal_aliases: Optional[bool] = None
+           minimal_aliases: Optional[bool] = None,
+           parallel_workers: Optional[int] = None,
+           parallel_ordered: Optional[bool] = None,
+           bulk_api: Optional[bool] = None,
+           bulk_query: Optional[bool] = None,
+           concurrency: Optional[int] = None,
+           priority: Optional[str] = None,
            ) -> 'SalesforceQuery[_T]':
         """
         Set additional parameters for a queryset
@@ -110,6 +118,34 @@ class SalesforceQuery(Query, Generic[_T]):
 
             `minimal_aliases`: Fields are compiled to a simple "field_name" if pssible without a dot,
                 not to a "table_alias.field_name".
+
+            `parallel_workers`: The number of threads that fetch pages of a big query result
+                concurrently. (see `Cursor.fetch_parallel()`) The default 0 is a normal sequential fetch.
+
+            `parallel_ordered`: False if rows fetched by parallel workers can be in any order
+                as the pages arrive. The default is True.
+
+            `bulk_api`: True: Methods `bulk_create`, `bulk_update`, `update` and `delete` write
+                records by Bulk API 2.0 ingest jobs instead of SObject Collections requests
+                of 200 records. (see `salesforce.dbapi.bulk2`) It is not possible with `all_or_none=True`.
+                False: Bulk API is not used. Default: It is used if the number of records is at least
+                OPTIONS['BULK_API_THRESHOLD'] of the database and if `all_or_none` is not True.
+
+            `bulk_query`: True: The query is executed by a Bulk API 2.0 query job and the result
+                is read by big pages of CSV. It is useful for huge extracts by `.iterator()`,
+                but the job can take some seconds also for a small result.
+                Aggregations, count() and child subqueries are executed normally.
+                The default is False.
+
+            `concurrency`: The maximal number of SObject Collections requests with chunks of 200
+                records that are sent concurrently by `update()` and `bulk_update()`. Chunks are
+                sent sequentially if `all_or_none` is True. The default is OPTIONS['BULK_CONCURRENCY']
+                of the database or 1.
+
+            `priority`: The priority of API requests for the API governor, 'interactive' or 'batch'.
+                Requests of 'batch' are delayed or refused earlier if the daily limit of API requests
+                is nearly used. (see `salesforce.dbapi.governor`) The default is the priority of
+                the current context, usually 'interactive'.
         """
         clone = self.clone()
         clone.sf_params = copy.copy(self.sf_params)
@@ -121,6 +157,18 @@ class SalesforceQuery(Query, Generic[_T]):
             clone.sf_params.edge_updates = edge_updates
         if minimal_aliases is not None:
             clone.sf_params.minimal_aliases = minimal_aliases
+        if parallel_workers is not None:
+            clone.sf_params.parallel_workers = parallel_workers
+        if parallel_ordered is not None:
+            clone.sf_params.parallel_ordered = parallel_ordered
+        if bulk_api is not None:
+            clone.sf_params.bulk_api = bulk_api
+        if bulk_query is not None:
+            clone.sf_params.bulk_query = bulk_query
+        if concurrency is not None:
+            clone.sf_params.concurrency = concurrency
+        if priority is not None:
+            clone.sf_params.priority = priority
         return clone
 
     def has_results(self, using: Optional[str]) -> bool:
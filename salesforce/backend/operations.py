@@ -61,6 +61,8 @@ class DatabaseOperations(BaseDatabaseOperations):  # pylint:disable=too-many-pub
         # because it is useful only for Oracle and this form of splitting would
         # cause only problems in Salesforce and no benefit:
         #     WHERE (Id IN ('z0001',... 'z1000') OR ... (Id IN 'z5001',... 'z6000'))
+        # Queries longer than OPTIONS['MAX_SOQL_LENGTH'] are split to more queries
+        # by the cursor instead, see `salesforce.dbapi.subselect.split_in_list()`.
         return None
 
     def max_name_length(self) -> Optional[int]:
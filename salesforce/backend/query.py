@@ -7,10 +7,15 @@
 """
 Salesforce object query and queryset customizations.  (like django.db.models.query)
 """
-from typing import Dict, Generic, Iterable, List, NoReturn, Optional, TYPE_CHECKING, Type, TypeVar
+from typing import (
+    Any, AsyncIterator, Dict, Generic, Iterable, Iterator, List, NoReturn, Optional, TYPE_CHECKING, Type, TypeVar,
+)
+import re
+import time
 import typing  # pylint:disable=unused-import
 
 from django.conf import settings
+from django.core.exceptions import EmptyResultSet
 from django.db import NotSupportedError, models, DEFAULT_DB_ALIAS
 from django.db.models import constants
 from django.db.models import query as models_query, Model
@@ -20,7 +25,11 @@ import django
 from salesforce.backend.indep import get_sf_alt_pk
 from salesforce.backend import compiler, DJANGO_40_PLUS, DJANGO_41_PLUS
 from salesforce.backend.models_sql_query import SalesforceQuery
+from salesforce.backend.query_cache import invalidate_table
 from salesforce.backend.operations import BULK_BATCH_SIZE
+from salesforce.dbapi import aio, bulk2
+from salesforce.dbapi.driver import merge_dict
+from salesforce.dbapi.governor import api_priority
 from salesforce.router import is_sf_database
 import salesforce.backend.utils
 
@@ -88,27 +97,62 @@ class SalesforceQuerySet(models_query.QuerySet, Generic[_T]):
                     unique_fields: Optional[List[str]] = None,
                     ) -> List[_T]:
         assert not update_conflicts and update_fields is None and unique_fields is None
+        with api_priority(self.query.sf_params.priority):
+            return self._bulk_create(objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+
+    def _bulk_create(self, objs: Iterable[_T], batch_size: Optional[int] = None, ignore_conflicts: bool = False
+                     ) -> List[_T]:
         if getattr(self.model, '_salesforce_object', '') == 'extended' and not is_sf_database(self.db):
             objs = list(objs)
             for x in objs:
                 if x.pk is None:
                     x.pk = get_sf_alt_pk()
+        elif is_sf_database(self.db) and not ignore_conflicts:
+            objs = list(objs)
+            if objs and self._use_bulk_api(len(objs)):
+                return self._bulk_api_create(objs)
         return super().bulk_create(objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
 
     def bulk_update(self, objs: Iterable[Model], fields: 'typing.Collection[str]',  # pylint:disable=arguments-differ
-                    batch_size: Optional[int] = None, all_or_none: bool = None):
+                    batch_size: Optional[int] = None, all_or_none: bool = None, concurrency: Optional[int] = None):
+        """Update objects by SObject Collections requests by chunks of `batch_size` (max 200) records
+
+        Up to `concurrency` chunks are sent concurrently (default by `.sf(concurrency=...)` or
+        by OPTIONS['BULK_CONCURRENCY']), but sequentially if `all_or_none` is True.
+        Errors of all chunks are reported by one SalesforceError.
+        """
         self.sf(all_or_none=all_or_none)
         if batch_size is not None and batch_size < 0:
             raise ValueError('Batch size must be a positive integer.')
-        batch_size = min(batch_size, BULK_BATCH_SIZE) if batch_size else BULK_BATCH_SIZE
-        for chunk in salesforce.backend.utils.chunked(objs, batch_size):
-            bulk_update_small(chunk, fields, all_or_none=all_or_none)
+        objs = list(objs)
+        if not objs:
+            return
+        with api_priority(self.query.sf_params.priority):
+            if is_sf_database(self.db) and self._use_bulk_api(len(objs), all_or_none=all_or_none):
+                bulk_api_update(objs, fields)
+                return
+            batch_size = min(batch_size, BULK_BATCH_SIZE) if batch_size else BULK_BATCH_SIZE
+            records, db = update_records(objs, fields)
+            db_wrapper = django.db.connections[db]
+            db_wrapper.ensure_connection()
+            try:
+                db_wrapper.connection.sobject_collections_chunks(
+                    'PATCH', records, all_or_none=all_or_none, chunk_size=batch_size,
+                    concurrency=concurrency or self.query.sf_params.concurrency)
+            finally:
+                invalidate_records(db, records)
 
     def sf(self,
            query_all: Optional[bool] = None,
            all_or_none: Optional[bool] = None,
            edge_updates: Optional[bool] = None,
            minimal_aliases: Optional[bool] = None,
+           parallel_workers: Optional[int] = None,
+           parallel_ordered: Optional[bool] = None,
+           bulk_api: Optional[bool] = None,
+           bulk_query: Optional[bool] = None,
+           concurrency: Optional[int] = None,
+           priority: Optional[str] = None,
            ) -> 'SalesforceQuerySet[_T]':
         """Set additional parameters for queryset methods with Salesforce.
 
@@ -127,9 +171,188 @@ class SalesforceQuerySet(models_query.QuerySet, Generic[_T]):
             all_or_none=all_or_none,
             edge_updates=edge_updates,
             minimal_aliases=minimal_aliases,
+            parallel_workers=parallel_workers,
+            parallel_ordered=parallel_ordered,
+            bulk_api=bulk_api,
+            bulk_query=bulk_query,
+            concurrency=concurrency,
+            priority=priority,
         )
         return clone
 
+    def sf_parallel_iterator(self, workers: int = 4, ordered: bool = True, chunk_size: Optional[int] = None
+                             ) -> Iterator[_T]:
+        """Iterate over a big queryset with pages of results fetched by concurrent requests.
+
+        It is useful for big full-table pulls. The rows are in the original order
+        if `ordered` is true, otherwise in the order as the pages arrive.
+        A normal `.iterator()` is used on non-salesforce databases.
+
+        Example:
+        >>> for contact in Contact.objects.sf_parallel_iterator(workers=4, ordered=False):
+        ...     process(contact)
+        """
+        qs = self.sf(parallel_workers=workers, parallel_ordered=ordered)
+        return qs.iterator() if chunk_size is None else qs.iterator(chunk_size=chunk_size)
+
+    # -- writing by Bulk API 2.0
+
+    def _use_bulk_api(self, count: int, all_or_none: Optional[bool] = None) -> bool:
+        sf_params = self.query.sf_params
+        return bulk2.use_bulk_api(django.db.connections[self.db].settings_dict, count, bulk_api=sf_params.bulk_api,
+                                  all_or_none=all_or_none if all_or_none is not None else sf_params.all_or_none)
+
+    def _insert_records(self, objs: List[_T]) -> List[Dict[str, Any]]:
+        """Values of new objects for SObject Collections or Bulk API, without defaults of the database"""
+        query = models.sql.InsertQuery(self.model)
+        query.insert_values(self.model._meta.concrete_fields, objs)
+        records = salesforce.backend.utils.extract_insert_values(query)
+        for record in records:
+            salesforce.backend.utils.fix_database_default(record)
+        return records
+
+    def _bulk_api_create(self, objs: List[_T]) -> List[_T]:
+        """Create objects by a Bulk API 2.0 ingest job, report failed records by IntegrityError"""
+        if hasattr(self, '_prepare_for_bulk_create'):
+            self._prepare_for_bulk_create(objs)
+        self._for_write = True
+        db_wrapper = django.db.connections[self.db]
+        db_wrapper.ensure_connection()
+        try:
+            result = bulk2.ingest(db_wrapper.connection, 'insert', self.model._meta.db_table,
+                                  self._insert_records(objs))
+        finally:
+            invalidate_table(self.db, db_wrapper.settings_dict, self.model._meta.db_table)
+        for obj, pk in zip(objs, result.ids):
+            if pk:
+                obj.pk = pk
+                obj._state.adding = False  # pylint:disable=protected-access
+                obj._state.db = self.db  # pylint:disable=protected-access
+        result.raise_errors()
+        return objs
+
+    # -- asynchronous methods by the asynchronous driver salesforce.dbapi.aio
+
+    def _use_async_driver(self) -> bool:
+        """The asynchronous driver is used on Salesforce databases if "aiohttp" is installed"""
+        return aio.aiohttp is not None and is_sf_database(self.db)
+
+    def _async_connection(self) -> aio.AsyncConnection:
+        return aio.get_connection(self.db, settings_dict=django.db.connections[self.db].settings_dict)
+
+    async def _async_execute(self, qs: 'SalesforceQuerySet[_T]', count: bool = False
+                             ) -> Optional['aio.AsyncCursor[typing.Tuple[typing.Any, ...]]']:
+        """Execute the query of a queryset by the asynchronous driver, None if the result is empty"""
+        t_0 = time.perf_counter()
+        compiler = qs.query.get_compiler(using=qs.db)
+        try:
+            sql, params = compiler.as_sql()
+            if not sql:
+                raise EmptyResultSet
+        except EmptyResultSet:
+            return None
+        column_types = compiler.get_column_types()
+        if count:
+            sql = re.sub(r'^SELECT .*? FROM ', 'SELECT COUNT() FROM ', sql, count=1)
+            column_types = None
+        cursor = self._async_connection().cursor()
+        cursor.compile_time = time.perf_counter() - t_0
+        with api_priority(qs.query.sf_params.priority):
+            await cursor.execute(sql, params, query_all=qs.query.sf_params.query_all,
+                                 tooling_api=qs.model._meta.sf_tooling_api_model, column_types=column_types)
+        return cursor
+
+    async def aiterator(self, chunk_size: int = 2000) -> AsyncIterator[_T]:
+        """An asynchronous iterator over a queryset, with pages requested by the asynchronous driver"""
+        if not self._use_async_driver() or self._prefetch_related_lookups:
+            async for obj in super().aiterator(chunk_size=chunk_size):
+                yield obj
+            return
+        if chunk_size <= 0:
+            raise ValueError('Chunk size must be strictly positive.')
+        cursor = await self._async_execute(self)
+        if cursor is None:
+            return
+        try:
+            while True:
+                rows = await cursor.fetchpage()
+                if not rows:
+                    break
+                # the model instances are created from rows by the normal synchronous code
+                page_qs = self._chain()
+                page_qs.query.prefetched_rows = rows
+                for obj in self._iterable_class(page_qs, chunked_fetch=True, chunk_size=len(rows)):
+                    yield obj
+        finally:
+            await cursor.close()
+
+    async def acount(self) -> int:
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        query = self.query
+        if (not self._use_async_driver() or query.is_sliced or query.distinct or query.combinator
+                or query.annotations or query.group_by):
+            return await super().acount()
+        cursor = await self._async_execute(self.order_by().values_list('pk'), count=True)
+        if cursor is None:
+            return 0
+        count = cursor.rowcount
+        await cursor.close()
+        return count
+
+    async def aget(self, *args, **kwargs) -> _T:
+        if not self._use_async_driver() or self.query.combinator:
+            return await super().aget(*args, **kwargs)
+        clone = self.filter(*args, **kwargs)
+        if self.query.can_filter() and not self.query.distinct_fields:
+            clone = clone.order_by()
+        limit = models_query.MAX_GET_RESULTS
+        clone.query.set_limits(high=limit)
+        objs = [obj async for obj in clone.aiterator()]
+        num = len(objs)
+        if num == 1:
+            return objs[0]
+        if not num:
+            raise self.model.DoesNotExist("%s matching query does not exist." % self.model._meta.object_name)
+        raise self.model.MultipleObjectsReturned(
+            "get() returned more than one %s -- it returned %s!"
+            % (self.model._meta.object_name, num if num < limit else "more than %s" % (limit - 1)))
+
+    async def abulk_create(self, objs: Iterable[_T], batch_size: Optional[int] = None,
+                           ignore_conflicts: bool = False,
+                           update_conflicts: bool = False,
+                           update_fields: Optional[List[str]] = None,
+                           unique_fields: Optional[List[str]] = None,
+                           ) -> List[_T]:
+        """Create objects by SObject Collections requests of the asynchronous driver"""
+        assert not update_conflicts and update_fields is None and unique_fields is None
+        if (not self._use_async_driver() or ignore_conflicts
+                or getattr(self.model, '_salesforce_object', '') == 'extended'):
+            return await super().abulk_create(objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+        if batch_size is not None and batch_size <= 0:
+            raise ValueError('Batch size must be a positive integer.')
+        batch_size = min(batch_size, BULK_BATCH_SIZE) if batch_size else BULK_BATCH_SIZE
+        objs = list(objs)
+        if hasattr(self, '_prepare_for_bulk_create'):
+            self._prepare_for_bulk_create(objs)
+        self._for_write = True
+        connection = self._async_connection()
+        table = self.model._meta.db_table
+        try:
+            for chunk in salesforce.backend.utils.chunked(objs, batch_size):
+                records = [merge_dict(x, type_=table) for x in self._insert_records(chunk)]
+                with api_priority(self.query.sf_params.priority):
+                    ids = await connection.sobject_collections_request(
+                        'POST', records, all_or_none=self.query.sf_params.all_or_none)
+                for obj, pk in zip(chunk, ids):
+                    obj.pk = pk
+                    obj._state.adding = False  # pylint:disable=protected-access
+                    obj._state.db = self.db  # pylint:disable=protected-access
+        finally:
+            # cached results with the table are invalidated also after a partial failure
+            invalidate_table(self.db, connection.settings_dict, table)
+        return objs
+
     # def _chain(self, **kwargs) -> 'SalesforceQuerySet[_T]':
     #     return super()._chain(**kwargs)
 
@@ -164,11 +387,9 @@ class SalesforceQuerySet(models_query.QuerySet, Generic[_T]):
     _insert.queryset_only = False  # type: ignore[attr-defined]  # noqa
 
 
-def bulk_update_small(objs: 'typing.Collection[models.Model]', fields: Iterable[str], all_or_none: bool = None
-                      ) -> None:
-    # simple implementation without "batch_size" parameter, but with "all_or_none"
-    # and objects from mixed models can be updated by one request in the same transaction
-    assert len(objs) <= BULK_BATCH_SIZE
+def update_records(objs: 'typing.Collection[models.Model]', fields: Iterable[str]
+                   ) -> typing.Tuple[List[Dict[str, Any]], str]:
+    """Values of updated fields of objects and their database alias"""
     records = []
     dbs = set()
     for item in objs:
@@ -182,5 +403,42 @@ def bulk_update_small(objs: 'typing.Collection[models.Model]', fields: Iterable[
     db = dbs.pop()
     if dbs or not is_sf_database(db):
         raise ValueError("All updated objects must be from the same Salesforce database.")
+    return records, db
+
+
+def bulk_api_update(objs: 'typing.Collection[models.Model]', fields: Iterable[str]) -> None:
+    """Update objects by Bulk API 2.0 ingest jobs, one job for every model"""
+    records, db = update_records(objs, fields)
+    by_type = {}  # type: Dict[str, List[Dict[str, Any]]]
+    for record in records:
+        table = record.pop('type_')
+        record['Id'] = record.pop('id')
+        by_type.setdefault(table, []).append(record)
+    db_wrapper = django.db.connections[db]
+    db_wrapper.ensure_connection()
+    for table, table_records in by_type.items():
+        try:
+            result = bulk2.ingest(db_wrapper.connection, 'update', table, table_records)
+        finally:
+            invalidate_table(db, db_wrapper.settings_dict, table)
+        result.raise_errors()
+
+
+def bulk_update_small(objs: 'typing.Collection[models.Model]', fields: Iterable[str], all_or_none: bool = None
+                      ) -> None:
+    # simple implementation without "batch_size" parameter, but with "all_or_none"
+    # and objects from mixed models can be updated by one request in the same transaction
+    assert len(objs) <= BULK_BATCH_SIZE
+    records, db = update_records(objs, fields)
     connection = django.db.connections[db].connection
-    connection.sobject_collections_request('PATCH', records, all_or_none=all_or_none)
+    try:
+        connection.sobject_collections_request('PATCH', records, all_or_none=all_or_none)
+    finally:
+        invalidate_records(db, records)
+
+
+def invalidate_records(db: str, records: Iterable[Dict[str, Any]]) -> None:
+    """Invalidate cached query results of tables of written records"""
+    settings_dict = django.db.connections[db].settings_dict
+    for table in {x['type_'] for x in records}:
+        invalidate_table(db, settings_dict, table)
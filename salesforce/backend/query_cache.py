@@ -0,0 +1,184 @@
+"""
+Cache of results of queries to reference tables (e.g. RecordType, Pricebook2, User)
+
+It is enabled by ``OPTIONS['QUERY_CACHE']`` in settings_dict of a database:
+    TIMEOUTS:        {table_name: seconds}  Timeouts of tables that can be cached
+    DEFAULT_TIMEOUT: seconds for other tables (default 0 - not cached)
+    MAX_ENTRIES:     the maximal number of results in the memory LRU cache (default 1000)
+    BACKEND:         an alias of a Django cache that is used instead of the memory cache,
+                     e.g. to share the cache between processes (default None)
+
+Only results of querysets that have one page (up to 2000 rows) are cached, in the raw
+JSON format. A result is keyed on the final SOQL, the query_all and tooling flags and
+on versions of all queried tables. A write to a table by insert, update or delete changes
+the version of the table, that invalidates all cached results with the table.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.core.cache import caches
+
+DEFAULT_MAX_ENTRIES = 1000
+
+
+class LRUCache:
+    """Thread safe memory cache with a limited size and expiration of items
+
+    It implements the used subset of methods of Django cache backends.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.data = OrderedDict()  # type: OrderedDict[str, Tuple[Optional[float], Any]]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires is not None and expires < time.monotonic():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        ret = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                ret[key] = value
+        return ret
+
+    def set(self, key: str, value: Any, timeout: Optional[float] = None) -> None:
+        with self.lock:
+            self.data[key] = (None if timeout is None else time.monotonic() + timeout, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def add(self, key: str, value: Any, timeout: Optional[float] = None) -> bool:
+        with self.lock:
+            if key in self.data:
+                return False
+        self.set(key, value, timeout)
+        return True
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+
+
+class QueryCache:
+    """Cache of query results of one database alias with statistics"""
+
+    def __init__(self, alias: str, options: Dict[str, Any]) -> None:
+        self.alias = alias
+        self.timeouts = options.get('TIMEOUTS', {})  # type: Dict[str, float]
+        self.default_timeout = options.get('DEFAULT_TIMEOUT', 0)  # type: float
+        backend = options.get('BACKEND')
+        self.cache = caches[backend] if backend else LRUCache(options.get('MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+        self.prefix = 'salesforce.query_cache:{}:'.format(alias)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def query_tables(soql: str, query: Any = None) -> Set[str]:
+        """Names of tables in a query, from the Django query and from the SOQL (including subqueries)"""
+        tables = set(re.findall(r'\bFROM\s+(\w+)', soql, flags=re.I))
+        if query is not None:
+            tables.update(x.table_name for x in query.alias_map.values())
+        return tables
+
+    def get_timeout(self, tables: Iterable[str]) -> float:
+        """Timeout of results of a query with the tables, 0 if it should not be cached"""
+        return min((self.timeouts.get(table, self.default_timeout) for table in tables), default=0)
+
+    def make_key(self, processed_soql: str, query_all: bool, tooling_api: bool, tables: Iterable[str]) -> str:
+        versions = self._versions(sorted(tables))
+        data = json.dumps([processed_soql, bool(query_all), bool(tooling_api), versions])
+        return self.prefix + hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        page = self.cache.get(key)
+        with self.lock:
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return page
+
+    def set(self, key: str, page: Dict[str, Any], timeout: float) -> None:
+        self.cache.set(key, page, timeout)
+
+    def invalidate(self, table: str) -> None:
+        """Invalidate all cached results of queries with the table"""
+        self.cache.set(self._version_key(table), uuid.uuid4().hex, None)
+        with self.lock:
+            self.invalidations += 1
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations}
+
+    def _version_key(self, table: str) -> str:
+        return '{}version:{}'.format(self.prefix, table)
+
+    def _versions(self, tables: List[str]) -> List[str]:
+        keys = [self._version_key(table) for table in tables]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # a new random version if it is missing, e.g. evicted from the cache
+                self.cache.add(key, uuid.uuid4().hex, None)
+                versions[key] = self.cache.get(key)
+        return [versions[key] for key in keys]
+
+
+_query_caches = {}  # type: Dict[str, Optional[QueryCache]]
+_query_caches_lock = threading.Lock()
+
+
+def get_query_cache(alias: str, settings_dict: Dict[str, Any]) -> Optional[QueryCache]:
+    """Get the cache of the database alias if it is enabled by OPTIONS['QUERY_CACHE']"""
+    try:
+        return _query_caches[alias]
+    except KeyError:
+        pass
+    options = settings_dict.get('OPTIONS', {}).get('QUERY_CACHE')
+    with _query_caches_lock:
+        if alias not in _query_caches:
+            _query_caches[alias] = QueryCache(alias, options) if options else None
+        return _query_caches[alias]
+
+
+def invalidate_table(alias: str, settings_dict: Dict[str, Any], table: str) -> None:
+    """Invalidate results of queries with the table after a write to it"""
+    query_cache = get_query_cache(alias, settings_dict)
+    if query_cache:
+        query_cache.invalidate(table)
+
+
+def cache_statistics() -> Dict[str, Dict[str, int]]:
+    """Hits, misses and invalidations of query caches by database alias
+
+    e.g. {'salesforce': {'hits': 1234, 'misses': 56, 'invalidations': 7}}
+    """
+    with _query_caches_lock:
+        return {alias: query_cache.statistics() for alias, query_cache in _query_caches.items() if query_cache}
+
+
+def reset_query_caches() -> None:
+    """Forget all query caches and their configuration, e.g. after a change of settings in tests"""
+    with _query_caches_lock:
+        _query_caches.clear()
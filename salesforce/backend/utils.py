@@ -11,16 +11,20 @@ import decimal
 import logging
 import warnings
 from itertools import islice
-from typing import Any, Dict, Iterable, Iterator, List, Tuple, TypeVar
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
 from django.db import models
 from django.db.models import expressions as db_expressions
 from django.db.models.sql import subqueries, Query, RawQuery
 
 from salesforce.backend import DJANGO_42_PLUS, DJANGO_50_PLUS
+from salesforce.backend.query_cache import get_query_cache, invalidate_table
+from salesforce.batch import get_write_batch
+from salesforce.dbapi import bulk2
+from salesforce.dbapi.governor import api_priority
 from salesforce.dbapi.driver import (
     DatabaseError, SalesforceWarning, merge_dict,
-    register_conversion, arg_to_json)
+    register_conversion, arg_to_json, arg_to_soql)
 from salesforce.fields import NOT_UPDATEABLE, NOT_CREATEABLE
 
 if DJANGO_42_PLUS:
@@ -63,6 +67,17 @@ def extract_insert_values(query) -> List[Dict[str, Any]]:  # TODO can be more st
     return ret
 
 
+def fix_database_default(obj_json_data: Dict[str, Any]) -> None:
+    """Remove values of fields that should get a default value from the database"""
+    if DJANGO_50_PLUS:
+        # sql, params = obj_json_data[name].as_sql(self.query.get_compiler('salesforce'), self.db)
+        ignore_names = [
+            name for name, val in obj_json_data.items()
+            if isinstance(val, db_expressions.DatabaseDefault)]  # type: ignore[attr-defined] # ok DJANGO_50_PLUS
+        for name in ignore_names:
+            del obj_json_data[name]
+
+
 def extract_update_values(query: subqueries.UpdateQuery) -> Dict[str, Any]:  # TODO can be more strict
     """
     Extract values from update query.
@@ -119,6 +134,12 @@ class CursorWrapper:
         self.rowcount = None
         self.first_row = None
         self.lastrowid = None  # not moved to driver because INSERT is implemented here
+        self.column_types = None  # type: Optional[List[Optional[str]]]
+        self.compile_time = 0.0
+        self.write_queued = False  # the last write is queued by an active batch_writes()
+        if db.settings_dict.get('OPTIONS', {}).get('DESCRIBE_RAW_QUERIES'):
+            # types of columns of raw SOQL queries are found by describe() of used objects
+            self.cursor.describe = db.introspection.table_description_cache
 
     def __enter__(self):
         return self
@@ -177,21 +198,35 @@ class CursorWrapper:
             if not q.upper().startswith('SELECT COUNT() FROM'):
                 self.first_row = data['records'][0] if data['records'] else None
 
-    def prepare_query(self, query):
+    def prepare_query(self, query, column_types=None, compile_time: float = 0.0):
         self.query = query
+        self.column_types = column_types
+        self.compile_time = compile_time
 
     def execute_django(self, soql: str, args: Tuple[Any, ...] = ()):
         """
         Fixed execute for queries coming from Django query compilers
         """
+        with api_priority(getattr(getattr(self.query, 'sf_params', None), 'priority', None)):
+            return self._execute_django(soql, args)
+
+    def _execute_django(self, soql: str, args: Tuple[Any, ...] = ()):
         response = None
         sqltype = soql.split(None, 1)[0].upper()
-        if isinstance(self.query, subqueries.InsertQuery):
-            response = self.execute_insert(self.query)
-        elif isinstance(self.query, subqueries.UpdateQuery):
-            response = self.execute_update(self.query)
-        elif isinstance(self.query, subqueries.DeleteQuery):
-            response = self.execute_delete(self.query)
+        if isinstance(self.query, (subqueries.InsertQuery, subqueries.UpdateQuery, subqueries.DeleteQuery)):
+            self.write_queued = False
+            try:
+                if isinstance(self.query, subqueries.InsertQuery):
+                    response = self.execute_insert(self.query)
+                elif isinstance(self.query, subqueries.UpdateQuery):
+                    response = self.execute_update(self.query)
+                else:
+                    response = self.execute_delete(self.query)
+            finally:
+                # cached results with the table are invalidated after the write, also after a partial failure,
+                # or by WriteBatch.flush_queue() when the write is sent if it has been queued
+                if not self.write_queued:
+                    invalidate_table(self.db.alias, self.db.settings_dict, self.query.model._meta.db_table)
         elif isinstance(self.query, RawQuery):
             self.execute_select(soql, args)
         elif sqltype in ('SAVEPOINT', 'ROLLBACK', 'RELEASE'):
@@ -208,7 +243,23 @@ class CursorWrapper:
             # normal query
             query_all = self.query and self.query.sf_params.query_all
             tooling_api = self.query and self.query.model._meta.sf_tooling_api_model
-            self.cursor.execute(soql, args, query_all=query_all, tooling_api=tooling_api)
+            bulk_query = bool(self.query and self.query.sf_params.bulk_query)
+            query_cache = get_query_cache(self.db.alias, self.db.settings_dict)
+            cache_key, timeout, page = None, 0.0, None
+            if query_cache and self.query is not None and not bulk_query:
+                tables = query_cache.query_tables(soql, self.query)
+                timeout = query_cache.get_timeout(tables)
+                if timeout:
+                    processed_soql = soql % tuple(arg_to_soql(x) for x in args)
+                    cache_key = query_cache.make_key(processed_soql, query_all, tooling_api, tables)
+                    page = query_cache.get(cache_key)
+            self.cursor.compile_time = self.compile_time
+            self.cursor.execute(soql, args, query_all=query_all, tooling_api=tooling_api,
+                                column_types=self.column_types, bulk_query=bulk_query, result_page=page)
+            if query_cache and cache_key and page is None:
+                page = self.cursor.single_page
+                if page is not None:
+                    query_cache.set(cache_key, page, timeout)
         else:
             # Nothing queried about django_migrations to SFDC and immediately responded that
             # nothing about migration status is recorded in SFDC.
@@ -221,13 +272,7 @@ class CursorWrapper:
         self.rowcount = self.cursor.rowcount
 
     def our_fix_default(self, obj_json_data: Dict[str, Any]) -> None:
-        if DJANGO_50_PLUS:
-            # sql, params = obj_json_data[name].as_sql(self.query.get_compiler('salesforce'), self.db)
-            ignore_names = [
-                name for name, val in obj_json_data.items()
-                if isinstance(val, db_expressions.DatabaseDefault)]  # type: ignore[attr-defined] # ok DJANGO_50_PLUS
-            for name in ignore_names:
-                del obj_json_data[name]
+        fix_database_default(obj_json_data)
 
     def execute_insert(self, query):
         table = query.model._meta.db_table
@@ -239,6 +284,12 @@ class CursorWrapper:
             # single object
             post_data_0 = post_data[0]
             self.our_fix_default(post_data_0)
+            batch = get_write_batch(self.db.alias)
+            if batch and not query.model._meta.sf_tooling_api_model:
+                # the primary key is assigned to the object later by batch.flush()
+                batch.add_insert(table, post_data_0, query.objs[0])
+                self.write_queued = True
+                return None
             return self.handle_api_exceptions('POST', obj_url, json=post_data_0)
         if self.db.connection.composite_type == 'sobject-collections':
             # SObject Collections
@@ -256,6 +307,16 @@ class CursorWrapper:
         ret = self.db.connection.composite_request(composite_data)
         return ret
 
+    @staticmethod
+    def is_pk_lookup(query) -> bool:
+        """Check if the query is filtered only by primary keys (not by a subquery or other fields)"""
+        where = query.where
+        if where.connector != 'AND' or where.negated or len(where.children) != 1:
+            return False
+        child = where.children[0]
+        return (getattr(child, 'lookup_name', None) in ('exact', 'in') and child.lhs.target.column == 'Id'
+                and isinstance(child.rhs, (str, tuple, list)))
+
     def get_pks_from_query(self, query):
         """Prepare primary keys for update and delete queries"""
         where = query.where
@@ -331,6 +392,14 @@ class CursorWrapper:
         log.debug('UPDATE %s(%s)%r', table, pks, post_data)
         if not pks:
             return
+        batch = get_write_batch(self.db.alias)
+        if batch and len(pks) == 1 and self.is_pk_lookup(query):
+            # only a single object is queued, e.g. by save(), not a QuerySet.update() of more objects
+            self.our_fix_default(post_data)
+            batch.add_update(table, pks[0], post_data)
+            self.rowcount = 1
+            self.write_queued = True
+            return
         obj_url = self.db.connection.rest_api_url('sobjects', table, '', relative=True)
         if len(pks) == 1:
             # single request
@@ -338,13 +407,21 @@ class CursorWrapper:
             ret = self.handle_api_exceptions('PATCH', obj_url + pks[0], json=post_data)
             self.rowcount = 1
             return ret
+        all_or_none = query.sf_params.all_or_none
+        if bulk2.use_bulk_api(self.db.settings_dict, len(pks), query.sf_params.bulk_api, all_or_none):
+            self.our_fix_default(post_data)
+            records = [merge_dict(post_data, Id=pk) for pk in pks]
+            result = bulk2.ingest(self.db.connection, 'update', table, records)
+            self.rowcount = len([x for x in result.ids if x])
+            result.raise_errors()
+            return
         if self.db.connection.composite_type == 'sobject-collections':
             # SObject Collections
             records = [merge_dict(post_data, id=pk, type_=table) for pk in pks]
             for item in records:
                 self.our_fix_default(item)
-            all_or_none = query.sf_params.all_or_none
-            ret = self.db.connection.sobject_collections_request('PATCH', records, all_or_none=all_or_none)
+            ret = self.db.connection.sobject_collections_chunks('PATCH', records, all_or_none=all_or_none,
+                                                                concurrency=query.sf_params.concurrency)
             self.lastrowid = ret
             self.rowcount = len(ret)
             return
@@ -363,15 +440,28 @@ class CursorWrapper:
         if not pks:
             self.rowcount = 0
             return
+        batch = get_write_batch(self.db.alias)
+        if batch and len(pks) == 1 and self.is_pk_lookup(query) and not query.model._meta.sf_tooling_api_model:
+            # only a single object is queued, e.g. by Model.delete(), not a QuerySet.delete() of more objects
+            batch.add_delete(table, pks[0])
+            self.rowcount = 1
+            self.write_queued = True
+            return
         if len(pks) == 1:
             ret = self.handle_api_exceptions('DELETE', 'sobjects', table, pks[0])
             self.rowcount = 1 if (ret and ret.status_code == 204) else 0
             return ret
+        # sf_params are not supported by DeleteQuery, only by QuerySet.update(), therefore only the threshold
+        if bulk2.use_bulk_api(self.db.settings_dict, len(pks)):
+            result = bulk2.ingest(self.db.connection, 'delete', table, pks)
+            self.rowcount = len([x for x in result.ids if x])
+            result.raise_errors()
+            return
         if self.db.connection.composite_type == 'sobject-collections':
             # SObject Collections
             records = pks
-            all_or_none = None  # sf_params not supported by DeleteQuery
-            ret = self.db.connection.sobject_collections_request('DELETE', records, all_or_none=all_or_none)
+            all_or_none = None  # sf_params not supported by DeleteQuery, concurrency only by OPTIONS
+            ret = self.db.connection.sobject_collections_chunks('DELETE', records, all_or_none=all_or_none)
             self.lastrowid = ret
             self.rowcount = len(ret)
             return
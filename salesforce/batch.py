@@ -0,0 +1,166 @@
+"""
+Deferred batching of writes by Model.save() and Model.delete() (a unit of work)
+
+    with salesforce.batch_writes(max_batch=200):
+        for contact in contacts:
+            contact.last_name = contact.last_name.title()
+            contact.save()
+
+Inserts, updates and deletes of single objects inside the block are queued per
+operation and table in the current thread and they are sent by SObject Collections
+requests when a queue has `max_batch` records or when the block exits. Primary keys
+of inserted objects are assigned to the instances when the batch is flushed.
+Failed records are reported by BatchWriteError with the originating instances.
+"""
+import contextlib
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Model
+
+from salesforce.backend.query_cache import invalidate_table
+from salesforce.dbapi.driver import merge_dict
+from salesforce.dbapi.exceptions import IntegrityError
+
+MAX_BATCH = 200  # the maximal number of records of SObject Collections request
+
+_local = threading.local()
+
+
+class BatchWriteError(IntegrityError):
+    """Errors of records of flushed batches
+
+    `failed` is a list of pairs (instance or primary key, errors),
+    an instance for inserted objects, otherwise a primary key.
+    """
+    def __init__(self, failed: List[Tuple[Union[Model, str], List[Dict[str, Any]]]], count_ok: int) -> None:
+        messages = ['(see details below)', '',
+                    'Batch write errors={}, success={}'.format(len(failed), count_ok)]
+        for obj, errs in failed:
+            messages.append('{!r}  {}: {}'.format(obj, errs[0]['statusCode'], errs[0]['message']))
+        super().__init__(messages)
+        self.failed = failed
+
+
+class WriteBatch:
+    """Queues of writes to one database, flushed by SObject Collections requests"""
+
+    def __init__(self, using: str, max_batch: int = MAX_BATCH) -> None:
+        if not 0 < max_batch <= MAX_BATCH:
+            raise ValueError("max_batch must be between 1 and {}".format(MAX_BATCH))
+        self.using = using
+        self.max_batch = max_batch
+        # (method, table) -> list of (record, instance); a record is a primary key for DELETE
+        self.queues = {}  # type: Dict[Tuple[str, str], List[Tuple[Any, Optional[Model]]]]
+        self.pending_pks = {}  # type: Dict[str, Tuple[str, str]]
+        self.failed = []  # type: List[Tuple[Union[Model, str], List[Dict[str, Any]]]]
+        self.count_ok = 0
+
+    def add_insert(self, table: str, record: Dict[str, Any], obj: Model) -> None:
+        queue = self.queues.get(('POST', table), [])
+        for i, (old_record, old_obj) in enumerate(queue):
+            if old_obj is obj:
+                # more saves of an instance without a primary key yet are merged to one inserted record
+                queue[i] = (merge_dict(old_record, **record), obj)
+                return
+        self._add('POST', table, merge_dict(record, type_=table), obj)
+
+    def add_update(self, table: str, pk: str, record: Dict[str, Any]) -> None:
+        queue = self.queues.get(('PATCH', table), [])
+        for i, (old_record, _) in enumerate(queue):
+            if old_record['id'] == pk:
+                # more updates of the same object are merged to one record
+                queue[i] = (merge_dict(old_record, **record), None)
+                return
+        self._add('PATCH', table, merge_dict(record, id=pk, type_=table), None)
+
+    def add_delete(self, table: str, pk: str) -> None:
+        if pk not in [x for x, _ in self.queues.get(('DELETE', table), [])]:
+            self._add('DELETE', table, pk, None)
+
+    def _add(self, method: str, table: str, record: Any, obj: Optional[Model]) -> None:
+        pk = record if method == 'DELETE' else record.get('id')
+        if pk and self.pending_pks.get(pk, (method, table)) != (method, table):
+            # the object has a pending write of another kind that must be sent before
+            self.flush()
+        queue = self.queues.setdefault((method, table), [])
+        queue.append((record, obj))
+        if pk:
+            self.pending_pks[pk] = (method, table)
+        if len(queue) >= self.max_batch:
+            self.flush_queue(method, table)
+            self.raise_errors()
+
+    def flush(self) -> None:
+        """Send all queues and report errors"""
+        for method, table in list(self.queues):
+            self.flush_queue(method, table)
+        self.raise_errors()
+
+    def flush_queue(self, method: str, table: str) -> None:
+        """Send one queue by a SObject Collections request and assign primary keys of inserted instances"""
+        queue = self.queues.pop((method, table), [])
+        if not queue:
+            return
+        records = [record for record, _ in queue]
+        for record in records:
+            self.pending_pks.pop(record if method == 'DELETE' else record.get('id'), None)
+        db_wrapper = connections[self.using]
+        db_wrapper.ensure_connection()
+        connection = db_wrapper.connection
+        try:
+            records, kwargs = connection.sobject_collections_params(method, records, False)
+            resp_data = connection.handle_api_exceptions(method, 'composite/sobjects', **kwargs).json()
+        except Exception:
+            # the writes are not lost by a transport error, they can be sent again by flush()
+            self.queues[(method, table)] = queue + self.queues.get((method, table), [])
+            for record, _ in queue:
+                pk = record if method == 'DELETE' else record.get('id')
+                if pk:
+                    self.pending_pks[pk] = (method, table)
+            raise
+        finally:
+            invalidate_table(self.using, db_wrapper.settings_dict, table)
+        for (record, obj), result in zip(queue, resp_data):
+            if result['success']:
+                self.count_ok += 1
+                if obj is not None:
+                    obj.pk = result['id']
+            else:
+                self.failed.append((obj if obj is not None else record if method == 'DELETE' else record['id'],
+                                    result['errors']))
+
+    def raise_errors(self) -> None:
+        if self.failed:
+            failed, self.failed = self.failed, []
+            count_ok, self.count_ok = self.count_ok, 0
+            raise BatchWriteError(failed, count_ok)
+
+
+def get_write_batch(using: str) -> Optional[WriteBatch]:
+    """The active batch of writes in the current thread for the database alias"""
+    return getattr(_local, 'batches', {}).get(using)
+
+
+@contextlib.contextmanager
+def batch_writes(using: Optional[str] = None, max_batch: int = MAX_BATCH) -> Iterator[WriteBatch]:
+    """Queue writes of single objects in the block and send them by batches of max_batch records
+
+    Queued objects can not be read back from the database and inserted objects have no primary key
+    until the batch is flushed, e.g. by `batch.flush()`. Writes of a failed request stay queued for
+    the next flush. Writes that are not flushed are discarded if the block is terminated by
+    an exception. A nested block uses the outer batch.
+    """
+    using = using or getattr(settings, 'SALESFORCE_DB_ALIAS', 'salesforce')
+    batches = _local.__dict__.setdefault('batches', {})  # type: Dict[str, WriteBatch]
+    if using in batches:
+        yield batches[using]
+        return
+    batch = batches[using] = WriteBatch(using, max_batch)
+    try:
+        yield batch
+        batch.flush()
+    finally:
+        del batches[using]
@@ -0,0 +1,539 @@
+"""
+Asynchronous DB API driver for Salesforce REST API by asyncio (an extension of DB API)
+
+AsyncConnection and AsyncCursor have the same semantics as the synchronous
+RawConnection and Cursor in `salesforce.dbapi.driver`, but every method that
+can send a request is a coroutine. Requests are sent by the asyncio HTTP client
+"aiohttp" with its own pool of connections, therefore thousands of concurrent
+requests are possible in one thread, without a thread for every request.
+
+The package "aiohttp" is an optional dependency.
+
+Example:
+    >>> from salesforce.dbapi import aio
+    >>> async def main():
+    ...     async with aio.AsyncConnection(settings_dict, alias='salesforce') as conn:
+    ...         cursor = conn.cursor()
+    ...         await cursor.execute("SELECT Id, Name FROM Contact")
+    ...         async for row in cursor:
+    ...             print(row)
+
+The authentication is shared with synchronous connections of the same alias
+if it is a static authentication. A slow authentication request runs in a thread.
+"""
+import asyncio
+import json
+import logging
+import pprint
+import time
+import weakref
+from typing import (
+    Any, cast, Dict, Generic, Iterable, Iterator, List, MutableMapping, Optional, overload, Sequence, Tuple, Type,
+    Union,
+)
+from urllib.parse import urlencode
+
+import salesforce
+from salesforce.auth import SalesforceAuth
+from salesforce.dbapi import driver, instrumentation
+from salesforce.dbapi.common import settings  # i.e. django.conf.settings
+from salesforce.dbapi.driver import (
+    ApiUsage, arg_to_soql, CompressionStats, ErrInfo, get_gzip_min_size, gzip_json_body, RawConnection)
+from salesforce.dbapi.describe_cache import org_key
+from salesforce.dbapi.governor import current_priority, get_governor
+from salesforce.dbapi.exceptions import (  # NOQA pylint: disable=unused-import
+    Error, InterfaceError, DatabaseError, DataError, OperationalError, IntegrityError, InternalError,
+    ProgrammingError, NotSupportedError, SalesforceError, FakeReq, FakeResp)
+from salesforce.dbapi.retry import get_retry_policy, Retrying
+from salesforce.dbapi.subselect import QQuery, _TRow
+
+try:
+    import aiohttp  # type: ignore[import]
+except ImportError:
+    aiohttp = None
+
+# timeouts and connection errors of aiohttp, passed to the retry policy like those of "requests"
+TRANSPORT_ERRORS = (asyncio.TimeoutError, aiohttp.ClientError) if aiohttp else (asyncio.TimeoutError,)
+
+log = logging.getLogger(__name__)
+
+# the default maximal number of open HTTP connections of one AsyncConnection
+ASYNC_POOL_SIZE = 100
+
+
+class AsyncResponse(FakeResp):
+    """A complete response of the asynchronous client, compatible with the used part of requests.Response"""
+    def __init__(self, status_code: int, headers: Any, text: str, request: FakeReq, reason: Optional[str] = None
+                 ) -> None:
+        super().__init__(status_code, headers, text, request)
+        self.reason = reason  # type: ignore[assignment]
+
+    def json(self, **kwargs: Any) -> Any:
+        return json.loads(self.text, **kwargs)
+
+    @property
+    def content(self) -> bytes:
+        return self.text.encode()
+
+
+class AsyncConnection:
+    """
+    parameters:
+        settings_dict:  like settings.DATABASES['salesforce'] in Django
+        alias:          important if the authentication is static and should be shared with other connections
+        errorhandler: function with following signature
+            ``errorhandler(connection, cursor, errorclass, errorvalue)``
+        sf_auth:        an optional instance of SalesforceAuth, created from `settings_dict` by default
+
+    The number of open HTTP connections is restricted by ``OPTIONS['ASYNC_POOL_SIZE']``
+    in `settings_dict`. (default 100)
+    """
+    # pylint:disable=too-many-instance-attributes
+
+    Error = Error
+    InterfaceError = InterfaceError
+    DatabaseError = DatabaseError
+    DataError = DataError
+    OperationalError = OperationalError
+    IntegrityError = IntegrityError
+    InternalError = InternalError
+    ProgrammingError = ProgrammingError
+    NotSupportedError = NotSupportedError
+
+    def __init__(self, settings_dict: Dict[str, Any], alias: Optional[str] = None,
+                 errorhandler: Optional[Any] = None, sf_auth: Optional[SalesforceAuth] = None) -> None:
+        self.alias = cast(str, alias)
+        self.errorhandler = errorhandler
+        self.settings_dict = settings_dict
+        self.messages = []           # type: List[ErrInfo]
+
+        self._api_version = settings_dict.get('API_VERSION', salesforce.API_VERSION)  # type: str
+        self.composite_type = 'sobject-collections'
+        self.pool_size = settings_dict.get('OPTIONS', {}).get('ASYNC_POOL_SIZE', ASYNC_POOL_SIZE)  # type: int
+        self.gzip_min_size = get_gzip_min_size(settings_dict)  # type: Optional[int]
+        self.compression_stats = CompressionStats()
+        self.sf_auth = sf_auth or SalesforceAuth.create_subclass_instance(db_alias=self.alias,
+                                                                          settings_dict=self.settings_dict)
+        self._session = None         # type: Any  # aiohttp.ClientSession
+        self._authenticated = False
+        self.closed = False
+        self.api_usage = ApiUsage(0, 5000)  # default before initialized by a request
+
+    # -- public methods
+
+    @property
+    def api_ver(self) -> str:
+        if self._api_version == 'MAX':
+            raise NotSupportedError("API_VERSION='MAX' is not supported by the asynchronous driver")
+        return self._api_version
+
+    async def close(self) -> None:
+        del self.messages[:]
+        self.closed = True
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def commit(self) -> None:
+        pass
+
+    async def rollback(self) -> None:
+        pass
+
+    @overload
+    def cursor(self) -> 'AsyncCursor[Tuple[Any, ...]]': ...
+    @overload  # noqa
+    def cursor(self, row_type: Type[_TRow]) -> 'AsyncCursor[_TRow]': ...
+
+    def cursor(self, row_type=tuple):  # type: ignore[no-untyped-def]
+        return AsyncCursor(self, row_type)
+
+    async def __aenter__(self) -> 'AsyncConnection':
+        return self
+
+    async def __aexit__(self, exc_type: Optional[Type[BaseException]], exc_value: Optional[BaseException],
+                        exc_tb: Any) -> None:
+        await self.close()
+
+    def check(self) -> None:
+        if self.closed:
+            raise InterfaceError("The connection has been closed previously")
+
+    # the same URL as in the synchronous driver
+    rest_api_url = RawConnection.rest_api_url
+
+    async def handle_api_exceptions(self, method: str, *url_parts: str, **kwargs: Any) -> AsyncResponse:
+        """Call REST API and handle exceptions, like RawConnection.handle_api_exceptions"""
+        # The outer part - about error handler
+        assert method in ('HEAD', 'GET', 'POST', 'PATCH', 'DELETE')
+        cursor_context = kwargs.pop('cursor_context', None)
+        if cursor_context is not None:
+            if 'priority' not in kwargs:
+                kwargs['priority'] = cursor_context.priority
+            kwargs['cursor_event'] = cursor_context.event
+        errorhandler = cursor_context.errorhandler if cursor_context else self.errorhandler
+        if not errorhandler:
+            return await self.handle_api_exceptions_inter(method, *url_parts, **kwargs)
+        try:
+            return await self.handle_api_exceptions_inter(method, *url_parts, **kwargs)
+        except SalesforceError as exc:
+            errorhandler(self, cursor_context, type(exc), exc)
+            raise
+
+    async def handle_api_exceptions_inter(self, method: str, *url_parts: str, **kwargs: Any) -> AsyncResponse:
+        """The main (middle) part - it is enough if no error occurs."""
+        self.check()
+        loop = asyncio.get_running_loop()
+        if not self._authenticated:
+            # a possible authentication request is synchronous
+            await loop.run_in_executor(None, self.sf_auth.authenticate_and_cache)
+            self._authenticated = True
+        api_ver = kwargs.pop('api_ver', None)
+        priority = kwargs.pop('priority', None)  # type: Optional[str]  # for the API governor
+        cursor_event = kwargs.pop('cursor_event', None)  # type: Optional[instrumentation.CursorEvent]
+        url = self.rest_api_url(*url_parts, api_ver=api_ver)
+        kwargs.setdefault('timeout', getattr(settings, 'SALESFORCE_QUERY_TIMEOUT', (4, 15)))
+        retry_policy = get_retry_policy(self.alias, self.settings_dict)
+        retrying = retry_policy.start(method, url, kwargs.get('json')) if retry_policy else None
+        if self.gzip_min_size is not None and kwargs.get('json') is not None:
+            gzip_json_body(kwargs, self.gzip_min_size, self.compression_stats)
+        log.debug('Request API URL: %s', url)
+        driver.count_request()
+        governor = None
+        if self.settings_dict.get('OPTIONS', {}).get('API_GOVERNOR'):
+            governor = get_governor(org_key(self.sf_auth.get_auth(), self.sf_auth.instance_url), self.settings_dict)
+            if governor:
+                await governor.aacquire(priority)
+
+        event = instrumentation.start_request(method, url, cursor_event)
+        try:
+            response, retries = await self._send_request(loop, method, url, kwargs, retrying)
+        except Exception as exc:
+            if event:
+                instrumentation.end_request(event, error=exc)
+            raise
+        if event:
+            instrumentation.end_request(event, response, retries=retries)
+        if governor:
+            governor.update(response.headers.get('Sforce-Limit-Info'))
+        if response.status_code < 400:  # OK
+            self.api_usage.update(response.headers.get('Sforce-Limit-Info'))
+            return response
+        RawConnection.raise_errors(cast(Any, response))
+        return  # type: ignore[return-value]
+
+    async def _send_request(self, loop: asyncio.AbstractEventLoop, method: str, url: str, kwargs: Dict[str, Any],
+                            retrying: Optional[Retrying] = None) -> Tuple[AsyncResponse, int]:
+        """Send a request with reauthentication and retries, like RawConnection._send_request
+
+        Return the response and the number of retries.
+        """
+        retries = 0
+        while True:
+            try:
+                response = await self._send(method, url, **kwargs)
+                if (response.status_code == 401                      # Unauthorized
+                        and 'json' in response.headers.get('content-type', '')
+                        and response.json()[0]['errorCode'] == 'INVALID_SESSION_ID'):
+                    # Reauthenticate and retry (expired or invalid session ID or OAuth)
+                    token = await loop.run_in_executor(None, self.sf_auth.reauthenticate)
+                    if token:
+                        retries += 1
+                        response = await self._send(method, url, **kwargs)
+            except TRANSPORT_ERRORS as exc:
+                delay = retrying.delay(exc=exc) if retrying else None
+                if delay is None:
+                    if isinstance(exc, asyncio.TimeoutError):
+                        raise SalesforceError("Timeout, URL=%s" % url)
+                    raise SalesforceError("ConnectionError, URL=%s, %r" % (url, exc))
+            else:
+                delay = retrying.delay(response) if retrying else None
+                if delay is None:
+                    return response, retries
+            retries += 1
+            await asyncio.sleep(delay)
+
+    async def _send(self, method: str, url: str, **kwargs: Any) -> AsyncResponse:
+        """Send one request by aiohttp and read the complete response"""
+        if self._session is None:
+            if aiohttp is None:
+                raise InterfaceError("The package 'aiohttp' is required by salesforce.dbapi.aio")
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['Authorization'] = 'OAuth %s' % self.sf_auth.get_auth()['access_token']
+        if self.gzip_min_size is not None:
+            headers['Accept-Encoding'] = 'gzip'
+        data = kwargs.pop('data', None)  # type: Optional[Union[str, bytes]]
+        if 'json' in kwargs:
+            data = json.dumps(kwargs.pop('json'))
+            headers['Content-Type'] = 'application/json'
+        params = kwargs.pop('params', None)
+        timeout = kwargs.pop('timeout')
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        assert not kwargs, "Unsupported parameters of the asynchronous driver: {}".format(list(kwargs))
+        request = FakeReq(method, url, cast(str, data or ''), headers)
+        # timeouts and connection errors are reported by _send_request()
+        async with self._session.request(
+                method, url, params=params, data=data, headers=headers,
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)) as resp:
+            text = await resp.text()
+            return AsyncResponse(resp.status, resp.headers, text, request, reason=resp.reason)
+
+    async def handle_api_exceptions_big(self, method: str, *url_parts: str, **kwargs: Any) -> AsyncResponse:
+        """Call REST API with the query encapsulated into the body if the query is big"""
+        assert method == 'GET'
+        api_ver = kwargs.pop('api_ver', None)
+        url = self.rest_api_url(*url_parts, api_ver=api_ver, relative=True)
+        data = [{'method': 'GET', 'url': url, 'referenceId': 'subrequest_0'}]
+        return await self.composite_request(data)
+
+    async def composite_request(self, data: List[Dict[str, Any]]) -> AsyncResponse:
+        """Call a 'composite' request with subrequests, error handling"""
+        post_data = {'compositeRequest': data, 'allOrNone': True}
+        resp = await self.handle_api_exceptions('POST', 'composite', json=post_data)
+        return cast(AsyncResponse, RawConnection.check_composite_response(cast(Any, resp), data))
+
+    async def sobject_collections_request(self,
+                                          method: str,
+                                          records: Sequence[Dict[str, Any]],
+                                          all_or_none: bool = True
+                                          ) -> List[str]:
+        records, kwargs = RawConnection.sobject_collections_params(method, records, all_or_none)
+        resp = await self.handle_api_exceptions(method, 'composite/sobjects', **kwargs)
+        return RawConnection.sobject_collections_result(resp.json(), records, all_or_none)
+
+
+class AsyncCursor(Generic[_TRow]):
+    """Asynchronous cursor with the same semantics as salesforce.dbapi.driver.Cursor
+
+    Rows of the current page are fetched without a request and the next
+    page is requested by `query_more` when the current has been consumed.
+    """
+
+    # pylint:disable=too-many-instance-attributes
+    def __init__(self, connection: AsyncConnection, row_type: Optional[Type[_TRow]] = None) -> None:
+        self.description = None           # type: Optional[List[Tuple[Any, ...]]]
+        self.rowcount = -1
+        self.arraysize = 1
+        self.rownumber = None             # type: Optional[int]
+        self._connection = connection
+        self.messages = []                # type: List[ErrInfo]
+        self.errorhandler = connection.errorhandler
+        assert row_type in (tuple, list, dict, None)
+        self.row_type = row_type or tuple  # type: Union[Type[Dict[str, Any]], Type[Tuple[Any, ...]], Type[List[Any]]]
+        self._chunk = []                  # type: List[Dict[str, Any]]
+        self._chunk_offset = None         # type: Optional[int]
+        self._next_records_url = None     # type: Optional[str]
+        self.handle = None                # type: Optional[str]
+        self.qquery = None                # type: Optional[QQuery]
+        self._iter = None                 # type: Optional[Iterator[_TRow]]  # rows of the current page
+        self.compile_time = 0.0           # seconds of compilation by the Django backend, for instrumentation
+        self.event = None                 # type: Optional[instrumentation.CursorEvent]
+        self.priority = current_priority()  # for the API governor, also for next pages
+        self.closed = False
+
+    @property
+    def connection(self) -> AsyncConnection:
+        self.check()
+        return self._connection
+
+    def check(self) -> None:
+        self._connection.check()
+        if self.closed:
+            raise InterfaceError("Cursor is closed")
+
+    async def close(self) -> None:
+        self._clean()
+        self.closed = True
+
+    async def execute(self, soql: str, parameters: Optional[Iterable[Any]] = None, query_all: bool = False,
+                      tooling_api: bool = False, column_types: Optional[Sequence[Optional[str]]] = None) -> None:
+        self._clean()
+        self.priority = current_priority()  # also for next pages requested later
+        parameters = list(parameters or [])
+        self.event = instrumentation.start_cursor(soql, self._connection.alias, self.compile_time, parameters)
+        self.compile_time = 0.0
+        sqltype = soql.split(None, 1)[0].upper()
+        try:
+            if sqltype == 'SELECT':
+                await self.execute_select(soql, parameters, query_all=query_all, tooling_api=tooling_api,
+                                          column_types=column_types)
+            elif sqltype == 'EXPLAIN':
+                assert not tooling_api
+                await self.execute_explain(soql, parameters, query_all=query_all)
+            else:
+                raise ProgrammingError("Unexpected command '{}'".format(sqltype))
+        except Exception as exc:
+            self._end_event(exc)
+            raise
+
+    async def execute_select(self, soql: str, parameters: Iterable[Any], query_all: bool = False,
+                             tooling_api: bool = False, column_types: Optional[Sequence[Optional[str]]] = None
+                             ) -> None:
+        processed_sql = str(soql) % tuple(arg_to_soql(x) for x in parameters)
+        service = '' if not tooling_api else 'tooling/'
+        service += 'query' if not query_all else 'queryAll'
+
+        self.qquery = qquery = QQuery(soql)
+        if column_types is None or len(column_types) != len(qquery.aliases):
+            column_types = [None] * len(qquery.aliases)
+        qquery.set_column_types(column_types)
+        self.description = qquery.description(column_types)
+
+        url_part = '/?'.join((service, urlencode(dict(q=processed_sql))))
+        await self.query_more(url_part)
+        self._chunk_offset = 0
+        self.rownumber = 0
+        if self._next_records_url:
+            self.handle = self._next_records_url.split('-')[0]
+        self._parse_page()
+
+    async def execute_explain(self, soql: str, parameters: Iterable[Any], query_all: bool = False) -> None:
+        assert soql.startswith('EXPLAIN SELECT')
+        soql = soql.split(' ', 1)[1]
+        processed_sql = str(soql) % tuple(arg_to_soql(x) for x in parameters)
+        service = 'query' if not query_all else 'queryAll'
+
+        self.qquery = QQuery(soql)
+        self.description = [('detail', None, None, None, 'detail')]
+        url_part = '/?'.join((service, urlencode(dict(explain=processed_sql))))
+        ret = await self.connection.handle_api_exceptions('GET', url_part, cursor_context=self)
+
+        self._chunk = [{'explain': x} for x in pprint.pformat(ret.json(), indent=1, width=100).split('\n')]
+        self._chunk_offset = 0
+        self.rownumber = 0
+        self._parse_page()
+
+    async def query_more(self, nextRecordsUrl: str) -> None:
+        connection = self.connection
+        if len(nextRecordsUrl) < 15500:
+            response = await connection.handle_api_exceptions('GET', nextRecordsUrl, cursor_context=self)
+            t_0 = time.perf_counter()
+            ret = response.json()
+            if self.event:
+                self.event.add(decode_time=time.perf_counter() - t_0)
+        else:
+            ret = (await connection.handle_api_exceptions_big('GET', nextRecordsUrl)).json()
+            ret = ret['compositeResponse'][0]['body']
+        self.rowcount = ret['totalSize']  # may be more accurate than the initial approximate value
+        self._chunk = ret['records']
+        self._next_records_url = ret.get('nextRecordsUrl')
+
+    async def fetchone(self) -> Optional[_TRow]:
+        self._check_data()
+        try:
+            return await self.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    async def fetchmany(self, size: Optional[int] = None) -> List[_TRow]:
+        self._check_data()
+        if size is None:
+            size = self.arraysize
+        out = []  # type: List[_TRow]
+        async for row in self:
+            out.append(row)
+            if len(out) >= size:
+                break
+        return out
+
+    async def fetchall(self) -> List[_TRow]:
+        self._check_data()
+        return [row async for row in self]
+
+    async def fetchpage(self) -> List[_TRow]:
+        """Fetch all remaining rows of the current page, or of the next page (an extension)
+
+        It is the most efficient way to fetch a big result. An empty list is
+        returned after the last page.
+        """
+        assert self.rownumber is not None
+        self._check_data()
+        rows = list(cast(Iterator[_TRow], self._iter))
+        while not rows and self._next_records_url:
+            await self._next_page()
+            rows = list(cast(Iterator[_TRow], self._iter))
+        self.rownumber += len(rows)
+        if not rows:
+            self._end_event()
+        return rows
+
+    def __aiter__(self) -> 'AsyncCursor[_TRow]':
+        return self
+
+    async def __anext__(self) -> _TRow:
+        assert self.rownumber is not None
+        self._check_data()
+        while True:
+            for row in cast(Iterator[_TRow], self._iter):
+                self.rownumber += 1
+                return row
+            if not self._next_records_url:
+                self._end_event()
+                raise StopAsyncIteration
+            await self._next_page()
+
+    # -- private methods
+
+    async def _next_page(self) -> None:
+        assert self._chunk_offset is not None and self._next_records_url
+        new_offset = self._chunk_offset + len(self._chunk)
+        try:
+            await self.query_more(self._next_records_url)
+        except Exception as exc:
+            self._end_event(exc)
+            raise
+        self._chunk_offset = new_offset
+        self._parse_page()
+
+    def _parse_page(self) -> None:
+        assert self.qquery
+        rows = self.qquery.parse_rest_response(self._chunk, self.rowcount, row_type=self.row_type)
+        if self.event:
+            # the page is parsed at once to measure the time
+            t_0 = time.perf_counter()
+            rows = list(rows)
+            self.event.add(parse_time=time.perf_counter() - t_0)
+        self._iter = iter(cast(Iterable[_TRow], rows))
+
+    def _end_event(self, error: Optional[BaseException] = None) -> None:
+        if self.event:
+            instrumentation.end_cursor(self.event, self.rownumber or 0, error)
+
+    def _check_data(self) -> None:
+        if self._iter is None:
+            raise ProgrammingError('No previous .execute("select...") before .fetch...()')
+
+    def _clean(self) -> None:
+        self._end_event()
+        self.event = None
+        self.description = None
+        self.rowcount = -1
+        self.rownumber = None
+        del self.messages[:]
+        self._chunk = []
+        self._chunk_offset = None
+        self._next_records_url = None
+        self.handle = None
+        self.qquery = None
+        self._iter = None
+
+
+# connections shared by aliases in every event loop
+_loop_connections = weakref.WeakKeyDictionary(
+)  # type: MutableMapping[asyncio.AbstractEventLoop, Dict[str, AsyncConnection]]
+
+
+def get_connection(alias: str, **params: Any) -> AsyncConnection:
+    """Get a connection of the alias in the current event loop or create it by `params`"""
+    connections = _loop_connections.setdefault(asyncio.get_running_loop(), {})
+    if alias not in connections or connections[alias].closed:
+        connections[alias] = AsyncConnection(alias=alias, **params)
+    return connections[alias]
+
+
+async def close_connections() -> None:
+    """Close all connections of the current event loop"""
+    connections = _loop_connections.pop(asyncio.get_running_loop(), {})
+    for connection in connections.values():
+        await connection.close()
@@ -0,0 +1,373 @@
+"""
+Bulk API 2.0 ingest and query jobs (an extension of DB API)
+
+Records are streamed as CSV into ingest jobs that are processed asynchronously
+by Salesforce. One job can replace thousands of SObject Collections requests
+with 200 records, therefore it saves the 24-hour API request limit.
+Results of the job are read from CSV of successful and failed records.
+
+Bulk API 2.0 does not support "all or none". Successful records are saved
+even if other records fail.
+
+Example:
+    >>> from salesforce.dbapi import bulk2
+    >>> result = bulk2.ingest(connection, 'insert', 'Contact', [{'LastName': 'a'}, {'LastName': 'b'}])
+    >>> result.ids
+    ['003...', '003...']
+    >>> result.raise_errors()  # IntegrityError if any record failed
+
+It is used automatically by `bulk_create()`, `bulk_update()`, `update()` and `delete()`
+of querysets by `.sf(bulk_api=True)` or if the number of records is at least
+OPTIONS['BULK_API_THRESHOLD'] in settings_dict. (default None: never automatically)
+
+Big queries can be read by a query job by `.sf(bulk_query=True)` on a queryset or by
+`cursor.execute(soql, bulk_query=True)`. The result is read by pages of CSV without
+an API request per 2000 rows.
+"""
+import csv
+import datetime
+import decimal
+import io
+import logging
+import re
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+from urllib.parse import urlencode
+
+from salesforce.dbapi.driver import RawConnection
+from salesforce.dbapi.exceptions import IntegrityError, NotSupportedError, OperationalError
+
+log = logging.getLogger(__name__)
+
+OPERATIONS = ('insert', 'update', 'upsert', 'delete', 'hardDelete')
+
+# The maximal size of CSV data of one job. The limit of Salesforce is 150 MB after
+# base64 encoding that is done internally by Salesforce, therefore 100 MB of data.
+MAX_UPLOAD_SIZE = 100000000
+
+# Intervals of polling the state of a job are increasing from POLL_INTERVAL to MAX_POLL_INTERVAL [seconds]
+POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 10.0
+# The default maximal time of waiting for a job [seconds]
+BULK_TIMEOUT = 3600.0
+
+# A special value that sets a field to null by update. An empty string is "unchanged".
+NULL_VALUE = '#N/A'
+
+NUMBER_RE = re.compile(r'^[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$')
+DATETIME_RE = re.compile(r'^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:?\d\d)?$')
+
+
+class IngestResult(NamedTuple):
+    """Results of ingest job(s) in the order of input records"""
+    object_name: str
+    ids: List[Optional[str]]                    # None for failed records
+    errors: List[Tuple[int, Optional[str], Dict[str, Any]]]  # (index, id, {'statusCode':..., 'message':...})
+
+    def raise_errors(self) -> None:
+        """Report failed records by IntegrityError, in the same format as errors of SObject Collections"""
+        if not self.errors:
+            return
+        x_err = [(i, [err], self.object_name, id_) for i, id_, err in self.errors]
+        count_ok = len([x for x in self.ids if x is not None])
+        raise IntegrityError(RawConnection.error_summary(x_err, 0, count_ok))  # type: ignore[arg-type]
+
+
+class BulkJob:
+    """A common part of Bulk API 2.0 ingest and query jobs"""
+    resource = ''
+
+    def __init__(self, connection: RawConnection) -> None:
+        self.connection = connection
+        self.job_id = None  # type: Optional[str]
+        self.info = {}  # type: Dict[str, Any]
+
+    def abort(self) -> None:
+        self.set_state('Aborted')
+
+    def set_state(self, state: str) -> None:
+        assert self.job_id
+        self.info = self.connection.handle_api_exceptions('PATCH', self.resource, self.job_id,
+                                                          json={'state': state}).json()
+
+    def wait(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Wait until the job is complete and return the job info"""
+        assert self.job_id
+        timeout = timeout if timeout is not None else BULK_TIMEOUT
+        t_end = time.time() + timeout
+        interval = POLL_INTERVAL
+        while True:
+            self.info = self.connection.handle_api_exceptions('GET', self.resource, self.job_id).json()
+            state = self.info['state']
+            if state == 'JobComplete':
+                return self.info
+            if state in ('Failed', 'Aborted'):
+                raise OperationalError("Bulk API job {} {}: {}".format(
+                    self.job_id, state, self.info.get('errorMessage') or ''))
+            if time.time() + interval > t_end:
+                self.abort()
+                raise OperationalError("Bulk API job {} aborted after timeout {} s".format(self.job_id, timeout))
+            time.sleep(interval)
+            interval = min(interval * 1.5, MAX_POLL_INTERVAL)
+
+
+class IngestJob(BulkJob):
+    """One Bulk API 2.0 ingest job
+
+    Methods are called in this order: create(), upload(), close(), wait() and then
+    the results can be read by successful_results(), failed_results() and unprocessed_records()
+    """
+    resource = 'jobs/ingest'
+
+    def __init__(self, connection: RawConnection, object_name: str, operation: str,
+                 external_id_field: Optional[str] = None) -> None:
+        if operation not in OPERATIONS:
+            raise NotSupportedError("Unknown Bulk API operation {}".format(operation))
+        if (operation == 'upsert') != bool(external_id_field):
+            raise NotSupportedError("The parameter external_id_field is required exactly by 'upsert'")
+        super().__init__(connection)
+        self.object_name = object_name
+        self.operation = operation
+        self.external_id_field = external_id_field
+
+    def create(self) -> str:
+        data = {'object': self.object_name, 'operation': self.operation, 'contentType': 'CSV', 'lineEnding': 'LF'}
+        if self.external_id_field:
+            data['externalIdFieldName'] = self.external_id_field
+        self.info = self.connection.handle_api_exceptions('POST', 'jobs/ingest/', json=data).json()
+        self.job_id = self.info['id']
+        log.debug('Bulk API job %s created: %s %s', self.job_id, self.operation, self.object_name)
+        return self.job_id
+
+    def upload(self, csv_data: bytes) -> None:
+        assert self.job_id
+        self.connection.handle_api_exceptions('PUT', 'jobs/ingest', self.job_id, 'batches', data=csv_data,
+                                              headers={'Content-Type': 'text/csv'})
+
+    def close(self) -> None:
+        """Mark the upload complete. The job is queued for processing by Salesforce"""
+        self.set_state('UploadComplete')
+
+    def successful_results(self) -> List[Dict[str, str]]:
+        """Rows with 'sf__Id', 'sf__Created' and the original columns"""
+        return self.get_csv('successfulResults/')
+
+    def failed_results(self) -> List[Dict[str, str]]:
+        """Rows with 'sf__Id', 'sf__Error' and the original columns"""
+        return self.get_csv('failedResults/')
+
+    def unprocessed_records(self) -> List[Dict[str, str]]:
+        return self.get_csv('unprocessedrecords/')
+
+    def get_csv(self, resource: str) -> List[Dict[str, str]]:
+        assert self.job_id
+        response = self.connection.handle_api_exceptions('GET', 'jobs/ingest', self.job_id, resource)
+        response.encoding = 'utf-8'
+        return list(csv.DictReader(io.StringIO(response.text)))
+
+
+class QueryJob(BulkJob):
+    """One Bulk API 2.0 query job
+
+    The result is read by pages of CSV. The page is identified by a locator
+    from the header "Sforce-Locator" of the previous page. ('' is the first page)
+    """
+    resource = 'jobs/query'
+
+    def __init__(self, connection: RawConnection, soql: str, query_all: bool = False,
+                 page_size: Optional[int] = None) -> None:
+        super().__init__(connection)
+        self.soql = soql
+        self.query_all = query_all
+        self.page_size = page_size
+
+    def create(self) -> str:
+        data = {'operation': 'queryAll' if self.query_all else 'query', 'query': self.soql}
+        self.info = self.connection.handle_api_exceptions('POST', 'jobs/query/', json=data).json()
+        self.job_id = self.info['id']
+        log.debug('Bulk API query job %s created: %s', self.job_id, self.soql)
+        return self.job_id
+
+    def get_page(self, locator: str, cursor_context: Any = None) -> Dict[str, Any]:
+        """Get a page of results in a structure like a REST query response, but records are rows of CSV
+
+        e.g. {'totalSize': 12345, 'records': [['001...', 'Name 1'], ...], 'nextRecordsUrl': 'MTAwMDA'}
+        """
+        assert self.job_id
+        params = {}  # type: Dict[str, Any]
+        if locator:
+            params['locator'] = locator
+        if self.page_size:
+            params['maxRecords'] = self.page_size
+        url_part = 'results?' + urlencode(params) if params else 'results'
+        response = self.connection.handle_api_exceptions('GET', 'jobs/query', self.job_id, url_part,
+                                                         cursor_context=cursor_context)
+        response.encoding = 'utf-8'
+        rows = csv.reader(io.StringIO(response.text))
+        next(rows, None)  # the header
+        ret = {'totalSize': self.info.get('numberRecordsProcessed', -1), 'records': list(rows)}
+        next_locator = response.headers.get('Sforce-Locator')
+        if next_locator and next_locator != 'null':
+            ret['nextRecordsUrl'] = next_locator
+        return ret
+
+
+def ingest(connection: RawConnection, operation: str, object_name: str,
+           records: Sequence[Union[Dict[str, Any], str]],
+           external_id_field: Optional[str] = None, timeout: Optional[float] = None) -> IngestResult:
+    """Insert, update, upsert or delete records by Bulk API 2.0 and return ids and errors
+
+    records:  dicts with values converted by `arg_to_json()` (like for SObject Collections)
+              or strings of ids for 'delete' and 'hardDelete'.
+    More jobs are used if the data are bigger than MAX_UPLOAD_SIZE. All jobs are uploaded
+    before waiting for the first, so that they can be processed concurrently.
+    """
+    dict_records = [{'Id': x} if isinstance(x, str) else x for x in records]
+    columns = []  # type: List[str]
+    for record in dict_records:
+        columns.extend(k for k in record if k not in columns)
+    null_value = '' if operation == 'insert' else NULL_VALUE
+    rows = [tuple(csv_value(record[k], null_value) if k in record else '' for k in columns)
+            for record in dict_records]
+
+    jobs = []  # type: List[Tuple[IngestJob, int, int]]  # job, index of the first row, index after the last row
+    start = 0
+    for csv_data, count in csv_chunks(columns, rows, MAX_UPLOAD_SIZE):
+        job = IngestJob(connection, object_name, operation, external_id_field=external_id_field)
+        job.create()
+        job.upload(csv_data)
+        job.close()
+        jobs.append((job, start, start + count))
+        start += count
+
+    ids = [None] * len(rows)  # type: List[Optional[str]]
+    errors = []  # type: List[Tuple[int, Optional[str], Dict[str, Any]]]
+    # results are not in the original order, but they contain the original columns, possibly with values
+    # normalized by Salesforce. Records with an Id are matched by the Id, other by normalized values.
+    key_columns = ['Id'] if operation != 'insert' and 'Id' in columns else columns
+    for job, start, stop in jobs:
+        job.wait(timeout=timeout)
+        # the job is committed, therefore all matched results are used even if some results can not be matched
+        results = ([(row, True) for row in job.successful_results()]
+                   + [(row, False) for row in job.failed_results()]
+                   + [(row, None) for row in job.unprocessed_records()])
+        matched = match_results(rows[start:stop], columns, key_columns, [row for row, _ in results])
+        for (row, success), index in zip(results, matched):
+            if index is None:
+                log.warning("Bulk API job %s returned a result that does not match any uploaded record: %r",
+                            job.job_id, row)
+            elif success:
+                ids[start + index] = row['sf__Id']
+            elif success is False:
+                errors.append((start + index, row.get('sf__Id') or None, parse_error(row['sf__Error'])))
+            else:
+                errors.append((start + index, None, {'statusCode': 'UNPROCESSED', 'message': 'Record not processed'}))
+        for index in sorted(set(range(stop - start)).difference(matched)):
+            errors.append((start + index, None, {
+                'statusCode': 'UNMATCHED_RESULT', 'fields': [],
+                'message': 'The result of Bulk API job {} can not be matched, the record could have been saved'
+                           .format(job.job_id)}))
+    errors.sort(key=lambda x: x[0])
+    return IngestResult(object_name, ids, errors)
+
+
+def match_results(rows: Sequence[Tuple[str, ...]], columns: List[str], key_columns: List[str],
+                  results: Sequence[Dict[str, str]]) -> List[Optional[int]]:
+    """Match result rows of a job to indexes of uploaded rows, None if a result can not be matched
+
+    Results are matched by normalized values of key columns. A result with a value normalized
+    otherwise by Salesforce (e.g. a picklist value, a formatted phone or a rounded number)
+    is matched to the remaining row with most equal values if no other row has so many.
+    """
+    key_indexes = [columns.index(k) for k in key_columns]
+    indexes = {}  # type: Dict[Tuple[str, ...], List[int]]
+    for i, row in enumerate(rows):
+        indexes.setdefault(tuple(match_key(row[j]) for j in key_indexes), []).append(i)
+    matched = []  # type: List[Optional[int]]
+    for result in results:
+        same_rows = indexes.get(tuple(match_key(result.get(k, '')) for k in key_columns))
+        matched.append(same_rows.pop(0) if same_rows else None)
+    remaining = sorted(i for same_rows in indexes.values() for i in same_rows)
+    for n, result in enumerate(results):
+        if matched[n] is None and remaining:
+            values = [match_key(result.get(k, '')) for k in columns]
+            scores = [sum(value == match_key(rows[i][j]) for j, value in enumerate(values)) for i in remaining]
+            if scores.count(max(scores)) == 1:
+                matched[n] = remaining.pop(scores.index(max(scores)))
+    return matched
+
+
+def csv_value(value: Any, null_value: str) -> str:
+    """Format a value converted by arg_to_json() for CSV"""
+    if value is None:
+        return null_value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def match_key(value: str) -> str:
+    """Normalize a CSV value for matching of result rows to uploaded rows
+
+    e.g. ' 1.50' -> '1.5', 'TRUE' -> 'true', '2021-03-19T14:05:33.000+0200' -> '2021-03-19T12:05:33.000000'
+    """
+    value = value.strip()
+    if value.lower() in ('true', 'false'):
+        return value.lower()
+    if NUMBER_RE.match(value):
+        return str(decimal.Decimal(value).normalize())
+    match = DATETIME_RE.match(value)
+    if match:
+        date_str, fraction, offset = match.groups()
+        dat = datetime.datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S')
+        dat += datetime.timedelta(seconds=float('0.' + (fraction or '0')))
+        if offset and offset != 'Z':
+            offset = offset.replace(':', '')
+            delta = datetime.timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+            dat = dat - delta if offset[0] == '+' else dat + delta
+        return dat.strftime('%Y-%m-%dT%H:%M:%S.%f')
+    return value
+
+
+def csv_chunks(columns: List[str], rows: Sequence[Tuple[str, ...]], max_size: int) -> Iterator[Tuple[bytes, int]]:
+    """Split rows to CSV data with a header, not bigger than max_size, and the numbers of rows"""
+    def encode(row: Sequence[str]) -> bytes:
+        output = io.StringIO()
+        csv.writer(output, lineterminator='\n').writerow(row)
+        return output.getvalue().encode('utf-8')
+
+    header = encode(columns)
+    chunk = [header]
+    size = len(header)
+    for row in rows:
+        line = encode(row)
+        if size + len(line) > max_size and len(chunk) > 1:
+            yield b''.join(chunk), len(chunk) - 1
+            chunk = [header]
+            size = len(header)
+        chunk.append(line)
+        size += len(line)
+    if len(chunk) > 1:
+        yield b''.join(chunk), len(chunk) - 1
+
+
+def parse_error(sf_error: str) -> Dict[str, Any]:
+    """Parse an error of a failed record, e.g. "REQUIRED_FIELD_MISSING:Required fields are missing: [Name]:Name --"
+    """
+    status_code, _, message = sf_error.partition(':')
+    fields = []  # type: List[str]
+    if message.endswith(' --') and ':' in message:
+        message, _, fields_str = message[:-3].rpartition(':')
+        fields = [x for x in fields_str.split(',') if x]
+    return {'statusCode': status_code, 'message': message, 'fields': fields}
+
+
+def use_bulk_api(settings_dict: Dict[str, Any], count: int, bulk_api: Optional[bool] = None,
+                 all_or_none: Optional[bool] = None) -> bool:
+    """Check if Bulk API should be used for `count` records by `bulk_api` parameter or by the threshold"""
+    if bulk_api is not None:
+        if bulk_api and all_or_none:
+            raise NotSupportedError("Bulk API does not support all_or_none=True")
+        return bulk_api
+    threshold = settings_dict.get('OPTIONS', {}).get('BULK_API_THRESHOLD')
+    return threshold is not None and count >= threshold and not all_or_none
@@ -0,0 +1,171 @@
+"""
+Persistent cache of describe() results on disk, revalidated by "If-Modified-Since"
+
+Results of `sobjects/` (describe global) and of `sobjects/X/describe/` are stored in
+files in a directory by org id, API version and sobject name:
+    {DIR}/{org_id}/{api_version}/[tooling/]{sobject}.json
+
+A fresh entry (younger than MAX_AGE) is used without a request. An older entry is
+revalidated by a conditional request with the header "If-Modified-Since" that is
+answered by 304 "Not Modified" with an empty body if the schema is not changed.
+If BACKGROUND is true, a stale entry is returned immediately and it is revalidated
+in a background thread (stale-while-revalidate).
+
+It is enabled by ``OPTIONS['DESCRIBE_CACHE']`` in settings_dict:
+    DIR:        directory of the cache (required)
+    MAX_AGE:    seconds when an entry is used without revalidation (default 3600)
+    BACKGROUND: revalidate stale entries in a background thread (default True)
+"""
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+import requests
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 3600
+GLOBAL_DESCRIBE = '_sobjects'  # a file name for the list of sobjects, it is not a valid sobject name
+
+_Key = Tuple[str, ...]
+_Fetch = Callable[[Dict[str, str]], requests.Response]
+
+
+def org_key(auth_data: Dict[str, str], instance_url: str) -> str:
+    """Org id from the identity url of OAuth data, or the instance host if it is unknown"""
+    match = re.search(r'/id/(\w+)/', auth_data.get('id', ''))
+    if match:
+        return match.group(1)
+    return re.sub(r'\W', '_', re.sub(r'^https?://', '', instance_url))
+
+
+class DescribeCache:
+    """Describe results stored in a directory, thread safe"""
+
+    def __init__(self, directory: str, max_age: float = DEFAULT_MAX_AGE, background: bool = True) -> None:
+        self.directory = directory
+        self.max_age = max_age
+        self.background = background
+        self.lock = threading.Lock()
+        self.refreshing = set()  # type: Set[_Key]
+        self.stats = {'fresh': 0, 'stale': 0, 'not_modified': 0, 'downloaded': 0}
+
+    def get(self, key: _Key, fetch: _Fetch) -> Any:
+        """Get a describe result by the key (org_id, api_version, 'tooling' or '', sobject_name)
+
+        fetch: a function that sends the describe request with additional headers
+        """
+        entry = self._read(key)
+        if entry and time.time() - entry['fetched'] < self.max_age:
+            self._count('fresh')
+            return entry['data']
+        if entry and self.background:
+            self._count('stale')
+            with self.lock:
+                if key in self.refreshing:
+                    return entry['data']
+                self.refreshing.add(key)
+            thread = threading.Thread(target=self._refresh, args=(key, fetch), daemon=True,
+                                      name='salesforce-describe-refresh')
+            thread.start()
+            return entry['data']
+        return self.revalidate(key, entry, fetch)
+
+    def revalidate(self, key: _Key, entry: Optional[Dict[str, Any]], fetch: _Fetch) -> Any:
+        """Request a describe result conditionally if there is an old entry and save it"""
+        headers = {'If-Modified-Since': entry['last_modified']} if entry else {}
+        response = fetch(headers)
+        now = time.time()
+        if entry and response.status_code == 304:
+            self._count('not_modified')
+            entry['fetched'] = now
+        else:
+            self._count('downloaded')
+            entry = {'fetched': now,
+                     'last_modified': response.headers.get('Last-Modified') or formatdate(now, usegmt=True),
+                     'data': response.json(object_pairs_hook=OrderedDict)}
+        self._write(key, entry)
+        return entry['data']
+
+    def statistics(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats)
+
+    def _refresh(self, key: _Key, fetch: _Fetch) -> None:
+        try:
+            # a new copy of the entry, because the returned data could be modified by the caller
+            self.revalidate(key, self._read(key), fetch)
+        except Exception as exc:  # pylint:disable=broad-except
+            log.warning("Describe of %s not refreshed: %r", '/'.join(key), exc)
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def _count(self, name: str) -> None:
+        with self.lock:
+            self.stats[name] += 1
+
+    def _path(self, key: _Key) -> str:
+        parts = [re.sub(r'[^\w.-]', '_', x) for x in key if x]
+        return os.path.join(self.directory, *parts) + '.json'
+
+    def _read(self, key: _Key) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return json.load(f, object_pairs_hook=OrderedDict)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key: _Key, entry: Dict[str, Any]) -> None:
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)  # atomic, a concurrent reader sees the old or the new file
+        except OSError as exc:
+            log.warning("Describe cache not saved to %s: %r", path, exc)
+
+
+_describe_caches = {}  # type: Dict[str, DescribeCache]
+_describe_caches_lock = threading.Lock()
+
+
+def get_describe_cache(settings_dict: Dict[str, Any]) -> Optional[DescribeCache]:
+    """Get the cache configured by OPTIONS['DESCRIBE_CACHE'] or None"""
+    options = settings_dict.get('OPTIONS', {}).get('DESCRIBE_CACHE')
+    if not options:
+        return None
+    with _describe_caches_lock:
+        directory = options['DIR']
+        if directory not in _describe_caches:
+            _describe_caches[directory] = DescribeCache(directory, max_age=options.get('MAX_AGE', DEFAULT_MAX_AGE),
+                                                        background=options.get('BACKGROUND', True))
+        return _describe_caches[directory]
+
+
+def cached_describe(connection: Any, sobject: Optional[str] = None, tooling_api: bool = False) -> Any:
+    """Describe result of a RawConnection: the list of sobjects or the describe of one sobject
+
+    The persistent cache is used if it is configured.
+    """
+    prefix = 'tooling/sobjects' if tooling_api else 'sobjects'
+    url_parts = (prefix, sobject, 'describe/') if sobject else (prefix + '/',)
+    cache = get_describe_cache(connection.settings_dict)
+    if cache is None:
+        return connection.handle_api_exceptions('GET', *url_parts).json(object_pairs_hook=OrderedDict)
+    org_id = org_key(connection.sf_auth.get_auth(), connection.sf_auth.instance_url)
+    key = (org_id, connection.api_ver, 'tooling' if tooling_api else '', sobject or GLOBAL_DESCRIBE)
+
+    def fetch(headers: Dict[str, str]) -> requests.Response:
+        return connection.handle_api_exceptions('GET', *url_parts, headers=headers)
+
+    return cache.get(key, fetch)
@@ -1,35 +1,48 @@
+import collections
+import concurrent.futures
+import dataclasses
 import datetime
 import decimal
+import functools
+import gzip
 import json
 import logging
 import pprint
+import queue
 import re
 import sys
+import threading
 import time
+import traceback
 import warnings
+import weakref
 from dataclasses import dataclass
-from itertools import islice
+from itertools import chain, islice
 from typing import (
-    Any, Callable, cast, Dict, Generic, Iterable, Iterator, List, NamedTuple, Optional,
+    Any, Callable, cast, Deque, Dict, Generic, Iterable, Iterator, List, NamedTuple, Optional,
     overload, Sequence, Tuple, Type, TypeVar, Union,
 )
 from urllib.parse import urlencode
 
 import pytz
 import requests
-from requests.adapters import HTTPAdapter
 
 import salesforce
 from salesforce.auth import SalesforceAuth
 from salesforce.dbapi.common import get_max_retries, get_thread_connections, time_statistics as time_statistics
 from salesforce.dbapi.common import settings  # i.e. django.conf.settings
+from salesforce.dbapi.describe_cache import org_key
+from salesforce.dbapi.governor import api_priority, current_priority, get_governor
+from salesforce.dbapi import instrumentation
+from salesforce.dbapi.pool import get_shared_adapter, pool_statistics
+from salesforce.dbapi.retry import get_retry_policy, Retrying
 from salesforce.dbapi.exceptions import (  # NOQA pylint: disable=unused-import
     Error as Error, InterfaceError as InterfaceError, DatabaseError as DatabaseError, DataError as DataError,
     OperationalError as OperationalError, IntegrityError as IntegrityError, InternalError as InternalError,
     ProgrammingError as ProgrammingError, NotSupportedError as NotSupportedError,
     SalesforceError as SalesforceError, SalesforceWarning as SalesforceWarning,
     warn_sf, FakeReq, FakeResp, GenResponse)
-from salesforce.dbapi.subselect import QQuery, _TRow
+from salesforce.dbapi.subselect import QQuery, _TRow, parse_order_by, parse_retrieve_query, split_in_list
 
 try:
     import beatbox as beatbox  # type: ignore[import]  # pylint: disable=unused-import,useless-import-alias
@@ -46,7 +59,31 @@ SALESFORCE_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f+0000'
 
 # ---
 
-request_count = 0  # global counter
+# A global counter of requests, kept for compatibility. Use `salesforce.dbapi.instrumentation` for metrics.
+request_count = 0
+_request_count_lock = threading.Lock()
+
+# A maximal number of concurrent requests to the same query locator by `Cursor.fetch_parallel()`
+MAX_PARALLEL_WORKERS = 10
+
+# The limit of open query locators per user in Salesforce. Parts of a split query after this
+# number are read completely at once, therefore their locators are not kept open.
+MAX_OPEN_LOCATORS = 10
+
+# The maximal length of a SOQL statement in Salesforce. Longer queries with a big "IN (...)" list
+# are split to more queries if possible. (OPTIONS['MAX_SOQL_LENGTH'])
+MAX_SOQL_LENGTH = 100000
+
+# The maximal number of records retrieved by one SObject Collections request
+RETRIEVE_CHUNK_SIZE = 2000
+
+# The default minimal number of Ids in a query "SELECT fields FROM table WHERE Id IN (...)" that is
+# executed by SObject Collections retrieve requests instead of SOQL (OPTIONS['RETRIEVE_THRESHOLD'])
+# 0 = disabled by default, because the semantic is not exactly the same as of SOQL (see docs)
+RETRIEVE_THRESHOLD = 0
+
+# The default minimal size of a request body compressed by gzip if OPTIONS['GZIP_REQUESTS'] is True
+GZIP_MIN_SIZE = 1024
 
 ErrInfo = Tuple[Type[Exception], Exception]
 
@@ -97,9 +134,25 @@ class RawConnection:
         self.messages = []           # type: List[ErrInfo]
 
         self._sf_session = None      # type: Optional[SfSession]
+        # the connection is used also by worker threads of its cursors (prefetch, parallel and split
+        # queries, concurrent SObject Collections), the session and authentication are shared by them
+        self._lock = threading.Lock()
         self._api_version = settings_dict.get('API_VERSION', salesforce.API_VERSION)  # type: str
         self.debug_verbs = []        # type: List[str]
         self.composite_type = 'sobject-collections'  # 'sobject-collections' or 'composite'
+        # the default look-ahead depth of query pages fetched in background by cursors, 0 = disabled
+        self.prefetch_pages = settings_dict.get('OPTIONS', {}).get('PREFETCH_PAGES', 0)  # type: int
+        # the default number of concurrent SObject Collections requests by sobject_collections_chunks()
+        self.bulk_concurrency = settings_dict.get('OPTIONS', {}).get('BULK_CONCURRENCY', 1)  # type: int
+        # longer queries are split by the longest "IN (...)" list and the parts run by more workers
+        self.max_soql_length = settings_dict.get('OPTIONS', {}).get('MAX_SOQL_LENGTH', MAX_SOQL_LENGTH)  # type: int
+        self.split_query_workers = settings_dict.get('OPTIONS', {}).get('SPLIT_QUERY_WORKERS', 1)  # type: int
+        # queries by a list of Ids are executed by SObject Collections retrieve if it is this long, 0 = disabled
+        self.retrieve_threshold = settings_dict.get('OPTIONS', {}).get('RETRIEVE_THRESHOLD',
+                                                                       RETRIEVE_THRESHOLD)  # type: int
+        # request bodies of this size or bigger are compressed by gzip, None = disabled
+        self.gzip_min_size = get_gzip_min_size(settings_dict)  # type: Optional[int]
+        self.compression_stats = CompressionStats()
 
         self.sf_auth = SalesforceAuth.create_subclass_instance(db_alias=self.alias,
                                                                settings_dict=self.settings_dict)
@@ -165,7 +218,8 @@ class RawConnection:
     @property
     def sf_session(self) -> SfSession:
         if self._sf_session is None:
-            self.make_session()
+            with self._lock:
+                self.make_session()
             assert self._sf_session
         return self._sf_session
 
@@ -178,12 +232,24 @@ class RawConnection:
             sf_session.auth = self.sf_auth  # a name for "requests" package
             if sf_instance_url and sf_instance_url not in sf_session.adapters:
                 # a repeated mount to the same prefix would cause a warning about unclosed SSL socket
-                sf_requests_adapter = HTTPAdapter(max_retries=get_max_retries())
+                # The pool of connections is shared by connections with the same alias in all threads.
+                sf_requests_adapter = get_shared_adapter(self.alias, sf_instance_url, self.settings_dict,
+                                                         max_retries=get_max_retries())
                 sf_session.mount(sf_instance_url, sf_requests_adapter)
             # Additional headers work, but the same are added automatically by "requests' package.
             # sf_session.header = {'accept-encoding': 'gzip, deflate', 'connection': 'keep-alive'}
+            if self.gzip_min_size is not None:
+                # not e.g. "br" or "zstd" that could be added by "requests" if other packages are installed
+                sf_session.headers['Accept-Encoding'] = 'gzip'
             self._sf_session = sf_session
 
+    @property
+    def pool_stats(self) -> Optional[Dict[str, Any]]:
+        """Statistics of the HTTP connection pool shared with other threads (None if not connected yet)"""
+        if self._sf_session is None:
+            return None
+        return pool_statistics().get('{} {}'.format(self.alias, self.sf_auth.instance_url))
+
     def rest_api_url(self, *url_parts_: str, **kwargs: Any) -> str:
         """Join the URL of REST_API
 
@@ -231,7 +297,7 @@ class RawConnection:
     def handle_api_exceptions(self, method: str, *url_parts: str, **kwargs: Any) -> requests.Response:
         """Call REST API and handle exceptions
         Params:
-            method:  'HEAD', 'GET', 'POST', 'PATCH' or 'DELETE'
+            method:  'HEAD', 'GET', 'POST', 'PUT', 'PATCH' or 'DELETE'
             url_parts: like in rest_api_url() method
             api_ver:   like in rest_api_url() method
             kwargs: other parameters passed to requests.request,
@@ -242,8 +308,12 @@ class RawConnection:
                     data=json.dumps(data))
         """
         # The outer part - about error handler
-        assert method in ('HEAD', 'GET', 'POST', 'PATCH', 'DELETE')
+        assert method in ('HEAD', 'GET', 'POST', 'PUT', 'PATCH', 'DELETE')
         cursor_context = kwargs.pop('cursor_context', None)
+        if cursor_context is not None:
+            if 'priority' not in kwargs:
+                kwargs['priority'] = cursor_context.priority
+            kwargs['cursor_event'] = cursor_context.event
         errorhandler = cursor_context.errorhandler if cursor_context else self.errorhandler
         if not errorhandler:
             # nothing is caught usually and error handler not used
@@ -257,38 +327,39 @@ class RawConnection:
 
     def handle_api_exceptions_inter(self, method: str, *url_parts: str, **kwargs: Any) -> requests.Response:
         """The main (middle) part - it is enough if no error occurs."""
-        global request_count  # used only in single thread tests - OK # pylint:disable=global-statement
         # log.info("request %s %s", method, '/'.join(url_parts))
         api_ver = kwargs.pop('api_ver', None)
+        priority = kwargs.pop('priority', None)  # type: Optional[str]  # for the API governor
+        cursor_event = kwargs.pop('cursor_event', None)  # type: Optional[instrumentation.CursorEvent]
         url = self.rest_api_url(*url_parts, api_ver=api_ver)
         # The 'verify' option is about verifying TLS certificates
         kwargs_in = {'timeout': getattr(settings, 'SALESFORCE_QUERY_TIMEOUT', (4, 15)),
                      'verify': True}
         kwargs_in.update(kwargs)
+        retry_policy = get_retry_policy(self.alias, self.settings_dict)
+        retrying = retry_policy.start(method, url, kwargs_in.get('json')) if retry_policy else None
+        if self.gzip_min_size is not None and kwargs_in.get('json') is not None:
+            gzip_json_body(kwargs_in, self.gzip_min_size, self.compression_stats)
         log.debug('Request API URL: %s', url)
-        request_count += 1
+        count_request()
         session = self.sf_session
+        governor = None
+        if self.settings_dict.get('OPTIONS', {}).get('API_GOVERNOR'):
+            governor = get_governor(org_key(session.auth.get_auth(), session.auth.instance_url), self.settings_dict)
+            if governor:
+                governor.acquire(priority)
 
+        event = instrumentation.start_request(method, url, cursor_event)
         try:
-            time_statistics.update_callback(url, self.ping_connection)
-            response = session.request(method, url, **kwargs_in)
-        except requests.exceptions.Timeout:
-            raise SalesforceError("Timeout, URL=%s" % url)
-        except requests.exceptions.ConnectionError as exc:
-            raise SalesforceError("ConnectionError, URL=%s, %r" % (url, exc))
-        if (response.status_code == 401                      # Unauthorized
-                and 'json' in response.headers['content-type']
-                and response.json()[0]['errorCode'] == 'INVALID_SESSION_ID'):
-            # Reauthenticate and retry (expired or invalid session ID or OAuth)
-            token = session.auth.reauthenticate()
-            if token:
-                if 'headers' in kwargs:
-                    kwargs['headers'].update(Authorization='OAuth %s' % token)
-                try:
-                    response = session.request(method, url, **kwargs_in)
-                except requests.exceptions.Timeout:
-                    raise SalesforceError("Timeout, URL=%s" % url)
-
+            response, retries = self._send_request(session, method, url, kwargs_in, retrying)
+        except Exception as exc:
+            if event:
+                instrumentation.end_request(event, error=exc)
+            raise
+        if event:
+            instrumentation.end_request(event, response, retries=retries)
+        if governor:
+            governor.update(response.headers.get('Sforce-Limit-Info'))
         if response.status_code < 400:  # OK
             # 200 "OK" (GET, POST)
             # 201 "Created" (POST)
@@ -296,12 +367,58 @@ class RawConnection:
             # 300 ambiguous items for external ID.
             # 304 "Not Modified" (after conditional HEADER request for metadata),
             self.api_usage.update(response.headers.get('Sforce-Limit-Info'))
+            if self.gzip_min_size is not None:
+                self.compression_stats.add_response(response)
             return response
         # status codes docs (400, 403, 404, 405, 415, 500)
         # https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/errorcodes.htm
         self.raise_errors(response)
         return  # type: ignore[return-value]
 
+    def _send_request(self, session: SfSession, method: str, url: str, kwargs_in: Dict[str, Any],
+                      retrying: Optional[Retrying] = None) -> Tuple[requests.Response, int]:
+        """Send a request, with a retry after reauthentication if the session is expired
+        and with retries by the retry policy OPTIONS['RETRY'] after throttling or temporary errors
+
+        Return the response and the number of retries.
+        """
+        retries = 0
+        while True:
+            try:
+                time_statistics.update_callback(url, self.ping_connection)
+                response = session.request(method, url, **kwargs_in)
+                if (response.status_code == 401                      # Unauthorized
+                        and 'json' in response.headers['content-type']
+                        and response.json()[0]['errorCode'] == 'INVALID_SESSION_ID'):
+                    # Reauthenticate and retry (expired or invalid session ID or OAuth)
+                    token = self._reauthenticate(session, response)
+                    if token:
+                        if 'headers' in kwargs_in:
+                            kwargs_in['headers'].update(Authorization='OAuth %s' % token)
+                        retries += 1
+                        response = session.request(method, url, **kwargs_in)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as exc:
+                delay = retrying.delay(exc=exc) if retrying else None
+                if delay is None:
+                    if isinstance(exc, requests.exceptions.Timeout):
+                        raise SalesforceError("Timeout, URL=%s" % url)
+                    raise SalesforceError("ConnectionError, URL=%s, %r" % (url, exc))
+            else:
+                delay = retrying.delay(response) if retrying else None
+                if delay is None:
+                    return response, retries
+            retries += 1
+            time.sleep(delay)
+
+    def _reauthenticate(self, session: SfSession, response: requests.Response) -> str:
+        """Get a new token, only once if requests of more worker threads failed with the same token"""
+        failed_auth = response.request.headers.get('Authorization') if response.request is not None else None
+        with self._lock:
+            token = session.auth.get_auth().get('access_token')
+            if failed_auth and token and failed_auth != 'OAuth %s' % token:
+                return token  # reauthenticated by another thread
+            return session.auth.reauthenticate()
+
     @staticmethod
     def raise_errors(response: GenResponse) -> None:
         """The innermost part - report errors by exceptions"""
@@ -360,11 +477,37 @@ class RawConnection:
         # https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobjects_collections.htm
         post_data = {'compositeRequest': data, 'allOrNone': True}
         resp = self.handle_api_exceptions('POST', 'composite', json=post_data)
+        return self.check_composite_response(resp, data)
+
+    @classmethod
+    def check_composite_response(cls, resp: requests.Response, data: List[Dict[str, Any]]) -> requests.Response:
+        """Report an error of a subrequest of the 'composite' request by an exception"""
         comp_resp = resp.json()['compositeResponse']
         is_ok = all(x['httpStatusCode'] < 400 for x in comp_resp)
         if is_ok:
             return resp
+        cls.raise_composite_errors(comp_resp, data, resp.headers['Content-Type'])
+        return  # type: ignore[return-value]  # TODO analyze whether this line is accessible in the case of 404 code
+
+    def composite_graph_request(self, graphs: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Call a 'composite/graph' request with more independent graphs of subrequests
 
+        Every graph is processed as an all-or-none transaction. The subrequests of a graph
+        can refer to results of previous subrequests of the same graph by "@{referenceId.id}".
+        Returns the list of graph responses in the original order. Errors are not reported
+        because the successful graphs are committed. A failed graph can be reported by
+        `raise_composite_errors(graph_response['graphResponse']['compositeResponse'], data)`
+        """
+        # https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_graph.htm
+        post_data = {'graphs': [{'graphId': str(i), 'compositeRequest': data} for i, data in enumerate(graphs)]}
+        resp = self.handle_api_exceptions('POST', 'composite/graph', json=post_data)
+        graph_responses = {x['graphId']: x for x in resp.json()['graphs']}
+        return [graph_responses[str(i)] for i in range(len(graphs))]
+
+    @classmethod
+    def raise_composite_errors(cls, comp_resp: List[Dict[str, Any]], data: List[Dict[str, Any]],
+                               content_type: str = 'application/json;charset=UTF-8') -> None:
+        """Report an error of a subrequest of the 'composite' or 'composite/graph' request by an exception"""
         # construct an equivalent of individual bad request/response
         bad_responses = {
             i: x for i, x in enumerate(comp_resp)
@@ -382,13 +525,12 @@ class RawConnection:
         body = [merge_dict(x, referenceId=bad_response['referenceId'])
                 for x in bad_response['body']]
         bad_resp_headers = bad_response['httpHeaders'].copy()
-        bad_resp_headers.update({'Content-Type': resp.headers['Content-Type']})
+        bad_resp_headers.update({'Content-Type': content_type})
 
         bad_resp = FakeResp(bad_response['httpStatusCode'], bad_resp_headers, json.dumps(body), bad_req
                             )  # type: requests.Response # type: ignore[assignment]
 
-        self.raise_errors(bad_resp)
-        return  # type: ignore[return-value]  # TODO analyze whether this line is accessible in the case of 404 code
+        cls.raise_errors(bad_resp)
 
     @staticmethod
     def _group_results(resp_data: List[Dict[str, Any]], records: Sequence[Dict[str, Any]], all_or_none: bool
@@ -418,37 +560,146 @@ class RawConnection:
                                     all_or_none: bool = True
                                     ) -> List[str]:
         # https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_composite.htm
-        # pylint:disable=too-many-locals
+        records, kwargs = self.sobject_collections_params(method, records, all_or_none)
+        resp = self.handle_api_exceptions(method, 'composite/sobjects', **kwargs)
+        return self.sobject_collections_result(resp.json(), records, all_or_none)
+
+    @staticmethod
+    def sobject_collections_params(method: str, records: Sequence[Dict[str, Any]], all_or_none: bool
+                                   ) -> Tuple[Sequence[Dict[str, Any]], Dict[str, Any]]:
+        """Prepare records and parameters of an SObject Collections request"""
         assert method in ('GET', 'POST', 'PATCH', 'DELETE')
         if method == 'DELETE':
             assert all(isinstance(x, str) for x in records)
             ids = cast(Sequence[str], records)
             params = dict(ids=','.join(ids), allOrNone=str(bool(all_or_none)).lower())
-            resp = self.handle_api_exceptions(method, 'composite/sobjects', params=params)
+            return records, {'params': params}
+        assert all(isinstance(x, dict) for x in records)
+        if method in ('POST', 'PATCH'):
+            records = [merge_dict(x, attributes={'type': x['type_']}) for x in records]
+            for x in records:
+                x.pop('type_')
+            post_data = {'records': records, 'allOrNone': all_or_none}
         else:
-            assert all(isinstance(x, dict) for x in records)
-            if method in ('POST', 'PATCH'):
-                records = [merge_dict(x, attributes={'type': x['type_']}) for x in records]
-                for x in records:
-                    x.pop('type_')
-                post_data = {'records': records, 'allOrNone': all_or_none}
-            else:
-                raise NotSupportedError("Method {} not implemended".format(method))
+            raise NotSupportedError("Method {} not implemended, use sobject_collections_retrieve()".format(method))
+        return records, {'json': post_data}
 
-            resp = self.handle_api_exceptions(method, 'composite/sobjects', json=post_data)
-        resp_data = resp.json()
+    def sobject_collections_retrieve(self, table: str, ids: Sequence[str], fields: Sequence[str],
+                                     concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Retrieve records of one table by Ids by SObject Collections requests, by chunks of 2000 Ids
 
-        x_ok, x_err, x_roll = self._group_results(resp_data, records, all_or_none)  # pylint:disable=unused-variable
+        Records are returned in the order of ids, without duplicates and without Ids
+        that are not found (deleted or inaccessible records).
+        concurrency: the maximal number of chunks in progress (default OPTIONS['BULK_CONCURRENCY'] or 1)
+        """
+        # https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobjects_collections_retrieve.htm
+        # POST is used instead of GET, because the url would be too long
+        concurrency = concurrency or self.bulk_concurrency
+        ids = list(dict.fromkeys(ids))
+        chunks = [ids[i:i + RETRIEVE_CHUNK_SIZE] for i in range(0, len(ids), RETRIEVE_CHUNK_SIZE)]
+        priority = current_priority()  # the context is not inherited by threads
+
+        def send(chunk: List[str]) -> List[Optional[Dict[str, Any]]]:
+            with api_priority(priority):
+                return cast(List[Optional[Dict[str, Any]]], self.handle_api_exceptions(
+                    'POST', 'composite/sobjects', table, json={'ids': chunk, 'fields': list(fields)}).json())
+
+        if concurrency <= 1 or len(chunks) <= 1:
+            results = [send(chunk) for chunk in chunks]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(concurrency, len(chunks)),
+                                                       thread_name_prefix='salesforce-chunks') as executor:
+                results = list(executor.map(send, chunks))
+        return [record for result in results for record in result if record is not None]
+
+    @classmethod
+    def sobject_collections_result(cls, resp_data: List[Dict[str, Any]], records: Sequence[Dict[str, Any]],
+                                   all_or_none: bool) -> List[str]:
+        """Get ids from a response of SObject Collections request or report errors by an exception"""
+        # pylint:disable=too-many-locals
+        x_ok, x_err, x_roll = cls._group_results(resp_data, records, all_or_none)  # pylint:disable=unused-variable
         is_ok = not x_err
         if is_ok:
             return [x['id'] for i, x in x_ok]  # for .lastrowid
 
+        raise SalesforceError(cls.error_summary(x_err, len(x_roll), len(x_ok)))
+
+    def sobject_collections_chunks(self,
+                                   method: str,
+                                   records: Sequence[Any],
+                                   all_or_none: Optional[bool] = None,
+                                   concurrency: Optional[int] = None,
+                                   chunk_size: int = 200,
+                                   ) -> List[str]:
+        """SObject Collections requests with any number of records, by chunks sent by concurrent threads
+
+        The semantic of `all_or_none` is applied to every chunk:
+            True:  Chunks are sent sequentially in the original order. No chunk is sent after a failed chunk.
+            None:  No new chunk is sent after a failed chunk, but chunks in progress are finished.
+            False: All chunks are sent.
+        Errors of all chunks are reported together by one SalesforceError with indexes of original records.
+        concurrency: the maximal number of chunks in progress (default OPTIONS['BULK_CONCURRENCY'] or 1)
+        """
+        concurrency = concurrency or self.bulk_concurrency
+        chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+        priority = current_priority()  # the context is not inherited by threads
+
+        def send(chunk: Sequence[Any]) -> Tuple[Sequence[Any], List[Dict[str, Any]]]:
+            chunk, kwargs = self.sobject_collections_params(method, chunk, cast(bool, all_or_none))
+            with api_priority(priority):
+                return chunk, self.handle_api_exceptions(method, 'composite/sobjects', **kwargs).json()
+
+        def is_failed(resp_data: List[Dict[str, Any]]) -> bool:
+            return all_or_none is not False and not all(x['success'] for x in resp_data)
+
+        results = []  # type: List[Tuple[Sequence[Any], List[Dict[str, Any]]]]
+        if all_or_none or concurrency <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                results.append(send(chunk))
+                if is_failed(results[-1][1]):
+                    break
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency,
+                                                             thread_name_prefix='salesforce-chunks')
+            chunks_iter = iter(chunks)
+            futures = collections.deque(executor.submit(send, chunk) for chunk in islice(chunks_iter, concurrency))
+            try:
+                while futures:
+                    results.append(futures.popleft().result())
+                    if is_failed(results[-1][1]):
+                        # only the chunks in progress are finished
+                        results.extend(future.result() for future in futures)
+                        break
+                    futures.extend(executor.submit(send, chunk) for chunk in islice(chunks_iter, 1))
+            finally:
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=True)
+
+        # merge results of chunks
+        ids = []  # type: List[str]
+        x_err = []  # type: List[Tuple[int, Any, Any, str]]
+        count_roll = len(records) - sum(len(chunk) for chunk, _ in results)  # not sent
+        offset = 0
+        for chunk, resp_data in results:
+            x_ok, chunk_err, x_roll = self._group_results(resp_data, chunk, cast(bool, all_or_none))
+            ids.extend(x['id'] for i, x in x_ok)
+            x_err.extend((offset + i, errs, type_, id_) for i, errs, type_, id_ in chunk_err)
+            count_roll += len(x_roll)
+            offset += len(chunk)
+        if x_err:
+            raise SalesforceError(self.error_summary(x_err, count_roll, len(ids)))
+        return ids
+
+    @staticmethod
+    def error_summary(x_err: List[Tuple[int, Any, Any, str]], count_roll: int, count_ok: int) -> List[str]:
+        """Messages of errors of records in a bulk request, one line per error record"""
         width_type = max(len(type_) for i, errs, type_, id_ in x_err)
         width_type = max(width_type, len('sobject'))
         messages = [
             '(see details below)',
             '',
-            'Error Summary: errors={}, rollback/cancel={}, success={}'.format(len(x_err), len(x_roll), len(x_ok)),
+            'Error Summary: errors={}, rollback/cancel={}, success={}'.format(len(x_err), count_roll, count_ok),
             'index {} sobject{:{width}s}error_info'.format(
                 ('ID' + 16 * ' ' if x_err[0][3] else ''), '', width=(width_type + 2 - len('sobject')))
         ]
@@ -458,7 +709,7 @@ class RawConnection:
                 i, id_ or '', type_, errs[0]['statusCode'], errs[0]['message'], field_info,
                 width_type=width_type)
             messages.append(msg)
-        raise SalesforceError(messages)
+        return messages
 
     def ping_connection(self, timeout: float = 1.0) -> float:
         """Fast check the connection by an unimportant request
@@ -539,7 +790,23 @@ class Cursor(Generic[_TRow]):
         self.qquery = None                # type: Optional[QQuery]
         self._raw_iterator = None         # type: Optional[Iterator[Dict[str, Any]]]
         self._iter = not_executed_yet()   # type: Iterator[_TRow]
+        self._prefetcher = None           # type: Optional[PagePrefetcher]
+        self._bulk_job = None             # type: Any  # Optional[bulk2.QueryJob]
+        # first pages of the next parts of a split query, not None if the query has been split
+        self._split_pages = None          # type: Optional[Deque[Dict[str, Any]]]
         self.closed = False
+        # writable: the number of next pages requested in background while the current page
+        # is processed. (0 = disabled)
+        self.prefetch_pages = connection.prefetch_pages
+        # writable: a function `describe(sobject_name)` that returns a describe() result, used
+        # to find types of columns of raw queries, if they are not passed to execute()
+        self.describe = None              # type: Optional[Callable[[str], Dict[str, Any]]]
+        # the priority of requests for the API governor, set from the context by execute()
+        self.priority = None              # type: Optional[str]
+        # writable: seconds of compilation of the next executed query, reported to instrumentation
+        self.compile_time = 0.0
+        # the instrumentation event of the current execution if any hook is registered
+        self.event = None                 # type: Optional[instrumentation.CursorEvent]
 
     # -- DB API methods
 
@@ -550,21 +817,30 @@ class Cursor(Generic[_TRow]):
         self.closed = True
 
     def execute(self, soql: str, parameters: Optional[Iterable[Any]] = None, query_all: bool = False,
-                tooling_api: bool = False) -> None:
+                tooling_api: bool = False, column_types: Optional[Sequence[Optional[str]]] = None,
+                bulk_query: bool = False, result_page: Optional[Dict[str, Any]] = None) -> None:
         self._clean()
-        parameters = parameters or []
+        self.priority = current_priority()  # also for next pages requested later or by threads
+        parameters = list(parameters or [])
+        self.event = instrumentation.start_cursor(soql, self._connection.alias, self.compile_time, parameters)
+        self.compile_time = 0.0
         if 'use_debug_info' in self.connection.debug_verbs:
             processed_soql = str(soql) % tuple(arg_to_soql(x) for x in parameters)
             self.connection.debug_info['soql'] = (soql, parameters, processed_soql)
         sqltype = soql.split(None, 1)[0].upper()
-        if sqltype == 'SELECT':
-            self.execute_select(soql, parameters, query_all=query_all, tooling_api=tooling_api)
-        elif sqltype == 'EXPLAIN':
-            assert not tooling_api
-            self.execute_explain(soql, parameters, query_all=query_all)
-        else:
-            # INSERT UPDATE DELETE
-            raise ProgrammingError("Unexpected command '{}'".format(sqltype))
+        try:
+            if sqltype == 'SELECT':
+                self.execute_select(soql, parameters, query_all=query_all, tooling_api=tooling_api,
+                                    column_types=column_types, bulk_query=bulk_query, result_page=result_page)
+            elif sqltype == 'EXPLAIN':
+                assert not tooling_api
+                self.execute_explain(soql, parameters, query_all=query_all)
+            else:
+                # INSERT UPDATE DELETE
+                raise ProgrammingError("Unexpected command '{}'".format(sqltype))
+        except Exception as exc:
+            self._end_event(exc)
+            raise
 
     def executemany(self, operation: str, seq_of_parameters: Iterable[Iterable[Any]]) -> None:
         self._clean()
@@ -586,6 +862,8 @@ class Cursor(Generic[_TRow]):
         return list(self)
 
     def scroll(self, value: int, mode: str = 'relative') -> None:
+        if self._split_pages is not None:
+            raise NotSupportedError("cursor.scroll is not supported for a query split to more queries")
         # TODO It is a beta based on an undocumented information
         # The undocumented structure of 'nextRecordsUrl' is
         #     'query/{query_id}-{offset}'  e.g.
@@ -601,6 +879,7 @@ class Cursor(Generic[_TRow]):
         assert self._chunk_offset is not None and self.rownumber is not None
         new_offset = int(value) + (0 if mode == 'absolute' else self.rownumber)
         if not self._chunk_offset <= new_offset < self._chunk_offset + len(self._chunk):
+            self._stop_prefetch()
             url = '{}-{}'.format(self.handle, new_offset)
             self.query_more(url)
             self._chunk_offset = new_offset
@@ -611,6 +890,84 @@ class Cursor(Generic[_TRow]):
         self.rownumber = new_offset
         self._iter = iter(self._gen())
 
+    def fetch_parallel(self, workers: int = 4, ordered: bool = True) -> Iterator[_TRow]:
+        """Fetch all remaining rows by concurrent requests to the query locator (an extension)
+
+        The offsets of all pages are computed from `totalSize` of the first response
+        and the pages are requested by a pool of `workers` threads. Rows are yielded
+        in the original order if `ordered` is true, otherwise as the pages arrive.
+        It is useful for big queries where the latency of page-by-page requests dominates.
+
+        Only the current query locator is used by all threads, no new locator is
+        opened, but the number of workers is restricted to MAX_PARALLEL_WORKERS,
+        because the limit of 10 open locators is per user.
+        It is based on the undocumented structure of 'nextRecordsUrl' like `scroll()`.
+        """
+        self._check_data()
+        if self._bulk_job is not None or self._split_pages is not None:
+            # pages of a Bulk API query are chained by locators, they can not be requested in parallel
+            # and a split query has more locators
+            yield from self
+            return
+        assert self.qquery and self._chunk_offset is not None and self.rownumber is not None
+        self._stop_prefetch()
+        workers = max(1, min(workers, MAX_PARALLEL_WORKERS))
+        page_size = len(self._chunk)
+        # records of the current page not consumed yet by the normal iterator
+        rest_of_chunk = list(self._raw_iterator) if self._raw_iterator is not None else self._chunk
+        self.rownumber = self._chunk_offset + page_size - len(rest_of_chunk)
+        slots = []  # type: List[Tuple[int, int]]
+        if self._next_records_url:
+            offset = self._chunk_offset + page_size
+            slots = [(x, min(x + page_size, self.rowcount)) for x in range(offset, self.rowcount, page_size)]
+        # the normal iterator is exhausted now
+        self._next_records_url = None
+        self._iter = iter([])
+        for records in chain([rest_of_chunk], self._fetch_slots(slots, workers, ordered)):
+            rows = self.qquery.parse_rest_response(records, self.rowcount, row_type=self.row_type)
+            if self.event:
+                rows = timed_rows(rows, self.event)
+            for row in rows:
+                yield cast(_TRow, row)
+                self.rownumber += 1
+        self._end_event()
+
+    def _fetch_slots(self, slots: Sequence[Tuple[int, int]], workers: int, ordered: bool
+                     ) -> Iterator[List[Dict[str, Any]]]:
+        """Fetch records of slots (start, stop) by a thread pool with bounded number of pending pages"""
+        slots_iter = iter(slots)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                         thread_name_prefix='salesforce-fetch')
+        futures = collections.deque(executor.submit(self._get_slot, *slot)
+                                    for slot in islice(slots_iter, 2 * workers))
+        try:
+            while futures:
+                if ordered:
+                    done = [futures.popleft()]
+                else:
+                    done_set, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    done = [x for x in futures if x in done_set]
+                    for future in done:
+                        futures.remove(future)
+                for future in done:
+                    records = future.result()
+                    futures.extend(executor.submit(self._get_slot, *slot) for slot in islice(slots_iter, 1))
+                    yield records
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _get_slot(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        """Get records from the offset `start` to `stop`, even if the server returns smaller pages"""
+        records = []  # type: List[Dict[str, Any]]
+        url = '{}-{}'.format(self.handle, start)  # type: Optional[str]
+        while url and len(records) < stop - start:
+            ret = self._get_page(url)
+            records.extend(ret['records'])
+            url = ret.get('nextRecordsUrl')
+        return records[:stop - start]
+
     # .nextset()  not implemented
 
     def setinputsizes(self, sizes: Any) -> None:
@@ -659,35 +1016,197 @@ class Cursor(Generic[_TRow]):
 
         while True:
             self._raw_iterator = iter(self._chunk)
-            for row in self.qquery.parse_rest_response(self._raw_iterator, self.rowcount,
-                                                       row_type=self.row_type):
+            if self._next_records_url and self.prefetch_pages > 0 and self._prefetcher is None:
+                # the next pages are requested while the rows of this page are parsed and consumed
+                self._prefetcher = PagePrefetcher(self, self._next_records_url, self.prefetch_pages)
+            if self._bulk_job is None:
+                rows = self.qquery.parse_rest_response(self._raw_iterator, self.rowcount, row_type=self.row_type)
+            else:
+                rows = self.qquery.parse_csv_rows(cast(Iterator[Sequence[str]], self._raw_iterator),
+                                                  row_type=self.row_type)
+            if self.event:
+                # rows are parsed lazily also with instrumentation, the rest of the page is used by fetch_parallel
+                rows = timed_rows(rows, self.event)
+            for row in rows:
                 yield cast(_TRow, row)
                 self.rownumber += 1
-            if not self._next_records_url:
-                break
             new_offset = self._chunk_offset + len(self._chunk)
-            self.query_more(self._next_records_url)
+            try:
+                if not self._next_records_url:
+                    self._prefetcher = None
+                    if not self._split_pages:
+                        self._end_event()
+                        break
+                    # continue by the next part of a split query
+                    self._set_page(self._split_pages.popleft())
+                elif self._prefetcher:
+                    self._check()
+                    self._set_page(self._prefetcher.get())
+                else:
+                    self.query_more(self._next_records_url)
+            except Exception as exc:
+                self._end_event(exc)
+                raise
             self._chunk_offset = new_offset
 
     def execute_select(self, soql: str, parameters: Iterable[Any], query_all: bool = False,
-                       tooling_api: bool = False) -> None:
+                       tooling_api: bool = False, column_types: Optional[Sequence[Optional[str]]] = None,
+                       bulk_query: bool = False, result_page: Optional[Dict[str, Any]] = None) -> None:
+        """Execute a SELECT query
+
+        bulk_query: The query is executed by a Bulk API 2.0 query job and the result is read
+            by pages of CSV. It is ignored for queries that are not supported by Bulk API,
+            e.g. aggregations, COUNT() or subqueries.
+        result_page: A complete result of the same query from a cache, e.g. from `single_page`
+            of a previous cursor, that is used instead of a request.
+        """
+        parameters = list(parameters)
         processed_sql = str(soql) % tuple(arg_to_soql(x) for x in parameters)
         service = '' if not tooling_api else 'tooling/'
         service += 'query' if not query_all else 'queryAll'
 
         self.qquery = qquery = QQuery(soql)
+        if column_types is None and self.describe and not tooling_api:
+            column_types = qquery.column_types_from_describe(self.describe)
+        if column_types is None or len(column_types) != len(qquery.aliases):
+            column_types = [None] * len(qquery.aliases)
+        qquery.set_column_types(column_types)
         # TODO better description
-        self.description = [(alias, None, None, None, name) for alias, name in
-                            zip(qquery.aliases, qquery.fields)]
-
-        url_part = '/?'.join((service, urlencode(dict(q=processed_sql))))
-        self.query_more(url_part)
+        self.description = qquery.description(column_types)
+
+        if bulk_query and not (tooling_api or qquery.is_aggregation or qquery.is_plain_count
+                               or qquery.has_child_rel_field):
+            from salesforce.dbapi import bulk2  # pylint:disable=cyclic-import,import-outside-toplevel
+            self._bulk_job = bulk2.QueryJob(self._connection, processed_sql, query_all=query_all)
+            self._bulk_job.create()
+            self._bulk_job.wait()
+            self.handle = self._bulk_job.job_id
+            self.query_more('')
+            self._chunk_offset = 0
+            self.rownumber = 0
+            self._iter = iter(self._gen())
+            return
+        retrieve = parse_retrieve_query(soql) if result_page is None and service == 'query' else None
+        if (retrieve and 0 < self._connection.retrieve_threshold <= len(parameters)
+                and all(isinstance(x, str) for x in parameters)
+                and self._execute_retrieve(retrieve[0], retrieve[1], cast(List[str], parameters))):
+            return
+        if (len(processed_sql) > self._connection.max_soql_length and result_page is None
+                and (qquery.is_plain_count or not qquery.is_aggregation)):
+            parts = split_in_list(soql, parameters, lambda x: len(str(arg_to_soql(x))),
+                                  self._connection.max_soql_length)
+            if parts and self._execute_split(service, parts):
+                return
+        if result_page is not None:
+            self._set_page(result_page)
+        else:
+            url_part = '/?'.join((service, urlencode(dict(q=processed_sql))))
+            self.query_more(url_part)
         self._chunk_offset = 0
         self.rownumber = 0
         if self._next_records_url:
             self.handle = self._next_records_url.split('-')[0]
         self._iter = iter(self._gen())
 
+    def _execute_split(self, service: str, parts: List[Tuple[str, List[Any]]]) -> bool:
+        """Execute parts of a query split by an "IN (...)" list and merge the results to one stream
+
+        ORDER BY and LIMIT are applied again to the merged rows and the count of
+        "SELECT COUNT()" is summed. Return False if the query can not be split,
+        e.g. if it is ordered by a field that is not selected.
+        """
+        assert self.qquery
+        qquery = self.qquery
+        soql = parts[0][0]
+        order = self._order_columns(soql)
+        if order is None:
+            return False
+        match_limit = re.search(r'\bLIMIT\s+(\d+)\s*$', soql, re.I)
+        limit = int(match_limit.group(1)) if match_limit else None
+        complete = bool(order or limit is not None)  # all pages are necessary to order the rows
+
+        def get_part(index: int) -> Dict[str, Any]:
+            part_soql, part_params = parts[index]
+            processed_sql = part_soql % tuple(arg_to_soql(x) for x in part_params)
+            ret = self._get_page('/?'.join((service, urlencode(dict(q=processed_sql)))))
+            if complete or index >= MAX_OPEN_LOCATORS:
+                while ret.get('nextRecordsUrl'):
+                    next_page = self._get_page(ret['nextRecordsUrl'])
+                    ret = dict(next_page, records=ret['records'] + next_page['records'])
+            return ret
+
+        log.debug("A query of length %d is split to %d parts", len(soql), len(parts))
+        self._check()
+        workers = max(1, min(self._connection.split_query_workers, MAX_PARALLEL_WORKERS, len(parts)))
+        if workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                       thread_name_prefix='salesforce-split') as executor:
+                pages = list(executor.map(get_part, range(len(parts))))
+        else:
+            pages = [get_part(index) for index in range(len(parts))]
+        self._chunk_offset = 0
+        self.rownumber = 0
+        if qquery.is_plain_count:
+            self._split_pages = collections.deque()
+            self._set_page({'totalSize': 0, 'records': []})
+            self.rowcount = sum(x['totalSize'] for x in pages)
+        elif complete:
+            self._split_pages = collections.deque()
+            self._set_ordered_rows([record for page in pages for record in page['records']], order, limit)
+            return True
+        else:
+            self._split_pages = collections.deque(pages[1:])
+            self._set_page(pages[0])
+            self.rowcount = sum(x['totalSize'] for x in pages)
+        self._iter = iter(self._gen())
+        return True
+
+    def _execute_retrieve(self, table: str, fields: List[str], ids: List[str]) -> bool:
+        """Execute a query "SELECT fields FROM table WHERE Id IN (ids)" by SObject Collections retrieve requests
+
+        Records are returned in the order of ids, if the query is not ordered.
+        Return False if the query can not be executed this way.
+        """
+        assert self.qquery
+        order = self._order_columns(self.qquery.soql or '')
+        if order is None:
+            return False
+        records = self._connection.sobject_collections_retrieve(table, ids, fields)
+        self._chunk_offset = 0
+        self.rownumber = 0
+        if order:
+            self._set_ordered_rows(records, order)
+        else:
+            self._set_page({'totalSize': len(records), 'records': records})
+            self._iter = iter(self._gen())
+        return True
+
+    def _order_columns(self, soql: str) -> Optional[List[Tuple[int, bool, bool]]]:
+        """ORDER BY of the query as (column index, descending, nulls_last) or None if not all are selected"""
+        assert self.qquery
+        order = []  # type: List[Tuple[int, bool, bool]]
+        aliases_lower = [x.lower() for x in self.qquery.aliases]
+        root_prefix = '{}.'.format(self.qquery.root_table).lower()
+        for field, descending, nulls_last in parse_order_by(soql):
+            field = field.lower()
+            if field.startswith(root_prefix):
+                field = field[len(root_prefix):]
+            if field not in aliases_lower:
+                return None
+            order.append((aliases_lower.index(field), descending, nulls_last))
+        return order
+
+    def _set_ordered_rows(self, records: List[Dict[str, Any]], order: List[Tuple[int, bool, bool]],
+                          limit: Optional[int] = None) -> None:
+        """Set the result to records sorted by `order` of parsed columns and truncated to `limit`"""
+        assert self.qquery
+        rows = self.qquery.parse_rest_response(records, len(records), row_type=list)
+        pairs = sorted(zip(rows, records), key=functools.cmp_to_key(lambda a, b: compare_rows(a[0], b[0], order)))
+        self._chunk = [record for _, record in pairs][:limit]
+        self._next_records_url = None
+        self.rowcount = len(self._chunk)
+        self._iter = iter(self._gen())
+
     def execute_explain(self, soql: str, parameters: Iterable[Any], query_all: bool = False) -> None:
         # https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/dome_query_explain.htm
         self._clean()
@@ -706,17 +1225,49 @@ class Cursor(Generic[_TRow]):
         self.rownumber = 0
         self._iter = iter(self._gen())
 
+    @property
+    def single_page(self) -> Optional[Dict[str, Any]]:
+        """The complete result of the last REST API query in the raw format if it has only one page"""
+        if (self.qquery is None or self._bulk_job is not None or self._chunk_offset != 0 or self._next_records_url
+                or self._split_pages is not None):
+            return None
+        return {'totalSize': self.rowcount, 'records': self._chunk}
+
     def query_more(self, nextRecordsUrl: str) -> None:
         self._check()
+        self._set_page(self._get_page(nextRecordsUrl))
+
+    def _get_page(self, nextRecordsUrl: str) -> Dict[str, Any]:
+        """Request a page of query results (without checking the thread, can run in a prefetch thread)"""
+        if self._bulk_job is not None:
+            # the "url" is a locator of a page of a Bulk API query job
+            return cast(Dict[str, Any], self._bulk_job.get_page(nextRecordsUrl, cursor_context=self))
         if len(nextRecordsUrl) < 15500:
-            ret = self.handle_api_exceptions('GET', nextRecordsUrl).json()
+            response = self._connection.handle_api_exceptions('GET', nextRecordsUrl, cursor_context=self)
+            t_0 = time.perf_counter()
+            ret = response.json()
+            if self.event:
+                self.event.add(decode_time=time.perf_counter() - t_0)
         else:
-            ret = self.connection.handle_api_exceptions_big('GET', nextRecordsUrl).json()
+            ret = self._connection.handle_api_exceptions_big('GET', nextRecordsUrl).json()
             ret = ret['compositeResponse'][0]['body']
-        self.rowcount = ret['totalSize']  # may be more accurate than the initial approximate value
+        return cast(Dict[str, Any], ret)
+
+    def _set_page(self, ret: Dict[str, Any]) -> None:
+        if self._split_pages is None:
+            self.rowcount = ret['totalSize']  # may be more accurate than the initial approximate value
         self._chunk = ret['records']
         self._next_records_url = ret.get('nextRecordsUrl')
 
+    def _end_event(self, error: Optional[BaseException] = None) -> None:
+        if self.event:
+            instrumentation.end_cursor(self.event, self.rownumber or 0, error)
+
+    def _stop_prefetch(self) -> None:
+        if self._prefetcher:
+            self._prefetcher.stop()
+            self._prefetcher = None
+
     def _check(self) -> None:
         if not self.connection:
             raise InterfaceError("Cursor Closed")
@@ -726,6 +1277,9 @@ class Cursor(Generic[_TRow]):
             raise ProgrammingError('No previous .execute("select...") before .fetch...()')
 
     def _clean(self) -> None:
+        self._stop_prefetch()
+        self._end_event()
+        self.event = None
         self.description = None
         self.rowcount = -1
         self.rownumber = None
@@ -737,6 +1291,8 @@ class Cursor(Generic[_TRow]):
         self.handle = None
         self.qquery = None
         self._raw_iterator = None
+        self._bulk_job = None
+        self._split_pages = None
         self._iter = not_executed_yet()
         self._check()
 
@@ -773,6 +1329,74 @@ class Cursor(Generic[_TRow]):
         return self.handle_api_exceptions('GET', '', api_ver='').json()
 
 
+class PagePrefetcher:
+    """Request the next pages of a query locator in a background thread
+
+    The pages are requested sequentially, because the url of the next page is
+    known only from the previous page. At most `depth` pages are waiting
+    in the queue and one more page can be requested, therefore the memory is
+    bounded. Exceptions are re-raised in the consumer thread by `get()`.
+    The cursor is referenced weakly and prefetching is stopped when an abandoned
+    cursor is garbage collected, e.g. after `break` from an iterator.
+    """
+    put_timeout = 1.0  # seconds between checks of a stopped prefetcher while the queue is full
+
+    def __init__(self, cursor: 'Cursor[Any]', nextRecordsUrl: str, depth: int) -> None:
+        self.cursor_ref = weakref.ref(cursor)
+        self.queue = queue.Queue(maxsize=depth)  # type: queue.Queue[Any]
+        self.stopped = threading.Event()
+        weakref.finalize(cursor, self.stopped.set)
+        self.thread = threading.Thread(target=self._run, args=(nextRecordsUrl,), daemon=True,
+                                       name='salesforce-prefetch')
+        self.thread.start()
+
+    def _run(self, url: Optional[str]) -> None:
+        # pylint:disable=protected-access,broad-except
+        try:
+            while url and not self.stopped.is_set():
+                cursor = self.cursor_ref()
+                if cursor is None:
+                    break
+                ret = cursor._get_page(url)
+                del cursor
+                if not self._put(ret):
+                    break
+                url = ret.get('nextRecordsUrl')
+        except Exception as exc:
+            # the traceback should not keep the cursor alive while the exception waits in the queue
+            cursor = None
+            traceback.clear_frames(exc.__traceback__)
+            if not self.stopped.is_set():
+                self._put(exc)
+
+    def _put(self, item: Any) -> bool:
+        """Put an item to the queue, unless the prefetcher is stopped while waiting"""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=self.put_timeout)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self) -> Dict[str, Any]:
+        """Get the next page in the original order"""
+        ret = self.queue.get()
+        if isinstance(ret, Exception):
+            raise ret
+        return cast(Dict[str, Any], ret)
+
+    def stop(self) -> None:
+        """Stop prefetching after the current request (without waiting for it)"""
+        self.stopped.set()
+        # release the thread if it is blocked by a full queue
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+
 # ---
 
 CursorDescription = NamedTuple(
@@ -809,6 +1433,7 @@ class ApiUsage:
     # see https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/headers_api_usage.htm
     api_usage: int  # API requests used per last 24 hours
     api_limit: int  # API requests limit pe 24 hours
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock, repr=False, compare=False)
 
     def update(self, sforce_limit_info: Optional[str]) -> None:
         # example: .update('api-usage=692/5000000')
@@ -816,13 +1441,118 @@ class ApiUsage:
             key, val = sforce_limit_info.split('=')
             assert key == 'api-usage'
             api_usage_s, api_limit_s = val.split('/')
-            self.api_usage = int(api_usage_s)
-            self.api_limit = int(api_limit_s)
+            with self.lock:
+                self.api_usage = int(api_usage_s)
+                self.api_limit = int(api_limit_s)
+
+
+@dataclass
+class CompressionStats:
+    """Sizes of compressed bodies of requests and responses of one connection (OPTIONS['GZIP_REQUESTS'])"""
+    requests: int = 0                 # number of compressed request bodies
+    request_bytes: int = 0            # their original size
+    request_bytes_sent: int = 0       # their compressed size
+    responses: int = 0                # number of compressed responses
+    response_bytes: int = 0           # their decompressed size
+    response_bytes_received: int = 0  # their size by Content-Length
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.request_bytes - self.request_bytes_sent + self.response_bytes - self.response_bytes_received
+
+    def add_request(self, size: int, compressed_size: int) -> None:
+        with self.lock:
+            self.requests += 1
+            self.request_bytes += size
+            self.request_bytes_sent += compressed_size
+
+    def add_response(self, response: GenResponse) -> None:
+        # a chunked response without Content-Length is not counted
+        headers = response.headers
+        if headers.get('Content-Encoding') == 'gzip' and headers.get('Content-Length'):
+            size = len(response.content)
+            with self.lock:
+                self.responses += 1
+                self.response_bytes += size
+                self.response_bytes_received += int(headers['Content-Length'])
+
+
+def get_gzip_min_size(settings_dict: Dict[str, Any]) -> Optional[int]:
+    """The minimal size of a request body compressed by gzip from OPTIONS['GZIP_REQUESTS']"""
+    value = settings_dict.get('OPTIONS', {}).get('GZIP_REQUESTS', False)  # type: Union[bool, int]
+    if value is True:
+        return GZIP_MIN_SIZE
+    if value is False or value is None:
+        return None
+    return int(value)
+
+
+def gzip_json_body(kwargs: Dict[str, Any], min_size: int, stats: CompressionStats) -> None:
+    """Replace a parameter json=... in request kwargs by gzip compressed data if it is big enough"""
+    # serialized like by "requests" package
+    body = json.dumps(kwargs['json'], allow_nan=False).encode('utf-8')
+    if len(body) < min_size:
+        return
+    compressed = gzip.compress(body, compresslevel=6)
+    if len(compressed) >= len(body):
+        return
+    del kwargs['json']
+    kwargs['data'] = compressed
+    headers = dict(kwargs.get('headers') or {})
+    headers.update({'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+    kwargs['headers'] = headers
+    stats.add_request(len(body), len(compressed))
 
 
 # --- private
 
 
+def compare_rows(row_a: Sequence[Any], row_b: Sequence[Any], order: Sequence[Tuple[int, bool, bool]]) -> int:
+    """Compare rows like ORDER BY in SOQL, by items (column index, descending, nulls_last)
+
+    Null values are sorted first by default, also for DESC. Strings are compared case insensitive.
+    """
+    for idx, descending, nulls_last in order:
+        val_a, val_b = row_a[idx], row_b[idx]
+        if val_a is None or val_b is None:
+            if val_a is None and val_b is None:
+                continue
+            return (1 if val_a is None else -1) * (1 if nulls_last else -1)
+        if isinstance(val_a, str) and isinstance(val_b, str):
+            val_a, val_b = val_a.lower(), val_b.lower()
+        if val_a == val_b:
+            continue
+        result = -1 if val_a < val_b else 1
+        return -result if descending else result
+    return 0
+
+
+def count_request() -> None:
+    """Increment the global counter `request_count` (thread safe)"""
+    global request_count  # pylint:disable=global-statement
+    with _request_count_lock:
+        request_count += 1
+
+
+def timed_rows(rows: Iterable[_TRow], event: instrumentation.CursorEvent) -> Iterator[_TRow]:
+    """Yield rows parsed lazily and add the time of parsing to the cursor event"""
+    parse_time = 0.0
+    iterator = iter(rows)
+    try:
+        while True:
+            t_0 = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                parse_time += time.perf_counter() - t_0
+            yield row
+    finally:
+        event.add(parse_time=parse_time)
+
+
 def not_executed_yet() -> Iterator[_TRow]:
     raise Connection.InterfaceError("called fetch...() before execute()")
     yield  # pylint:disable=unreachable
@@ -140,6 +140,10 @@ class LicenseError(OperationalError):
     pass
 
 
+class ApiLimitError(OperationalError):
+    """A request refused by the API governor, before the daily limit of API requests is exhausted"""
+
+
 def prepare_exception(obj: Union[Error, SalesforceWarning],
                       messages: Optional[Union[str, List[str]]] = None,
                       response: Optional[GenResponse] = None,
@@ -0,0 +1,192 @@
+"""
+Process-wide governor of API requests by org, driven by the header "Sforce-Limit-Info"
+
+All connections of all threads to the same org share one governor that knows the
+latest API usage reported by any response (e.g. "api-usage=692/5000000").
+Every request is tagged by a priority, 'interactive' (default) or 'batch', and
+the governor enforces these policies before the request is sent:
+    - a token bucket: at most RATE requests per second, with bursts of BURST requests
+    - a soft brake: 'batch' requests are delayed by SOFT_DELAY seconds after SOFT_LIMIT %
+      of the daily limit is used
+    - 'batch' requests are refused by ApiLimitError after BATCH_LIMIT %, therefore
+      a runaway batch job can not exhaust the quota reserved for interactive requests
+    - all requests are refused after HARD_LIMIT %
+
+It is enabled by ``OPTIONS['API_GOVERNOR']`` in settings_dict, a dict (or True for defaults):
+    RATE:        requests per second (default None = unlimited)
+    BURST:       the size of the token bucket (default max(RATE, 1))
+    SOFT_LIMIT:  percent of the daily limit (default 80)
+    SOFT_DELAY:  seconds (default 1.0)
+    BATCH_LIMIT: percent of the daily limit (default 90)
+    HARD_LIMIT:  percent of the daily limit (default 98)
+
+The priority is set by `qs.sf(priority='batch')` for querysets or by the context manager
+`api_priority('batch')` for any code.
+"""
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from salesforce.dbapi.exceptions import ApiLimitError
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PRIORITIES = (INTERACTIVE, BATCH)
+
+DEFAULT_SOFT_LIMIT = 80.0
+DEFAULT_SOFT_DELAY = 1.0
+DEFAULT_BATCH_LIMIT = 90.0
+DEFAULT_HARD_LIMIT = 98.0
+
+_current_priority = contextvars.ContextVar('salesforce_api_priority', default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def api_priority(priority: Optional[str]) -> Iterator[None]:
+    """Set the priority of API requests in this context, e.g. `with api_priority('batch'): ...`
+
+    None is the current priority (no change).
+    """
+    if priority is None:
+        yield
+        return
+    if priority not in PRIORITIES:
+        raise ValueError("Invalid priority {!r}, expected one of {}".format(priority, PRIORITIES))
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+class ApiGovernor:
+    """Policies of API requests to one org, thread safe"""
+
+    # pylint:disable=too-many-instance-attributes
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None,
+                 soft_limit: float = DEFAULT_SOFT_LIMIT, soft_delay: float = DEFAULT_SOFT_DELAY,
+                 batch_limit: float = DEFAULT_BATCH_LIMIT, hard_limit: float = DEFAULT_HARD_LIMIT) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate or 1, 1)
+        self.soft_limit = soft_limit
+        self.soft_delay = soft_delay
+        self.batch_limit = batch_limit
+        self.hard_limit = hard_limit
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.api_usage = None  # type: Optional[int]  # the last reported usage per 24 hours
+        self.api_limit = None  # type: Optional[int]
+        self.stats = {'requests': 0, 'delayed': 0, 'refused': 0, 'wait_time': 0.0}  # type: Dict[str, Any]
+
+    @property
+    def usage_percent(self) -> Optional[float]:
+        if self.api_usage is None or not self.api_limit:
+            return None
+        return 100.0 * self.api_usage / self.api_limit
+
+    def acquire(self, priority: Optional[str] = None) -> None:
+        """Wait until a request of the priority is allowed or raise ApiLimitError"""
+        delay = self.reserve(priority)
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, priority: Optional[str] = None) -> None:
+        """Wait asynchronously until a request of the priority is allowed or raise ApiLimitError"""
+        delay = self.reserve(priority)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def reserve(self, priority: Optional[str] = None) -> float:
+        """Reserve a request of the priority and return the seconds to wait or raise ApiLimitError"""
+        priority = priority or current_priority()
+        percent = self.usage_percent
+        if percent is not None:
+            limit = self.batch_limit if priority == BATCH else self.hard_limit
+            if percent >= limit:
+                with self.lock:
+                    self.stats['refused'] += 1
+                raise ApiLimitError(
+                    "API requests with priority {!r} are stopped after {:g}% of the daily limit: {}/{}".format(
+                        priority, limit, self.api_usage, self.api_limit))
+        delay = self.soft_delay if priority == BATCH and percent is not None and percent >= self.soft_limit else 0.0
+        with self.lock:
+            self.stats['requests'] += 1
+            if delay:
+                self.stats['delayed'] += 1
+            if self.rate:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                # the token is reserved now, possibly in the future, that is equivalent to a queue
+                self.tokens -= 1
+                if self.tokens < 0:
+                    delay = max(delay, -self.tokens / self.rate)
+            self.stats['wait_time'] += delay
+        return delay
+
+    def update(self, sforce_limit_info: Optional[str]) -> None:
+        """Update the API usage from the header "Sforce-Limit-Info" of a response"""
+        # example: .update('api-usage=692/5000000')
+        if sforce_limit_info:
+            for item in sforce_limit_info.split(','):
+                key, val = item.strip().split('=')
+                if key == 'api-usage':
+                    api_usage_s, api_limit_s = val.split('/')
+                    with self.lock:
+                        self.api_usage = int(api_usage_s)
+                        self.api_limit = int(api_limit_s)
+
+    def statistics(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.stats, wait_time=round(self.stats['wait_time'], 6),
+                        api_usage=self.api_usage, api_limit=self.api_limit)
+
+
+_governors = {}  # type: Dict[str, ApiGovernor]
+_governors_lock = threading.Lock()
+
+
+def get_governor(org_id: str, settings_dict: Dict[str, Any]) -> Optional[ApiGovernor]:
+    """Get the governor of an org configured by OPTIONS['API_GOVERNOR'] or None"""
+    options = settings_dict.get('OPTIONS', {}).get('API_GOVERNOR')
+    if not options:
+        return None
+    try:
+        return _governors[org_id]
+    except KeyError:
+        pass
+    if options is True:
+        options = {}
+    with _governors_lock:
+        if org_id not in _governors:
+            _governors[org_id] = ApiGovernor(
+                rate=options.get('RATE'), burst=options.get('BURST'),
+                soft_limit=options.get('SOFT_LIMIT', DEFAULT_SOFT_LIMIT),
+                soft_delay=options.get('SOFT_DELAY', DEFAULT_SOFT_DELAY),
+                batch_limit=options.get('BATCH_LIMIT', DEFAULT_BATCH_LIMIT),
+                hard_limit=options.get('HARD_LIMIT', DEFAULT_HARD_LIMIT))
+        return _governors[org_id]
+
+
+def governor_statistics() -> Dict[str, Dict[str, Any]]:
+    """Statistics of governors by org id
+
+    e.g. {'00D000000000001': {'requests': 1234, 'delayed': 10, 'refused': 0, 'wait_time': 12.5,
+          'api_usage': 4100, 'api_limit': 5000}}
+    """
+    with _governors_lock:
+        return {org_id: governor.statistics() for org_id, governor in _governors.items()}
+
+
+def reset_governors() -> None:
+    """Forget all governors, e.g. after a change of settings"""
+    with _governors_lock:
+        _governors.clear()
@@ -0,0 +1,343 @@
+"""
+Instrumentation of API requests and cursor executions by pluggable hooks
+
+A hook is an object with methods called synchronously by the driver
+(a subclass of `Hook` that overrides only some of them):
+    request_start(event: RequestEvent), request_end(event: RequestEvent)
+    cursor_start(event: CursorEvent),   cursor_end(event: CursorEvent)
+Hooks are registered by `add_hook(hook)` and removed by `remove_hook(hook)`.
+Events are created only if some hook is registered. An exception in a hook
+is logged and it does not affect the request.
+
+A request event is about one HTTP request to the REST API: method, url, endpoint class
+(e.g. 'query', 'collections', 'describe'), status code, bytes out and in, number of
+retries and duration. A cursor event is about one execution of a SOQL query and
+fetching of its rows: SOQL template, rows, number of requests and the time split
+to compile (by the Django backend), network, JSON decode and row parse.
+
+Events can be labeled by the context manager `labels(view='contact_list')`,
+e.g. in a middleware, to find which views use the most of API requests.
+
+Provided hooks:
+    MetricsAggregator: in-process counters by endpoint class and by SOQL template
+    LoggingHook:       a log record for every finished request and cursor execution
+    OpenTelemetryHook: spans created by an OpenTelemetry tracer (or a compatible object)
+"""
+import contextlib
+import contextvars
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+_current_labels = contextvars.ContextVar('salesforce_instrumentation_labels', default=())  # type: Any
+
+
+@contextlib.contextmanager
+def labels(**kwargs: str) -> Iterator[None]:
+    """Add labels to events of requests and queries in this context"""
+    new_labels = tuple(sorted(dict(_current_labels.get(), **kwargs).items()))
+    token = _current_labels.set(new_labels)
+    try:
+        yield
+    finally:
+        _current_labels.reset(token)
+
+
+def current_labels() -> _Labels:
+    return _current_labels.get()  # type: ignore[no-any-return]
+
+
+@dataclass
+class RequestEvent:
+    # pylint:disable=too-many-instance-attributes
+    method: str
+    url: str
+    endpoint: str                       # a class of the endpoint, see `endpoint_class()`
+    labels: _Labels = ()
+    start_time: float = 0.0             # by time.perf_counter()
+    status_code: Optional[int] = None   # None if no response is received
+    bytes_out: int = 0                  # size of the request body
+    bytes_in: int = 0                   # size of the response body
+    retries: int = 0
+    duration: float = 0.0               # seconds
+    error: Optional[BaseException] = None
+    cursor: Optional['CursorEvent'] = None  # the cursor execution that requested it, if any
+    context: Dict[str, Any] = field(default_factory=dict)  # for private data of hooks, e.g. a span
+
+
+@dataclass
+class CursorEvent:
+    # pylint:disable=too-many-instance-attributes
+    soql: str                           # the SOQL template with "%s" parameters
+    alias: Optional[str] = None
+    params: Sequence[Any] = ()
+    labels: _Labels = ()
+    start_time: float = 0.0
+    rows: int = 0                       # rows returned to the caller
+    requests: int = 0
+    compile_time: float = 0.0           # seconds of compilation of a queryset to SOQL
+    network_time: float = 0.0
+    decode_time: float = 0.0            # JSON decode
+    parse_time: float = 0.0             # conversion of records to rows
+    duration: float = 0.0               # from execute() to the last row or close
+    error: Optional[BaseException] = None
+    finished: bool = False
+    context: Dict[str, Any] = field(default_factory=dict)
+
+    def add(self, **kwargs: float) -> None:
+        """Add values to counters, also from threads of a parallel fetch"""
+        with _event_lock:
+            for name, value in kwargs.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+_event_lock = threading.Lock()
+
+
+class Hook:
+    """Base class of instrumentation hooks, with methods that do nothing"""
+
+    def request_start(self, event: RequestEvent) -> None:
+        pass
+
+    def request_end(self, event: RequestEvent) -> None:
+        pass
+
+    def cursor_start(self, event: CursorEvent) -> None:
+        pass
+
+    def cursor_end(self, event: CursorEvent) -> None:
+        pass
+
+
+# registered hooks, replaced as a whole by a new tuple, therefore they are read without a lock
+_hooks = ()  # type: Tuple[Hook, ...]
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook: Hook) -> None:
+    global _hooks  # pylint:disable=global-statement
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+
+
+def remove_hook(hook: Hook) -> None:
+    global _hooks  # pylint:disable=global-statement
+    with _hooks_lock:
+        _hooks = tuple(x for x in _hooks if x is not hook)
+
+
+def is_enabled() -> bool:
+    return bool(_hooks)
+
+
+def _call(method_name: str, event: Any) -> None:
+    for hook in _hooks:
+        try:
+            getattr(hook, method_name)(event)
+        except Exception:  # pylint:disable=broad-except
+            log.exception("Instrumentation hook %r failed in %s", hook, method_name)
+
+
+ENDPOINT_PATTERNS = [
+    (re.compile(r'^tooling/'), 'tooling'),
+    (re.compile(r'^query(?:All)?\b'), 'query'),
+    (re.compile(r'^composite/sobjects\b'), 'collections'),
+    (re.compile(r'^composite/graph\b'), 'graph'),
+    (re.compile(r'^composite\b'), 'composite'),
+    (re.compile(r'^jobs/'), 'bulk'),
+    (re.compile(r'^sobjects/(?:[^/]+/)?describe\b|^sobjects/?$'), 'describe'),
+    (re.compile(r'^sobjects/'), 'sobject'),
+]
+
+
+def endpoint_class(url: str) -> str:
+    """A class of the REST API endpoint from the url, e.g. 'query', 'collections', 'describe', 'sobject'"""
+    path = re.sub(r'^(?:\w+://[^/]*)?(?:/services/data/v[\d.]+/)?', '', url).split('?', 1)[0]
+    for pattern, name in ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return name
+    return path.split('/', 1)[0] or 'other'
+
+
+def start_request(method: str, url: str, cursor: Optional[CursorEvent] = None) -> Optional[RequestEvent]:
+    """Create an event of a request and call hooks, or return None if instrumentation is not enabled"""
+    if not _hooks:
+        return None
+    event = RequestEvent(method, url, endpoint_class(url), labels=cursor.labels if cursor else current_labels(),
+                         start_time=time.perf_counter(), cursor=cursor)
+    _call('request_start', event)
+    return event
+
+
+def end_request(event: RequestEvent, response: Any = None, error: Optional[BaseException] = None,
+                retries: int = 0) -> None:
+    event.duration = time.perf_counter() - event.start_time
+    event.error = error
+    event.retries = retries
+    if response is not None:
+        event.status_code = response.status_code
+        body = getattr(getattr(response, 'request', None), 'body', None)
+        event.bytes_out = len(body) if body else 0
+        event.bytes_in = len(response.content or b'')
+    if event.cursor:
+        event.cursor.add(requests=1 + retries, network_time=event.duration)
+    _call('request_end', event)
+
+
+def start_cursor(soql: str, alias: Optional[str] = None, compile_time: float = 0.0, params: Sequence[Any] = ()
+                 ) -> Optional[CursorEvent]:
+    if not _hooks:
+        return None
+    event = CursorEvent(soql, alias=alias, params=params, labels=current_labels(), start_time=time.perf_counter(),
+                        compile_time=compile_time)
+    _call('cursor_start', event)
+    return event
+
+
+def end_cursor(event: CursorEvent, rows: int, error: Optional[BaseException] = None) -> None:
+    if event.finished:
+        return
+    event.finished = True
+    event.duration = time.perf_counter() - event.start_time
+    event.rows = rows
+    event.error = error
+    _call('cursor_end', event)
+
+
+class MetricsAggregator(Hook):
+    """Counters of requests by (endpoint, method, labels) and of queries by (SOQL, labels)
+
+    Counters are updated without a lock: every thread updates its own counters
+    and they are summed by `snapshot()`.
+    """
+
+    REQUEST_FIELDS = ('count', 'errors', 'retries', 'bytes_out', 'bytes_in', 'time')
+    CURSOR_FIELDS = ('count', 'errors', 'rows', 'requests', 'compile_time', 'network_time', 'decode_time',
+                     'parse_time', 'time')
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._all_counters = []  # type: List[Dict[Tuple[Any, ...], List[float]]]
+
+    def _counters(self) -> Dict[Tuple[Any, ...], List[float]]:
+        try:
+            return self._local.counters  # type: ignore[no-any-return]
+        except AttributeError:
+            counters = {}  # type: Dict[Tuple[Any, ...], List[float]]
+            self._local.counters = counters
+            self._all_counters.append(counters)  # atomic
+            return counters
+
+    def _add(self, key: Tuple[Any, ...], values: Tuple[float, ...]) -> None:
+        counters = self._counters()
+        item = counters.get(key)
+        if item is None:
+            counters[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                item[i] += value
+
+    def request_end(self, event: RequestEvent) -> None:
+        self._add(('request', event.endpoint, event.method, event.labels),
+                  (1, int(event.error is not None or (event.status_code or 0) >= 400), event.retries,
+                   event.bytes_out, event.bytes_in, event.duration))
+
+    def cursor_end(self, event: CursorEvent) -> None:
+        self._add(('cursor', event.soql, event.labels),
+                  (1, int(event.error is not None), event.rows, event.requests, event.compile_time,
+                   event.network_time, event.decode_time, event.parse_time, event.duration))
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Summed counters: {'requests': [{endpoint, method, labels, count, ...}], 'queries': [{soql, ...}]}"""
+        totals = {}  # type: Dict[Tuple[Any, ...], List[float]]
+        for counters in list(self._all_counters):
+            for key, values in list(counters.items()):
+                values = list(values)
+                if key in totals:
+                    totals[key] = [a + b for a, b in zip(totals[key], values)]
+                else:
+                    totals[key] = values
+        out = {'requests': [], 'queries': []}  # type: Dict[str, List[Dict[str, Any]]]
+        for key, values in sorted(totals.items(), key=lambda x: -x[1][0]):
+            if key[0] == 'request':
+                item = dict(endpoint=key[1], method=key[2], labels=dict(key[3]))
+                item.update(zip(self.REQUEST_FIELDS, values))
+                out['requests'].append(item)
+            else:
+                item = dict(soql=key[1], labels=dict(key[2]))
+                item.update(zip(self.CURSOR_FIELDS, values))
+                out['queries'].append(item)
+        return out
+
+    def reset(self) -> None:
+        for counters in list(self._all_counters):
+            counters.clear()
+
+
+class LoggingHook(Hook):
+    """Log every finished request and cursor execution"""
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO) -> None:
+        self.logger = logger or log
+        self.level = level
+
+    def request_end(self, event: RequestEvent) -> None:
+        self.logger.log(self.level, "%s %s %s status=%s out=%d in=%d retries=%d time=%.3f%s",
+                        event.endpoint, event.method, event.url, event.status_code, event.bytes_out,
+                        event.bytes_in, event.retries, event.duration,
+                        ' error=%r' % event.error if event.error else '')
+
+    def cursor_end(self, event: CursorEvent) -> None:
+        self.logger.log(self.level, "SOQL %s rows=%d requests=%d compile=%.3f network=%.3f decode=%.3f "
+                        "parse=%.3f time=%.3f%s", event.soql, event.rows, event.requests, event.compile_time,
+                        event.network_time, event.decode_time, event.parse_time, event.duration,
+                        ' error=%r' % event.error if event.error else '')
+
+
+class OpenTelemetryHook(Hook):
+    """Spans for requests and cursor executions by an OpenTelemetry-style tracer
+
+    The tracer is e.g. `opentelemetry.trace.get_tracer(__name__)` or any object with
+    a method `start_span(name, attributes=...)` that returns a span with methods
+    `set_attribute(key, value)`, `record_exception(exc)` and `end()`.
+    """
+
+    def __init__(self, tracer: Any) -> None:
+        self.tracer = tracer
+
+    def request_start(self, event: RequestEvent) -> None:
+        event.context['span'] = self.tracer.start_span('salesforce {}'.format(event.endpoint), attributes={
+            'http.request.method': event.method, 'url.full': event.url, 'salesforce.endpoint': event.endpoint,
+            **{'salesforce.label.' + k: v for k, v in event.labels}})
+
+    def request_end(self, event: RequestEvent) -> None:
+        span = event.context.pop('span')
+        if event.status_code is not None:
+            span.set_attribute('http.response.status_code', event.status_code)
+        span.set_attribute('http.request.body.size', event.bytes_out)
+        span.set_attribute('http.response.body.size', event.bytes_in)
+        span.set_attribute('salesforce.retries', event.retries)
+        if event.error is not None:
+            span.record_exception(event.error)
+        span.end()
+
+    def cursor_start(self, event: CursorEvent) -> None:
+        event.context['span'] = self.tracer.start_span('salesforce query', attributes={
+            'db.system': 'salesforce', 'db.statement': event.soql,
+            **{'salesforce.label.' + k: v for k, v in event.labels}})
+
+    def cursor_end(self, event: CursorEvent) -> None:
+        span = event.context.pop('span')
+        for name in ('rows', 'requests', 'compile_time', 'network_time', 'decode_time', 'parse_time'):
+            span.set_attribute('salesforce.' + name, getattr(event, name))
+        if event.error is not None:
+            span.record_exception(event.error)
+        span.end()
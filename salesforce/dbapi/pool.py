@@ -0,0 +1,159 @@
+"""
+HTTP connection pools shared by connections of all threads with the same alias
+
+Every thread has its own RawConnection and its own session (with cursors
+and authentication isolated), but all sessions with the same alias and
+instance url use the same HTTPAdapter, therefore the same pool of open TLS
+connections. A connection that has been used by one thread can be reused by
+another thread without a new handshake.
+
+Worker threads of a cursor (prefetched pages, parallel and split queries,
+concurrent SObject Collections) use the RawConnection of the calling thread,
+its session and its authentication. The connection reauthenticates only once
+if more workers fail with the same expired token, and its counters are locked.
+
+The pool is configured by ``OPTIONS`` in settings_dict:
+    POOL_CONNECTIONS: the number of cached pools for different hosts (default 10)
+    POOL_MAXSIZE:     the maximal number of open connections to one host (default 10)
+    POOL_BLOCK:       wait for a free connection if all POOL_MAXSIZE are used, instead of
+                      opening a temporary connection that is not saved to the pool. (default False)
+
+Occupancy of pools and time of waiting for a connection can be monitored by `pool_statistics()`.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from requests.adapters import DEFAULT_POOLBLOCK, DEFAULT_POOLSIZE, HTTPAdapter
+from urllib3 import PoolManager
+
+
+class PoolStatistics:
+    """Thread safe counters of a shared pool"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.lock = threading.Lock()
+        self.maxsize = maxsize
+        self.requests = 0
+        self.in_use = 0       # requests in progress now
+        self.max_in_use = 0
+        self.wait_time = 0.0  # total time of waiting for a connection from the pool [seconds]
+        self.max_wait_time = 0.0
+
+    def start_request(self) -> None:
+        with self.lock:
+            self.requests += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def end_request(self) -> None:
+        with self.lock:
+            self.in_use -= 1
+
+    def add_wait(self, wait_time: float) -> None:
+        with self.lock:
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'maxsize': self.maxsize, 'requests': self.requests, 'in_use': self.in_use,
+                    'max_in_use': self.max_in_use, 'wait_time': round(self.wait_time, 6),
+                    'max_wait_time': round(self.max_wait_time, 6)}
+
+
+class MonitoredPoolManager(PoolManager):
+    """PoolManager that measures the time of getting a connection from its pools"""
+
+    def __init__(self, *args: Any, stats: PoolStatistics, **kwargs: Any) -> None:
+        self.stats = stats
+        super().__init__(*args, **kwargs)
+
+    def _new_pool(self, *args: Any, **kwargs: Any) -> Any:
+        pool = super()._new_pool(*args, **kwargs)
+        get_conn = pool._get_conn  # pylint:disable=protected-access
+        stats = self.stats
+
+        def timed_get_conn(timeout: Optional[float] = None) -> Any:
+            t_0 = time.monotonic()
+            try:
+                return get_conn(timeout=timeout)
+            finally:
+                stats.add_wait(time.monotonic() - t_0)
+
+        pool._get_conn = timed_get_conn  # pylint:disable=protected-access
+        return pool
+
+
+class SharedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that is shared by sessions of more threads
+
+    It can not be closed by a session, only by `close_pools()`.
+    """
+
+    def __init__(self, pool_connections: int = DEFAULT_POOLSIZE, pool_maxsize: int = DEFAULT_POOLSIZE,
+                 max_retries: int = 0, pool_block: bool = DEFAULT_POOLBLOCK) -> None:
+        self.stats = PoolStatistics(pool_maxsize)
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                         max_retries=max_retries, pool_block=pool_block)
+
+    def init_poolmanager(self, connections: int, maxsize: int, block: bool = DEFAULT_POOLBLOCK,
+                         **pool_kwargs: Any) -> None:
+        # pylint:disable=attribute-defined-outside-init
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = MonitoredPoolManager(num_pools=connections, maxsize=maxsize, block=block,
+                                                stats=self.stats, **pool_kwargs)
+
+    def send(self, request: Any, *args: Any, **kwargs: Any) -> Any:  # pylint:disable=signature-differs
+        self.stats.start_request()
+        try:
+            return super().send(request, *args, **kwargs)
+        finally:
+            self.stats.end_request()
+
+    def close(self) -> None:
+        """Ignore closing by a session of one thread"""
+
+    def close_pool(self) -> None:
+        super().close()
+
+
+_shared_adapters = {}  # type: Dict[Tuple[Optional[str], str], SharedHTTPAdapter]
+_shared_adapters_lock = threading.Lock()
+
+
+def get_shared_adapter(alias: Optional[str], instance_url: str, settings_dict: Dict[str, Any], max_retries: int
+                       ) -> SharedHTTPAdapter:
+    """Get the adapter for an alias and instance url, created by the first connection"""
+    options = settings_dict.get('OPTIONS', {})
+    with _shared_adapters_lock:
+        key = (alias, instance_url)
+        if key not in _shared_adapters:
+            _shared_adapters[key] = SharedHTTPAdapter(
+                pool_connections=options.get('POOL_CONNECTIONS', DEFAULT_POOLSIZE),
+                pool_maxsize=options.get('POOL_MAXSIZE', DEFAULT_POOLSIZE),
+                max_retries=max_retries,
+                pool_block=options.get('POOL_BLOCK', DEFAULT_POOLBLOCK),
+            )
+        return _shared_adapters[key]
+
+
+def pool_statistics() -> Dict[str, Dict[str, Any]]:
+    """Statistics of all shared pools by "alias instance_url"
+
+    e.g. {'salesforce https://na1.salesforce.com': {'maxsize': 10, 'requests': 1234, 'in_use': 2,
+          'max_in_use': 7, 'wait_time': 0.0, 'max_wait_time': 0.0}}
+    """
+    with _shared_adapters_lock:
+        return {'{} {}'.format(alias, url): adapter.stats.as_dict()
+                for (alias, url), adapter in _shared_adapters.items()}
+
+
+def close_pools() -> None:
+    """Close all shared pools, e.g. before a fork of the process"""
+    with _shared_adapters_lock:
+        for adapter in _shared_adapters.values():
+            adapter.close_pool()
+        _shared_adapters.clear()
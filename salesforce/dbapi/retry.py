@@ -0,0 +1,243 @@
+"""
+Retry policy of REST API requests after throttling, temporary errors and lock contention
+
+Retried conditions:
+    - errors reported by these error codes (for all methods):
+        UNABLE_TO_LOCK_ROW      the transaction is rolled back after a lock timeout
+        REQUEST_LIMIT_EXCEEDED  too many concurrent requests (not the daily limit "TotalRequests")
+        SERVER_UNAVAILABLE
+    - 503 Service Unavailable (for all methods), the request has not been processed
+    - 500, 502, 504 and timeouts or connection errors only for idempotent methods
+      (GET, HEAD, PUT, DELETE and "composite" requests with only GET subrequests)
+    - a response of SObject Collections or of a "composite" request with HTTP status 200, where
+      no record has been saved and all errors are UNABLE_TO_LOCK_ROW or rolled back by allOrNone.
+      That is the most frequent error of bulk writes of related records.
+Non-idempotent requests (POST, PATCH) are retried only if it is sure that nothing has been saved.
+
+The delay is by "decorrelated jitter": a random value between BASE_DELAY and three times
+the previous delay, at most MAX_DELAY, but at least by the header "Retry-After".
+No retry is started if the total time of the request with retries would exceed TIME_BUDGET.
+
+It is enabled by ``OPTIONS['RETRY']`` in settings_dict, a dict (or True for defaults):
+    MAX_RETRIES:  the maximal number of retries of a request (default 4)
+    BASE_DELAY:   seconds (default 0.5)
+    MAX_DELAY:    seconds (default 20)
+    TIME_BUDGET:  seconds of the request including all retries and delays (default 60)
+    NON_IDEMPOTENT: retry also POST and PATCH if nothing has been saved (default True)
+"""
+import email.utils
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+log = logging.getLogger(__name__)
+
+RETRY_ERROR_CODES = ('UNABLE_TO_LOCK_ROW', 'REQUEST_LIMIT_EXCEEDED', 'SERVER_UNAVAILABLE')
+ROLLED_BACK_CODES = ('ALL_OR_NONE_OPERATION_ROLLED_BACK', 'PROCESSING_HALTED')
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+IDEMPOTENT_STATUS_CODES = (500, 502, 503, 504)
+
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 20.0
+DEFAULT_TIME_BUDGET = 60.0
+
+
+class RetryPolicy:
+    """Rules of retries of requests by one database alias, with statistics, thread safe"""
+
+    # pylint:disable=too-many-instance-attributes
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = DEFAULT_BASE_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY, time_budget: float = DEFAULT_TIME_BUDGET,
+                 non_idempotent: bool = True) -> None:
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.time_budget = time_budget
+        self.non_idempotent = non_idempotent
+        self.random = random.Random()
+        self.lock = threading.Lock()
+        self.stats = {'retries': 0, 'recovered': 0, 'gave_up': 0, 'wait_time': 0.0,
+                      'reasons': {}}  # type: Dict[str, Any]
+
+    def start(self, method: str, url: str, json_data: Any = None) -> 'Retrying':
+        """The state of retries of one request. `json_data` is the request body before compression."""
+        idempotent = method in IDEMPOTENT_METHODS or (
+            method == 'POST' and url.rstrip('/').endswith('/composite') and isinstance(json_data, dict)
+            and all(x.get('method') == 'GET' for x in json_data.get('compositeRequest', [{}])))
+        return Retrying(self, method, url, idempotent)
+
+    def reason(self, method: str, url: str, idempotent: bool, response: Any = None,
+               exc: Optional[BaseException] = None) -> Optional[str]:
+        """The reason of a retry of the response or exception, or None if it should not be retried"""
+        # pylint:disable=too-many-return-statements
+        if exc is not None:
+            if isinstance(exc, requests.exceptions.ConnectTimeout):
+                return 'connect timeout'  # the request has not been sent
+            return type(exc).__name__ if idempotent else None
+        status = response.status_code
+        if status < 300:
+            return self.unsaved_batch_reason(method, url, response) if status == 200 else None
+        error_code = first_error_code(response)
+        if error_code == 'REQUEST_LIMIT_EXCEEDED' and 'TotalRequests' in response.text:
+            return None  # the daily limit is not renewed by waiting seconds
+        if error_code in RETRY_ERROR_CODES:
+            return error_code
+        if status == 503 or (idempotent and status in IDEMPOTENT_STATUS_CODES):
+            return 'HTTP {}'.format(status)
+        return None
+
+    @staticmethod
+    def unsaved_batch_reason(method: str, url: str, response: Any) -> Optional[str]:
+        """A retryable error code if nothing is saved by SObject Collections or by composite request"""
+        url = url.split('?')[0].rstrip('/')
+        if method == 'GET' or not ('/composite/sobjects' in url or url.endswith('/composite')):
+            return None
+        try:
+            data = json.loads(response.text)
+        except ValueError:
+            return None
+        if isinstance(data, dict) and 'compositeResponse' in data:
+            results = data['compositeResponse']
+            if any(x['httpStatusCode'] < 400 for x in results):
+                return None
+            codes = [err.get('errorCode') for x in results for err in x['body'] if isinstance(x['body'], list)]
+        elif isinstance(data, list) and data and all(isinstance(x, dict) and 'success' in x for x in data):
+            if any(x['success'] for x in data):
+                return None
+            codes = [err.get('statusCode') for x in data for err in x['errors']]
+        else:
+            return None
+        retryable = [x for x in codes if x not in ROLLED_BACK_CODES]
+        if retryable and all(x in RETRY_ERROR_CODES for x in retryable):
+            return retryable[0]
+        return None
+
+    def count(self, reason: Optional[str], delay: float = 0.0, gave_up: bool = False) -> None:
+        with self.lock:
+            if gave_up:
+                self.stats['gave_up'] += 1
+            elif reason is None:
+                self.stats['recovered'] += 1
+            else:
+                self.stats['retries'] += 1
+                self.stats['wait_time'] += delay
+                self.stats['reasons'][reason] = self.stats['reasons'].get(reason, 0) + 1
+
+    def statistics(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.stats, wait_time=round(self.stats['wait_time'], 6), reasons=dict(self.stats['reasons']))
+
+
+class Retrying:
+    """The state of retries of one request"""
+
+    def __init__(self, policy: RetryPolicy, method: str, url: str, idempotent: bool) -> None:
+        self.policy = policy
+        self.method = method
+        self.url = url
+        self.idempotent = idempotent
+        self.start_time = time.monotonic()
+        self.retries = 0
+        self.prev_delay = policy.base_delay
+
+    def delay(self, response: Any = None, exc: Optional[BaseException] = None) -> Optional[float]:
+        """Seconds to wait before the next retry or None if the response should be returned (or exc raised)"""
+        policy = self.policy
+        reason = None
+        if self.idempotent or policy.non_idempotent or exc is not None:
+            reason = policy.reason(self.method, self.url, self.idempotent, response, exc)
+        if reason is None:
+            if self.retries:
+                policy.count(None)
+            return None
+        # decorrelated jitter
+        delay = min(policy.max_delay, policy.random.uniform(policy.base_delay, self.prev_delay * 3))
+        self.prev_delay = delay
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if (self.retries >= policy.max_retries
+                or time.monotonic() - self.start_time + delay > policy.time_budget):
+            policy.count(reason, gave_up=True)
+            log.warning("Request %s %s is not retried any more after %d retries: %s",
+                        self.method, self.url, self.retries, reason)
+            return None
+        self.retries += 1
+        policy.count(reason, delay)
+        log.info("Retry %d of %s %s after %.3f s: %s", self.retries, self.method, self.url, delay, reason)
+        return delay
+
+
+def first_error_code(response: Any) -> Optional[str]:
+    if 'json' not in response.headers.get('Content-Type', ''):
+        return None
+    try:
+        data = json.loads(response.text)
+    except ValueError:
+        return None
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        return data[0].get('errorCode')
+    return None
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds by the header Retry-After, that is a number of seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+_policies = {}  # type: Dict[Optional[str], RetryPolicy]
+_policies_lock = threading.Lock()
+
+
+def get_retry_policy(alias: Optional[str], settings_dict: Dict[str, Any]) -> Optional[RetryPolicy]:
+    """Get the retry policy of a database alias configured by OPTIONS['RETRY'] or None"""
+    options = settings_dict.get('OPTIONS', {}).get('RETRY')
+    if not options:
+        return None
+    try:
+        return _policies[alias]
+    except KeyError:
+        pass
+    if options is True:
+        options = {}
+    with _policies_lock:
+        if alias not in _policies:
+            _policies[alias] = RetryPolicy(
+                max_retries=options.get('MAX_RETRIES', DEFAULT_MAX_RETRIES),
+                base_delay=options.get('BASE_DELAY', DEFAULT_BASE_DELAY),
+                max_delay=options.get('MAX_DELAY', DEFAULT_MAX_DELAY),
+                time_budget=options.get('TIME_BUDGET', DEFAULT_TIME_BUDGET),
+                non_idempotent=options.get('NON_IDEMPOTENT', True))
+        return _policies[alias]
+
+
+def retry_statistics() -> Dict[Optional[str], Dict[str, Any]]:
+    """Statistics of retry policies by database alias
+
+    e.g. {'salesforce': {'retries': 12, 'recovered': 10, 'gave_up': 1, 'wait_time': 9.5,
+          'reasons': {'UNABLE_TO_LOCK_ROW': 9, 'HTTP 503': 3}}}
+    """
+    with _policies_lock:
+        return {alias: policy.statistics() for alias, policy in _policies.items()}
+
+
+def reset_retry_policies() -> None:
+    """Forget all retry policies, e.g. after a change of settings"""
+    with _policies_lock:
+        _policies.clear()
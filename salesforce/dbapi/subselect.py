@@ -14,12 +14,21 @@ Especially DISTANCE and GEOLOCATION are not trivial because they would
 require a combined parser for parentheses and commas.
 
 Unsupported GROUP BY ROLLUP and GROUP BY CUBE (their syntax for reports).
+
+Parsed SOQL templates are cached as immutable plans in a process wide LRU cache
+of the size `settings.SF_QUERY_PLAN_CACHE_SIZE` (default 512, 0 = no cache),
+because the same template is usually executed many times with different parameters.
 """
-from typing import Any, Callable, Dict, Iterable, List, Optional, overload, Sequence, Type, TypeVar, Tuple, Union
+from collections import OrderedDict
+from typing import (
+    Any, Callable, Dict, Iterable, List, NamedTuple, Optional, overload, Sequence, Type, TypeVar, Tuple, Union,
+)
 import datetime
 import re
+import threading
 import pytz
-from salesforce.dbapi.exceptions import ProgrammingError
+from salesforce.dbapi.common import settings
+from salesforce.dbapi.exceptions import NotSupportedError, ProgrammingError
 
 _TRow = TypeVar('_TRow', Tuple[Any, ...], List[Any], Dict[str, Any])
 _T = TypeVar('_T')
@@ -43,6 +52,8 @@ AGGREGATION_WORDS = set((
 pattern_aggregation = re.compile(r'\b(?:{})(?=\()'.format('|'.join(AGGREGATION_WORDS)), re.I)
 pattern_groupby = re.compile(r'\bGROUP BY\b', re.I)
 
+DEFAULT_QUERY_PLAN_CACHE_SIZE = 512
+
 
 class QQuery:
     """Parse the SOQL query to an object useful to correctly interpret a response.
@@ -67,9 +78,15 @@ class QQuery:
     def __init__(self, soql: Optional[str] = None) -> None:
         self.soql = None                  # type: Optional[str]
         self.fields = []                  # type: List[Union[str, QQuery]]
-        # dictionary of chil to parent relationships - lowercase keys
-        self.subroots = {}                # type: Dict[str, Any]  # recursive is Any
         self.aliases = []                 # type: List[str]
+        # the projector: lowercase paths to values in a nested response record, one path by alias
+        self.paths = []                   # type: List[Tuple[str, ...]]
+        # converters of values by column types, None = no conversion. (the default is guessing)
+        self.converters = []              # type: List[Optional[Callable[[Any], Any]]]
+        # converters of strings from a CSV result of Bulk API to values like in a JSON response
+        self.csv_converters = []          # type: List[Callable[[str], Any]]
+        # the case of keys in responses, found by the first record: {lowercase_key: key}
+        self._response_keys = {}          # type: Dict[str, str]
         self.root_table = None            # type: Optional[str]
         # is_aggregation: only to know if aliases are relevant for output
         self.is_aggregation = False
@@ -78,86 +95,101 @@ class QQuery:
         # after optional alias), usually WHERE...
         self.extra_soql = None            # type: Optional[str]
         self.subqueries = None            # type: Optional[List[Tuple[str, Any]]]
+        self.plan = None                  # type: Optional[QueryPlan]
         if soql:
             self._from_sql(soql)
 
     def _from_sql(self, soql: str) -> None:
         """Create Force.com SOQL tree structure from SOQL"""
-        # pylint:disable=too-many-branches,too-many-nested-blocks
         assert not self.soql, "Don't use _from_sql method directly"
-        self.soql = soql
-        soql, self.subqueries = split_subquery(soql)
-        match_parse = re.match(r'SELECT (.*) FROM (\w+)\b(.*)$', soql, re.I)
-        if not match_parse:
-            raise ProgrammingError('Invalid SQL: %s' % self.soql)
-        fields_sql, self.root_table, self.extra_soql = match_parse.groups()
-        fields = [x.strip() for x in fields_sql.split(',')]
-        self.is_aggregation = bool(pattern_groupby.search(self.extra_soql) or
-                                   pattern_aggregation.search(fields[0]))
-        self.is_plain_count = fields[0].upper() == 'COUNT()'
-        consumed_subqueries = 0
-        expr_alias_counter = 0
-        #
-        if not self.is_plain_count:
-            out_field = ''  # type: Union[str, QQuery]
-            for field in fields:
-                if self.is_aggregation:
-                    match = re.search(r'\b\w+$', field)
-                    if match:
-                        alias = match.group()
-                        assert alias not in RESERVED_WORDS, "invalid alias name"
-                        if match.start() > 0 and field[match.start() - 1] == ' ':
-                            out_field = field = field[match.start() - 1]
-                    else:
-                        alias = 'expr{}'.format(expr_alias_counter)
-                        expr_alias_counter += 1
-                    assert '&' not in field, "Subquery not expected as field in aggregation query"
-                elif '&' in field:
-                    assert field == '(&)'  # verify that the subquery was in parentheses
-                    subquery = QQuery(self.subqueries[consumed_subqueries][0])
-                    consumed_subqueries += 1
-                    self.has_child_rel_field = True
-                    out_field = subquery
-                    # TODO more child relationships to the same table
-                    alias = nz(subquery.root_table)
-                else:
-                    alias = out_field = field
-                    if '.' in alias:
-                        if alias.split('.', 1)[0].lower() == self.root_table.lower():
-                            alias = alias.split('.', 1)[1]
-                        if '.' in alias:
-                            # prepare paths for possible empty outer joins
-                            subroots = self.subroots
-                            root_crumbs = alias.lower().split('.')[:-1]
-                            for scrumb in root_crumbs:
-                                subroots.setdefault(scrumb, {})
-                                subroots = subroots[scrumb]
-                self.aliases.append(alias)
-                self.fields.append(out_field)
-        # TODO it is not currently necessary to parse the exta_soql
-
-    def _make_flat(self, row_dict: Dict[str, Any], path: Tuple[str, ...], subroots: Dict[str, Dict[str, Any]]
-                   ) -> Dict[str, Any]:
-        """Replace the nested dict objects by a flat dict with keys "object.object.name"."""
-        # can get a cursor parameter, if introspection should be possible on the fly
-        out = {}
-        for k, v in row_dict.items():
-            klc = k.lower()  # "key lower case"
-            if (not (isinstance(v, dict) and 'attributes' in v)
-                    or ('done' in v and 'records' in v and 'totalSize' in v)):
-                # :
-                if klc not in subroots:
-                    out[klc] = v
-                else:
-                    strpath = '.'.join(path + (klc,)) + '.'
-                    strip_pos = len(strpath) - len(klc + '.')
-                    for alias in self.aliases:
-                        if alias.lower().startswith(strpath):
-                            out[alias.lower()[strip_pos:]] = None  # empty outer join field names
-            else:
-                new_subroots = subroots[klc] if k != 'attributes' else {}
-                for sub_k, sub_v in self._make_flat(v, path + (klc,), new_subroots).items():
-                    out[k.lower() + '.' + sub_k] = sub_v
+        plan = get_query_plan(soql)
+        self.plan = plan
+        self.soql = plan.soql
+        self.fields = list(plan.fields)
+        self.aliases = list(plan.aliases)
+        self.paths = list(plan.paths)
+        self.root_table = plan.root_table
+        self.extra_soql = plan.extra_soql
+        self.subqueries = plan.subqueries
+        self.is_aggregation = plan.is_aggregation
+        self.is_plain_count = plan.is_plain_count
+        self.has_child_rel_field = plan.has_child_rel_field
+        self.converters = [fix_data_type] * len(plan.aliases)
+        self.csv_converters = [csv_to_json_value] * len(plan.aliases)
+
+    def set_column_types(self, column_types: Sequence[Optional[str]]) -> None:
+        """Set converters of columns by their types, e.g. 'datetime' or 'DateTimeField'.
+
+        A column of an unknown type (None) is converted by guessing like before.
+        Types are ignored if their number doesn't match the columns.
+        """
+        if len(column_types) == len(self.aliases):
+            self.converters = [column_converter(x) for x in column_types]
+            # a string of a known type without a converter is not modified
+            self.csv_converters = [CSV_TYPE_CONVERTERS.get(x.lower(), str) if x else csv_to_json_value
+                                   for x in column_types]
+
+    def description(self, column_types: Sequence[Optional[str]]) -> List[Tuple[Any, ...]]:
+        """Cursor description of columns by aliases and fields of the cached plan"""
+        plan = nz(self.plan)
+        return [(alias, type_code, None, None, name)
+                for alias, type_code, name in zip(plan.aliases, column_types, plan.fields)]
+
+    def column_types_from_describe(self, describe: Callable[[str], Dict[str, Any]]) -> List[Optional[str]]:
+        """Get types of columns by `describe(sobject_name)` of the root and parent objects.
+
+        The type is None if it can't be found, e.g. for aggregations, subqueries
+        or polymorphic relationships.
+        """
+        out = []  # type: List[Optional[str]]
+        for field, path in zip(self.fields, self.paths):
+            col_type = None
+            sobject = self.root_table
+            if isinstance(field, str) and not self.is_aggregation:
+                for key_lc in path[:-1]:
+                    refs = [x['referenceTo'] for x in describe(nz(sobject))['fields']
+                            if (x['relationshipName'] or '').lower() == key_lc]
+                    sobject = refs[0][0] if len(refs) == 1 and len(refs[0]) == 1 else None
+                    if sobject is None:
+                        break
+                if sobject:
+                    col_type = next((x['type'] for x in describe(sobject)['fields']
+                                     if x['name'].lower() == path[-1]), None)
+            out.append(col_type)
+        return out
+
+    def _resolve_key(self, record: Dict[str, Any], key_lc: str) -> str:
+        """Find the key of a record case insensitive and remember it for the next records"""
+        for key in record:
+            if key.lower() == key_lc:
+                self._response_keys[key_lc] = key
+                return key
+        raise KeyError(key_lc)
+
+    def _project(self, record: Dict[str, Any]) -> List[Any]:
+        """Extract values of all aliases from a nested record in one pass, without a flat dict.
+
+        A parent relationship that is None (an empty outer join) propagates
+        None to all its fields.
+        """
+        keys = self._response_keys
+        out = []
+        for path, converter in zip(self.paths, self.converters):
+            value = record  # type: Any
+            for key_lc in path:
+                if value is None:
+                    break
+                try:
+                    value = value[keys[key_lc]]
+                except KeyError:
+                    value = value[self._resolve_key(value, key_lc)]
+            out.append(converter(value) if converter and value is not None else value)
+        if self.has_child_rel_field:
+            for alias, value in zip(self.aliases, out):
+                if isinstance(value, dict) and value.get('done') is False:
+                    raise NotSupportedError(
+                        "The child relationship subquery {!r} returned only a part of the records "
+                        "(done=false). Query the child object separately.".format(alias))
         return out
 
     @overload                   # noqa
@@ -185,15 +217,216 @@ class QQuery:
                     yield (row_deep['explain'],)
                 else:
                     assert self.is_aggregation == (row_deep['attributes']['type'] == 'AggregateResult')
-                    row_flat = self._make_flat(row_deep, path=(), subroots=self.subroots)
-                    # TODO Will be the expression "or x['done']" really correct also for long subrequests?
-                    assert all(not isinstance(x, dict) or x['done'] for x in row_flat)
+                    values = self._project(row_deep)
                     if issubclass(row_type, dict):
-                        yield {k: fix_data_type(row_flat[k.lower()]) for k in self.aliases}
+                        yield dict(zip(self.aliases, values))
                     elif issubclass(row_type, list):
-                        yield [fix_data_type(row_flat[k.lower()]) for k in self.aliases]
+                        yield values
                     elif issubclass(row_type, tuple):
-                        yield tuple(fix_data_type(row_flat[k.lower()]) for k in self.aliases)
+                        yield tuple(values)
+
+    def parse_csv_rows(self, rows: Iterable[Sequence[str]], row_type: Type[Any] = tuple) -> Iterable[Any]:
+        """Parse rows of a CSV result of Bulk API query (columns in the order of aliases) to rows of row_type
+
+        Values are the same as if they are parsed from a REST API response. An empty string is None.
+        """
+        assert row_type in (dict, list, tuple)
+        assert not self.is_aggregation and not self.has_child_rel_field
+        converters = list(zip(self.csv_converters, self.converters))
+        for row in rows:
+            values = []
+            for text, (csv_converter, converter) in zip(row, converters):
+                value = csv_converter(text) if text != '' else None
+                values.append(converter(value) if converter and value is not None else value)
+            if issubclass(row_type, dict):
+                yield dict(zip(self.aliases, values))
+            elif issubclass(row_type, list):
+                yield values
+            else:
+                yield tuple(values)
+
+
+class QueryPlan(NamedTuple):
+    """Immutable result of parsing of a SOQL template, shared by QQuery objects of the same SOQL"""
+    soql: str
+    fields: Tuple[Union[str, 'QQuery'], ...]
+    aliases: Tuple[str, ...]
+    paths: Tuple[Tuple[str, ...], ...]
+    root_table: str
+    extra_soql: str
+    subqueries: List[Tuple[str, Any]]
+    is_aggregation: bool
+    is_plain_count: bool
+    has_child_rel_field: bool
+
+
+def parse_query_plan(soql: str) -> QueryPlan:
+    """Parse a SOQL template to a plan of columns (without a cache)"""
+    # pylint:disable=too-many-branches,too-many-locals
+    orig_soql = soql
+    soql, subqueries = split_subquery(soql)
+    match_parse = re.match(r'SELECT (.*) FROM (\w+)\b(.*)$', soql, re.I)
+    if not match_parse:
+        raise ProgrammingError('Invalid SQL: %s' % orig_soql)
+    fields_sql, root_table, extra_soql = match_parse.groups()
+    fields = [x.strip() for x in fields_sql.split(',')]
+    is_aggregation = bool(pattern_groupby.search(extra_soql) or pattern_aggregation.search(fields[0]))
+    is_plain_count = fields[0].upper() == 'COUNT()'
+    has_child_rel_field = False
+    out_fields = []  # type: List[Union[str, QQuery]]
+    aliases = []  # type: List[str]
+    paths = []  # type: List[Tuple[str, ...]]
+    consumed_subqueries = 0
+    expr_alias_counter = 0
+    if not is_plain_count:
+        out_field = ''  # type: Union[str, QQuery]
+        for field in fields:
+            if is_aggregation:
+                match = re.search(r'\b\w+$', field)
+                if match:
+                    alias = match.group()
+                    assert alias not in RESERVED_WORDS, "invalid alias name"
+                    if match.start() > 0 and field[match.start() - 1] == ' ':
+                        out_field = field = field[match.start() - 1]
+                else:
+                    alias = 'expr{}'.format(expr_alias_counter)
+                    expr_alias_counter += 1
+                assert '&' not in field, "Subquery not expected as field in aggregation query"
+            elif '&' in field:
+                assert field == '(&)'  # verify that the subquery was in parentheses
+                subquery = QQuery(subqueries[consumed_subqueries][0])
+                consumed_subqueries += 1
+                has_child_rel_field = True
+                out_field = subquery
+                # TODO more child relationships to the same table
+                alias = nz(subquery.root_table)
+            else:
+                alias = out_field = field
+                if '.' in alias:
+                    if alias.split('.', 1)[0].lower() == root_table.lower():
+                        alias = alias.split('.', 1)[1]
+            aliases.append(alias)
+            out_fields.append(out_field)
+            # a path through parent relationships, e.g. ('account', 'owner', 'name')
+            paths.append(tuple(alias.lower().split('.')))
+    # TODO it is not currently necessary to parse the exta_soql
+    return QueryPlan(orig_soql, tuple(out_fields), tuple(aliases), tuple(paths), root_table, extra_soql,
+                     subqueries, is_aggregation, is_plain_count, has_child_rel_field)
+
+
+_query_plans = OrderedDict()  # type: OrderedDict[str, QueryPlan]
+_query_plans_lock = threading.Lock()
+_query_plans_stats = {'hits': 0, 'misses': 0}
+
+
+def get_query_plan(soql: str) -> QueryPlan:
+    """Get a parsed plan of a SOQL template from the cache or parse it (thread safe)"""
+    with _query_plans_lock:
+        plan = _query_plans.get(soql)
+        if plan is not None:
+            _query_plans.move_to_end(soql)
+            _query_plans_stats['hits'] += 1
+            return plan
+        _query_plans_stats['misses'] += 1
+    plan = parse_query_plan(soql)
+    max_size = getattr(settings, 'SF_QUERY_PLAN_CACHE_SIZE', DEFAULT_QUERY_PLAN_CACHE_SIZE)
+    if max_size:
+        with _query_plans_lock:
+            _query_plans[soql] = plan
+            while len(_query_plans) > max_size:
+                _query_plans.popitem(last=False)
+    return plan
+
+
+def query_plan_statistics() -> Dict[str, int]:
+    """Hits and misses of the cache of parsed SOQL templates and its current size"""
+    with _query_plans_lock:
+        return dict(_query_plans_stats, size=len(_query_plans))
+
+
+def clear_query_plans() -> None:
+    with _query_plans_lock:
+        _query_plans.clear()
+        _query_plans_stats.update(hits=0, misses=0)
+
+
+def split_in_list(soql: str, params: Sequence[Any], param_length: Callable[[Any], int], max_length: int
+                  ) -> Optional[List[Tuple[str, List[Any]]]]:
+    """Split a query with an oversized "IN (%s, ...)" list to more queries with shorter lists
+
+    The result is a list of pairs (soql, params), where the length of every query after
+    substitution of params is up to `max_length` if possible, or None if the query can not be
+    split safely. Only the longest IN list in a WHERE condition with AND operators (without OR
+    and NOT) is split and queries with subqueries, GROUP BY, HAVING and OFFSET are not split.
+    The union of results is equal to the original result, except ORDER BY and LIMIT that must
+    be applied again to the merged result. Duplicate values are removed from the list,
+    otherwise a row would be in the results of more parts.
+    """
+    if "'" in soql or '%%' in soql or re.search(r'\(SELECT\b|\bGROUP BY\b|\bHAVING\b|\bOFFSET\b', soql, re.I):
+        return None
+    match_where = re.search(r'\bWHERE\b(.*?)(?:\bORDER BY\b.*?)?(?:\bLIMIT\s+\d+\s*)?$', soql, re.I | re.S)
+    if not match_where or re.search(r'\b(?:OR|NOT)\b', match_where.group(1), re.I):
+        return None
+    candidates = [x for x in re.finditer(r'\bIN\s*\(((?:\s*%s\s*,)*\s*%s\s*)\)', soql, re.I)
+                  if match_where.start(1) <= x.start() < match_where.end(1)]
+    if not candidates:
+        return None
+    match = max(candidates, key=lambda x: x.group(1).count('%s'))
+    start, end = match.span(1)
+    first = soql[:start].count('%s')
+    count = match.group(1).count('%s')
+    params = list(params)
+    in_params, other_params = params[first:first + count], params[:first] + params[first + count:]
+    in_params = list({(type(x), x): x for x in in_params}.values())
+    # the length of the query with an empty list, minus the separator that is not after the last item
+    base_length = len(soql) - (end - start) + sum(param_length(x) - 2 for x in other_params) - 2
+    chunks = [[]]  # type: List[List[Any]]
+    length = base_length
+    for param in in_params:
+        item_length = param_length(param) + 2  # with the separator ', '
+        if chunks[-1] and length + item_length > max_length:
+            chunks.append([])
+            length = base_length
+        chunks[-1].append(param)
+        length += item_length
+    if len(chunks) < 2:
+        return None
+    return [(soql[:start] + ', '.join(['%s'] * len(chunk)) + soql[end:],
+             params[:first] + chunk + params[first + count:])
+            for chunk in chunks]
+
+
+def parse_retrieve_query(soql: str) -> Optional[Tuple[str, List[str]]]:
+    """Parse a query "SELECT fields FROM table WHERE Id IN (%s, ...) [ORDER BY ...]" to (table, fields)
+
+    Only simple fields of the table are allowed. Return None for any other query.
+    """
+    match = re.match(r'SELECT\s+(.*?)\s+FROM\s+(\w+)\s+WHERE\s+\(?\s*(?:\2\.)?Id\s+IN\s*\((?:\s*%s\s*,)*\s*%s\s*\)'
+                     r'\s*\)?(\s+ORDER BY\s+[\w.,\s]*)?$', soql.strip(), re.I | re.S)
+    if not match or re.search(r'\b(?:LIMIT|OFFSET)\b', match.group(3) or '', re.I):
+        return None
+    table = match.group(2)
+    fields = []
+    for field in match.group(1).split(','):
+        field = field.strip()
+        if field.lower().startswith(table.lower() + '.'):
+            field = field[len(table) + 1:]
+        if not re.match(r'\w+$', field):
+            return None
+        fields.append(field)
+    return table, fields
+
+
+def parse_order_by(soql: str) -> List[Tuple[str, bool, bool]]:
+    """Parse the ORDER BY clause of a query to a list of (field, descending, nulls_last)"""
+    match = re.search(r'\bORDER BY\s+(.*?)(?:\s+LIMIT\s+\d+)?(?:\s+OFFSET\s+\d+)?\s*$', soql, re.I | re.S)
+    out = []
+    if match:
+        for item in match.group(1).split(','):
+            words = item.split()
+            keywords = ' '.join(words[1:]).upper()
+            out.append((words[0], 'DESC' in keywords, 'NULLS LAST' in keywords))
+    return out
 
 
 SALESFORCE_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f+0000'
@@ -212,6 +445,65 @@ def fix_data_type(data: Any, tzinfo: Optional[datetime.timezone] = None) -> Any:
     return data
 
 
+def parse_sf_datetime(data: Any, tzinfo: Optional[datetime.timezone] = None) -> Any:
+    """Fast conversion of a value of DateTime field, e.g. '2021-03-19T12:05:33.000+0000'
+
+    Salesforce uses this fixed format, therefore no regexp and strptime are
+    necessary. Other values are processed by fix_data_type.
+    """
+    if isinstance(data, str) and len(data) == 28 and data[19] == '.' and data.endswith('+0000'):
+        return datetime.datetime(int(data[:4]), int(data[5:7]), int(data[8:10]),
+                                 int(data[11:13]), int(data[14:16]), int(data[17:19]), int(data[20:23]) * 1000,
+                                 tzinfo=tzinfo or pytz.utc)
+    return fix_data_type(data, tzinfo)
+
+
+# converters by a Salesforce type from describe() or by an internal type of a Django field (lowercase)
+COLUMN_TYPE_CONVERTERS = {
+    'datetime': parse_sf_datetime,
+    'datetimefield': parse_sf_datetime,
+}  # type: Dict[str, Callable[[Any], Any]]
+
+
+def csv_to_json_value(text: str) -> Any:
+    """Convert a string of an unknown type from CSV like in JSON: only a timestamp is modified
+
+    Bulk API uses e.g. '2021-03-19T12:05:33.000Z' instead of '2021-03-19T12:05:33.000+0000'
+    """
+    if len(text) == 24 and text[10] == 'T' and text[19] == '.' and text[23] == 'Z':
+        return text[:23] + '+0000'
+    return text
+
+
+# converters of non empty strings from CSV by a Salesforce type or by an internal type of Django field
+CSV_TYPE_CONVERTERS = {
+    'boolean': lambda x: x == 'true',
+    'booleanfield': lambda x: x == 'true',
+    'nullbooleanfield': lambda x: x == 'true',
+    'int': int,
+    'integerfield': int,
+    'smallintegerfield': int,
+    'bigintegerfield': int,
+    'positiveintegerfield': int,
+    'positivesmallintegerfield': int,
+    'positivebigintegerfield': int,
+    'double': float,
+    'currency': float,
+    'percent': float,
+    'floatfield': float,
+    'decimalfield': float,
+    'datetime': csv_to_json_value,
+    'datetimefield': csv_to_json_value,
+}  # type: Dict[str, Callable[[str], Any]]
+
+
+def column_converter(column_type: Optional[str]) -> Optional[Callable[[Any], Any]]:
+    """Get a converter of values by a column type (None = no conversion is necessary)"""
+    if column_type is None:
+        return fix_data_type
+    return COLUMN_TYPE_CONVERTERS.get(column_type.lower())
+
+
 def mark_quoted_strings(sql: str) -> Tuple[str, List[str]]:
     """Mark all quoted strings in the SOQL by '@' and get them as params,
     with respect to all escaped backslashes and quotes.
@@ -0,0 +1,16 @@
+"""
+Local emulator of the Salesforce REST API backed by SQLite, for load tests
+
+The emulator implements the part of the REST API used by django-salesforce:
+query, queryAll with query locators, sobjects CRUD and describe, composite
+and composite/sobjects (SObject Collections). Tables are created from
+Salesforce models and a practical subset of SOQL is translated to SQLite.
+
+It is a WSGI application. Run it by:
+    python -m salesforce.emulator [--port 8111] [--latency 0.05] [--error-rate 0.01]
+and configure a database with 'HOST': 'http://localhost:8111'.
+"""
+from salesforce.emulator.app import ApiError, Emulator
+from salesforce.emulator.schema import Field, Table, tables_from_models
+
+__all__ = ['ApiError', 'Emulator', 'Field', 'Table', 'tables_from_models']
@@ -0,0 +1,48 @@
+"""
+Run the Salesforce REST API emulator by a threading WSGI server
+
+Usage:
+    [DJANGO_SETTINGS_MODULE=mysite.settings] python -m salesforce.emulator
+        [--host 127.0.0.1] [--port 8111] [--database FILE] [--latency SECONDS[:MAX_SECONDS]]
+        [--error-rate 0.01] [--error-status 503] [--api-limit 15000] [--api-version 52.0]
+
+Tables are created from Salesforce models of installed applications.
+"""
+import argparse
+import os
+import socketserver
+from wsgiref.simple_server import make_server, WSGIServer
+
+import django
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8111)
+    parser.add_argument('--database', default=':memory:', help="SQLite database file (default: in memory)")
+    parser.add_argument('--latency', default='0', help="seconds added to every request, or a range MIN:MAX")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="probability of an injected error")
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--api-limit', type=int, default=15000)
+    parser.add_argument('--api-version', default='52.0')
+    args = parser.parse_args()
+    if os.environ.get('DJANGO_SETTINGS_MODULE'):
+        django.setup()
+    from salesforce.emulator.app import Emulator  # pylint:disable=import-outside-toplevel
+
+    latency = tuple(float(x) for x in args.latency.split(':'))
+    app = Emulator(database=args.database, api_version=args.api_version,
+                   latency=latency if len(latency) == 2 else latency[0],  # type: ignore[arg-type]
+                   error_rate=args.error_rate, error_status=args.error_status, api_limit=args.api_limit)
+    with make_server(args.host, args.port, app, server_class=ThreadingWSGIServer) as server:
+        print("Salesforce emulator on http://{}:{}/ with {} tables".format(args.host, args.port, len(app.tables)))
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
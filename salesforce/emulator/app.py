@@ -0,0 +1,508 @@
+"""
+WSGI application that emulates the REST API of Salesforce used by django-salesforce
+
+Data are stored in SQLite. The emulator is intended for load tests and for
+tests of applications without a Salesforce org, not for testing of Salesforce
+itself: validation rules, triggers, sharing and most of metadata do not exist.
+"""
+import base64
+import datetime
+import gzip
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+from salesforce.emulator.schema import Table, tables_from_models, to_storage
+from salesforce.emulator.soql import compile_query, SoqlError
+
+Response = Tuple[int, Any, Dict[str, str]]  # (status, JSON data, headers)
+
+DEFAULT_USER_ID = '005000000000001AAA'
+MAX_LOCATORS = 100  # the oldest query locators are discarded (Salesforce has also a limit of open cursors)
+ID_SUFFIX_CHARS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ012345'
+
+
+class ApiError(Exception):
+    """An error response of the REST API"""
+
+    def __init__(self, status: int, error_code: str, message: str, fields: Sequence[str] = ()) -> None:
+        super().__init__(message)
+        self.status = status
+        self.error_code = error_code
+        self.message = message
+        self.fields = list(fields)
+
+    def response(self) -> Response:
+        return self.status, [{'message': self.message, 'errorCode': self.error_code, 'fields': self.fields}], {}
+
+    def collection_error(self) -> Dict[str, Any]:
+        return {'statusCode': self.error_code, 'message': self.message, 'fields': self.fields}
+
+
+class _Rollback(Exception):
+    pass
+
+
+def id18(id15: str) -> str:
+    """Add the case safe suffix to a 15 character Id"""
+    suffix = ''
+    for i in range(0, 15, 5):
+        flags = sum(1 << j for j, char in enumerate(id15[i:i + 5]) if char.isupper())
+        suffix += ID_SUFFIX_CHARS[flags]
+    return id15 + suffix
+
+
+def now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+
+
+class Emulator:
+    """WSGI application that emulates the REST API of Salesforce
+
+    tables:      tables of the emulator (default: from all installed Salesforce models)
+    database:    the SQLite database file (default: in memory)
+    latency:     seconds added to every request, or a (min, max) range of random latency
+    error_rate:  the probability that a data request fails by an injected error
+    error_status, error_code: the response of an injected error (default 503 SERVER_UNAVAILABLE)
+    api_limit:   the daily limit of API requests, reported by "Sforce-Limit-Info" headers
+                 and enforced by REQUEST_LIMIT_EXCEEDED
+    page_size:   the default number of records in a page of a query result
+    """
+    # pylint:disable=too-many-instance-attributes
+
+    def __init__(self, tables: Optional[Iterable[Table]] = None, database: str = ':memory:',
+                 api_version: str = '52.0', latency: Union[float, Tuple[float, float]] = 0,
+                 error_rate: float = 0.0, error_status: int = 503, error_code: str = 'SERVER_UNAVAILABLE',
+                 api_limit: int = 15000, page_size: int = 2000, seed: Optional[int] = None) -> None:
+        # pylint:disable=too-many-arguments
+        self.tables = {x.name.lower(): x for x in (tables if tables is not None else tables_from_models())}
+        self.by_prefix = {x.key_prefix: x for x in self.tables.values()}
+        self.api_version = api_version
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_code = error_code
+        self.api_limit = api_limit
+        self.api_usage = 0
+        self.page_size = page_size
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.locators = OrderedDict()  # type: OrderedDict[str, List[Dict[str, Any]]]
+        self.locator_counter = itertools.count(1)
+        self.savepoint_counter = itertools.count(1)
+        self.db = sqlite3.connect(database, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            for table in self.tables.values():
+                self.db.execute(table.create_sql())
+            self.id_counters = {}  # type: Dict[str, int]
+            for table in self.tables.values():
+                self.id_counters[table.key_prefix] = self.db.execute(
+                    'SELECT COUNT(*) FROM "{}"'.format(table.name)).fetchone()[0] + 1
+            user = self.tables.get('user')
+            if user and not self.db.execute('SELECT 1 FROM "User" WHERE "Id" = ?', [DEFAULT_USER_ID]).fetchone():
+                values = {'Id': DEFAULT_USER_ID, 'Username': 'emulator@example.com', 'LastName': 'Emulator',
+                          'Email': 'emulator@example.com', 'Alias': 'emul', 'IsActive': 1}
+                self._insert(user, {k: v for k, v in values.items() if user.get_field(k)})
+                self.id_counters[user.key_prefix] += 1
+
+    # -- WSGI
+
+    def __call__(self, environ: Dict[str, Any], start_response: Callable[..., Any]) -> List[bytes]:
+        self.sleep()
+        method = environ['REQUEST_METHOD']
+        path = environ.get('PATH_INFO', '/')
+        params = {k: v[-1] for k, v in parse_qs(environ.get('QUERY_STRING', '')).items()}
+        body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+        if environ.get('HTTP_CONTENT_ENCODING') == 'gzip':
+            body = gzip.decompress(body)
+        headers = {'Content-Type': 'application/json;charset=UTF-8'}
+        try:
+            if path == '/services/oauth2/token':
+                data = self.token(parse_qs(body.decode()), '{}://{}'.format(
+                    environ['wsgi.url_scheme'], environ.get('HTTP_HOST') or environ['SERVER_NAME']))
+                status = 200
+            else:
+                status, data, more_headers = self.request(method, path, params, body, environ)
+                headers.update(more_headers)
+        except ApiError as exc:
+            status, data, _ = exc.response()
+        except (KeyError, TypeError, ValueError, AttributeError) as exc:  # malformed data of a request
+            status, data, _ = ApiError(400, 'JSON_PARSER_ERROR', repr(exc)).response()
+        if path.startswith('/services/data/v'):
+            headers['Sforce-Limit-Info'] = 'api-usage={}/{}'.format(self.api_usage, self.api_limit)
+        content = json.dumps(data).encode() if status != 204 and data is not None else b''
+        start_response('{} {}'.format(status, HTTPStatus(status).phrase), list(headers.items()))
+        return [content]
+
+    def sleep(self) -> None:
+        latency = self.latency
+        if isinstance(latency, tuple):
+            latency = self.random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+    @staticmethod
+    def token(form: Dict[str, List[str]], instance_url: str) -> Dict[str, str]:
+        """Response of the OAuth username-password flow, with the signature of the client secret"""
+        issued_at = str(int(time.time() * 1000))
+        id_url = 'https://login.salesforce.com/id/00D000000000001AAA/' + DEFAULT_USER_ID
+        secret = form.get('client_secret', [''])[0]
+        signature = base64.b64encode(hmac.new(secret.encode(), (id_url + issued_at).encode(),
+                                              digestmod=hashlib.sha256).digest()).decode('ascii')
+        return {'access_token': '00D000000000001!emulator', 'instance_url': instance_url, 'id': id_url,
+                'token_type': 'Bearer', 'issued_at': issued_at, 'signature': signature}
+
+    def request(self, method: str, path: str, params: Dict[str, str], body: bytes, environ: Dict[str, Any]
+                ) -> Response:
+        if path in ('', '/'):
+            return 200, 'Salesforce REST API emulator', {}
+        if path.rstrip('/') == '/services/data':
+            return 200, [{'label': 'Emulator', 'url': '/services/data/v' + self.api_version,
+                          'version': self.api_version}], {}
+        match = re.match(r'^/services/data/v(\d+\.\d)/(.*)$', path)
+        if not match:
+            raise ApiError(404, 'NOT_FOUND', 'The requested resource does not exist')
+        if not environ.get('HTTP_AUTHORIZATION'):
+            raise ApiError(401, 'INVALID_SESSION_ID', 'Session expired or invalid')
+        with self.lock:
+            self.api_usage += 1
+            if self.api_usage > self.api_limit:
+                raise ApiError(403, 'REQUEST_LIMIT_EXCEEDED', 'TotalRequests Limit exceeded.')
+            if self.error_rate and self.random.random() < self.error_rate:
+                raise ApiError(self.error_status, self.error_code, 'Injected error of the emulator')
+        data = json.loads(body) if body else None
+        batch_size = re.search(r'batchSize=(\d+)', environ.get('HTTP_SFORCE_QUERY_OPTIONS', ''))
+        return self.handle(method, match.group(1), match.group(2), params, data,
+                           int(batch_size.group(1)) if batch_size else None)
+
+    # -- resources
+
+    def handle(self, method: str, version: str, resource: str, params: Dict[str, str], data: Any,
+               batch_size: Optional[int] = None) -> Response:
+        """Handle a request to a resource relative to "/services/data/vXX.X/" """
+        # pylint:disable=too-many-arguments,too-many-return-statements,too-many-branches
+        parts = [x for x in resource.split('/') if x]
+        route = (method, parts[0] if parts else '', len(parts))
+        try:
+            if route in (('GET', 'query', 1), ('GET', 'queryAll', 1)):
+                if 'q' not in params:
+                    raise ApiError(400, 'MALFORMED_QUERY', "The query parameter 'q' is missing or explain "
+                                   "is not supported by the emulator")
+                return 200, self.query(params['q'], parts[0] == 'queryAll', version, batch_size), {}
+            if route in (('GET', 'query', 2), ('GET', 'queryAll', 2)):
+                return 200, self.query_more(parts[1], version), {}
+            if route == ('GET', 'limits', 1):
+                return 200, {'DailyApiRequests': {'Max': self.api_limit,
+                                                  'Remaining': max(self.api_limit - self.api_usage, 0)}}, {}
+            if route == ('GET', 'sobjects', 1):
+                return 200, {'encoding': 'UTF-8', 'maxBatchSize': 200,
+                             'sobjects': [x.describe_global() for x in self.tables.values()]}, {}
+            if parts[:1] == ['sobjects'] and len(parts) >= 2:
+                table = self.get_table(parts[1])
+                if route == ('GET', 'sobjects', 3) and parts[2] == 'describe':
+                    return 200, table.describe(), {}
+                if route == ('POST', 'sobjects', 2):
+                    return 201, {'id': self.create(table.name, data or {}), 'success': True, 'errors': []}, {}
+                if route == ('GET', 'sobjects', 3):
+                    fields = params['fields'].split(',') if params.get('fields') else None
+                    return 200, self.retrieve(table, [parts[2]], fields, version, not_found=True)[0], {}
+                if route == ('PATCH', 'sobjects', 3):
+                    with self.transaction():
+                        self.update(table, parts[2], data or {})
+                    return 204, None, {}
+                if route == ('DELETE', 'sobjects', 3):
+                    with self.transaction():
+                        self.delete(parts[2], table)
+                    return 204, None, {}
+            if parts[:2] == ['composite', 'sobjects'] and len(parts) == 2:
+                return 200, self.collections(method, params, data), {}
+            if parts[:2] == ['composite', 'sobjects'] and len(parts) == 3 and method in ('GET', 'POST'):
+                data = data or {'ids': params.get('ids', '').split(','), 'fields': params.get('fields', '').split(',')}
+                return 200, self.retrieve(self.get_table(parts[2]), data['ids'], data['fields'], version), {}
+            if route == ('POST', 'composite', 1):
+                return 200, self.composite(data, version), {}
+        except SoqlError as exc:
+            raise ApiError(400, exc.error_code, exc.message) from exc
+        raise ApiError(404, 'NOT_FOUND', 'The requested resource does not exist')
+
+    def get_table(self, name: str) -> Table:
+        table = self.tables.get(name.lower())
+        if table is None:
+            raise ApiError(404, 'NOT_FOUND', 'The requested resource does not exist')
+        return table
+
+    def table_by_id(self, id_: str) -> Table:
+        table = self.by_prefix.get(id_[:3])
+        if table is None or len(id_) not in (15, 18):
+            raise ApiError(400, 'MALFORMED_ID', 'malformed id {}'.format(id_))
+        return table
+
+    # -- queries
+
+    def query(self, soql: str, query_all: bool, version: str, batch_size: Optional[int] = None
+              ) -> Dict[str, Any]:
+        compiled = compile_query(soql, self.tables, include_deleted=query_all, api_version=version)
+        with self.lock:
+            rows = self.db.execute(compiled.sql, compiled.params).fetchall()
+        if compiled.kind == 'count':
+            return {'totalSize': rows[0][0], 'done': True, 'records': []}
+        records = [compiled.make_record(row) for row in rows]
+        batch_size = min(max(batch_size or self.page_size, 200), 2000)
+        if len(records) <= batch_size:
+            return {'totalSize': len(records), 'done': True, 'records': records}
+        with self.lock:
+            locator = '01g{:012d}'.format(next(self.locator_counter))
+            locator = '{}-{}'.format(id18(locator), batch_size)  # the page size is remembered by the locator
+            self.locators[locator] = records
+            while len(self.locators) > MAX_LOCATORS:
+                self.locators.popitem(last=False)
+        return self.page(locator, 0, version)
+
+    def query_more(self, locator_offset: str, version: str) -> Dict[str, Any]:
+        match = re.match(r'^(\w+)-(\d+)$', locator_offset)
+        if not match:
+            raise ApiError(400, 'INVALID_QUERY_LOCATOR', 'invalid query locator')
+        locator = next((x for x in self.locators if x.split('-')[0] == match.group(1)), None)
+        if locator is None:
+            raise ApiError(400, 'INVALID_QUERY_LOCATOR', 'invalid query locator')
+        return self.page(locator, int(match.group(2)), version)
+
+    def page(self, locator: str, offset: int, version: str) -> Dict[str, Any]:
+        records = self.locators[locator]
+        locator_id, batch_size = locator.split('-')
+        end = offset + int(batch_size)
+        ret = {'totalSize': len(records), 'done': end >= len(records), 'records': records[offset:end]}
+        if end < len(records):
+            ret['nextRecordsUrl'] = '/services/data/v{}/query/{}-{}'.format(version, locator_id, end)
+        return ret
+
+    def retrieve(self, table: Table, ids: Sequence[str], fields: Optional[Sequence[str]], version: str,
+                 not_found: bool = False) -> List[Optional[Dict[str, Any]]]:
+        """Records by Ids, None for Ids that are not found (or an error if not_found=True)"""
+        fields = [self.get_field(table, x).name for x in fields] if fields else [x.name for x in table.fields]
+        soql = 'SELECT {} FROM {}'.format(', '.join(fields), table.name)
+        compiled = compile_query(soql, self.tables, api_version=version)
+        sql = compiled.sql + ' AND t0."Id" = ?'
+        ret = []
+        with self.lock:
+            for id_ in ids:
+                row = self.db.execute(sql, [id_]).fetchone()
+                if row is None and not_found:
+                    raise ApiError(404, 'NOT_FOUND', 'Provided external ID field does not exist or is not '
+                                   'accessible: {}'.format(id_))
+                ret.append(compiled.make_record(row) if row else None)
+        return ret
+
+    # -- writes
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """A transaction or a nested savepoint"""
+        with self.lock:
+            name = 'sp{}'.format(next(self.savepoint_counter))
+            self.db.execute('SAVEPOINT ' + name)
+            try:
+                yield
+            except BaseException:
+                self.db.execute('ROLLBACK TO ' + name)
+                self.db.execute('RELEASE ' + name)
+                raise
+            self.db.execute('RELEASE ' + name)
+
+    @staticmethod
+    def get_field(table: Table, name: str) -> Any:
+        fld = table.get_field(name)
+        if fld is None:
+            raise ApiError(400, 'INVALID_FIELD', "No such column '{}' on sobject of type {}".format(
+                name, table.name), [name])
+        return fld
+
+    def values(self, table: Table, data: Dict[str, Any], create: bool) -> Dict[str, Any]:
+        """Validated and converted values of a record from a request"""
+        values = {}
+        for name, value in data.items():
+            if name == 'attributes' or (name.lower() == 'id' and not create):
+                continue
+            fld = self.get_field(table, name)
+            if not (fld.createable if create else fld.updateable):
+                raise ApiError(400, 'INVALID_FIELD_FOR_INSERT_UPDATE', "Unable to {} fields: [{}]. Please check "
+                               "the security settings of this field and verify that it is read/write for your "
+                               "profile or permission set.".format('create' if create else 'update', fld.name),
+                               [fld.name])
+            try:
+                values[fld.name] = to_storage(fld, value)
+            except (ValueError, ArithmeticError) as exc:
+                raise ApiError(400, 'JSON_PARSER_ERROR', "Cannot deserialize instance of {} from value {}: {}"
+                               .format(fld.type, value, exc), [fld.name]) from exc
+            if fld.reference_to and value and fld.reference_to.lower() in self.tables:
+                if not self.exists(self.tables[fld.reference_to.lower()], value):
+                    raise ApiError(400, 'INVALID_CROSS_REFERENCE_KEY', "invalid cross reference id", [fld.name])
+        timestamp = now()
+        for fld in table.fields:
+            if fld.name in ('LastModifiedDate', 'SystemModstamp') or (create and fld.name == 'CreatedDate'):
+                values[fld.name] = timestamp
+            elif fld.name == 'LastModifiedById' or (create and fld.name == 'CreatedById'):
+                values[fld.name] = DEFAULT_USER_ID
+            elif create and values.get(fld.name) is None:
+                if fld.type == 'boolean':
+                    values[fld.name] = 0
+                elif fld.defaulted_on_create and fld.reference_to == 'User':
+                    values[fld.name] = DEFAULT_USER_ID
+        if create:
+            missing = [x.name for x in table.fields if x.required and values.get(x.name) is None]
+            if missing:
+                raise ApiError(400, 'REQUIRED_FIELD_MISSING', 'Required fields are missing: [{}]'.format(
+                    ', '.join(missing)), missing)
+        return values
+
+    def exists(self, table: Table, id_: str) -> bool:
+        with self.lock:
+            return bool(self.db.execute('SELECT 1 FROM "{}" WHERE "Id" = ? AND "IsDeleted" = 0'.format(
+                table.name), [id_]).fetchone())
+
+    def _insert(self, table: Table, values: Dict[str, Any]) -> None:
+        self.db.execute('INSERT INTO "{}" ({}) VALUES ({})'.format(
+            table.name, ', '.join('"{}"'.format(x) for x in values), ', '.join('?' for _ in values)),
+            list(values.values()))
+
+    def _update_name(self, table: Table, id_: str) -> None:
+        """Update a compound Name of a person, e.g. of a Contact"""
+        name = table.get_field('Name')
+        if name and not name.createable and table.get_field('FirstName') and table.get_field('LastName'):
+            self.db.execute('UPDATE "{}" SET "Name" = TRIM(COALESCE("FirstName", \'\') || \' \' || '
+                            'COALESCE("LastName", \'\')) WHERE "Id" = ?'.format(table.name), [id_])
+
+    def create(self, table_name: str, data: Dict[str, Any]) -> str:
+        """Create a record and return the Id. It can be used also for fixtures of tests."""
+        table = self.get_table(table_name)
+        with self.transaction():
+            values = self.values(table, data, create=True)
+            id_ = id18('{}{:012d}'.format(table.key_prefix, self.id_counters[table.key_prefix]))
+            self.id_counters[table.key_prefix] += 1
+            values['Id'] = id_
+            self._insert(table, values)
+            self._update_name(table, id_)
+        return id_
+
+    def update(self, table: Table, id_: str, data: Dict[str, Any]) -> None:
+        if not self.exists(table, id_):
+            raise ApiError(404, 'NOT_FOUND', 'Provided external ID field does not exist or is not accessible: '
+                           '{}'.format(id_))
+        values = self.values(table, data, create=False)
+        self.db.execute('UPDATE "{}" SET {} WHERE "Id" = ?'.format(
+            table.name, ', '.join('"{}" = ?'.format(x) for x in values)), list(values.values()) + [id_])
+        self._update_name(table, id_)
+
+    def delete(self, id_: str, table: Optional[Table] = None) -> None:
+        table = table or self.table_by_id(id_)
+        if not self.exists(table, id_):
+            deleted = self.db.execute('SELECT 1 FROM "{}" WHERE "Id" = ?'.format(table.name), [id_]).fetchone()
+            if deleted:
+                raise ApiError(404, 'ENTITY_IS_DELETED', 'entity is deleted')
+            raise ApiError(404, 'INVALID_CROSS_REFERENCE_KEY', 'invalid cross reference id')
+        self.db.execute('UPDATE "{}" SET "IsDeleted" = 1 WHERE "Id" = ?'.format(table.name), [id_])
+
+    def collections(self, method: str, params: Dict[str, str], data: Any) -> List[Dict[str, Any]]:
+        """SObject Collections: create, update or delete up to 200 records"""
+        if method == 'DELETE':
+            items = [x for x in params.get('ids', '').split(',') if x]  # type: List[Any]
+            all_or_none = params.get('allOrNone', 'false').lower() == 'true'
+        elif method in ('POST', 'PATCH'):
+            items = data['records']
+            all_or_none = bool(data.get('allOrNone'))
+        else:
+            raise ApiError(405, 'METHOD_NOT_ALLOWED', 'HTTP Method \'{}\' not allowed'.format(method))
+        if len(items) > 200:
+            raise ApiError(400, 'EXCEEDED_ID_LIMIT', 'record limit reached. cannot submit more than 200 records '
+                           'into this call')
+        results = []  # type: List[Dict[str, Any]]
+        try:
+            with self.transaction():
+                for item in items:
+                    try:
+                        with self.transaction():
+                            if method == 'DELETE':
+                                self.delete(item)
+                                id_ = item
+                            else:
+                                table_name = item.get('attributes', {}).get('type', '')
+                                if method == 'POST':
+                                    id_ = self.create(table_name, item)
+                                else:
+                                    id_ = item.get('Id') or item.get('id', '')
+                                    self.update(self.get_table(table_name), id_, item)
+                        results.append({'id': id_, 'success': True, 'errors': []})
+                    except ApiError as exc:
+                        results.append({'id': item if method == 'DELETE' else None, 'success': False,
+                                        'errors': [exc.collection_error()]})
+                if all_or_none and not all(x['success'] for x in results):
+                    raise _Rollback
+        except _Rollback:
+            rolled_back = {'statusCode': 'ALL_OR_NONE_OPERATION_ROLLED_BACK',
+                           'message': 'Record rolled back because not all records were valid and the request '
+                                      'was using AllOrNone header', 'fields': []}
+            for result in results:
+                if result['success']:
+                    result.update(success=False, errors=[rolled_back], id=None)
+        return results
+
+    def composite(self, data: Dict[str, Any], version: str) -> Dict[str, Any]:
+        """Composite request: subrequests with references to results of previous subrequests"""
+        all_or_none = bool(data.get('allOrNone'))
+        responses = []  # type: List[Dict[str, Any]]
+        results = {}  # type: Dict[str, Any]
+        try:
+            with self.transaction():
+                for subrequest in data['compositeRequest']:
+                    ref_id = subrequest['referenceId']
+                    try:
+                        url = urlsplit(self.resolve_references(subrequest['url'], results))
+                        match = re.match(r'^/services/data/v(\d+\.\d)/(.*)$', url.path)
+                        if not match:
+                            raise ApiError(404, 'NOT_FOUND', 'The requested resource does not exist')
+                        body = json.loads(self.resolve_references(json.dumps(subrequest.get('body')), results))
+                        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                        with self.transaction():
+                            status, body, _ = self.handle(subrequest['method'], match.group(1), match.group(2),
+                                                          params, body)
+                    except ApiError as exc:
+                        status, body, _ = exc.response()
+                    results[ref_id] = body
+                    responses.append({'body': body, 'httpHeaders': {}, 'httpStatusCode': status,
+                                      'referenceId': ref_id})
+                    if status >= 400 and all_or_none:
+                        raise _Rollback
+        except _Rollback:
+            halted = [{'errorCode': 'PROCESSING_HALTED', 'message': 'The transaction was rolled back since '
+                       'another operation in the same transaction failed.'}]
+            for response in responses[:-1]:
+                response.update(body=halted, httpStatusCode=400)
+            for subrequest in data['compositeRequest'][len(responses):]:
+                responses.append({'body': halted, 'httpHeaders': {}, 'httpStatusCode': 400,
+                                  'referenceId': subrequest['referenceId']})
+        return {'compositeResponse': responses}
+
+    @staticmethod
+    def resolve_references(text: str, results: Dict[str, Any]) -> str:
+        """Replace references like "@{refContact.id}" or "@{refQuery.records[0].Id}" by values"""
+        def replace(match: 're.Match[str]') -> str:
+            value = results
+            for key in re.findall(r'[^.\[\]]+', match.group(1)):
+                try:
+                    value = value[int(key)] if isinstance(value, list) else value[key]
+                except (KeyError, IndexError, ValueError, TypeError) as exc:
+                    raise ApiError(400, 'INVALID_REFERENCE', 'Invalid reference specified: {}'.format(
+                        match.group(0))) from exc
+            return str(value)
+        return re.sub(r'@\{([^}]+)\}', replace, text)
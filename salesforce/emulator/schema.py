@@ -0,0 +1,200 @@
+"""
+Metadata of tables of the emulator, built from Salesforce models
+
+Field values are stored in SQLite in a normalized form that can be compared
+by SQL operators: booleans as 0/1, datetimes as UTC text "YYYY-MM-DDTHH:MM:SS.000+0000",
+dates as "YYYY-MM-DD", text with a case insensitive collation like in SOQL.
+"""
+import datetime
+import decimal
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db.models import NOT_PROVIDED
+
+from salesforce.fields import NOT_CREATEABLE, NOT_UPDATEABLE
+
+# key prefixes of Ids of standard objects, custom objects get 'a00', 'a01'...
+KEY_PREFIXES = {
+    'Account': '001', 'Note': '002', 'Contact': '003', 'User': '005', 'Opportunity': '006',
+    'Lead': '00Q', 'Task': '00T', 'Event': '00U', 'Attachment': '00P', 'OpportunityContactRole': '00K',
+    'OpportunityLineItem': '00k', 'Case': '500', 'Campaign': '701', 'CampaignMember': '00v',
+    'Product2': '01t', 'Pricebook2': '01s', 'PricebookEntry': '01u', 'ContentVersion': '068',
+}
+
+# Salesforce types by internal types of Django fields
+FIELD_TYPES = {
+    'AutoField': 'id', 'BigAutoField': 'id', 'CharField': 'string', 'TextField': 'textarea',
+    'EmailField': 'email', 'URLField': 'url', 'SlugField': 'string', 'BooleanField': 'boolean',
+    'NullBooleanField': 'boolean', 'IntegerField': 'int', 'SmallIntegerField': 'int',
+    'BigIntegerField': 'int', 'PositiveIntegerField': 'int', 'PositiveSmallIntegerField': 'int',
+    'DecimalField': 'double', 'FloatField': 'double', 'DateField': 'date', 'DateTimeField': 'datetime',
+    'TimeField': 'time', 'ForeignKey': 'reference', 'OneToOneField': 'reference',
+}
+
+# other types are stored as text with a case insensitive collation, but Ids are case sensitive
+SQLITE_TYPES = {'boolean': 'INTEGER', 'int': 'INTEGER', 'double': 'REAL', 'currency': 'REAL', 'percent': 'REAL',
+                'id': 'TEXT', 'reference': 'TEXT'}
+
+
+@dataclass
+class Field:
+    # pylint:disable=too-many-instance-attributes
+    name: str
+    type: str = 'string'                # Salesforce type: 'id', 'string', 'boolean', 'int', 'double'...
+    nillable: bool = True
+    createable: bool = True
+    updateable: bool = True
+    defaulted_on_create: bool = False
+    reference_to: Optional[str] = None  # the target table of a reference
+    length: int = 0
+
+    @property
+    def relationship_name(self) -> Optional[str]:
+        """The name of the parent relationship of a reference, e.g. 'Account' for 'AccountId'"""
+        if self.reference_to is None:
+            return None
+        if self.name.endswith('__c'):
+            return self.name[:-3] + '__r'
+        return re.sub('Id$', '', self.name)
+
+    @property
+    def required(self) -> bool:
+        return not self.nillable and self.createable and not self.defaulted_on_create and self.type != 'boolean'
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'name': self.name, 'label': self.name, 'type': self.type, 'length': self.length,
+            'nillable': self.nillable, 'createable': self.createable, 'updateable': self.updateable,
+            'defaultedOnCreate': self.defaulted_on_create, 'custom': self.name.endswith('__c'),
+            'calculated': False, 'unique': False, 'externalId': False, 'idLookup': self.type == 'id',
+            'filterable': True, 'sortable': True, 'picklistValues': [], 'precision': 0, 'scale': 0,
+            'referenceTo': [self.reference_to] if self.reference_to else [],
+            'relationshipName': self.relationship_name,
+        }
+
+
+@dataclass
+class Table:
+    name: str
+    fields: List[Field]
+    key_prefix: str = ''
+    by_name: Dict[str, Field] = field(init=False, repr=False)        # by lowercase names
+    relationships: Dict[str, Field] = field(init=False, repr=False)  # by lowercase relationship names
+
+    def __post_init__(self) -> None:
+        if not any(x.name == 'Id' for x in self.fields):
+            self.fields.insert(0, Field('Id', 'id', nillable=False, createable=False, updateable=False))
+        self.by_name = {x.name.lower(): x for x in self.fields}
+        self.relationships = {x.relationship_name.lower(): x for x in self.fields if x.relationship_name}
+
+    def get_field(self, name: str) -> Optional[Field]:
+        return self.by_name.get(name.lower())
+
+    def create_sql(self) -> str:
+        columns = ['"IsDeleted" INTEGER NOT NULL DEFAULT 0']
+        for fld in self.fields:
+            if fld.name == 'Id':
+                columns.insert(0, '"Id" TEXT PRIMARY KEY')
+            elif fld.name != 'IsDeleted':
+                sql_type = SQLITE_TYPES.get(fld.type, 'TEXT COLLATE NOCASE')
+                columns.append('"{}" {}'.format(fld.name, sql_type))
+        return 'CREATE TABLE IF NOT EXISTS "{}" ({})'.format(self.name, ', '.join(columns))
+
+    def describe(self) -> Dict[str, Any]:
+        return dict(self.describe_global(), fields=[x.describe() for x in self.fields], childRelationships=[])
+
+    def describe_global(self) -> Dict[str, Any]:
+        return {
+            'name': self.name, 'label': self.name, 'labelPlural': self.name, 'keyPrefix': self.key_prefix,
+            'custom': self.name.endswith('__c'), 'queryable': True, 'createable': True, 'updateable': True,
+            'deletable': True, 'retrieveable': True, 'searchable': True,
+        }
+
+
+def tables_from_models(models: Optional[Iterable[Any]] = None) -> List[Table]:
+    """Tables of the emulator from Salesforce models, by default from all installed Salesforce models"""
+    # pylint:disable=import-outside-toplevel
+    if models is None:
+        from django.apps import apps
+        models = [x for x in apps.get_models() if getattr(x, '_salesforce_object', None)]
+    tables = {}  # type: Dict[str, Table]
+    for model in models:
+        meta = model._meta
+        if meta.db_table in tables or getattr(meta, 'sf_tooling_api_model', False):
+            continue
+        fields = []
+        for fld in meta.concrete_fields:
+            internal_type = fld.get_internal_type()
+            sf_read_only = getattr(fld, 'sf_read_only', 0)
+            default = getattr(fld, 'db_default', NOT_PROVIDED)
+            if default is NOT_PROVIDED:
+                default = fld.default
+            fields.append(Field(
+                fld.column, FIELD_TYPES.get(internal_type, 'string'),
+                nillable=fld.null or fld.has_default() or internal_type == 'AutoField',
+                createable=not sf_read_only & NOT_CREATEABLE and internal_type != 'AutoField',
+                updateable=not sf_read_only & NOT_UPDATEABLE and internal_type != 'AutoField',
+                defaulted_on_create=hasattr(default, 'default'),  # DefaultedOnCreate
+                reference_to=fld.related_model._meta.db_table if fld.is_relation else None,
+                length=getattr(fld, 'max_length', None) or 0,
+            ))
+        tables[meta.db_table] = Table(meta.db_table, fields)
+    custom_count = 0
+    for table in tables.values():
+        if table.name in KEY_PREFIXES:
+            table.key_prefix = KEY_PREFIXES[table.name]
+        else:
+            table.key_prefix = 'a{:02d}'.format(custom_count)
+            custom_count += 1
+    return list(tables.values())
+
+
+# -- conversion of values between JSON, SOQL literals and SQLite
+
+def normalize_datetime(value: str) -> str:
+    """Normalize an ISO datetime with any time zone to UTC "YYYY-MM-DDTHH:MM:SS.000+0000" """
+    match = re.match(r'^(\d{4}-\d\d-\d\d)[T ](\d\d:\d\d:\d\d)(?:\.\d+)?(Z|[+-]\d\d:?\d\d)?$', value)
+    if not match:
+        raise ValueError("Invalid datetime: {}".format(value))
+    date_part, time_part, zone = match.groups()
+    dat = datetime.datetime.fromisoformat('{}T{}'.format(date_part, time_part))
+    if zone and zone != 'Z':
+        offset = datetime.timedelta(hours=int(zone[1:3]), minutes=int(zone[-2:]))
+        dat -= offset if zone[0] == '+' else -offset
+    return dat.strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+
+
+def to_storage(fld: Field, value: Any) -> Any:
+    """Convert a value from JSON or from a SOQL literal to the stored value"""
+    # pylint:disable=too-many-return-statements
+    if value is None:
+        return None
+    if fld.type == 'boolean':
+        if isinstance(value, str):
+            if value.lower() not in ('true', 'false'):
+                raise ValueError("Invalid boolean: {}".format(value))
+            return int(value.lower() == 'true')
+        return int(bool(value))
+    if fld.type == 'int':
+        return int(decimal.Decimal(str(value)))
+    if fld.type in ('double', 'currency', 'percent'):
+        return float(value)
+    if fld.type == 'datetime':
+        return normalize_datetime(str(value))
+    if fld.type == 'date':
+        value = str(value)
+        if not re.match(r'^\d{4}-\d\d-\d\d$', value):
+            raise ValueError("Invalid date: {}".format(value))
+        return value
+    if isinstance(value, (dict, list)):
+        raise ValueError("Invalid value of field {}".format(fld.name))
+    return str(value) if not isinstance(value, str) else value
+
+
+def from_storage(fld: Field, value: Any) -> Any:
+    """Convert a stored value to the JSON value of a response"""
+    if value is not None and fld.type == 'boolean':
+        return bool(value)
+    return value
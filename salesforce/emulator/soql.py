@@ -0,0 +1,470 @@
+"""
+Translation of a practical subset of SOQL to SQLite
+
+Supported:
+    SELECT with fields, parent relationship paths (Contact.Account.Owner.Name),
+        COUNT(), COUNT(field), COUNT_DISTINCT, SUM, AVG, MIN, MAX with aliases
+    FROM one object with an optional alias
+    WHERE with AND, OR, NOT, parentheses, operators = != <> < <= > >= LIKE,
+        IN and NOT IN with a list or with a semi-join subquery of one field,
+        literals: strings, numbers, true, false, null, dates and datetimes
+    GROUP BY fields, ORDER BY fields ASC/DESC NULLS FIRST/LAST, LIMIT, OFFSET
+
+Not supported (reported by MALFORMED_QUERY): child relationship subqueries,
+date functions and date literals like TODAY, INCLUDES/EXCLUDES, TYPEOF, FOR UPDATE...
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from salesforce.emulator.schema import Field, from_storage, Table, to_storage
+
+TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<string>'(?:[^'\\]|\\.)*')
+  | (?P<datetime>\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?(?:Z|[+-]\d\d:?\d\d))
+  | (?P<date>\d{4}-\d\d-\d\d)
+  | (?P<number>[+-]?\d+(?:\.\d+)?)
+  | (?P<op><=|>=|!=|<>|=|<|>|\(|\)|,)
+  | (?P<name>[A-Za-z_][\w.]*)
+)""", re.VERBOSE)
+
+AGGREGATES = ('COUNT', 'COUNT_DISTINCT', 'SUM', 'AVG', 'MIN', 'MAX')
+KEYWORDS = ('SELECT', 'FROM', 'WHERE', 'GROUP', 'ORDER', 'LIMIT', 'OFFSET', 'AND', 'OR', 'NOT', 'IN',
+            'LIKE', 'BY', 'ASC', 'DESC', 'NULLS', 'FIRST', 'LAST', 'WITH', 'FOR', 'HAVING', 'USING')
+STRING_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+
+class SoqlError(Exception):
+    def __init__(self, message: str, error_code: str = 'MALFORMED_QUERY') -> None:
+        super().__init__(message)
+        self.message = message
+        self.error_code = error_code
+
+
+Token = Tuple[str, str]  # (kind, text)
+Literal = Tuple[str, Any]  # (kind, value): 'string', 'number', 'boolean', 'null', 'date', 'datetime'
+
+
+@dataclass
+class Column:
+    path: str                   # e.g. 'Contact.Account.Name', resolved later
+    func: Optional[str] = None  # an aggregate function
+    alias: Optional[str] = None
+
+
+@dataclass
+class Select:
+    # pylint:disable=too-many-instance-attributes
+    table: str
+    alias: Optional[str] = None
+    columns: List[Column] = field(default_factory=list)
+    count_only: bool = False    # SELECT COUNT() FROM ...
+    where: Any = None           # a tree of tuples ('and'|'or', [...]), ('not', x), ('cmp', ...), ('in', ...)
+    group_by: List[str] = field(default_factory=list)
+    order_by: List[Tuple[str, bool, Optional[bool]]] = field(default_factory=list)  # (path, desc, nulls_last)
+    limit: Optional[int] = None
+    offset: Optional[int] = None
+
+
+class Parser:
+    def __init__(self, soql: str) -> None:
+        self.tokens = self.tokenize(soql)
+        self.pos = 0
+
+    @staticmethod
+    def tokenize(soql: str) -> List[Token]:
+        tokens = []
+        pos = 0
+        soql = soql.rstrip()
+        while pos < len(soql):
+            match = TOKEN_RE.match(soql, pos)
+            if not match or match.end() == pos:
+                raise SoqlError("unexpected token: '{}'".format(soql[pos:].strip()[:20]))
+            kind = match.lastgroup
+            assert kind
+            tokens.append((kind, match.group(kind)))
+            pos = match.end()
+        return tokens
+
+    def peek(self, offset: int = 0) -> Token:
+        pos = self.pos + offset
+        return self.tokens[pos] if pos < len(self.tokens) else ('end', '')
+
+    def next(self) -> Token:
+        token = self.peek()
+        if token[0] == 'end':
+            raise SoqlError("unexpected end of query")
+        self.pos += 1
+        return token
+
+    def is_word(self, *words: str, offset: int = 0) -> bool:
+        kind, text = self.peek(offset)
+        return kind == 'name' and text.upper() in words
+
+    def accept(self, text: str) -> bool:
+        kind, token_text = self.peek()
+        if (kind == 'name' and token_text.upper() == text) or (kind == 'op' and token_text == text):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, text: str) -> None:
+        if not self.accept(text):
+            raise SoqlError("expecting '{}', unexpected token: '{}'".format(text, self.peek()[1]))
+
+    def name(self) -> str:
+        kind, text = self.next()
+        if kind != 'name' or text.upper() in KEYWORDS:
+            raise SoqlError("unexpected token: '{}'".format(text))
+        return text
+
+    def integer(self) -> int:
+        kind, text = self.next()
+        if kind != 'number' or not text.isdigit():
+            raise SoqlError("expecting a non-negative integer, unexpected token: '{}'".format(text))
+        return int(text)
+
+    def parse(self) -> Select:
+        select = self.select()
+        if self.peek()[0] != 'end':
+            raise SoqlError("unexpected token: '{}'".format(self.peek()[1]))
+        return select
+
+    def select(self) -> Select:
+        # pylint:disable=too-many-branches
+        self.expect('SELECT')
+        columns = []
+        count_only = False
+        while True:
+            if self.peek() == ('op', '('):
+                raise SoqlError("child relationship subqueries are not supported by the emulator")
+            if self.is_word(*AGGREGATES) and self.peek(1) == ('op', '('):
+                func = self.next()[1].upper()
+                self.expect('(')
+                if func == 'COUNT' and self.accept(')'):
+                    count_only = True
+                    columns.append(Column('', func))
+                else:
+                    path = self.name()
+                    self.expect(')')
+                    alias = self.name() if self.peek()[0] == 'name' and not self.is_word('FROM') else None
+                    columns.append(Column(path, func, alias))
+            else:
+                path = self.name()
+                columns.append(Column(path))
+            if not self.accept(','):
+                break
+        if count_only and len(columns) > 1:
+            raise SoqlError("COUNT() can not be combined with other fields")
+        self.expect('FROM')
+        select = Select(self.name(), columns=[] if count_only else columns, count_only=count_only)
+        if self.peek()[0] == 'name' and self.peek()[1].upper() not in KEYWORDS:
+            select.alias = self.name()
+        if self.accept('WHERE'):
+            select.where = self.condition()
+        if self.accept('GROUP'):
+            self.expect('BY')
+            select.group_by = [self.name()]
+            while self.accept(','):
+                select.group_by.append(self.name())
+        if self.accept('ORDER'):
+            self.expect('BY')
+            while True:
+                path = self.name()
+                desc = self.accept('DESC') or (not self.accept('ASC') and False)
+                nulls_last = None
+                if self.accept('NULLS'):
+                    nulls_last = self.accept('LAST') or (self.expect('FIRST') or False)
+                select.order_by.append((path, desc, nulls_last))
+                if not self.accept(','):
+                    break
+        if self.accept('LIMIT'):
+            select.limit = self.integer()
+        if self.accept('OFFSET'):
+            select.offset = self.integer()
+        if self.is_word('WITH', 'FOR', 'HAVING', 'USING'):
+            raise SoqlError("'{}' is not supported by the emulator".format(self.peek()[1]))
+        return select
+
+    def condition(self) -> Any:
+        items = [self.conjunction()]
+        while self.accept('OR'):
+            items.append(self.conjunction())
+        return items[0] if len(items) == 1 else ('or', items)
+
+    def conjunction(self) -> Any:
+        items = [self.negation()]
+        while self.accept('AND'):
+            items.append(self.negation())
+        return items[0] if len(items) == 1 else ('and', items)
+
+    def negation(self) -> Any:
+        if self.accept('NOT'):
+            return ('not', self.negation())
+        if self.accept('('):
+            ret = self.condition()
+            self.expect(')')
+            return ret
+        return self.comparison()
+
+    def comparison(self) -> Any:
+        path = self.name()
+        if self.accept('NOT'):
+            self.expect('IN')
+            return ('in', path, True, self.in_values())
+        if self.accept('IN'):
+            return ('in', path, False, self.in_values())
+        if self.accept('LIKE'):
+            return ('cmp', path, 'LIKE', self.literal())
+        kind, operator = self.next()
+        if kind != 'op' or operator not in ('=', '!=', '<>', '<', '<=', '>', '>='):
+            raise SoqlError("unexpected token: '{}'".format(operator))
+        return ('cmp', path, '!=' if operator == '<>' else operator, self.literal())
+
+    def in_values(self) -> Any:
+        self.expect('(')
+        if self.is_word('SELECT'):
+            select = self.select()
+            self.expect(')')
+            return select
+        values = [self.literal()]
+        while self.accept(','):
+            values.append(self.literal())
+        self.expect(')')
+        return values
+
+    def literal(self) -> Literal:
+        kind, text = self.next()
+        if kind == 'string':
+            return ('string', re.sub(r'\\(.)', lambda m: STRING_ESCAPES.get(m.group(1), m.group(0)), text[1:-1]))
+        if kind in ('number', 'date', 'datetime'):
+            return (kind, text)
+        if kind == 'name' and text.lower() in ('true', 'false'):
+            return ('boolean', text.lower())
+        if kind == 'name' and text.lower() == 'null':
+            return ('null', None)
+        raise SoqlError("unexpected token: '{}' (date literals like TODAY are not supported)".format(text))
+
+
+@dataclass
+class CompiledQuery:
+    sql: str
+    params: List[Any]
+    kind: str                                     # 'rows', 'count' or 'aggregate'
+    make_record: Callable[[Tuple[Any, ...]], Dict[str, Any]]
+
+
+class Translator:
+    """Translate a parsed SELECT to SQLite SQL with LEFT JOINs of parent relationships"""
+
+    def __init__(self, schema: Dict[str, Table], select: Select, include_deleted: bool = False,
+                 alias_prefix: str = 't', api_version: str = '') -> None:
+        table = schema.get(select.table.lower())
+        if table is None:
+            raise SoqlError("sObject type '{}' is not supported.".format(select.table), 'INVALID_TYPE')
+        self.schema = schema
+        self.select = select
+        self.root = table
+        self.include_deleted = include_deleted
+        self.alias_prefix = alias_prefix
+        self.api_version = api_version
+        # joins by tuples of lowercase relationship names: (sql alias, table, parent alias, reference field)
+        self.joins = {(): (alias_prefix + '0', table, '', None)}  # type: Dict[Tuple[str, ...], Any]
+        self.params = []  # type: List[Any]
+
+    def split_path(self, path: str) -> List[str]:
+        names = path.split('.')
+        if len(names) > 1 and names[0].lower() in (self.select.table.lower(), (self.select.alias or '').lower()):
+            names = names[1:]
+        return names
+
+    def resolve(self, path: str) -> Tuple[str, Field, Tuple[str, ...]]:
+        """Resolve a field path to (sql expression, field, key of the join)"""
+        names = self.split_path(path)
+        key = ()  # type: Tuple[str, ...]
+        alias, table = self.joins[key][:2]
+        for rel_name in names[:-1]:
+            ref_field = table.relationships.get(rel_name.lower())
+            target = self.schema.get((ref_field.reference_to or '').lower()) if ref_field else None
+            if ref_field is None or target is None:
+                raise SoqlError("Didn't understand relationship '{}' in field path. If you are attempting to use "
+                                "a custom relationship, be sure to append the '__r'".format(rel_name),
+                                'INVALID_FIELD')
+            parent_alias = alias
+            key += (rel_name.lower(),)
+            if key not in self.joins:
+                self.joins[key] = ('{}{}'.format(self.alias_prefix, len(self.joins)), target, parent_alias, ref_field)
+            alias, table = self.joins[key][:2]
+        fld = table.get_field(names[-1])
+        if fld is None:
+            raise SoqlError("No such column '{}' on entity '{}'.".format(names[-1], table.name), 'INVALID_FIELD')
+        return '{}."{}"'.format(alias, fld.name), fld, key
+
+    def value(self, fld: Field, literal: Literal) -> Any:
+        kind, value = literal
+        if kind == 'string' and fld.type not in ('string', 'textarea', 'email', 'url', 'id', 'reference', 'phone',
+                                                 'picklist', 'time'):
+            raise SoqlError("value of filter criterion for field '{}' must be of type {} and should not be "
+                            "enclosed in quotes".format(fld.name, fld.type), 'INVALID_FIELD')
+        try:
+            return to_storage(fld, value)
+        except (ValueError, ArithmeticError) as exc:
+            raise SoqlError(str(exc), 'INVALID_FIELD') from exc
+
+    def where(self, node: Any) -> str:
+        # pylint:disable=too-many-return-statements
+        kind = node[0]
+        if kind in ('and', 'or'):
+            return '(' + ' {} '.format(kind.upper()).join(self.where(x) for x in node[1]) + ')'
+        if kind == 'not':
+            return '(NOT {})'.format(self.where(node[1]))
+        if kind == 'cmp':
+            _, path, operator, literal = node
+            expr, fld, _ = self.resolve(path)
+            if literal[0] == 'null':
+                if operator not in ('=', '!='):
+                    raise SoqlError("invalid operator on null")
+                return '{} IS {}NULL'.format(expr, 'NOT ' if operator == '!=' else '')
+            if operator == 'LIKE':
+                self.params.append(literal[1])
+                return "{} LIKE ? ESCAPE '\\'".format(expr)
+            if literal[0] == 'string':
+                literal = ('string', re.sub(r'\\([%_])', r'\1', literal[1]))
+            self.params.append(self.value(fld, literal))
+            if operator == '!=':
+                return '{} IS NOT ?'.format(expr)  # null values are also different in SOQL
+            return '{} {} ?'.format(expr, operator)
+        assert kind == 'in'
+        _, path, negated, values = node
+        expr, fld, _ = self.resolve(path)
+        if isinstance(values, Select):
+            sub = Translator(self.schema, values, include_deleted=self.include_deleted,
+                             alias_prefix=self.alias_prefix + 's')
+            if len(values.columns) != 1 or values.columns[0].func:
+                raise SoqlError("a semi-join subquery must select one field")
+            sub_sql = sub.sql(object_ids=False)
+            self.params.extend(sub.params)
+        else:
+            sub_sql = ', '.join('?' for _ in values)
+            self.params.extend(self.value(fld, x) for x in values)
+        if negated:
+            return '({0} IS NULL OR {0} NOT IN ({1}))'.format(expr, sub_sql)
+        return '{} IN ({})'.format(expr, sub_sql)
+
+    def sql(self, object_ids: bool = True) -> str:
+        """SQL of the select, with params in self.params"""
+        select = self.select
+        columns = []
+        for col in select.columns:
+            if col.func:
+                expr = self.resolve(col.path)[0]
+                columns.append('COUNT(DISTINCT {})'.format(expr) if col.func == 'COUNT_DISTINCT'
+                               else '{}({})'.format(col.func, expr))
+            else:
+                columns.append(self.resolve(col.path)[0])
+        where = self.where(select.where) if select.where is not None else ''
+        group_by = [self.resolve(x)[0] for x in select.group_by]
+        order_by = []
+        for path, desc, nulls_last in select.order_by:
+            order = self.resolve(path)[0] + (' DESC' if desc else '')
+            if nulls_last is not None:
+                order += ' NULLS LAST' if nulls_last else ' NULLS FIRST'
+            order_by.append(order)
+        if select.count_only:
+            columns = ['1']
+        elif object_ids and not any(x.func for x in select.columns):
+            # the Ids of all objects are selected to recognize empty parents and to create urls
+            columns.extend('{}."Id"'.format(alias) for alias, _, _, _ in self.joins.values())
+        sql = 'SELECT {} FROM "{}" {}'.format(', '.join(columns), self.root.name, self.alias_prefix + '0')
+        for alias, table, parent_alias, ref_field in list(self.joins.values())[1:]:
+            sql += ' LEFT JOIN "{0}" {1} ON {1}."Id" = {2}."{3}" AND {1}."IsDeleted" = 0'.format(
+                table.name, alias, parent_alias, ref_field.name)
+        conditions = [] if self.include_deleted else ['{}0."IsDeleted" = 0'.format(self.alias_prefix)]
+        if where:
+            conditions.append(where)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if group_by:
+            sql += ' GROUP BY ' + ', '.join(group_by)
+        if order_by:
+            sql += ' ORDER BY ' + ', '.join(order_by)
+        if select.limit is not None or select.offset is not None:
+            sql += ' LIMIT {} OFFSET {}'.format(select.limit if select.limit is not None else -1,
+                                                select.offset or 0)
+        if select.count_only:
+            sql = 'SELECT COUNT(*) FROM ({})'.format(sql)
+        return sql
+
+    def compile(self) -> CompiledQuery:
+        sql = self.sql()
+        if self.select.count_only:
+            return CompiledQuery(sql, self.params, 'count', lambda row: {})
+        if any(x.func for x in self.select.columns):
+            return CompiledQuery(sql, self.params, 'aggregate', self.aggregate_record_maker())
+        return CompiledQuery(sql, self.params, 'rows', self.record_maker())
+
+    def sobject_attributes(self, table: Table, id_: Optional[str]) -> Dict[str, str]:
+        attributes = {'type': table.name}
+        if id_ and self.api_version:
+            attributes['url'] = '/services/data/v{}/sobjects/{}/{}'.format(self.api_version, table.name, id_)
+        return attributes
+
+    def record_maker(self) -> Callable[[Tuple[Any, ...]], Dict[str, Any]]:
+        columns = [self.resolve(x.path) for x in self.select.columns]
+        joins = list(self.joins.items())
+        count = len(columns)
+
+        def make_record(row: Tuple[Any, ...]) -> Dict[str, Any]:
+            ids = dict(zip((key for key, _ in joins), row[count:]))
+            objects = {}  # type: Dict[Tuple[str, ...], Optional[Dict[str, Any]]]
+            for key, (_, table, _, ref_field) in joins:
+                if key and objects.get(key[:-1]) is None:
+                    objects[key] = None  # the parent is empty
+                    continue
+                obj = {'attributes': self.sobject_attributes(table, ids[key])} if ids[key] or not key else None
+                objects[key] = obj
+                if key:
+                    parent = objects[key[:-1]]
+                    assert parent is not None
+                    parent[ref_field.relationship_name] = obj
+            for (_, fld, key), value in zip(columns, row):
+                obj = objects[key]
+                if obj is not None:
+                    obj[fld.name] = from_storage(fld, value)
+            # parents that are not referenced by any selected field are not in the result
+            used = {key[:i] for _, _, key in columns for i in range(1, len(key) + 1)}
+            for key, (_, _, _, ref_field) in joins:
+                if key and key not in used and objects.get(key[:-1]) is not None:
+                    objects[key[:-1]].pop(ref_field.relationship_name, None)  # type: ignore[union-attr]
+            ret = objects[()]
+            assert ret is not None
+            return ret
+        return make_record
+
+    def aggregate_record_maker(self) -> Callable[[Tuple[Any, ...]], Dict[str, Any]]:
+        names = []
+        expr_count = 0
+        for col in self.select.columns:
+            if col.func:
+                if col.alias:
+                    names.append((col.alias, None))
+                else:
+                    names.append(('expr{}'.format(expr_count), None))
+                    expr_count += 1
+            else:
+                fld = self.resolve(col.path)[1]
+                names.append((fld.name, fld))
+
+        def make_record(row: Tuple[Any, ...]) -> Dict[str, Any]:
+            record = {'attributes': {'type': 'AggregateResult'}}  # type: Dict[str, Any]
+            for (name, fld), value in zip(names, row):
+                record[name] = from_storage(fld, value) if fld else value
+            return record
+        return make_record
+
+
+def compile_query(soql: str, schema: Dict[str, Table], include_deleted: bool = False, api_version: str = ''
+                  ) -> CompiledQuery:
+    """Compile SOQL to SQLite. The schema is a dict of tables by lowercase names."""
+    return Translator(schema, Parser(soql).parse(), include_deleted=include_deleted,
+                      api_version=api_version).compile()
@@ -22,6 +22,10 @@ class Command(InspectDBCommand):
                             # help="Introspect metadata models in Tooling API (not standard tables)",
                             help=argparse.SUPPRESS,  # hidden option
                             )
+        parser.add_argument('--jobs', action='store', type=int, dest='jobs',
+                            default=sf_introspection.DEFAULT_DESCRIBE_JOBS,
+                            help="The number of concurrent describe requests (default %(default)s). "
+                            "The value 1 disables prefetching of describes.")
 
 
     def handle(self, **options: Any) -> None:  # type: ignore[override] # noqa # it is incompatible in Django
@@ -44,6 +48,8 @@ class Command(InspectDBCommand):
                 self.connection.introspection.filter_table_list(
                     [x.name for x in self.connection.introspection.get_table_list(None) if table_name_filter(x.name)]
                 )
+            if options['jobs'] > 1:
+                self.prefetch_descriptions(options['jobs'])
             for line in self.handle_inspection(options):
                 line = line.replace(" Field renamed because it contained more than one '_' in a row.", "")
                 line = re.sub(' #$', '', line)
@@ -51,6 +57,17 @@ class Command(InspectDBCommand):
         else:
             super().handle(**options)
 
+    def prefetch_descriptions(self, jobs: int) -> None:
+        """Describe all inspected tables concurrently before the models are generated"""
+        introspection = self.connection.introspection
+        tables = [x.name for x in introspection.get_table_list(None)]
+
+        def progress(count_done: int, count_total: int, table_name: str) -> None:
+            if self.verbosity >= 2 or (self.verbosity >= 1 and (count_done % 100 == 0 or count_done == count_total)):
+                self.stderr.write("Described %d/%d tables (%s)" % (count_done, count_total, table_name))
+
+        introspection.prefetch_table_descriptions(tables, jobs=jobs, progress=progress)
+
     def get_field_type(self, connection, table_name, row):
         field_type, field_params, field_notes = super().get_field_type(connection, table_name, row)
         if connection.vendor == 'salesforce':
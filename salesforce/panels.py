@@ -0,0 +1,218 @@
+"""
+Panel for django-debug-toolbar with SOQL queries and REST API requests to Salesforce
+
+It is enabled by settings:
+    DEBUG_TOOLBAR_PANELS = [*debug_toolbar.settings.PANELS_DEFAULTS, 'salesforce.panels.SalesforcePanel']
+
+Every SOQL query of a HTTP request is listed with the time split to compile,
+network, JSON decode and parsing of rows, with the number of rows and with
+pages fetched by `query_more`. Duplicate queries (the same SOQL and parameters)
+and similar queries (the same SOQL with other parameters, e.g. N+1 patterns)
+are marked. Requests that are not queries (writes by SObject Collections,
+describe, Bulk API...) are listed separately. The consumed API requests are
+summarized with the usage of the daily limit from the header Sforce-Limit-Info.
+
+Events are collected by instrumentation hooks (`salesforce.dbapi.instrumentation`)
+only while a request is recorded. The package "django-debug-toolbar" is an
+optional dependency, the recorder `record()` can be used without it.
+"""
+import contextlib
+import contextvars
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.db import connections
+from django.utils.html import format_html, format_html_join
+
+from salesforce.dbapi import instrumentation
+from salesforce.router import is_sf_database
+
+try:
+    from debug_toolbar.panels import Panel  # type: ignore[import]
+except ImportError:
+    Panel = None
+
+_Records = Dict[str, List[Dict[str, Any]]]
+
+_current_records = contextvars.ContextVar('salesforce_panel_records', default=None)  # type: Any
+
+
+class PanelRecorder(instrumentation.Hook):
+    """Collect events of the current context while it is recorded by `record()`
+
+    Pages of a query are collected also from threads of a parallel fetch,
+    other requests only from the thread of the recorded context.
+    """
+
+    def request_end(self, event: instrumentation.RequestEvent) -> None:
+        if event.cursor is not None:
+            pages = event.cursor.context.get('panel_pages')
+            if pages is not None:
+                pages.append(request_record(event))
+            return
+        records = _current_records.get()
+        if records is not None:
+            records['requests'].append(request_record(event))
+
+    def cursor_start(self, event: instrumentation.CursorEvent) -> None:
+        records = _current_records.get()
+        if records is not None:
+            event.context['panel_pages'] = []
+            event.context['panel_record'] = record = query_record(event)
+            records['queries'].append(record)
+
+    def cursor_end(self, event: instrumentation.CursorEvent) -> None:
+        record = event.context.get('panel_record')
+        if record is not None:
+            record.update(query_record(event))
+
+
+recorder = PanelRecorder()
+_recording_count = 0
+_recording_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def record() -> Iterator[_Records]:
+    """Record queries and requests in this context to a dict {'queries': [...], 'requests': [...]}"""
+    global _recording_count  # pylint:disable=global-statement
+    with _recording_lock:
+        if not _recording_count:
+            instrumentation.add_hook(recorder)
+        _recording_count += 1
+    records = {'queries': [], 'requests': []}  # type: _Records
+    token = _current_records.set(records)
+    try:
+        yield records
+    finally:
+        _current_records.reset(token)
+        with _recording_lock:
+            _recording_count -= 1
+            if not _recording_count:
+                instrumentation.remove_hook(recorder)
+
+
+def request_record(event: instrumentation.RequestEvent) -> Dict[str, Any]:
+    return dict(method=event.method, url=event.url, endpoint=event.endpoint, status_code=event.status_code,
+                bytes_out=event.bytes_out, bytes_in=event.bytes_in, retries=event.retries,
+                time=event.duration, start_time=event.start_time,
+                error=repr(event.error) if event.error is not None else '')
+
+
+def query_record(event: instrumentation.CursorEvent) -> Dict[str, Any]:
+    # only values that can be serialized by the toolbar store
+    return dict(soql=event.soql, params=[repr(x) for x in event.params], alias=event.alias,
+                rows=event.rows, requests=event.requests, compile_time=event.compile_time,
+                network_time=event.network_time, decode_time=event.decode_time, parse_time=event.parse_time,
+                time=event.duration, start_time=event.start_time, finished=event.finished,
+                error=repr(event.error) if event.error is not None else '',
+                pages=event.context.get('panel_pages', []))
+
+
+def api_usage() -> Dict[str, List[int]]:
+    """The last known usage of API requests by connections of this thread: {alias: [used, limit]}"""
+    ret = {}
+    for alias in connections:
+        if is_sf_database(alias):
+            raw_connection = connections[alias].connection
+            if raw_connection is not None:
+                ret[alias] = [raw_connection.api_usage.api_usage, raw_connection.api_usage.api_limit]
+    return ret
+
+
+def panel_stats(records: _Records, api_usage_before: Optional[Dict[str, List[int]]] = None,
+                api_usage_after: Optional[Dict[str, List[int]]] = None) -> Dict[str, Any]:
+    """Statistics for the panel with marked duplicate and similar queries"""
+    queries = sorted(records['queries'], key=lambda x: x['start_time'])
+    duplicates = Counter((x['alias'], x['soql'], tuple(x['params'])) for x in queries)
+    similar = Counter((x['alias'], x['soql']) for x in queries)
+    for query in queries:
+        query['duplicates'] = duplicates[(query['alias'], query['soql'], tuple(query['params']))]
+        query['similar'] = similar[(query['alias'], query['soql'])]
+    requests = sorted(records['requests'], key=lambda x: x['start_time'])
+    usage = []
+    for alias, (used, limit) in sorted((api_usage_after or {}).items()):
+        before = (api_usage_before or {}).get(alias)
+        usage.append(dict(alias=alias, used=used, limit=limit, before=before[0] if before else None))
+    return dict(
+        queries=queries, requests=requests, api_usage=usage,
+        api_requests=sum(x['requests'] for x in queries) + sum(1 + x['retries'] for x in requests),
+        query_time=sum(x['time'] for x in queries),
+        request_time=sum(x['time'] for x in requests),
+        duplicate_count=sum(count - 1 for count in duplicates.values()),
+        similar_count=sum(count - 1 for count in similar.values() if count > 1),
+    )
+
+
+def _ms(seconds: float) -> str:
+    return '{:.1f}'.format(seconds * 1000)
+
+
+def render_stats(stats: Dict[str, Any]) -> str:
+    """HTML content of the panel"""
+    summary = format_html(
+        '<p>{} API requests, {} queries ({} duplicate, {} similar), {} other requests</p>',
+        stats['api_requests'], len(stats['queries']), stats['duplicate_count'], stats['similar_count'],
+        len(stats['requests']))
+    usage = format_html_join('', '<p>API usage of "{}": {} of {} requests per 24 hours{}</p>', (
+        (x['alias'], x['used'], x['limit'],
+         '' if x['before'] is None else ' (before this request {})'.format(x['before']))
+        for x in stats['api_usage']))
+    query_rows = format_html_join('', (
+        '<tr><td>{}</td><td><code>{}</code><br>{}{}{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td>'
+        '<td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'), (
+        (i, query['soql'], ', '.join(query['params']),
+         format_html(' <strong>duplicated {} times</strong>', query['duplicates']) if query['duplicates'] > 1 else '',
+         format_html(' <strong>{} similar queries</strong>', query['similar']) if query['similar'] > 1 else '',
+         query['rows'],
+         format_html_join(', ', '{}', ((_ms(page['time']),) for page in query['pages'])) or query['requests'],
+         _ms(query['compile_time']), _ms(query['network_time']), _ms(query['decode_time']),
+         _ms(query['parse_time']), _ms(query['time']), query['alias'],
+         query['error'] or ('' if query['finished'] else 'not finished'))
+        for i, query in enumerate(stats['queries'], 1)))
+    request_rows = format_html_join('', (
+        '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>'), (
+        (req['method'], req['url'], req['endpoint'], req['status_code'], req['bytes_out'], req['bytes_in'],
+         _ms(req['time']), req['error'] or (req['retries'] or ''))
+        for req in stats['requests']))
+    return format_html(
+        '{}{}<h4>SOQL queries</h4><table><thead><tr><th>#</th><th>SOQL</th><th>Rows</th>'
+        '<th>Pages (ms)</th><th>Compile (ms)</th><th>Network (ms)</th><th>Decode (ms)</th><th>Parse (ms)</th>'
+        '<th>Total (ms)</th><th>Database</th><th>Error</th></tr></thead><tbody>{}</tbody></table>'
+        '<h4>Other requests</h4><table><thead><tr><th>Method</th><th>URL</th><th>Endpoint</th><th>Status</th>'
+        '<th>Bytes out</th><th>Bytes in</th><th>Time (ms)</th><th>Error or retries</th></tr></thead>'
+        '<tbody>{}</tbody></table>',
+        summary, usage, query_rows, request_rows)
+
+
+if Panel is not None:
+    class SalesforcePanel(Panel):  # type: ignore[misc,valid-type]
+        """Panel of django-debug-toolbar with SOQL queries and REST API requests"""
+        title = "Salesforce"
+        is_async = False
+
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            super().__init__(*args, **kwargs)
+            self._records = {'queries': [], 'requests': []}  # type: _Records
+            self._api_usage_before = {}  # type: Dict[str, List[int]]
+
+        @property
+        def nav_subtitle(self) -> str:
+            stats = self.get_stats()
+            if not stats:
+                return ''
+            return "{} API requests in {} ms".format(stats['api_requests'],
+                                                     _ms(stats['query_time'] + stats['request_time']))
+
+        def process_request(self, request: Any) -> Any:
+            self._api_usage_before = api_usage()
+            with record() as self._records:
+                return super().process_request(request)
+
+        def generate_stats(self, request: Any, response: Any) -> None:
+            self.record_stats(panel_stats(self._records, self._api_usage_before, api_usage()))
+
+        @property
+        def content(self) -> str:
+            return render_stats(self.get_stats())
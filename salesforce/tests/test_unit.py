@@ -3,14 +3,22 @@ Tests that do not need to connect servers
 """
 # pylint:disable=unused-variable
 
-from typing import Type
+from typing import Any, Dict, List, Type
+from unittest import mock
+import gzip
+import json
+import tempfile
+import threading
+import time
 from django.apps.registry import Apps
 from django.test import TestCase
-from django.db.models import DO_NOTHING, Subquery
+from django.db.models import DO_NOTHING, Count, F, Subquery
 from salesforce import fields, models
-from salesforce.dbapi import driver
+from salesforce.dbapi import describe_cache, driver, pool
 from salesforce.testrunner.example.models import (
         Contact, Opportunity, OpportunityContactRole, ChargentOrder, Test as TestModel)
+from salesforce.backend import compile_cache
+from salesforce.backend.compiler import SQLCompiler
 from salesforce.backend.test_helpers import default_is_sf, LazyTestMixin, skipUnless
 from salesforce.backend.utils import sobj_id
 
@@ -195,6 +203,52 @@ class QueryTest(TestCase):
         expected = "SELECT django_Test__c.Id FROM django_Test__c WHERE django_Test__c.Contact__r.Name IN (%s, %s)"
         self.assertEqual(soql, expected)
 
+    def test_column_types(self):
+        qs = Contact.objects.values_list('last_name', 'email_bounced_date', 'owner__Username')
+        compiler = qs.query.get_compiler('salesforce')
+        compiler.as_sql()
+        self.assertEqual(compiler.get_column_types(), ['CharField', 'DateTimeField', 'CharField'])
+
+
+class CompileCacheTest(TestCase):
+    def setUp(self) -> None:
+        compile_cache.reset_compile_caches()
+        self.addCleanup(compile_cache.reset_compile_caches)
+
+    def test_hit(self) -> None:
+        def compile_(qs):
+            compiler = qs.query.get_compiler('salesforce')
+            return compiler.as_sql(), compiler
+
+        (sql_1, params_1), compiler_1 = compile_(Contact.objects.filter(last_name='a', owner__Username='b')[:5])
+        with mock.patch.object(SQLCompiler, 'pre_sql_setup') as mock_setup:
+            (sql_2, params_2), compiler = compile_(Contact.objects.filter(last_name='c', owner__Username='d')[:5])
+            mock_setup.assert_not_called()
+        self.assertEqual(params_1, ('a', 'b'))
+        self.assertEqual((sql_2, params_2), (sql_1, ('c', 'd')))
+        self.assertEqual(compiler.get_column_types(), compiler_1.get_column_types())
+        self.assertEqual(compiler.klass_info['model'], Contact)
+
+    def test_different_shapes(self) -> None:
+        qs = Contact.objects.values('pk')
+        self.assertIn('IN (%s, %s)', qs.filter(last_name__in=['a', 'b']).query.get_compiler('salesforce').as_sql()[0])
+        self.assertIn('IN (%s)', qs.filter(last_name__in=['a']).query.get_compiler('salesforce').as_sql()[0])
+        self.assertIn('= null', qs.filter(email__isnull=True).query.get_compiler('salesforce').as_sql()[0])
+        self.assertIn('!= null', qs.filter(email__isnull=False).query.get_compiler('salesforce').as_sql()[0])
+        self.assertIn('LIMIT 2', str(qs.filter(last_name='a')[:2].query))
+        self.assertNotIn('LIMIT', str(qs.filter(last_name='a').query))
+
+    def test_not_cacheable(self) -> None:
+        qs = Contact.objects.filter(last_name='a')
+        compiler = qs.query.get_compiler('salesforce')
+        self.assertIsNotNone(compile_cache.query_fingerprint(compiler, True, False))
+        for qs in (Contact.objects.annotate(cnt=Count('pk')),
+                   Contact.objects.filter(last_name=F('first_name')),
+                   Contact.objects.filter(pk__in=Contact.objects.values('pk')),
+                   Contact.objects.order_by(F('last_name').desc())):
+            compiler = qs.query.get_compiler('salesforce')
+            self.assertIsNone(compile_cache.query_fingerprint(compiler, True, False))
+
 
 class SfParamsTest(TestCase):
     # type checking of this test case is currently not possible
@@ -231,6 +285,13 @@ class SfParamsTest(TestCase):
         qs = Contact.objects.filter(first_name='Peter').values('last_name').sf(minimal_aliases=True)
         self.assertEqual(str(qs.query), expected_sql)
 
+    def test_parallel_params(self):
+        """Test that parameters of parallel fetch are passed from qs to a salesforce compiler"""
+        qs = Contact.objects.sf(parallel_workers=3, parallel_ordered=False)
+        compiler = qs.query.get_compiler('salesforce')
+        self.assertEqual((compiler.sf_params.parallel_workers, compiler.sf_params.parallel_ordered), (3, False))
+        self.assertEqual(Contact.objects.all().query.get_compiler('salesforce').sf_params.parallel_workers, 0)
+
 
 class RegisterConversionTest(TestCase):
     @staticmethod
@@ -264,3 +325,138 @@ class RegisterConversionTest(TestCase):
         self.assertNotIn(models.SalesforceModel, driver.json_conversions)
         self.assertNotIn(models.SalesforceModel, driver.sql_conversions)
         self.assertNotIn(models.SalesforceModel, driver.subclass_conversions)
+
+
+class SharedPoolTest(TestCase):
+    def test_shared_adapter(self) -> None:
+        settings_dict = {'OPTIONS': {'POOL_MAXSIZE': 3, 'POOL_BLOCK': True}}
+        url = 'https://pool-test.example.com'
+        adapters = []  # type: List[pool.SharedHTTPAdapter]
+        thread = threading.Thread(target=lambda: adapters.append(
+            pool.get_shared_adapter('pool_test', url, settings_dict, max_retries=0)))
+        thread.start()
+        thread.join()
+        adapter = pool.get_shared_adapter('pool_test', url, settings_dict, max_retries=0)
+        try:
+            self.assertIs(adapters[0], adapter)
+            adapter.close()  # ignored if called by a session
+            # get a (not connected) connection from the pool without a request
+            http_pool = adapter.poolmanager.connection_from_url(url)
+            http_pool._put_conn(http_pool._get_conn())  # pylint:disable=protected-access
+            stats = pool.pool_statistics()['pool_test ' + url]
+            self.assertEqual((stats['maxsize'], stats['in_use']), (3, 0))
+            self.assertEqual(stats['max_wait_time'], stats['wait_time'])  # exactly one wait measured
+        finally:
+            del pool._shared_adapters[('pool_test', url)]  # pylint:disable=protected-access
+            adapter.close_pool()
+
+
+class GzipRequestTest(TestCase):
+    def test_gzip_min_size(self) -> None:
+        self.assertEqual(driver.get_gzip_min_size({}), None)
+        self.assertEqual(driver.get_gzip_min_size({'OPTIONS': {'GZIP_REQUESTS': True}}), driver.GZIP_MIN_SIZE)
+        self.assertEqual(driver.get_gzip_min_size({'OPTIONS': {'GZIP_REQUESTS': 0}}), 0)
+
+    def test_gzip_json_body(self) -> None:
+        stats = driver.CompressionStats()
+        records = {'records': [{'attributes': {'type': 'Contact'}, 'Description': 'x' * 1000}] * 10}
+        kwargs = {'json': records, 'headers': {'Sforce-Auto-Assign': 'FALSE'}}
+        driver.gzip_json_body(kwargs, 1024, stats)
+        self.assertNotIn('json', kwargs)
+        self.assertEqual(json.loads(gzip.decompress(kwargs['data'])), records)
+        self.assertEqual(kwargs['headers'], {'Sforce-Auto-Assign': 'FALSE', 'Content-Type': 'application/json',
+                                             'Content-Encoding': 'gzip'})
+        self.assertEqual((stats.requests, stats.request_bytes_sent), (1, len(kwargs['data'])))
+        self.assertGreater(stats.bytes_saved, 9000)
+        # a small body is not compressed
+        kwargs = {'json': {'LastName': 'a'}}
+        driver.gzip_json_body(kwargs, 1024, stats)
+        self.assertEqual(kwargs, {'json': {'LastName': 'a'}})
+        self.assertEqual(stats.requests, 1)
+
+
+class SharedConnectionStateTest(TestCase):
+    """State of a connection that is used also by worker threads of its cursors"""
+
+    def test_reauthenticate_once(self) -> None:
+        auth = mock.Mock()
+        auth.get_auth.return_value = {'access_token': 'old'}
+        auth.reauthenticate.side_effect = lambda: auth.get_auth.return_value.update(access_token='new') or 'new'
+        session = mock.Mock(auth=auth)
+        connection = mock.Mock(_lock=threading.Lock())
+        # two requests of parallel workers failed with the same expired token
+        responses = [mock.Mock(request=mock.Mock(headers={'Authorization': 'OAuth old'})) for _ in range(2)]
+        reauthenticate = driver.RawConnection._reauthenticate  # pylint:disable=protected-access
+        tokens = [reauthenticate(connection, session, response) for response in responses]
+        self.assertEqual(tokens, ['new', 'new'])
+        self.assertEqual(auth.reauthenticate.call_count, 1)
+
+    def test_time_statistics_callback_once(self) -> None:
+        stats = driver.time_statistics.__class__(300)
+        callback = mock.Mock()
+        barrier = threading.Barrier(4)
+
+        def request() -> None:
+            barrier.wait()
+            stats.update_callback('https://example.my.salesforce.com/services/data', callback)
+
+        threads = [threading.Thread(target=request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(callback.call_count, 1)
+
+    def test_counters(self) -> None:
+        stats = driver.CompressionStats()
+        threads = [threading.Thread(target=lambda: [stats.add_request(10, 1) for _ in range(1000)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((stats.requests, stats.request_bytes, stats.bytes_saved), (4000, 40000, 36000))
+
+
+class DescribeCacheTest(TestCase):
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()  # pylint:disable=consider-using-with
+        self.addCleanup(tmp_dir.cleanup)
+        self.directory = tmp_dir.name
+        self.requests = []  # type: List[Dict[str, str]]
+
+    def fetch(self, headers: Dict[str, str]) -> Any:
+        self.requests.append(headers)
+        if 'If-Modified-Since' in headers:
+            return mock.Mock(status_code=304, headers={})
+        return mock.Mock(status_code=200, headers={'Last-Modified': 'Mon, 19 Oct 2026 10:00:00 GMT'},
+                         json=lambda **kw: {'name': 'Contact', 'fields': []})
+
+    def test_revalidate(self) -> None:
+        key = ('00D000000000001', '66.0', '', 'Contact')
+        cache = describe_cache.DescribeCache(self.directory, max_age=60, background=False)
+        self.assertEqual(cache.get(key, self.fetch), {'name': 'Contact', 'fields': []})
+        self.assertEqual(cache.get(key, self.fetch)['name'], 'Contact')  # fresh, without request
+        self.assertEqual(self.requests, [{}])
+        # a new process with an expired entry on disk
+        cache = describe_cache.DescribeCache(self.directory, max_age=0, background=False)
+        self.assertEqual(cache.get(key, self.fetch)['name'], 'Contact')
+        self.assertEqual(self.requests[1], {'If-Modified-Since': 'Mon, 19 Oct 2026 10:00:00 GMT'})
+        self.assertEqual(cache.statistics(), {'fresh': 0, 'stale': 0, 'not_modified': 1, 'downloaded': 0})
+
+    def test_stale_while_revalidate(self) -> None:
+        key = ('00D000000000001', '66.0', 'tooling', 'ApexClass')
+        describe_cache.DescribeCache(self.directory, background=False).get(key, self.fetch)
+        cache = describe_cache.DescribeCache(self.directory, max_age=0)
+        self.assertEqual(cache.get(key, self.fetch)['name'], 'Contact')  # stale, returned immediately
+        for _ in range(100):
+            if cache.statistics()['not_modified']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.statistics(), {'fresh': 0, 'stale': 1, 'not_modified': 1, 'downloaded': 0})
+
+    def test_org_key(self) -> None:
+        self.assertEqual(describe_cache.org_key({'id': 'https://login.salesforce.com/id/00D000000000001AAA/'
+                                                       '005000000000001AAA'}, 'https://na1.salesforce.com'),
+                         '00D000000000001AAA')
+        self.assertEqual(describe_cache.org_key({}, 'https://na1.salesforce.com'), 'na1_salesforce_com')
@@ -0,0 +1,167 @@
+"""
+Tests of the Salesforce REST API emulator by the driver and by the ORM
+"""
+import threading
+import warnings
+from typing import Any, Dict
+from unittest import TestCase
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+from django.db import connections
+
+from salesforce.dbapi import driver
+from salesforce.dbapi.exceptions import SalesforceError, SalesforceWarning
+from salesforce.emulator import Emulator
+from salesforce.emulator.app import id18
+from salesforce.emulator.schema import tables_from_models
+from salesforce.emulator.soql import compile_query, SoqlError
+from salesforce.testrunner.example.models import Account, Contact
+
+SF_ALIAS = 'salesforce'
+API_VERSION = '52.0'
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:  # pylint:disable=redefined-builtin
+        pass
+
+
+class TranslationTest(TestCase):
+    schema = {x.name.lower(): x for x in tables_from_models()}
+
+    def test_parent_relationship(self) -> None:
+        compiled = compile_query("SELECT Contact.LastName, Contact.Account.Name FROM Contact "
+                                 "WHERE Contact.Account.Name = 'a' AND Contact.Email != null", self.schema)
+        self.assertEqual(
+            compiled.sql,
+            'SELECT t0."LastName", t1."Name", t0."Id", t1."Id" FROM "Contact" t0 '
+            'LEFT JOIN "Account" t1 ON t1."Id" = t0."AccountId" AND t1."IsDeleted" = 0 '
+            'WHERE t0."IsDeleted" = 0 AND (t1."Name" = ? AND t0."Email" IS NOT NULL)')
+        self.assertEqual(compiled.params, ['a'])
+
+    def test_literals(self) -> None:
+        compiled = compile_query("SELECT Id FROM Contact WHERE EmailBouncedDate < 2020-01-01T00:00:00+02:00 "
+                                 "AND LastName NOT IN ('O\\'Neil', 'x') LIMIT 10", self.schema, include_deleted=True)
+        self.assertIn('t0."LastName" IS NULL OR t0."LastName" NOT IN (?, ?)', compiled.sql)
+        self.assertTrue(compiled.sql.endswith('LIMIT 10 OFFSET 0'))
+        self.assertEqual(compiled.params, ['2019-12-31T22:00:00.000+0000', "O'Neil", 'x'])
+
+    def test_errors(self) -> None:
+        for soql, error_code in [
+                ("SELECT Id, (SELECT Id FROM Contacts) FROM Account", 'MALFORMED_QUERY'),
+                ("SELECT Id FROM Contact WHERE CreatedDate > TODAY", 'MALFORMED_QUERY'),
+                ("SELECT Nonsense FROM Contact", 'INVALID_FIELD'),
+                ("SELECT Id FROM Nonsense", 'INVALID_TYPE')]:
+            with self.assertRaises(SoqlError) as cm:
+                compile_query(soql, self.schema)
+            self.assertEqual(cm.exception.error_code, error_code)
+
+    def test_id18(self) -> None:
+        self.assertEqual(id18('001A0000006Vm9r'), '001A0000006Vm9rIAC')
+
+
+class EmulatorTest(TestCase):
+    """The emulator is used by a real HTTP server in a thread"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.emulator = Emulator(api_version=API_VERSION)
+        cls.server = make_server('127.0.0.1', 0, cls.emulator, handler_class=QuietHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.settings_dict = {
+            'ENGINE': 'salesforce.backend', 'HOST': 'http://127.0.0.1:{}'.format(cls.server.server_port),
+            'CONSUMER_KEY': 'key', 'CONSUMER_SECRET': 'secret', 'USER': 'user', 'PASSWORD': 'password',
+            'API_VERSION': API_VERSION,
+        }  # type: Dict[str, Any]
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.emulator.db.close()
+        super().tearDownClass()
+
+    def setUp(self) -> None:
+        self.connection = driver.connect(settings_dict=self.settings_dict, alias='emulator')
+        self.addCleanup(driver.get_thread_connections().pop, 'emulator', None)
+        # the ORM uses the emulator instead of Salesforce
+        wrapper = connections[SF_ALIAS]
+        self.addCleanup(setattr, wrapper, 'connection', wrapper.connection)
+        wrapper.connection = self.connection
+
+    def test_query_and_crud(self) -> None:
+        cursor = self.connection.cursor()
+        contact_id = self.emulator.create('Contact', {'LastName': 'Emulated'})
+        cursor.execute("SELECT LastName FROM Contact WHERE Id = %s", [contact_id])
+        self.assertEqual(cursor.fetchall(), [('Emulated',)])
+        self.connection.handle_api_exceptions('PATCH', 'sobjects/Contact', contact_id, json={'FirstName': 'Tom'})
+        self.assertEqual(Contact.objects.get(pk=contact_id).name, 'Tom Emulated')
+        response = self.connection.handle_api_exceptions('GET', 'limits')
+        self.assertIn('api-usage=', response.headers['Sforce-Limit-Info'])
+        Contact.objects.filter(pk=contact_id).delete()
+        self.assertFalse(Contact.objects.filter(pk=contact_id).exists())
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT LastName FROM Contact WHERE Id = %s", [contact_id], query_all=True)
+        self.assertEqual(cursor.fetchall(), [('Emulated',)])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', SalesforceWarning)
+            self.connection.handle_api_exceptions('DELETE', 'sobjects/Contact', contact_id)  # ENTITY_IS_DELETED
+
+    def test_orm(self) -> None:
+        account = Account.objects.create(Name='Orm Account')
+        contacts = Contact.objects.bulk_create([
+            Contact(first_name='John', last_name='Doe', account=account),
+            Contact(last_name='Nobody'),
+        ])
+        self.addCleanup(Contact.objects.filter(pk__in=[x.pk for x in contacts]).delete)
+        self.addCleanup(account.delete)
+        contact = Contact.objects.select_related('account').get(pk=contacts[0].pk)
+        self.assertEqual((contact.name, contact.account.Name), ('John Doe', 'Orm Account'))
+        self.assertEqual(list(Contact.objects.filter(account__isnull=True, pk__in=[x.pk for x in contacts])
+                              .values_list('last_name', 'account__Name')), [('Nobody', None)])
+        self.assertEqual(Contact.objects.filter(last_name__startswith='no', pk__in=[x.pk for x in contacts])
+                         .count(), 1)
+
+    def test_query_more(self) -> None:
+        contact_ids = self.connection.sobject_collections_chunks(
+            'POST', [{'type_': 'Contact', 'LastName': 'Page {:03d}'.format(i)} for i in range(250)])
+        self.addCleanup(self.connection.sobject_collections_chunks, 'DELETE', contact_ids)
+        self.emulator.page_size = 200
+        self.addCleanup(setattr, self.emulator, 'page_size', 2000)
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT Id, LastName FROM Contact WHERE LastName LIKE 'Page%%' ORDER BY LastName")
+        rows = cursor.fetchall()
+        self.assertEqual([x[1] for x in rows], ['Page {:03d}'.format(i) for i in range(250)])
+        self.assertIsNotNone(cursor.handle)
+        cursor.execute("SELECT COUNT() FROM Contact WHERE LastName LIKE 'Page%%'")
+        self.assertEqual(cursor.rowcount, 250)
+
+    def test_collections_all_or_none(self) -> None:
+        with self.assertRaises(SalesforceError) as cm:
+            self.connection.sobject_collections_request(
+                'POST', [{'type_': 'Contact', 'LastName': 'Valid'}, {'type_': 'Contact', 'FirstName': 'Invalid'}])
+        self.assertIn('REQUIRED_FIELD_MISSING', str(cm.exception))
+        self.assertEqual(Contact.objects.filter(last_name='Valid').count(), 0)
+
+    def test_composite_reference(self) -> None:
+        url = '/services/data/v{}/'.format(API_VERSION)
+        response = self.connection.composite_request([
+            {'method': 'POST', 'url': url + 'sobjects/Contact', 'referenceId': 'contact',
+             'body': {'LastName': 'Composite'}},
+            {'method': 'PATCH', 'url': url + 'sobjects/Contact/@{contact.id}', 'referenceId': 'update',
+             'body': {'FirstName': 'Jane'}},
+            {'method': 'GET', 'url': url + "query/?q=SELECT+Name+FROM+Contact+WHERE+Id='@{contact.id}'",
+             'referenceId': 'query'},
+        ]).json()['compositeResponse']
+        self.addCleanup(self.connection.sobject_collections_request, 'DELETE', [response[0]['body']['id']])
+        self.assertEqual([x['httpStatusCode'] for x in response], [201, 204, 200])
+        self.assertEqual(response[2]['body']['records'][0]['Name'], 'Jane Composite')
+
+    def test_error_injection(self) -> None:
+        self.emulator.error_rate = 1.0
+        self.addCleanup(setattr, self.emulator, 'error_rate', 0.0)
+        with self.assertRaises(SalesforceError) as cm:
+            self.connection.handle_api_exceptions('GET', 'limits')
+        self.assertIn('SERVER_UNAVAILABLE', str(cm.exception))
@@ -1,7 +1,12 @@
-from unittest import TestCase
+import datetime
+from unittest import mock, TestCase
+import pytz
+from salesforce.dbapi import subselect
+from salesforce.dbapi.exceptions import NotSupportedError
 from salesforce.dbapi.subselect import (
-    find_closing_parenthesis, split_subquery, transform_except_subquery,
-    mark_quoted_strings, subst_quoted_strings, simplify_expression,
+    QQuery, find_closing_parenthesis, split_subquery, transform_except_subquery,
+    mark_quoted_strings, subst_quoted_strings, simplify_expression, fix_data_type, parse_sf_datetime,
+    split_in_list, parse_order_by, parse_retrieve_query,
 )
 
 
@@ -63,3 +68,149 @@ class ReplaceQuotedStringsTest(TestCase):
 
     def test_simplify_expression(self):
         self.assertEqual(simplify_expression(' a \t b  c . . d '), 'a b c..d')
+
+
+class ParseRestResponseTest(TestCase):
+    def test_nested_and_empty_outer_join(self):
+        qquery = QQuery("SELECT Contact.Name, Contact.Account.Name, Account.Owner.Email, "
+                        "(SELECT Subject FROM Tasks) FROM Contact")
+        self.assertEqual(qquery.aliases, ['Name', 'Account.Name', 'Account.Owner.Email', 'Tasks'])
+        tasks = {'totalSize': 0, 'done': True, 'records': []}
+        records = [
+            {'attributes': {'type': 'Contact'}, 'Name': 'a', 'Tasks': tasks,
+             'Account': {'attributes': {'type': 'Account'}, 'Name': 'b',
+                         'Owner': {'attributes': {'type': 'User'}, 'Email': 'c@example.com'}}},
+            {'attributes': {'type': 'Contact'}, 'Name': 'd', 'Account': None, 'Tasks': None},
+        ]
+        self.assertEqual(list(qquery.parse_rest_response(records, 2)),
+                         [('a', 'b', 'c@example.com', tasks), ('d', None, None, None)])
+        self.assertEqual(list(qquery.parse_rest_response(records[1:], 2, row_type=dict)),
+                         [{'Name': 'd', 'Account.Name': None, 'Account.Owner.Email': None, 'Tasks': None}])
+
+    def test_incomplete_child_records(self):
+        qquery = QQuery("SELECT Contact.Name, (SELECT Subject FROM Tasks) FROM Contact")
+        tasks = {'totalSize': 300, 'done': False, 'records': [],
+                 'nextRecordsUrl': '/services/data/v52.0/query/01gD0000002HU6KIAW-200'}
+        records = [{'attributes': {'type': 'Contact'}, 'Name': 'a', 'Tasks': tasks}]
+        with self.assertRaises(NotSupportedError) as cm:
+            list(qquery.parse_rest_response(records, 1))
+        self.assertIn("'Tasks'", cm.exception.args[0])
+
+    def test_case_insensitive_keys(self):
+        qquery = QQuery("SELECT name, CreatedDate FROM Contact")
+        records = [{'attributes': {'type': 'Contact'}, 'Name': 'a', 'CreatedDate': '2020-01-02T03:04:05.000+0000'}]
+        row, = qquery.parse_rest_response(records, 1, row_type=list)
+        self.assertEqual(row, ['a', datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=pytz.utc)])
+
+    def test_aggregation(self):
+        qquery = QQuery("SELECT Contact.LastName, COUNT(Contact.Id) cnt FROM Contact GROUP BY Contact.LastName")
+        records = [{'attributes': {'type': 'AggregateResult'}, 'LastName': 'a', 'cnt': 2}]
+        self.assertEqual(list(qquery.parse_rest_response(records, 1)), [('a', 2)])
+
+    def test_column_types(self):
+        qquery = QQuery("SELECT Name, Description, CreatedDate, Account.Name FROM Contact")
+        looks_like_date = '2020-01-02T03:04:05.000+0000'
+        records = [{'attributes': {'type': 'Contact'}, 'Name': 'a', 'Description': looks_like_date,
+                    'CreatedDate': '2020-01-02T03:04:05.678+0000', 'Account': None}]
+        qquery.set_column_types(['CharField', 'TextField', 'DateTimeField', None])
+        row, = qquery.parse_rest_response(records, 1)
+        self.assertEqual(row, ('a', looks_like_date, datetime.datetime(2020, 1, 2, 3, 4, 5, 678000, tzinfo=pytz.utc),
+                               None))
+
+    def test_column_types_from_describe(self):
+        descriptions = {
+            'Contact': {'fields': [
+                {'name': 'Name', 'type': 'string', 'relationshipName': None, 'referenceTo': []},
+                {'name': 'AccountId', 'type': 'reference', 'relationshipName': 'Account', 'referenceTo': ['Account']},
+                {'name': 'OwnerId', 'type': 'reference', 'relationshipName': 'Owner',
+                 'referenceTo': ['Group', 'User']},
+            ]},
+            'Account': {'fields': [
+                {'name': 'LastModifiedDate', 'type': 'datetime', 'relationshipName': None, 'referenceTo': []},
+            ]},
+        }
+        qquery = QQuery("SELECT Contact.Name, Contact.Account.LastModifiedDate, Contact.Owner.Name, Contact.Foo "
+                        "FROM Contact")
+        self.assertEqual(qquery.column_types_from_describe(descriptions.__getitem__),
+                         ['string', 'datetime', None, None])
+
+
+class QueryPlanCacheTest(TestCase):
+    def setUp(self):
+        subselect.clear_query_plans()
+        self.addCleanup(subselect.clear_query_plans)
+
+    def test_shared_plan(self):
+        soql = "SELECT Contact.Name, Contact.CreatedDate, (SELECT Subject FROM Tasks) FROM Contact WHERE Name = %s"
+        qquery_1 = QQuery(soql)
+        qquery_2 = QQuery(soql)
+        self.assertIs(qquery_1.plan, qquery_2.plan)
+        self.assertEqual(subselect.query_plan_statistics(), {'hits': 1, 'misses': 2, 'size': 2})  # with subquery
+        # column types are not shared
+        qquery_1.set_column_types(['CharField', 'DateTimeField', None])
+        self.assertEqual(qquery_2.converters, [fix_data_type] * 3)
+        self.assertEqual(qquery_2.description([None, None, None])[:2],
+                         [('Name', None, None, None, 'Contact.Name'),
+                          ('CreatedDate', None, None, None, 'Contact.CreatedDate')])
+
+    def test_size(self):
+        with mock.patch.object(subselect.settings, 'SF_QUERY_PLAN_CACHE_SIZE', 2, create=True):
+            for i in range(3):
+                QQuery("SELECT Id FROM Contact LIMIT {}".format(i + 1))
+            self.assertEqual(subselect.query_plan_statistics()['size'], 2)
+            QQuery("SELECT Id FROM Contact LIMIT 1")  # the least recently used is evicted
+            self.assertEqual(subselect.query_plan_statistics(), {'hits': 0, 'misses': 4, 'size': 2})
+
+
+class SplitInListTest(TestCase):
+    @staticmethod
+    def param_length(x):
+        return len(x) + 2  # quoted
+
+    def test_split(self):
+        soql = "SELECT Id FROM Contact WHERE (Name = %s AND Id IN (%s, %s, %s)) LIMIT 5"
+        params = ['x', 'a', 'b', 'c']
+        full_length = len(soql % ("'x'", "'a'", "'b'", "'c'"))
+        self.assertIsNone(split_in_list(soql, params, self.param_length, full_length))
+        self.assertEqual(split_in_list(soql, params, self.param_length, full_length - 1), [
+            ("SELECT Id FROM Contact WHERE (Name = %s AND Id IN (%s, %s)) LIMIT 5", ['x', 'a', 'b']),
+            ("SELECT Id FROM Contact WHERE (Name = %s AND Id IN (%s)) LIMIT 5", ['x', 'c']),
+        ])
+        self.assertEqual(len(split_in_list(soql, params, self.param_length, 0)), 3)
+
+    def test_split_duplicates(self):
+        soql = "SELECT Id FROM Contact WHERE Id IN (%s, %s, %s, %s)"
+        self.assertEqual(split_in_list(soql, ['a', 'b', 'a', 'b'], self.param_length, 0), [
+            ("SELECT Id FROM Contact WHERE Id IN (%s)", ['a']),
+            ("SELECT Id FROM Contact WHERE Id IN (%s)", ['b']),
+        ])
+
+    def test_not_split(self):
+        for soql in ("SELECT Id FROM Contact WHERE Name = %s OR Id IN (%s, %s, %s)",
+                     "SELECT Id FROM Contact WHERE NOT Name = %s AND Id IN (%s, %s, %s)",
+                     "SELECT Id FROM Contact WHERE Name = %s AND Id NOT IN (%s, %s, %s)",
+                     "SELECT Id FROM Contact WHERE Name = %s AND Id IN (%s, %s, %s) OFFSET 10",
+                     "SELECT Name, COUNT(Id) FROM Contact WHERE Name = %s AND Id IN (%s, %s, %s) GROUP BY Name",
+                     "SELECT Id, (SELECT Id FROM Cases) FROM Contact WHERE Name = %s AND Id IN (%s, %s, %s)"):
+            self.assertIsNone(split_in_list(soql, ['x', 'a', 'b', 'c'], self.param_length, 0), soql)
+
+    def test_parse_retrieve_query(self):
+        soql = "SELECT Contact.Id, Contact.Name FROM Contact WHERE Contact.Id IN (%s, %s) ORDER BY Contact.Name DESC"
+        self.assertEqual(parse_retrieve_query(soql), ('Contact', ['Id', 'Name']))
+        for soql in ("SELECT Contact.Id, Account.Name FROM Contact WHERE Contact.Id IN (%s, %s)",
+                     "SELECT Contact.Id FROM Contact WHERE Contact.Id IN (%s, %s) AND Name = %s",
+                     "SELECT Contact.Id FROM Contact WHERE Contact.AccountId IN (%s, %s)",
+                     "SELECT Contact.Id FROM Contact WHERE Contact.Id IN (%s, %s) LIMIT 1",
+                     "SELECT COUNT() FROM Contact WHERE Contact.Id IN (%s, %s)"):
+            self.assertIsNone(parse_retrieve_query(soql), soql)
+
+    def test_parse_order_by(self):
+        self.assertEqual(parse_order_by("SELECT Id FROM Contact ORDER BY Contact.Name DESC NULLS LAST, Id LIMIT 5"),
+                         [('Contact.Name', True, True), ('Id', False, False)])
+        self.assertEqual(parse_order_by("SELECT Id FROM Contact"), [])
+
+
+class ParseDatetimeTest(TestCase):
+    def test_parse_sf_datetime(self):
+        for value in ('2020-01-02T03:04:05.678+0000', '2020-01-02', 'abc', None, 1):
+            self.assertEqual(parse_sf_datetime(value), fix_data_type(value))
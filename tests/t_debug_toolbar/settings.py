@@ -1,7 +1,9 @@
 from salesforce.testrunner.settings import *  # NOQA pylint: disable=unused-wildcard-import,wildcard-import
 from salesforce.testrunner.settings import INSTALLED_APPS, MIDDLEWARE
+from debug_toolbar.settings import PANELS_DEFAULTS  # type: ignore[import]
 
 INSTALLED_APPS += ['debug_toolbar', 'tests.t_debug_toolbar', 'tests.t_debug_toolbar.small_app']
 MIDDLEWARE = ['debug_toolbar.middleware.DebugToolbarMiddleware'] + MIDDLEWARE
 ROOT_URLCONF = 'tests.t_debug_toolbar.urls'
 INTERNAL_IPS = ['127.0.0.1']
+DEBUG_TOOLBAR_PANELS = [*PANELS_DEFAULTS, 'salesforce.panels.SalesforcePanel']
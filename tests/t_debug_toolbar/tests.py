@@ -30,6 +30,7 @@ class DebugToolbarAdminTest(TestCase):
         """Check that django-debug-toolbar is enabled."""
         resp = self.client.get('/admin/example/campaign/add/')
         self.assertContains(resp, 'djDebugToolbar')
+        self.assertContains(resp, 'SalesforcePanel')
 
     def test_simple_create(self):
         resp = self.client.post('/admin/example/campaign/add/', {'name': 'test_' + uid})
@@ -44,6 +44,7 @@ from typing import Any, Callable, cast, Dict, Iterable, Iterator, List, Optional
 from unittest import mock, TestCase  # pylint:disable=unused-import  # NOQA
 import json as json_mod
 import re
+from urllib.parse import urlencode
 
 import requests.models
 from django.db import connections
@@ -181,7 +182,8 @@ class MockRequest:
                  req: Union[str, Dict[str, Any], None] = None, resp: Optional[str] = None,
                  request_json: Any = None,
                  request_type: Optional[str] = None, response_type: Optional[str] = None,
-                 status_code: int = 200, check_request: bool = True) -> None:
+                 status_code: int = 200, check_request: bool = True,
+                 response_headers: Optional[Dict[str, str]] = None) -> None:
         method, url = method_url.split(' ', 1)
         self.method = method
         self.url = url
@@ -192,16 +194,19 @@ class MockRequest:
         self.response_type = response_type
         self.status_code = status_code
         self.check_request = check_request
+        self.response_headers = response_headers
 
     def request(self, method: str, url: str, data: Optional[str] = None, json: Any = None,
                 testcase: Optional[SimpleTestCase] = None, **kwargs: Any) -> 'MockResponse':
         # pylint:disable=too-many-branches
         """Compare the request to the expected. Return the expected response.
-        Supported kwargs: 'msg', 'headers', 'timeout', 'verify'
+        Supported kwargs: 'msg', 'headers', 'timeout', 'verify', 'params'
         """
         if testcase is None:
             raise TypeError("Required keyword argument 'testcase' not found")
         msg = kwargs.pop('msg', None)
+        if kwargs.get('params'):
+            url += '?' + urlencode(kwargs.pop('params'))
         if self.check_request:
             testcase.assertEqual(method.upper(), self.method.upper())
             testcase.assertEqual(url, self.url, msg=msg)
@@ -218,7 +223,8 @@ class MockRequest:
             request_type = kwargs['headers'].pop('Content-Type', '') or request_type
         response = response_class(self.response_data,
                                   status_code=self.status_code,
-                                  resp_content_type=self.response_type)
+                                  resp_content_type=self.response_type,
+                                  resp_headers=self.response_headers)
         response.request = RequestHint(method, url, body=data, headers={'content-type': request_type})
         if not self.check_request:
             return response
@@ -328,18 +334,26 @@ class MockResponse:
     default_type = None  # type: Optional[str]
     request = None  # type: RequestHint
 
-    def __init__(self, text: Optional[str], resp_content_type: Optional[str] = None, status_code: int = 200) -> None:
+    def __init__(self, text: Optional[str], resp_content_type: Optional[str] = None, status_code: int = 200,
+                 resp_headers: Optional[Dict[str, str]] = None) -> None:
         self.text = text
         self.status_code = status_code
         self.content_type = resp_content_type if resp_content_type is not None else self.default_type
+        self.resp_headers = resp_headers or {}
 
     def json(self, parse_float: Optional[Callable[[str], Any]] = None) -> Any:
         assert self.text
         return json_mod.loads(self.text.replace('...', ''), parse_float=parse_float)
 
+    @property
+    def content(self) -> bytes:
+        return (self.text or '').encode('utf-8')
+
     @property
     def headers(self) -> Dict[str, str]:
-        return {'Content-Type': self.content_type} if self.content_type else {}
+        headers = {'Content-Type': self.content_type} if self.content_type else {}
+        headers.update(self.resp_headers)
+        return headers
 
 
 class MockJsonResponse(MockResponse):
@@ -0,0 +1,218 @@
+"""
+Tests of the asynchronous driver by recorded requests (without network and without aiohttp)
+"""
+import asyncio
+import json
+from typing import Any, List, Optional, Tuple, Union
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from salesforce.auth import MockAuth
+from salesforce.backend.compiler import SQLCompiler
+from salesforce.backend.query import SalesforceQuerySet
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi import aio, governor, instrumentation, retry
+from salesforce.dbapi.exceptions import ApiLimitError, FakeReq, SalesforceError
+from tests.test_mock.test_cursor import LOCATOR, page_json
+from tests.test_mock2.models import Contact
+
+# expected request "METHOD url", expected json data or None, response text or a raised exception
+Expected = Tuple[str, Optional[Any], Union[str, BaseException]]
+
+QUERY_URL = "GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Name+FROM+Contact"
+
+
+class MockAsyncConnection(aio.AsyncConnection):
+    """AsyncConnection that plays recorded responses instead of requests by aiohttp"""
+    def __init__(self, expected: List[Expected]) -> None:
+        super().__init__({'USER': '', 'API_VERSION': '44.0'}, alias='dummy',
+                         sf_auth=MockAuth('dummy', {'USER': ''}))
+        self.expected = expected
+        self.response_headers = {'Content-Type': 'application/json'}
+
+    async def _send(self, method: str, url: str, **kwargs: Any) -> aio.AsyncResponse:
+        assert self.expected, "Unexpected request {} {}".format(method, url)
+        method_url, data, text = self.expected.pop(0)
+        assert method_url == '{} {}'.format(method, url), method_url
+        assert data == kwargs.get('json'), kwargs.get('json')
+        if isinstance(text, BaseException):
+            raise text
+        return aio.AsyncResponse(400 if '"errorCode"' in text else 200, self.response_headers, text,
+                                 FakeReq(method, url, json.dumps(data)))
+
+
+class AsyncCursorTest(SimpleTestCase):
+
+    def test_pages(self) -> None:
+        conn = MockAsyncConnection([
+            (QUERY_URL, None, page_json(['a', 'b'], 3, 2)),
+            ('GET mock://{}-2'.format(LOCATOR), None, page_json(['c'], 3)),
+        ])
+
+        async def run() -> None:
+            cursor = conn.cursor()
+            await cursor.execute("SELECT Contact.Name FROM Contact")
+            self.assertEqual(await cursor.fetchone(), ('a',))
+            self.assertEqual([row async for row in cursor], [('b',), ('c',)])
+            self.assertEqual((cursor.rownumber, cursor.rowcount), (3, 3))
+            self.assertEqual(await cursor.fetchone(), None)
+
+        asyncio.run(run())
+        self.assertEqual(conn.expected, [])
+
+    def test_fetchpage(self) -> None:
+        conn = MockAsyncConnection([
+            (QUERY_URL, None, page_json(['a', 'b'], 3, 2)),
+            ('GET mock://{}-2'.format(LOCATOR), None, page_json(['c'], 3)),
+        ])
+
+        async def run() -> List[List[Tuple[Any, ...]]]:
+            cursor = conn.cursor()
+            await cursor.execute("SELECT Contact.Name FROM Contact")
+            return [await cursor.fetchpage() for _ in range(3)]
+
+        self.assertEqual(asyncio.run(run()), [[('a',), ('b',)], [('c',)], []])
+
+    def test_sobject_collections_error(self) -> None:
+        resp = ('[{"success": false, "errors": [{"statusCode": "DUPLICATES_DETECTED", '
+                '"message": "Use one of these records?", "fields": []}]}]')
+        conn = MockAsyncConnection([
+            ('POST mock:///services/data/v44.0/composite/sobjects',
+             {'records': [{'attributes': {'type': 'Account'}, 'Name': 'a'}], 'allOrNone': False}, resp),
+        ])
+        records = [{'type_': 'Account', 'Name': 'a'}]
+        with self.assertRaises(SalesforceError) as cm:
+            asyncio.run(conn.sobject_collections_request('POST', records, all_or_none=False))
+        self.assertIn('Account  DUPLICATES_DETECTED', cm.exception.args[0])
+
+    def test_timeout_retry(self) -> None:
+        """Timeouts are retried by the retry policy like by the synchronous driver"""
+        self.addCleanup(retry.reset_retry_policies)
+        retry.reset_retry_policies()
+        conn = MockAsyncConnection([
+            (QUERY_URL, None, asyncio.TimeoutError()),
+            (QUERY_URL, None, page_json(['a'], 1)),
+            (QUERY_URL, None, asyncio.TimeoutError()),
+        ])
+        conn.settings_dict['OPTIONS'] = {'RETRY': {'BASE_DELAY': 0.001, 'MAX_DELAY': 0.001}}
+
+        async def run() -> List[Tuple[Any, ...]]:
+            cursor = conn.cursor()
+            await cursor.execute("SELECT Contact.Name FROM Contact")
+            return await cursor.fetchall()
+
+        self.assertEqual(asyncio.run(run()), [('a',)])
+        self.assertEqual(retry.retry_statistics()['dummy']['reasons'], {'TimeoutError': 1})
+        conn.settings_dict['OPTIONS'] = {}
+        with self.assertRaises(SalesforceError) as cm:
+            asyncio.run(run())
+        self.assertIn('Timeout', str(cm.exception))
+        self.assertEqual(conn.expected, [])
+
+
+class AsyncQuerySetTest(SimpleTestCase):
+    databases = {'salesforce'}
+
+    def run_with(self, expected: List[Expected], coroutine: Any, conn: Optional[MockAsyncConnection] = None) -> Any:
+        conn = conn or MockAsyncConnection([])
+        conn.expected.extend(expected)
+        with mock.patch.object(aio, 'aiohttp', True), \
+                mock.patch.object(SalesforceQuerySet, '_async_connection', return_value=conn):
+            ret = asyncio.run(coroutine)
+        self.assertEqual(conn.expected, [])
+        return ret
+
+    def test_aiterator(self) -> None:
+        records = [{'attributes': {'type': 'Contact'}, 'Id': '003A00000000001AAA', 'LastName': 'a'}]
+        resp = json.dumps({'totalSize': 1, 'done': True, 'records': records})
+
+        async def run() -> List[Contact]:
+            return [obj async for obj in Contact.objects.db_manager(sf_alias).only('last_name').aiterator()]
+
+        contacts = self.run_with([
+            ('GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Id%2C+Contact.LastName+FROM+Contact',
+             None, resp),
+        ], run())
+        self.assertEqual([(x.pk, x.last_name) for x in contacts], [('003A00000000001AAA', 'a')])
+
+    def test_aiterator_compiled_once(self) -> None:
+        def page(pk: str, next_offset: Optional[int] = None) -> str:
+            data = {'totalSize': 2, 'done': next_offset is None,
+                    'records': [{'attributes': {'type': 'Contact'}, 'Id': pk, 'LastName': 'a'}]}  # type: Any
+            if next_offset is not None:
+                data['nextRecordsUrl'] = '{}-{}'.format(LOCATOR, next_offset)
+            return json.dumps(data)
+
+        async def run() -> List[Contact]:
+            return [obj async for obj in Contact.objects.db_manager(sf_alias).only('last_name').aiterator()]
+
+        with mock.patch.object(SQLCompiler, 'as_sql', autospec=True, side_effect=SQLCompiler.as_sql) as as_sql:
+            contacts = self.run_with([
+                ('GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Id%2C+Contact.LastName+FROM+Contact',
+                 None, page('003A00000000001AAA', 1)),
+                ('GET mock://{}-1'.format(LOCATOR), None, page('003A00000000002AAA')),
+            ], run())
+        self.assertEqual([x.pk for x in contacts], ['003A00000000001AAA', '003A00000000002AAA'])
+        self.assertEqual(as_sql.call_count, 1)
+
+    def test_instrumentation(self) -> None:
+        metrics = instrumentation.MetricsAggregator()
+        instrumentation.add_hook(metrics)
+        self.addCleanup(instrumentation.remove_hook, metrics)
+        records = [{'attributes': {'type': 'Contact'}, 'Id': '003A00000000001AAA', 'LastName': 'a'}]
+        resp = json.dumps({'totalSize': 1, 'done': True, 'records': records})
+
+        async def run() -> List[Contact]:
+            with instrumentation.labels(view='contact_list'):
+                return [obj async for obj in Contact.objects.db_manager(sf_alias).only('last_name').aiterator()]
+
+        self.run_with([
+            ('GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Id%2C+Contact.LastName+FROM+Contact',
+             None, resp),
+        ], run())
+        snapshot = metrics.snapshot()
+        [requests] = snapshot['requests']
+        self.assertEqual((requests['endpoint'], requests['labels'], requests['count']),
+                         ('query', {'view': 'contact_list'}, 1))
+        [query] = snapshot['queries']
+        self.assertEqual((query['soql'], query['count'], query['rows'], query['requests']),
+                         ('SELECT Contact.Id, Contact.LastName FROM Contact', 1, 1, 1))
+        self.assertGreater(query['compile_time'], 0)
+
+    def test_acount(self) -> None:
+        resp = json.dumps({'totalSize': 5, 'done': True, 'records': []})
+        count = self.run_with([
+            ("GET mock:///services/data/v44.0/query/?q=SELECT+COUNT%28%29+FROM+Contact+"
+             "WHERE+Contact.LastName+%3D+%27a%27", None, resp),
+        ], Contact.objects.db_manager(sf_alias).filter(last_name='a').acount())
+        self.assertEqual(count, 5)
+
+    @mock.patch('salesforce.backend.query.invalidate_table')
+    def test_abulk_create(self, invalidate_table: mock.Mock) -> None:
+        resp = '[{"id": "003A00000000001AAA", "success": true, "errors": []}]'
+        objs = self.run_with([
+            ('POST mock:///services/data/v44.0/composite/sobjects',
+             {'records': [{'attributes': {'type': 'Contact'}, 'LastName': 'a', 'Donor_class__c': 'x'}],
+              'allOrNone': None}, resp),
+        ], Contact.objects.db_manager(sf_alias).abulk_create([Contact(last_name='a', donor_class='x')]))
+        self.assertEqual(objs[0].pk, '003A00000000001AAA')
+        invalidate_table.assert_called_once_with(sf_alias, mock.ANY, 'Contact')
+
+    def test_governor(self) -> None:
+        governor.reset_governors()
+        self.addCleanup(governor.reset_governors)
+        conn = MockAsyncConnection([])
+        conn.settings_dict['OPTIONS'] = {'API_GOVERNOR': {'BATCH_LIMIT': 90}}
+        conn.response_headers['Sforce-Limit-Info'] = 'api-usage=90/100'
+        resp = json.dumps({'totalSize': 5, 'done': True, 'records': []})
+        qs = Contact.objects.db_manager(sf_alias).filter(last_name='a')
+        self.assertEqual(self.run_with([
+            ("GET mock:///services/data/v44.0/query/?q=SELECT+COUNT%28%29+FROM+Contact+"
+             "WHERE+Contact.LastName+%3D+%27a%27", None, resp),
+        ], qs.acount(), conn=conn), 5)
+        with self.assertRaises(ApiLimitError):
+            self.run_with([], qs.sf(priority='batch').acount(), conn=conn)
+        with self.assertRaises(ApiLimitError):
+            self.run_with([], qs.sf(priority='batch').abulk_create([Contact(last_name='a')]), conn=conn)
+        self.assertEqual([x['refused'] for x in governor.governor_statistics().values()], [2])
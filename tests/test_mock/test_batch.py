@@ -0,0 +1,121 @@
+"""
+Tests of deferred batching of writes by salesforce.batch_writes()
+"""
+import json
+from typing import Any, Dict, List
+from unittest import mock
+
+import salesforce
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.batch import BatchWriteError
+from salesforce.dbapi.exceptions import SalesforceError
+from tests.test_mock.mocksf import MockJsonRequest, MockTestCase
+from tests.test_mock2.models import Contact
+
+COLLECTIONS_URL = 'mock:///services/data/v44.0/composite/sobjects'
+
+
+def ok(*pks: str) -> str:
+    return json.dumps([{'id': pk, 'success': True, 'errors': []} for pk in pks])
+
+
+def records(*items: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [dict(item, attributes={'type': 'Contact'}) for item in items]
+
+
+class BatchWritesTest(MockTestCase):
+    api_version = '44.0'
+
+    def test_save_delete(self) -> None:
+        self.mock_add_expected([
+            MockJsonRequest('POST ' + COLLECTIONS_URL,
+                            req=json.dumps({'records': records({'LastName': 'a'}, {'LastName': 'b'}),
+                                            'allOrNone': False}),
+                            resp=ok('003A00000000001AAA', '003A00000000002AAA')),
+            MockJsonRequest('PATCH ' + COLLECTIONS_URL,
+                            req=json.dumps({'records': records({'LastName': 'y', 'id': '003A00000000009AAA'}),
+                                            'allOrNone': False}),
+                            resp=ok('003A00000000009AAA')),
+            MockJsonRequest('DELETE {}?ids=003A00000000008AAA&allOrNone=false'.format(COLLECTIONS_URL),
+                            resp=ok('003A00000000008AAA')),
+        ])
+        new_contacts = [Contact(last_name='a'), Contact(last_name='b')]
+        old_contact = Contact(pk='003A00000000009AAA', last_name='x')
+        deleted_contact = Contact(pk='003A00000000008AAA', last_name='z')
+        with salesforce.batch_writes(using=sf_alias):
+            for obj in new_contacts:
+                obj.save(using=sf_alias)
+            old_contact.save(using=sf_alias, update_fields=['last_name'])
+            # more updates of the same object are merged
+            old_contact.last_name = 'y'
+            old_contact.save(using=sf_alias, update_fields=['last_name'])
+            deleted_contact.delete(using=sf_alias)
+            self.assertEqual([x.pk for x in new_contacts], [None, None])
+        self.assertEqual([x.pk for x in new_contacts], ['003A00000000001AAA', '003A00000000002AAA'])
+
+    def test_errors(self) -> None:
+        error = {'success': False, 'errors': [{'statusCode': 'REQUIRED_FIELD_MISSING', 'message': 'Required fields',
+                                               'fields': ['LastName']}]}
+        self.mock_add_expected([
+            MockJsonRequest('POST ' + COLLECTIONS_URL,
+                            req=json.dumps({'records': records({'LastName': 'a'}, {'LastName': ''}),
+                                            'allOrNone': False}),
+                            resp=json.dumps([{'id': '003A00000000001AAA', 'success': True, 'errors': []}, error])),
+        ])
+        objs = [Contact(last_name='a'), Contact(last_name=''), Contact(last_name='c')]
+        with self.assertRaises(BatchWriteError) as cm:
+            with salesforce.batch_writes(using=sf_alias, max_batch=2):
+                for obj in objs:
+                    obj.save(using=sf_alias)  # the batch is flushed by the second save
+        self.assertEqual(cm.exception.failed, [(objs[1], error['errors'])])
+        self.assertIn('errors=1, success=1', cm.exception.args[0])
+        # the third object is not saved because the error is raised by save() of the second one
+        self.assertEqual([x.pk for x in objs], ['003A00000000001AAA', None, None])
+
+    def test_saved_twice(self) -> None:
+        self.mock_add_expected([
+            MockJsonRequest('POST ' + COLLECTIONS_URL,
+                            req=json.dumps({'records': records({'LastName': 'b'}), 'allOrNone': False}),
+                            resp=ok('003A00000000001AAA')),
+        ])
+        obj = Contact(last_name='a')
+        with mock.patch('salesforce.backend.utils.invalidate_table') as invalidate_table:
+            with salesforce.batch_writes(using=sf_alias):
+                obj.save(using=sf_alias)
+                # the instance has no primary key yet and it is still inserted only once
+                obj.last_name = 'b'
+                obj.save(using=sf_alias)
+            # cached results are invalidated by the flush, not by queued writes
+            invalidate_table.assert_not_called()
+        self.assertEqual(obj.pk, '003A00000000001AAA')
+
+    def test_queryset_update_not_queued(self) -> None:
+        """QuerySet.update() of more objects is sent immediately, like without a batch"""
+        self.mock_add_expected([
+            MockJsonRequest('PATCH ' + COLLECTIONS_URL,
+                            req=json.dumps({'records': records({'LastName': 'x', 'id': '003A00000000001AAA'},
+                                                               {'LastName': 'x', 'id': '003A00000000002AAA'}),
+                                            'allOrNone': None}),
+                            resp=ok('003A00000000001AAA', '003A00000000002AAA')),
+        ])
+        with salesforce.batch_writes(using=sf_alias) as batch:
+            count = Contact.objects.db_manager(sf_alias).filter(
+                pk__in=['003A00000000001AAA', '003A00000000002AAA']).update(last_name='x')
+            self.assertEqual(count, 2)
+            self.assertEqual(batch.queues, {})
+
+    def test_transport_error(self) -> None:
+        """Writes are not lost if the request fails, they can be flushed again"""
+        request = {'records': records({'LastName': 'a'}), 'allOrNone': False}
+        self.mock_add_expected([
+            MockJsonRequest('POST ' + COLLECTIONS_URL, req=json.dumps(request),
+                            resp='[{"errorCode": "SERVER_UNAVAILABLE", "message": "Try again"}]', status_code=503),
+            MockJsonRequest('POST ' + COLLECTIONS_URL, req=json.dumps(request), resp=ok('003A00000000001AAA')),
+        ])
+        obj = Contact(last_name='a')
+        with salesforce.batch_writes(using=sf_alias) as batch:
+            obj.save(using=sf_alias)
+            with self.assertRaises(SalesforceError):
+                batch.flush()
+            self.assertIsNone(obj.pk)
+        self.assertEqual(obj.pk, '003A00000000001AAA')
@@ -0,0 +1,189 @@
+"""
+Tests of Bulk API 2.0 ingest jobs by recorded requests (without network)
+"""
+import datetime
+import json
+from decimal import Decimal
+from typing import List, Sequence
+from urllib.parse import urlencode
+
+import pytz
+
+from django.test import SimpleTestCase
+
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi import bulk2
+from salesforce.dbapi.exceptions import IntegrityError
+from tests.test_mock.mocksf import MockJsonRequest, MockRequest, MockTestCase
+from tests.test_mock2.models import Contact, Unreal
+
+JOB_URL = 'mock:///services/data/v44.0/jobs/ingest/750M0000001abcdIAA'
+
+
+def job_requests(operation: str, csv_data: bytes, successful: str, failed: str) -> List[MockRequest]:
+    """Requests of one complete ingest job with Contact"""
+    header = csv_data.split(b'\n')[0].decode()
+    return [
+        MockJsonRequest('POST mock:///services/data/v44.0/jobs/ingest/',
+                        req=json.dumps({'object': 'Contact', 'operation': operation, 'contentType': 'CSV',
+                                        'lineEnding': 'LF'}),
+                        resp='{"id": "750M0000001abcdIAA", "state": "Open"}'),
+        MockRequest('PUT {}/batches'.format(JOB_URL), req=csv_data, request_type='text/csv', status_code=201),
+        MockJsonRequest('PATCH {}'.format(JOB_URL), req='{"state": "UploadComplete"}',
+                        resp='{"id": "750M0000001abcdIAA", "state": "UploadComplete"}'),
+        MockJsonRequest('GET {}'.format(JOB_URL), resp='{"id": "750M0000001abcdIAA", "state": "JobComplete"}'),
+        MockRequest('GET {}/successfulResults/'.format(JOB_URL), resp=successful, response_type='text/csv'),
+        MockRequest('GET {}/failedResults/'.format(JOB_URL), resp=failed, response_type='text/csv'),
+        MockRequest('GET {}/unprocessedrecords/'.format(JOB_URL), resp=header + '\n', response_type='text/csv'),
+    ]
+
+
+def bulk_query_requests(soql: str, pages: Sequence[str], query_all: bool = False) -> List[MockRequest]:
+    """Requests of a Bulk API query job that plays back recorded pages of CSV results
+
+    The pages are chained by fake locators in the header Sforce-Locator.
+    """
+    query_url = 'mock:///services/data/v44.0/jobs/query/750M0000002abcdIAA'
+    total = sum(len(page.strip().split('\n')) - 1 for page in pages)
+    requests = [
+        MockJsonRequest('POST mock:///services/data/v44.0/jobs/query/',
+                        req=json.dumps({'operation': 'queryAll' if query_all else 'query', 'query': soql}),
+                        resp='{"id": "750M0000002abcdIAA", "state": "UploadComplete"}'),
+        MockJsonRequest('GET {}'.format(query_url),
+                        resp=json.dumps({'id': '750M0000002abcdIAA', 'state': 'JobComplete',
+                                         'numberRecordsProcessed': total})),
+    ]  # type: List[MockRequest]
+    for i, page in enumerate(pages):
+        url = '{}/results?{}'.format(query_url, urlencode({'locator': 'locator{}'.format(i)})) if i else (
+            '{}/results'.format(query_url))
+        locator = 'locator{}'.format(i + 1) if i + 1 < len(pages) else 'null'
+        requests.append(MockRequest('GET {}'.format(url), resp=page, response_type='text/csv',
+                                    response_headers={'Sforce-Locator': locator,
+                                                      'Sforce-NumberOfRecords': str(len(page.split('\n')) - 2)}))
+    return requests
+
+
+class BulkQueryTest(MockTestCase):
+    api_version = '44.0'
+
+    def test_iterator(self) -> None:
+        self.mock_add_expected(bulk_query_requests('SELECT Contact.Id, Contact.LastName FROM Contact', [
+            '"Id","LastName"\n"003A00000000001AAA","a"\n"003A00000000002AAA","b, c"\n',
+            '"Id","LastName"\n"003A00000000003AAA","d"\n',
+        ]))
+        qs = Contact.objects.db_manager(sf_alias).sf(bulk_query=True).only('last_name')
+        self.assertEqual([(x.pk, x.last_name) for x in qs.iterator()], [
+            ('003A00000000001AAA', 'a'), ('003A00000000002AAA', 'b, c'), ('003A00000000003AAA', 'd')])
+
+    def test_column_types(self) -> None:
+        self.mock_add_expected(bulk_query_requests(
+            'SELECT Unreal.BoolX, Unreal.IntX, Unreal.DecimalX, Unreal.DatetimeX, Unreal.StrX FROM Unreal', [
+                '"BoolX","IntX","DecimalX","DatetimeX","StrX"\n'
+                '"true","12","1.5","2021-03-19T12:05:33.000Z","2021-03-19T12:05:33.000Z"\n'
+                '"false","","","",""\n',
+            ], query_all=True))
+        qs = Unreal.objects.db_manager(sf_alias).sf(bulk_query=True, query_all=True).values_list(
+            'bool_x', 'int_x', 'decimal_x', 'datetime_x', 'str_x')
+        self.assertEqual(list(qs), [
+            (True, 12, Decimal('1.50'), datetime.datetime(2021, 3, 19, 12, 5, 33, tzinfo=pytz.utc),
+             '2021-03-19T12:05:33.000Z'),
+            (False, None, None, None, None),
+        ])
+
+
+class BulkIngestTest(MockTestCase):
+    api_version = '44.0'
+
+    def test_bulk_create(self) -> None:
+        self.mock_add_expected(job_requests(
+            'insert', b'LastName,Donor_class__c\nb,x\na,x\n',
+            successful='"sf__Id","sf__Created",LastName,Donor_class__c\n"003A00000000001AAA","true",a,x\n',
+            failed='"sf__Id","sf__Error",LastName,Donor_class__c\n'
+                   '"","DUPLICATES_DETECTED:Use one of these records?: --",b,x\n'))
+        objs = [Contact(last_name='b', donor_class='x'), Contact(last_name='a', donor_class='x')]
+        with self.assertRaises(IntegrityError) as cm:
+            Contact.objects.db_manager(sf_alias).sf(bulk_api=True).bulk_create(objs)
+        self.assertIn('errors=1, rollback/cancel=0, success=1', cm.exception.args[0])
+        self.assertIn('    0  Contact  DUPLICATES_DETECTED: Use one of these records?', cm.exception.args[0])
+        # the successful object is saved in spite of the error
+        self.assertEqual([x.pk for x in objs], [None, '003A00000000001AAA'])
+
+    def test_bulk_update(self) -> None:
+        self.mock_add_expected(job_requests(
+            'update', b'LastName,Id\na,003A00000000001AAA\nb,003A00000000002AAA\n',
+            successful='"sf__Id","sf__Created",LastName,Id\n'
+                       '"003A00000000002AAA","false",b,003A00000000002AAA\n'
+                       '"003A00000000001AAA","false",a,003A00000000001AAA\n',
+            failed='"sf__Id","sf__Error",LastName,Id\n'))
+        objs = [Contact(pk='003A00000000001AAA', last_name='a'), Contact(pk='003A00000000002AAA', last_name='b')]
+        for obj in objs:
+            obj._state.db = sf_alias  # pylint:disable=protected-access
+        Contact.objects.db_manager(sf_alias).sf(bulk_api=True).bulk_update(objs, ['last_name'])
+
+    def test_normalized_results(self) -> None:
+        csv_data = b'Name,BoolX,DecimalX\na,true,1.50\na,false,1.50\n'
+        self.mock_add_expected(job_requests(
+            'insert', csv_data,
+            successful='"sf__Id","sf__Created",Name,BoolX,DecimalX\n'
+                       '"003A00000000002AAA","true",a,FALSE,1.5\n'
+                       '"003A00000000001AAA","true",a ,TRUE,1.5\n',
+            failed='"sf__Id","sf__Error",Name,BoolX,DecimalX\n'))
+        result = bulk2.ingest(self.sf_connection, 'insert', 'Contact', [
+            {'Name': 'a', 'BoolX': True, 'DecimalX': '1.50'}, {'Name': 'a', 'BoolX': False, 'DecimalX': '1.50'}])
+        self.assertEqual(result.ids, ['003A00000000001AAA', '003A00000000002AAA'])
+
+    def test_value_normalized_by_server(self) -> None:
+        """A picklist value is saved with a different case, the result is matched by other values"""
+        self.mock_add_expected(job_requests(
+            'insert', b'LastName,LeadSource\na,web\nb,Phone\n',
+            successful=('"sf__Id","sf__Created",LastName,LeadSource\n'
+                        '"003A00000000002AAA","true",b,Phone\n"003A00000000001AAA","true",a,Web\n'),
+            failed='"sf__Id","sf__Error",LastName,LeadSource\n'))
+        result = bulk2.ingest(self.sf_connection, 'insert', 'Contact', [
+            {'LastName': 'a', 'LeadSource': 'web'}, {'LastName': 'b', 'LeadSource': 'Phone'}])
+        self.assertEqual(result.ids, ['003A00000000001AAA', '003A00000000002AAA'])
+        self.assertEqual(result.errors, [])
+
+    def test_unmatched_result(self) -> None:
+        """Results that can not be matched are reported by errors, without an exception after the commit"""
+        self.mock_add_expected(job_requests(
+            'insert', b'LastName\na\nb\n',
+            successful=('"sf__Id","sf__Created",LastName\n'
+                        '"003A00000000001AAA","true",x\n"003A00000000002AAA","true",y\n'),
+            failed='"sf__Id","sf__Error",LastName\n'))
+        with self.assertLogs('salesforce.dbapi.bulk2', 'WARNING'):
+            result = bulk2.ingest(self.sf_connection, 'insert', 'Contact', [{'LastName': 'a'}, {'LastName': 'b'}])
+        self.assertEqual(result.ids, [None, None])
+        self.assertEqual([(i, err['statusCode']) for i, _, err in result.errors],
+                         [(0, 'UNMATCHED_RESULT'), (1, 'UNMATCHED_RESULT')])
+        with self.assertRaises(IntegrityError):
+            result.raise_errors()
+
+
+class BulkHelpersTest(SimpleTestCase):
+
+    def test_csv_chunks(self) -> None:
+        rows = [('a', 'x,y'), ('b', 'z')]
+        self.assertEqual(list(bulk2.csv_chunks(['Name', 'Note'], rows, 100)),
+                         [(b'Name,Note\na,"x,y"\nb,z\n', 2)])
+        self.assertEqual(list(bulk2.csv_chunks(['Name', 'Note'], rows, 20)),
+                         [(b'Name,Note\na,"x,y"\n', 1), (b'Name,Note\nb,z\n', 1)])
+
+    def test_csv_value(self) -> None:
+        self.assertEqual([bulk2.csv_value(x, '#N/A') for x in (True, False, None, '1.5')],
+                         ['true', 'false', '#N/A', '1.5'])
+        self.assertEqual(bulk2.match_key('2021-03-19T14:05:33.000+0200'), bulk2.match_key('2021-03-19T12:05:33Z'))
+
+    def test_parse_error(self) -> None:
+        self.assertEqual(bulk2.parse_error('REQUIRED_FIELD_MISSING:Required fields are missing: [Name]:Name --'),
+                         {'statusCode': 'REQUIRED_FIELD_MISSING', 'message': 'Required fields are missing: [Name]',
+                          'fields': ['Name']})
+
+    def test_use_bulk_api(self) -> None:
+        settings_dict = {'OPTIONS': {'BULK_API_THRESHOLD': 1000}}
+        self.assertFalse(bulk2.use_bulk_api({}, 10000))
+        self.assertFalse(bulk2.use_bulk_api(settings_dict, 999))
+        self.assertTrue(bulk2.use_bulk_api(settings_dict, 1000))
+        self.assertFalse(bulk2.use_bulk_api(settings_dict, 1000, all_or_none=True))
+        self.assertFalse(bulk2.use_bulk_api(settings_dict, 1000, bulk_api=False))
+        self.assertTrue(bulk2.use_bulk_api({}, 1, bulk_api=True))
@@ -0,0 +1,85 @@
+"""
+Tests of SObject Collections requests sent by chunks, sequentially or concurrently
+"""
+import json
+import threading
+import time
+from typing import Any, Dict, List
+from unittest import mock
+
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi.exceptions import SalesforceError
+from tests.test_mock.mocksf import MockJsonRequest, MockTestCase
+from tests.test_mock2.models import Contact
+
+ERROR = {'success': False, 'errors': [{'statusCode': 'FIELD_CUSTOM_VALIDATION_EXCEPTION',
+                                       'message': 'Invalid name', 'fields': []}]}
+
+
+def contacts(count: int) -> List[Contact]:
+    objs = [Contact(pk='003A{:014d}'.format(i), last_name='name{}'.format(i)) for i in range(count)]
+    for obj in objs:
+        obj._state.db = sf_alias  # pylint:disable=protected-access
+    return objs
+
+
+def patch_request(obj: Contact, all_or_none: bool) -> MockJsonRequest:
+    return MockJsonRequest(
+        'PATCH mock:///services/data/v44.0/composite/sobjects',
+        req=json.dumps({'records': [{'LastName': obj.last_name, 'id': obj.pk, 'attributes': {'type': 'Contact'}}],
+                        'allOrNone': all_or_none}),
+        resp=json.dumps([{'id': obj.pk, 'success': True, 'errors': []}]))
+
+
+class ChunksTest(MockTestCase):
+    api_version = '44.0'
+
+    def test_all_or_none_sequential(self) -> None:
+        objs = contacts(3)
+        failed = patch_request(objs[1], True)
+        failed.response_data = json.dumps([ERROR])
+        self.mock_add_expected([patch_request(objs[0], True), failed])  # the third chunk is not sent
+        with self.assertRaises(SalesforceError) as cm:
+            Contact.objects.db_manager(sf_alias).bulk_update(objs, ['last_name'], batch_size=1, all_or_none=True,
+                                                             concurrency=4)
+        self.assertIn('errors=1, rollback/cancel=1, success=1', cm.exception.args[0])
+        self.assertIn('    1 003A00000000000001 Contact  FIELD_CUSTOM_VALIDATION_EXCEPTION', cm.exception.args[0])
+
+    def test_concurrent(self) -> None:
+        lock = threading.Lock()
+        stats = {'in_progress': 0, 'max_in_progress': 0}
+        sent = []  # type: List[str]
+
+        def fake_request(method: str, url: str, json: Dict[str, Any]) -> Any:  # pylint:disable=redefined-outer-name
+            with lock:
+                stats['in_progress'] += 1
+                stats['max_in_progress'] = max(stats['max_in_progress'], stats['in_progress'])
+            time.sleep(0.05)
+            with lock:
+                stats['in_progress'] -= 1
+                sent.extend(x['id'] for x in json['records'])
+            resp_data = [ERROR if x['LastName'] == 'name3' else {'id': x['id'], 'success': True, 'errors': []}
+                         for x in json['records']]
+            return mock.Mock(json=lambda: resp_data)
+
+        objs = contacts(10)
+        with mock.patch.object(self.sf_connection, 'handle_api_exceptions', side_effect=fake_request):
+            with self.assertRaises(SalesforceError) as cm:
+                Contact.objects.db_manager(sf_alias).sf(concurrency=3).bulk_update(
+                    objs, ['last_name'], batch_size=2, all_or_none=False)
+        # all chunks are sent with all_or_none=False and the index of error is in the original list
+        self.assertEqual(sorted(sent), [x.pk for x in objs])
+        self.assertEqual(stats['max_in_progress'], 3)
+        self.assertIn('errors=1, rollback/cancel=0, success=9', cm.exception.args[0])
+        self.assertIn('    3 003A00000000000003 Contact  FIELD_CUSTOM_VALIDATION_EXCEPTION', cm.exception.args[0])
+
+    def test_concurrent_ids_order(self) -> None:
+        def fake_request(method: str, url: str, params: Dict[str, str]) -> Any:
+            ids = params['ids'].split(',')
+            time.sleep(0.02 if ids[0].endswith('0') else 0)  # the first chunk is finished last
+            return mock.Mock(json=lambda: [{'id': x, 'success': True, 'errors': []} for x in ids])
+
+        ids = ['001A{:014d}'.format(i) for i in range(5)]
+        with mock.patch.object(self.sf_connection, 'handle_api_exceptions', side_effect=fake_request):
+            ret = self.sf_connection.sobject_collections_chunks('DELETE', ids, concurrency=5, chunk_size=1)
+        self.assertEqual(ret, ids)
@@ -0,0 +1,233 @@
+"""
+Tests of the cursor in the driver by recorded requests (without network)
+"""
+import gc
+import json
+import time
+from typing import Any, Dict, List, Optional
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.db import connections
+
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi import instrumentation
+from salesforce.dbapi.driver import PagePrefetcher
+from salesforce.dbapi.exceptions import NotSupportedError, SalesforceError
+from tests.test_mock.mocksf import MockJsonRequest, MockTestCase
+
+QUERY_URL = "GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Name+FROM+Contact"
+LOCATOR = '/services/data/v44.0/query/01gM000000zr0N0IAI'
+
+
+def page_json(names: List[str], total_size: int, next_offset: Optional[int] = None) -> str:
+    """Simulated response of one page of a query"""
+    records = [{'attributes': {'type': 'Contact'}, 'Name': name} for name in names]
+    data = {'totalSize': total_size, 'done': next_offset is None, 'records': records}  # type: Dict[str, Any]
+    if next_offset is not None:
+        data['nextRecordsUrl'] = '{}-{}'.format(LOCATOR, next_offset)
+    return json.dumps(data)
+
+
+class CursorPrefetchTest(MockTestCase):
+    api_version = '44.0'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cursor = connections[sf_alias].cursor()
+
+    def add_pages(self) -> None:
+        self.mock_add_expected([
+            MockJsonRequest(QUERY_URL, resp=page_json(['a', 'b'], 5, 2)),
+            MockJsonRequest('GET mock://{}-2'.format(LOCATOR), resp=page_json(['c', 'd'], 5, 4)),
+            MockJsonRequest('GET mock://{}-4'.format(LOCATOR), resp=page_json(['e'], 5)),
+        ])
+
+    def test_without_prefetch(self) -> None:
+        self.add_pages()
+        self.assertEqual(self.cursor.cursor.prefetch_pages, 0)
+        self.cursor.execute("SELECT Contact.Name FROM Contact")
+        self.assertEqual([x[0] for x in self.cursor.fetchall()], ['a', 'b', 'c', 'd', 'e'])
+
+    def test_prefetch(self) -> None:
+        for depth in (1, 2):
+            self.add_pages()
+            self.cursor.cursor.prefetch_pages = depth
+            self.cursor.execute("SELECT Contact.Name FROM Contact")
+            self.assertEqual([x[0] for x in self.cursor.fetchall()], ['a', 'b', 'c', 'd', 'e'])
+            self.assertEqual(self.cursor.cursor.rownumber, 5)
+
+    def test_prefetch_error(self) -> None:
+        self.mock_add_expected([
+            MockJsonRequest(QUERY_URL, resp=page_json(['a', 'b'], 5, 2)),
+            MockJsonRequest('GET mock://{}-2'.format(LOCATOR),
+                            resp='[{"errorCode": "INVALID_QUERY_LOCATOR", "message": "invalid query locator"}]',
+                            status_code=400),
+        ])
+        self.cursor.cursor.prefetch_pages = 1
+        self.cursor.execute("SELECT Contact.Name FROM Contact")
+        self.assertEqual(self.cursor.fetchmany(2), [('a',), ('b',)])
+        with self.assertRaises(SalesforceError) as cm:
+            self.cursor.fetchone()
+        self.assertIn('invalid query locator', str(cm.exception))
+
+    @mock.patch.object(PagePrefetcher, 'put_timeout', 0.01)
+    def test_abandoned_cursor(self) -> None:
+        self.add_pages()
+        cursor = self.cursor.cursor
+        cursor.prefetch_pages = 1
+        cursor.execute("SELECT Contact.Name FROM Contact")
+        self.assertEqual(cursor.fetchone(), ('a',))
+        assert cursor._prefetcher  # pylint:disable=protected-access
+        thread = cursor._prefetcher.thread  # pylint:disable=protected-access
+        session = self.sf_connection._sf_session  # pylint:disable=protected-access
+        for _ in range(200):
+            if session.index == len(session.expected):
+                break  # the thread waits with the last page for a free place in the queue
+            time.sleep(0.01)
+        # the cursor is neither closed nor read to the end
+        del cursor, self.cursor
+        gc.collect()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+
+
+class CursorFetchParallelTest(MockTestCase):
+    api_version = '44.0'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cursor = connections[sf_alias].cursor()
+
+    def test_fetch_parallel(self) -> None:
+        # one worker is used to have a deterministic order of recorded requests
+        self.mock_add_expected([
+            MockJsonRequest(QUERY_URL, resp=page_json(['a', 'b'], 5, 2)),
+            MockJsonRequest('GET mock://{}-2'.format(LOCATOR), resp=page_json(['c', 'd'], 5, 4)),
+            MockJsonRequest('GET mock://{}-4'.format(LOCATOR), resp=page_json(['e'], 5)),
+        ])
+        self.cursor.execute("SELECT Contact.Name FROM Contact")
+        rows = list(self.cursor.cursor.fetch_parallel(workers=1))
+        self.assertEqual([x[0] for x in rows], ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(self.cursor.cursor.rownumber, 5)
+        self.assertEqual(self.cursor.fetchall(), [])
+
+    def test_fetch_parallel_after_fetch_and_short_page(self) -> None:
+        """Continue after the first row; a page shorter than expected is completed by the next url"""
+        self.mock_add_expected([
+            MockJsonRequest(QUERY_URL, resp=page_json(['a', 'b'], 5, 2)),
+            MockJsonRequest('GET mock://{}-2'.format(LOCATOR), resp=page_json(['c'], 5, 3)),
+            MockJsonRequest('GET mock://{}-3'.format(LOCATOR), resp=page_json(['d', 'e'], 5)),
+            MockJsonRequest('GET mock://{}-4'.format(LOCATOR), resp=page_json(['e'], 5)),
+        ])
+        self.cursor.execute("SELECT Contact.Name FROM Contact")
+        self.assertEqual(self.cursor.fetchone(), ('a',))
+        rows = list(self.cursor.cursor.fetch_parallel(workers=1, ordered=False))
+        self.assertEqual([x[0] for x in rows], ['b', 'c', 'd', 'e'])
+
+    def test_fetch_parallel_with_hook(self) -> None:
+        """The rest of the first page is not lost if the rows are timed by instrumentation"""
+        metrics = instrumentation.MetricsAggregator()
+        instrumentation.add_hook(metrics)
+        self.addCleanup(instrumentation.remove_hook, metrics)
+        self.mock_add_expected([
+            MockJsonRequest(QUERY_URL, resp=page_json(['a', 'b'], 5, 2)),
+            MockJsonRequest('GET mock://{}-2'.format(LOCATOR), resp=page_json(['c', 'd'], 5, 4)),
+            MockJsonRequest('GET mock://{}-4'.format(LOCATOR), resp=page_json(['e'], 5)),
+        ])
+        self.cursor.execute("SELECT Contact.Name FROM Contact")
+        self.assertEqual(self.cursor.fetchone(), ('a',))
+        rows = list(self.cursor.cursor.fetch_parallel(workers=1))
+        self.assertEqual([x[0] for x in rows], ['b', 'c', 'd', 'e'])
+
+
+def query_url(soql: str) -> str:
+    return 'GET mock:///services/data/v44.0/query/?' + urlencode(dict(q=soql))
+
+
+class CursorSplitTest(MockTestCase):
+    """Queries with an oversized "IN (...)" list are split"""
+    api_version = '44.0'
+    soql = "SELECT Contact.Name FROM Contact WHERE Contact.Id IN (%s, %s, %s, %s)"
+    ids = ['003A', '003B', '003C', '003D']
+    part_1 = "SELECT Contact.Name FROM Contact WHERE Contact.Id IN ('003A', '003B')"
+    part_2 = "SELECT Contact.Name FROM Contact WHERE Contact.Id IN ('003C', '003D')"
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cursor = connections[sf_alias].cursor()
+        raw_connection = self.cursor.cursor._connection  # pylint:disable=protected-access
+        orig_max_length = raw_connection.max_soql_length
+        raw_connection.max_soql_length = len(self.part_1)
+        self.addCleanup(setattr, raw_connection, 'max_soql_length', orig_max_length)
+
+    def test_split(self) -> None:
+        self.mock_add_expected([
+            MockJsonRequest(query_url(self.part_1), resp=page_json(['a', 'b'], 3, 2)),
+            MockJsonRequest(query_url(self.part_2), resp=page_json(['d'], 1)),
+            MockJsonRequest('GET mock://{}-2'.format(LOCATOR), resp=page_json(['c'], 3)),
+        ])
+        self.cursor.execute(self.soql, self.ids)
+        self.assertEqual(self.cursor.cursor.rowcount, 4)
+        self.assertEqual([x[0] for x in self.cursor.fetchall()], ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.cursor.cursor.rownumber, 4)
+        self.assertIsNone(self.cursor.cursor.single_page)
+        with self.assertRaises(NotSupportedError):
+            self.cursor.cursor.scroll(0, mode='absolute')
+
+    def test_split_duplicates(self) -> None:
+        """Duplicate Ids are removed, otherwise the same row would be in the results of more parts"""
+        self.mock_add_expected([
+            MockJsonRequest(query_url(self.part_1), resp=page_json(['a', 'b'], 2)),
+            MockJsonRequest(query_url(self.part_2), resp=page_json(['c', 'd'], 2)),
+        ])
+        self.cursor.execute(self.soql.replace('%s)', '%s, %s, %s)'), self.ids + ['003A', '003D'])
+        self.assertEqual(self.cursor.cursor.rowcount, 4)
+        self.assertEqual([x[0] for x in self.cursor.fetchall()], ['a', 'b', 'c', 'd'])
+
+    @mock.patch('salesforce.dbapi.driver.MAX_OPEN_LOCATORS', 1)
+    def test_split_open_locators(self) -> None:
+        """Parts after the limit of open locators are read completely at once"""
+        self.mock_add_expected([
+            MockJsonRequest(query_url(self.part_1), resp=page_json(['a', 'b'], 3, 2)),
+            MockJsonRequest(query_url(self.part_2), resp=page_json(['d'], 2, 1)),
+            MockJsonRequest('GET mock://{}-1'.format(LOCATOR), resp=page_json(['e'], 2)),
+        ])
+        self.cursor.execute(self.soql, self.ids)
+        session = self.sf_connection._sf_session  # pylint:disable=protected-access
+        self.assertEqual(session.index, 3)  # only the locator of the first part is open now
+        self.mock_add_expected(MockJsonRequest('GET mock://{}-2'.format(LOCATOR), resp=page_json(['c'], 3)))
+        self.assertEqual([x[0] for x in self.cursor.fetchall()], ['a', 'b', 'c', 'd', 'e'])
+
+    def test_split_order_by_limit(self) -> None:
+        suffix = " ORDER BY Contact.Name DESC NULLS LAST LIMIT 3"
+        self.mock_add_expected([
+            MockJsonRequest(query_url(self.part_1 + suffix), resp=page_json(['d', 'B', None], 3)),
+            MockJsonRequest(query_url(self.part_2 + suffix), resp=page_json(['c', 'a'], 2)),
+        ])
+        raw_connection = self.cursor.cursor._connection  # pylint:disable=protected-access
+        raw_connection.max_soql_length = len(self.part_1 + suffix)
+        self.cursor.execute(self.soql + suffix, self.ids)
+        self.assertEqual(self.cursor.cursor.rowcount, 3)
+        self.assertEqual([x[0] for x in self.cursor.fetchall()], ['d', 'c', 'B'])
+
+    def test_split_count(self) -> None:
+        self.mock_add_expected([
+            MockJsonRequest(query_url(self.part_1.replace('Contact.Name', 'COUNT()')),
+                            resp='{"totalSize": 2, "done": true, "records": []}'),
+            MockJsonRequest(query_url(self.part_2.replace('Contact.Name', 'COUNT()')),
+                            resp='{"totalSize": 1, "done": true, "records": []}'),
+        ])
+        raw_connection = self.cursor.cursor._connection  # pylint:disable=protected-access
+        raw_connection.max_soql_length = len(self.part_1.replace('Contact.Name', 'COUNT()'))
+        self.cursor.execute(self.soql.replace('Contact.Name', 'COUNT()'), self.ids)
+        self.assertEqual(self.cursor.fetchall(), [(3,)])
+
+    def test_not_split_order_by_not_selected(self) -> None:
+        soql = self.soql + " ORDER BY Contact.LastName"
+        self.mock_add_expected(MockJsonRequest(
+            query_url("SELECT Contact.Name FROM Contact WHERE Contact.Id IN ('003A', '003B', '003C', '003D')"
+                      " ORDER BY Contact.LastName"),
+            resp=page_json(['a'], 1)))
+        self.cursor.execute(soql, self.ids)
+        self.assertEqual(self.cursor.fetchall(), [('a',)])
@@ -0,0 +1,80 @@
+"""
+Tests of the process-wide API governor driven by the header Sforce-Limit-Info
+"""
+import json
+from typing import List
+from unittest import mock, TestCase
+
+from django.db import connections
+
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi import governor
+from salesforce.dbapi.exceptions import ApiLimitError
+from salesforce.dbapi.governor import ApiGovernor, api_priority
+from tests.test_mock.mocksf import MockJsonRequest, MockTestCase
+from tests.test_mock2.models import Contact
+
+QUERY_URL = "GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Id%2C+Contact.LastName+FROM+Contact"
+EMPTY_RESULT = json.dumps({'totalSize': 0, 'done': True, 'records': []})
+
+
+class ApiGovernorTest(TestCase):
+    def setUp(self) -> None:
+        self.sleeps = []  # type: List[float]
+        patcher = mock.patch('salesforce.dbapi.governor.time.sleep', self.sleeps.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_bucket(self) -> None:
+        gov = ApiGovernor(rate=2, burst=2)
+        with mock.patch('salesforce.dbapi.governor.time.monotonic', return_value=gov.last_refill):
+            for _ in range(4):
+                gov.acquire()
+        self.assertEqual(self.sleeps, [0.5, 1.0])  # the third and fourth request wait for tokens
+
+    def test_priorities(self) -> None:
+        gov = ApiGovernor(soft_limit=50, soft_delay=2.0, batch_limit=80, hard_limit=95)
+        gov.update('api-usage=60/100')
+        gov.acquire()
+        with api_priority('batch'):
+            gov.acquire()
+        self.assertEqual(self.sleeps, [2.0])  # only the batch request is delayed
+        gov.update('api-usage=80/100')
+        with self.assertRaises(ApiLimitError):
+            gov.acquire('batch')
+        gov.acquire('interactive')
+        gov.update('api-usage=95/100')
+        with self.assertRaises(ApiLimitError):
+            gov.acquire('interactive')
+        self.assertEqual(gov.statistics(), {'requests': 3, 'delayed': 1, 'refused': 2, 'wait_time': 2.0,
+                                            'api_usage': 95, 'api_limit': 100})
+
+    def test_invalid_priority(self) -> None:
+        with self.assertRaises(ValueError):
+            with api_priority('urgent'):
+                pass
+
+
+class GovernorQueryTest(MockTestCase):
+    api_version = '44.0'
+
+    def setUp(self) -> None:
+        super().setUp()
+        options = connections[sf_alias].settings_dict.setdefault('OPTIONS', {})
+        options['API_GOVERNOR'] = {'BATCH_LIMIT': 90}
+        self.addCleanup(options.pop, 'API_GOVERNOR')
+        self.addCleanup(governor.reset_governors)
+        governor.reset_governors()
+
+    def test_batch_refused(self) -> None:
+        self.mock_add_expected([
+            MockJsonRequest(QUERY_URL, resp=EMPTY_RESULT, response_headers={'Sforce-Limit-Info': 'api-usage=90/100'}),
+            MockJsonRequest(QUERY_URL, resp=EMPTY_RESULT),
+        ])
+        qs = Contact.objects.db_manager(sf_alias).only('last_name')
+        self.assertEqual(list(qs), [])
+        with self.assertRaises(ApiLimitError):
+            list(qs.sf(priority='batch'))
+        # interactive requests are still allowed
+        self.assertEqual(list(qs.sf(priority='interactive')), [])
+        self.assertEqual([x['refused'] for x in governor.governor_statistics().values()], [1])
@@ -0,0 +1,102 @@
+"""
+Tests of saving related new objects by Composite Graph requests
+"""
+import json
+from typing import Any, Dict, List
+
+from salesforce.backend.graph import save_graph
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi.exceptions import SalesforceError
+from tests.test_mock.mocksf import MockJsonRequest, MockTestCase
+from tests.test_mock2.models import Account, User
+
+GRAPH_URL = 'POST mock:///services/data/v50.0/composite/graph'
+
+
+def node(ref: str, table: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {'method': 'POST', 'url': '/services/data/v50.0/sobjects/{}'.format(table), 'referenceId': ref,
+            'body': body}
+
+
+def node_response(ref: str, pk: str) -> Dict[str, Any]:
+    return {'body': {'id': pk, 'success': True, 'errors': []}, 'httpHeaders': {}, 'httpStatusCode': 201,
+            'referenceId': ref}
+
+
+def graph(graph_id: str, nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {'graphId': graph_id, 'compositeRequest': nodes}
+
+
+class GraphTest(MockTestCase):
+    api_version = '50.0'
+
+    def test_save_graph(self) -> None:
+        users = [User(name='a'), User(name='b')]
+        accounts = [Account(name='x', owner=users[1]), Account(name='y', owner=users[0]), Account(name='z')]
+        self.mock_add_expected(MockJsonRequest(
+            GRAPH_URL,
+            req=json.dumps({'graphs': [graph('0', [
+                node('ref3', 'User', {'Name': 'b'}),
+                node('ref0', 'Account', {'Name': 'x', 'OwnerId': '@{ref3.id}'}),
+                node('ref2', 'User', {'Name': 'a'}),
+                node('ref1', 'Account', {'Name': 'y', 'OwnerId': '@{ref2.id}'}),
+                node('ref4', 'Account', {'Name': 'z'}),
+            ])]}),
+            resp=json.dumps({'graphs': [{'graphId': '0', 'isSuccessful': True, 'graphResponse': {
+                'compositeResponse': [node_response(ref, pk) for ref, pk in [
+                    ('ref3', '005A00000000002AAA'), ('ref0', '001A00000000001AAA'), ('ref2', '005A00000000001AAA'),
+                    ('ref1', '001A00000000002AAA'), ('ref4', '001A00000000003AAA')]]}}]})))
+        # the children are before their parents in the input, the parents are sent first
+        save_graph(accounts[:2] + users + accounts[2:], using=sf_alias)
+        self.assertEqual([x.pk for x in users], ['005A00000000001AAA', '005A00000000002AAA'])
+        self.assertEqual([x.pk for x in accounts], ['001A00000000001AAA', '001A00000000002AAA', '001A00000000003AAA'])
+        self.assertEqual([x.owner_id for x in accounts[:2]], ['005A00000000002AAA', '005A00000000001AAA'])
+        self.assertFalse(accounts[0]._state.adding)  # pylint:disable=protected-access
+
+    def test_split_graphs(self) -> None:
+        user = User(name='a')
+        accounts = [Account(name='x', owner=user), Account(name='y', owner=user), Account(name='z'),
+                    Account(name='w')]
+        self.mock_add_expected([
+            MockJsonRequest(
+                GRAPH_URL,
+                req=json.dumps({'graphs': [
+                    graph('0', [node('ref0', 'User', {'Name': 'a'}),
+                                node('ref1', 'Account', {'Name': 'x', 'OwnerId': '@{ref0.id}'})]),
+                ]}),
+                resp=json.dumps({'graphs': [{'graphId': '0', 'isSuccessful': True, 'graphResponse': {
+                    'compositeResponse': [node_response('ref0', '005A00000000001AAA'),
+                                          node_response('ref1', '001A00000000001AAA')]}}]})),
+            # the rest of a big group of related objects is saved by the next request with the real id
+            # of the parent, independent graphs are sent together
+            MockJsonRequest(
+                GRAPH_URL,
+                req=json.dumps({'graphs': [
+                    graph('0', [node('ref2', 'Account', {'Name': 'y', 'OwnerId': '005A00000000001AAA'}),
+                                node('ref3', 'Account', {'Name': 'z'})]),
+                    graph('1', [node('ref4', 'Account', {'Name': 'w'})]),
+                ]}),
+                resp=json.dumps({'graphs': [
+                    {'graphId': '0', 'isSuccessful': True, 'graphResponse': {
+                        'compositeResponse': [node_response('ref2', '001A00000000002AAA'),
+                                              node_response('ref3', '001A00000000003AAA')]}},
+                    {'graphId': '1', 'isSuccessful': False, 'graphResponse': {'compositeResponse': [
+                        {'body': [{'errorCode': 'FIELD_CUSTOM_VALIDATION_EXCEPTION', 'message': 'Bad name'}],
+                         'httpHeaders': {}, 'httpStatusCode': 400, 'referenceId': 'ref4'}]}},
+                ]})),
+        ])
+        with self.assertRaises(SalesforceError) as cm:
+            save_graph([user] + accounts, using=sf_alias, max_nodes=2)
+        self.assertIn('Bad name', cm.exception.args[0])
+        # objects of the successful graphs are saved
+        self.assertEqual([x.pk for x in accounts], [
+            '001A00000000001AAA', '001A00000000002AAA', '001A00000000003AAA', None])
+
+    def test_unsaved_parent(self) -> None:
+        with self.assertRaises(ValueError):
+            save_graph([Account(name='x', owner=User(name='a'))], using=sf_alias)
+        user, account = User(name='a'), Account(name='x')
+        account.owner = user
+        user.pk = '005A00000000001AAA'
+        with self.assertRaises(ValueError):
+            save_graph([user, account], using=sf_alias)
@@ -0,0 +1,122 @@
+"""
+Tests of instrumentation hooks of API requests and cursor executions
+"""
+import json
+from typing import Any, Dict, List
+from unittest import TestCase
+
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi import instrumentation
+from salesforce.dbapi.instrumentation import MetricsAggregator, OpenTelemetryHook, endpoint_class, labels
+from tests.test_mock.mocksf import MockJsonRequest, MockTestCase
+from tests.test_mock2.models import Contact
+
+QUERY_URL = "GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Id%2C+Contact.LastName+FROM+Contact"
+SOQL = "SELECT Contact.Id, Contact.LastName FROM Contact"
+
+
+def result(last_names: List[str], next_url: str = '') -> str:
+    records = [{'attributes': {'type': 'Contact'}, 'Id': '003A0000000{:06d}AAA'.format(i), 'LastName': name}
+               for i, name in enumerate(last_names)]
+    response = {'totalSize': 3, 'done': not next_url, 'records': records}  # type: Dict[str, Any]
+    if next_url:
+        response['nextRecordsUrl'] = next_url
+    return json.dumps(response)
+
+
+class FakeSpan:
+    def __init__(self, name: str, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.attributes = dict(attributes)
+        self.ended = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.attributes['exception'] = exc
+
+    def end(self) -> None:
+        self.ended = True
+
+
+class FakeTracer:
+    def __init__(self) -> None:
+        self.spans = []  # type: List[FakeSpan]
+
+    def start_span(self, name: str, attributes: Dict[str, Any]) -> FakeSpan:
+        span = FakeSpan(name, attributes)
+        self.spans.append(span)
+        return span
+
+
+class EndpointClassTest(TestCase):
+    def test_endpoint_class(self) -> None:
+        for url, expected in [
+                ('mock:///services/data/v44.0/query/?q=SELECT+Id+FROM+Contact', 'query'),
+                ('/services/data/v44.0/query/01gD0000002HU6KIAW-2000', 'query'),
+                ('queryAll?q=SELECT+Id+FROM+Contact', 'query'),
+                ('composite/sobjects/Contact', 'collections'),
+                ('composite/sobjects', 'collections'),
+                ('composite', 'composite'),
+                ('composite/graph', 'graph'),
+                ('tooling/query?q=x', 'tooling'),
+                ('jobs/query/750R0000000zlh9IAA/results', 'bulk'),
+                ('sobjects/Contact/describe/', 'describe'),
+                ('sobjects/', 'describe'),
+                ('sobjects/Contact/003A000000AAAAAAAA', 'sobject'),
+                ('limits', 'limits')]:
+            self.assertEqual(endpoint_class(url), expected, url)
+
+
+class InstrumentationQueryTest(MockTestCase):
+    api_version = '44.0'
+
+    def add_hook(self, hook: instrumentation.Hook) -> None:
+        instrumentation.add_hook(hook)
+        self.addCleanup(instrumentation.remove_hook, hook)
+
+    def test_metrics(self) -> None:
+        metrics = MetricsAggregator()
+        self.add_hook(metrics)
+        next_url = '/services/data/v44.0/query/01gD0000002HU6KIAW-2000'
+        self.mock_add_expected([
+            MockJsonRequest(QUERY_URL, resp=result(['a', 'b'], next_url=next_url)),
+            MockJsonRequest('GET mock://' + next_url, resp=result(['c'])),
+        ])
+        with labels(view='contact_list'):
+            qs = Contact.objects.db_manager(sf_alias).only('last_name')
+            self.assertEqual([x.last_name for x in qs], ['a', 'b', 'c'])
+        snapshot = metrics.snapshot()
+        [requests] = snapshot['requests']
+        self.assertEqual((requests['endpoint'], requests['method'], requests['labels'], requests['count'],
+                          requests['errors']), ('query', 'GET', {'view': 'contact_list'}, 2, 0))
+        self.assertGreater(requests['bytes_in'], 0)
+        [query] = snapshot['queries']
+        self.assertEqual((query['soql'], query['labels'], query['count'], query['rows'], query['requests']),
+                         (SOQL, {'view': 'contact_list'}, 1, 3, 2))
+        self.assertGreater(query['compile_time'], 0)
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {'requests': [], 'queries': []})
+
+    def test_open_telemetry(self) -> None:
+        tracer = FakeTracer()
+        self.add_hook(OpenTelemetryHook(tracer))
+        self.mock_add_expected(MockJsonRequest(QUERY_URL, resp=result(['a'])))
+        self.assertEqual(len(Contact.objects.db_manager(sf_alias).only('last_name')), 1)
+        self.assertEqual([x.name for x in tracer.spans], ['salesforce query', 'salesforce query'])
+        query_span, request_span = tracer.spans
+        self.assertTrue(query_span.ended and request_span.ended)
+        self.assertEqual(query_span.attributes['db.statement'], SOQL)
+        self.assertEqual(query_span.attributes['salesforce.rows'], 1)
+        self.assertEqual(request_span.attributes['http.response.status_code'], 200)
+
+    def test_failing_hook(self) -> None:
+        class FailingHook(instrumentation.Hook):
+            def request_start(self, event: instrumentation.RequestEvent) -> None:
+                raise RuntimeError("bug in a hook")
+
+        self.add_hook(FailingHook())
+        self.mock_add_expected(MockJsonRequest(QUERY_URL, resp=result(['a'])))
+        with self.assertLogs('salesforce.dbapi.instrumentation', 'ERROR'):
+            self.assertEqual(len(Contact.objects.db_manager(sf_alias).only('last_name')), 1)
@@ -0,0 +1,56 @@
+"""
+Tests of concurrent prefetching of describe results for inspectdb
+"""
+import threading
+import time
+from typing import Any, Dict, List
+from unittest import mock
+
+from django.db import connections
+
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi.exceptions import SalesforceError
+from tests.test_mock.mocksf import MockTestCase
+
+
+def describe(table: str) -> Dict[str, Any]:
+    return {'name': table, 'fields': [{'name': 'Name', 'type': 'string'}, {'name': 'Id', 'type': 'id'}]}
+
+
+class PrefetchDescriptionsTest(MockTestCase):
+    api_version = '44.0'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.introspection = connections[sf_alias].introspection
+        self.addCleanup(self.introspection._table_description_cache.clear)  # pylint:disable=protected-access
+        self.lock = threading.Lock()
+        self.stats = {'in_progress': 0, 'max_in_progress': 0}
+
+    def fake_describe(self, connection: Any, sobject: str, tooling_api: bool = False) -> Dict[str, Any]:
+        with self.lock:
+            self.stats['in_progress'] += 1
+            self.stats['max_in_progress'] = max(self.stats['max_in_progress'], self.stats['in_progress'])
+        time.sleep(0.02)
+        with self.lock:
+            self.stats['in_progress'] -= 1
+        if sobject == 'Invalid':
+            raise SalesforceError("The requested resource does not exist")
+        return describe(sobject)
+
+    def test_prefetch(self) -> None:
+        tables = ['Table{}'.format(i) for i in range(12)]
+        reported = []  # type: List[int]
+        with mock.patch('salesforce.backend.introspection.cached_describe', self.fake_describe):
+            self.introspection.prefetch_table_descriptions(
+                tables, jobs=4, progress=lambda count_done, count_total, table: reported.append(count_done))
+            # the cache is filled and the field 'Id' is removed
+            self.assertEqual(self.introspection.table_description_cache('Table5')['fields'],
+                             [{'name': 'Name', 'type': 'string'}])
+        self.assertEqual(self.stats['max_in_progress'], 4)
+        self.assertEqual(reported, list(range(1, 13)))
+
+    def test_error(self) -> None:
+        with mock.patch('salesforce.backend.introspection.cached_describe', self.fake_describe):
+            with self.assertRaises(SalesforceError):
+                self.introspection.prefetch_table_descriptions(['Table1', 'Invalid', 'Table2'], jobs=2)
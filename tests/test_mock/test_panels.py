@@ -0,0 +1,74 @@
+"""
+Tests of the recorder of queries and requests for the panel of django-debug-toolbar
+"""
+import json
+from urllib.parse import quote_plus
+
+from django.db import connections
+
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi import instrumentation
+from salesforce.panels import api_usage, panel_stats, record, recorder, render_stats
+from tests.test_mock.mocksf import MockJsonRequest, MockTestCase
+from tests.test_mock2.models import Contact
+
+SOQL = "SELECT Contact.Id, Contact.LastName FROM Contact WHERE Contact.LastName = %s"
+
+
+def query_url(last_name: str) -> str:
+    return "GET mock:///services/data/v44.0/query/?q=" + quote_plus(SOQL % "'{}'".format(last_name))
+
+
+def result(count: int, next_url: str = '') -> str:
+    records = [{'attributes': {'type': 'Contact'}, 'Id': '003A0000000{:06d}AAA'.format(i), 'LastName': 'a'}
+               for i in range(count)]
+    return json.dumps({'totalSize': 3, 'done': not next_url, 'records': records,
+                       **({'nextRecordsUrl': next_url} if next_url else {})})
+
+
+class PanelRecorderTest(MockTestCase):
+    api_version = '44.0'
+
+    def test_record(self) -> None:
+        next_url = '/services/data/v44.0/query/01gD0000002HU6KIAW-2000'
+        limit_info = {'Sforce-Limit-Info': 'api-usage=25/5000'}
+        self.mock_add_expected([
+            MockJsonRequest(query_url('a'), resp=result(2, next_url=next_url)),
+            MockJsonRequest('GET mock://' + next_url, resp=result(1)),
+            MockJsonRequest(query_url('a'), resp=result(0)),
+            MockJsonRequest(query_url('b'), resp=result(0), response_headers=limit_info),
+            MockJsonRequest('POST mock:///services/data/v44.0/composite/sobjects',
+                            req=json.dumps({'records': [{'LastName': 'x', 'attributes': {'type': 'Contact'}}],
+                                            'allOrNone': True}),
+                            resp='[{"id": "003A0000000000000A", "success": true, "errors": []}]'),
+        ])
+        qs = Contact.objects.db_manager(sf_alias).only('last_name')
+        with record() as records:
+            self.assertEqual(len(qs.filter(last_name='a')), 3)
+            self.assertEqual(len(qs.filter(last_name='a')), 0)
+            self.assertEqual(len(qs.filter(last_name='b')), 0)
+            connections[sf_alias].connection.sobject_collections_request(
+                'POST', [dict(type_='Contact', LastName='x')])
+        self.assertFalse(instrumentation.is_enabled())  # the hook is removed after recording
+
+        stats = panel_stats(records, {sf_alias: [20, 5000]}, api_usage())
+        self.assertEqual([(x['soql'], x['params'], x['rows'], x['requests'], x['duplicates'], x['similar'])
+                          for x in stats['queries']],
+                         [(SOQL, ["'a'"], 3, 2, 2, 3), (SOQL, ["'a'"], 0, 1, 2, 3), (SOQL, ["'b'"], 0, 1, 1, 3)])
+        self.assertEqual(len(stats['queries'][0]['pages']), 2)
+        self.assertEqual([(x['method'], x['endpoint'], x['status_code']) for x in stats['requests']],
+                         [('POST', 'collections', 200)])
+        self.assertEqual((stats['api_requests'], stats['duplicate_count'], stats['similar_count']), (5, 1, 2))
+        self.assertEqual(stats['api_usage'], [{'alias': sf_alias, 'used': 25, 'limit': 5000, 'before': 20}])
+        content = render_stats(stats)
+        self.assertIn('duplicated 2 times', content)
+        self.assertIn('Contact.LastName = %s', content)
+
+    def test_not_recorded(self) -> None:
+        self.mock_add_expected(MockJsonRequest(query_url('a'), resp=result(0)))
+        with record() as records:
+            pass
+        instrumentation.add_hook(recorder)
+        self.addCleanup(instrumentation.remove_hook, recorder)
+        self.assertEqual(len(Contact.objects.db_manager(sf_alias).only('last_name').filter(last_name='a')), 0)
+        self.assertEqual(records, {'queries': [], 'requests': []})
@@ -0,0 +1,81 @@
+"""
+Tests of the cache of query results
+"""
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from salesforce.backend import query_cache
+from salesforce.backend.query_cache import LRUCache, QueryCache
+from salesforce.backend.test_helpers import sf_alias
+from tests.test_mock.mocksf import MockJsonRequest, MockTestCase
+from tests.test_mock2.models import Account, Contact
+
+QUERY_URL = 'GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Id%2C+Contact.LastName+FROM+Contact'
+
+
+def query_request(*names: str) -> MockJsonRequest:
+    records = [{'attributes': {'type': 'Contact'}, 'Id': '003A0000000{}AAA'.format(i), 'LastName': name}
+               for i, name in enumerate(names, 1001)]
+    return MockJsonRequest(QUERY_URL, resp=json.dumps({'totalSize': len(records), 'done': True,
+                                                       'records': records}))
+
+
+class QueryCacheTest(MockTestCase):
+    api_version = '44.0'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = QueryCache(sf_alias, {'TIMEOUTS': {'Contact': 60}})
+        patcher = mock.patch.dict(query_cache._query_caches, {sf_alias: self.cache})  # pylint:disable=protected-access
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit_and_invalidation(self) -> None:
+        self.mock_add_expected([
+            query_request('a', 'b'),
+            MockJsonRequest('PATCH mock:///services/data/v44.0/sobjects/Contact/003A00000001001AAA',
+                            req={'LastName': 'c'}),
+            query_request('a', 'c'),
+        ])
+        qs = Contact.objects.db_manager(sf_alias).only('last_name')
+        self.assertEqual([x.last_name for x in qs], ['a', 'b'])
+        self.assertEqual([x.last_name for x in qs.all()], ['a', 'b'])  # from the cache
+        self.assertEqual(self.cache.statistics(), {'hits': 1, 'misses': 1, 'invalidations': 0})
+        # a write to the table invalidates the cached results
+        qs.filter(pk='003A00000001001AAA').update(last_name='c')
+        self.assertEqual([x.last_name for x in qs.all()], ['a', 'c'])
+        self.assertEqual(self.cache.statistics(), {'hits': 1, 'misses': 2, 'invalidations': 1})
+
+    def test_not_cached_table(self) -> None:
+        self.mock_add_expected(MockJsonRequest(
+            'GET mock:///services/data/v44.0/query/?q=SELECT+Account.Id%2C+Account.Name+FROM+Account',
+            resp=json.dumps({'totalSize': 0, 'done': True, 'records': []})))
+        self.assertEqual(list(Account.objects.db_manager(sf_alias).only('name')), [])
+        self.assertEqual(self.cache.statistics(), {'hits': 0, 'misses': 0, 'invalidations': 0})
+
+
+class LRUCacheTest(SimpleTestCase):
+
+    def test_lru(self) -> None:
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1, 60)
+        cache.set('b', 2, 60)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3, 60)  # the least recently used 'b' is evicted
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+    def test_expiration(self) -> None:
+        cache = LRUCache()
+        cache.set('a', 1, 60)
+        cache.set('b', 2, None)
+        with mock.patch('time.monotonic', return_value=1E12):
+            self.assertEqual(cache.get('a'), None)
+            self.assertEqual(cache.get('b'), 2)
+
+    def test_timeout(self) -> None:
+        cache = QueryCache('x', {'TIMEOUTS': {'RecordType': 3600, 'User': 60}})
+        self.assertEqual(cache.get_timeout(cache.query_tables('SELECT Id FROM RecordType')), 3600)
+        self.assertEqual(cache.get_timeout(['RecordType', 'User']), 60)
+        self.assertEqual(cache.get_timeout(['RecordType', 'Contact']), 0)
@@ -0,0 +1,78 @@
+"""
+Tests of queries by a list of Ids executed by SObject Collections retrieve requests
+"""
+import json
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+from django.db import connections
+
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi import driver
+from tests.test_mock.mocksf import MockJsonRequest, MockTestCase
+from tests.test_mock2.models import Contact
+
+RETRIEVE_URL = 'POST mock:///services/data/v44.0/composite/sobjects/Contact'
+
+
+def record(pk: str, last_name: str) -> Dict[str, Any]:
+    return {'attributes': {'type': 'Contact', 'url': '/services/data/v44.0/sobjects/Contact/' + pk},
+            'Id': pk, 'LastName': last_name}
+
+
+def retrieve_request(ids: List[str], records: List[Optional[Dict[str, Any]]]) -> MockJsonRequest:
+    return MockJsonRequest(RETRIEVE_URL, req=json.dumps({'ids': ids, 'fields': ['Id', 'LastName']}),
+                           resp=json.dumps(records))
+
+
+class RetrieveTest(MockTestCase):
+    api_version = '44.0'
+
+    def setUp(self) -> None:
+        super().setUp()
+        connection = connections[sf_alias].connection
+        orig_threshold = connection.retrieve_threshold
+        connection.retrieve_threshold = 2
+        self.addCleanup(setattr, connection, 'retrieve_threshold', orig_threshold)
+
+    def test_in_bulk(self) -> None:
+        ids = ['003A00000000000001', '003A00000000000002', '003A00000000000003']
+        # a not found Id is reported as null
+        self.mock_add_expected(retrieve_request(ids, [record(ids[0], 'a'), None, record(ids[2], 'c')]))
+        objs = Contact.objects.db_manager(sf_alias).only('last_name').in_bulk(ids)
+        self.assertEqual({k: v.last_name for k, v in objs.items()}, {ids[0]: 'a', ids[2]: 'c'})
+
+    def test_filter_order_by(self) -> None:
+        ids = ['003A00000000000001', '003A00000000000002']
+        self.mock_add_expected(retrieve_request(ids, [record(ids[0], 'b'), record(ids[1], 'a')]))
+        qs = Contact.objects.db_manager(sf_alias).filter(pk__in=ids).only('last_name').order_by('last_name')
+        self.assertEqual([x.pk for x in qs], ids[::-1])
+
+    def test_under_threshold(self) -> None:
+        self.mock_add_expected(MockJsonRequest(
+            "GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Id%2C+Contact.LastName+FROM+Contact+"
+            "WHERE+Contact.Id+IN+%28%27003A00000000000001%27%29",
+            resp=json.dumps({'totalSize': 1, 'done': True, 'records': [record('003A00000000000001', 'a')]})))
+        qs = Contact.objects.db_manager(sf_alias).filter(pk__in=['003A00000000000001']).only('last_name')
+        self.assertEqual([x.last_name for x in qs], ['a'])
+
+    def test_disabled_by_default(self) -> None:
+        connections[sf_alias].connection.retrieve_threshold = driver.RETRIEVE_THRESHOLD
+        ids = ['003A00000000000001', '003A00000000000002']
+        self.mock_add_expected(MockJsonRequest(
+            "GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Id%2C+Contact.LastName+FROM+Contact+"
+            "WHERE+Contact.Id+IN+%28%27003A00000000000001%27%2C+%27003A00000000000002%27%29",
+            resp=json.dumps({'totalSize': 1, 'done': True, 'records': [record(ids[0], 'a')]})))
+        qs = Contact.objects.db_manager(sf_alias).filter(pk__in=ids).only('last_name')
+        self.assertEqual([x.last_name for x in qs], ['a'])
+
+    def test_chunks(self) -> None:
+        ids = ['003A00000000000001', '003A00000000000002', '003A00000000000003', '003A00000000000001']
+        self.mock_add_expected([
+            retrieve_request(ids[:2], [record(ids[0], 'a'), record(ids[1], 'b')]),
+            retrieve_request(ids[2:3], [record(ids[2], 'c')]),
+        ])
+        with mock.patch('salesforce.dbapi.driver.RETRIEVE_CHUNK_SIZE', 2):
+            records = connections[sf_alias].connection.sobject_collections_retrieve(
+                'Contact', ids, ['Id', 'LastName'])
+        self.assertEqual([x['LastName'] for x in records], ['a', 'b', 'c'])
@@ -0,0 +1,153 @@
+"""
+Tests of the retry policy after throttling, temporary errors and lock contention
+"""
+import json
+from typing import Dict, List, Optional
+from unittest import mock, TestCase
+
+from django.db import connections
+
+from salesforce.backend.test_helpers import sf_alias
+from salesforce.dbapi import retry
+from salesforce.dbapi.exceptions import SalesforceError
+from salesforce.dbapi.retry import parse_retry_after, RetryPolicy
+from tests.test_mock.mocksf import MockJsonRequest, MockTestCase
+from tests.test_mock2.models import Contact
+
+QUERY_URL = "GET mock:///services/data/v44.0/query/?q=SELECT+Contact.Id%2C+Contact.LastName+FROM+Contact"
+COLLECTIONS_URL = 'mock:///services/data/v44.0/composite/sobjects'
+EMPTY_RESULT = json.dumps({'totalSize': 0, 'done': True, 'records': []})
+LOCK_ERROR = {'statusCode': 'UNABLE_TO_LOCK_ROW', 'message': 'unable to obtain exclusive access to this record',
+              'fields': []}
+ROLLED_BACK = {'statusCode': 'ALL_OR_NONE_OPERATION_ROLLED_BACK', 'message': 'Record rolled back', 'fields': []}
+
+
+def error(error_code: str, message: str = 'error') -> str:
+    return json.dumps([{'message': message, 'errorCode': error_code}])
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, text: str = '', headers: Optional[Dict[str, str]] = None) -> None:
+        self.status_code = status_code
+        self.text = text
+        self.headers = dict({'Content-Type': 'application/json'}, **(headers or {}))
+
+
+class RetryPolicyTest(TestCase):
+    def test_reasons(self) -> None:
+        policy = RetryPolicy()
+        url = 'https://na1.salesforce.com/services/data/v44.0/sobjects/Contact'
+        for method, response, expected in [
+                ('GET', FakeResponse(503), 'HTTP 503'),
+                ('POST', FakeResponse(503), 'HTTP 503'),
+                ('GET', FakeResponse(500), 'HTTP 500'),
+                ('POST', FakeResponse(500), None),
+                ('POST', FakeResponse(400, error('UNABLE_TO_LOCK_ROW')), 'UNABLE_TO_LOCK_ROW'),
+                ('GET', FakeResponse(403, error('REQUEST_LIMIT_EXCEEDED', 'ConcurrentPerOrgLongTxn Limit '
+                                                'exceeded.')), 'REQUEST_LIMIT_EXCEEDED'),
+                ('GET', FakeResponse(403, error('REQUEST_LIMIT_EXCEEDED', 'TotalRequests Limit exceeded.')),
+                 None),
+                ('GET', FakeResponse(400, error('MALFORMED_QUERY')), None)]:
+            retrying = policy.start(method, url)
+            self.assertEqual(policy.reason(method, url, retrying.idempotent, response), expected,
+                             (method, response.status_code, response.text))
+
+    def test_unsaved_batch(self) -> None:
+        policy = RetryPolicy()
+        url = 'https://na1.salesforce.com/services/data/v44.0/composite/sobjects'
+        locked = FakeResponse(200, json.dumps([{'success': False, 'errors': [LOCK_ERROR]},
+                                               {'success': False, 'errors': [ROLLED_BACK]}]))
+        partial = FakeResponse(200, json.dumps([{'success': False, 'errors': [LOCK_ERROR]},
+                                                {'id': '003A00000000001AAA', 'success': True, 'errors': []}]))
+        self.assertEqual(policy.reason('POST', url, False, locked), 'UNABLE_TO_LOCK_ROW')
+        self.assertIsNone(policy.reason('POST', url, False, partial))  # a record is saved
+        composite_url = 'https://na1.salesforce.com/services/data/v44.0/composite'
+        self.assertTrue(policy.start('POST', composite_url, {'compositeRequest': [{'method': 'GET'}]}).idempotent)
+        self.assertFalse(policy.start('POST', composite_url, {'compositeRequest': [{'method': 'POST'}]}).idempotent)
+
+    def test_delays(self) -> None:
+        policy = RetryPolicy(max_retries=10, base_delay=1.0, max_delay=5.0, time_budget=1000)
+        retrying = policy.start('GET', 'url')
+        delays = [retrying.delay(FakeResponse(503)) for _ in range(10)]
+        self.assertTrue(all(x is not None and 1.0 <= x <= 5.0 for x in delays), delays)
+        with self.assertLogs('salesforce.dbapi.retry', 'WARNING'):
+            self.assertIsNone(retrying.delay(FakeResponse(503)))  # max_retries
+        retrying = policy.start('GET', 'url')
+        self.assertEqual(retrying.delay(FakeResponse(503, headers={'Retry-After': '30'})), 30)
+        self.assertEqual(policy.statistics()['gave_up'], 1)
+        self.assertEqual(policy.statistics()['reasons'], {'HTTP 503': 11})
+
+    def test_time_budget(self) -> None:
+        policy = RetryPolicy(time_budget=10)
+        retrying = policy.start('GET', 'url')
+        with self.assertLogs('salesforce.dbapi.retry', 'WARNING'):
+            self.assertIsNone(retrying.delay(FakeResponse(503, headers={'Retry-After': '20'})))
+
+    def test_parse_retry_after(self) -> None:
+        self.assertEqual(parse_retry_after('120'), 120)
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)  # in the past
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+
+
+class RetryRequestTest(MockTestCase):
+    api_version = '44.0'
+
+    def setUp(self) -> None:
+        super().setUp()
+        options = connections[sf_alias].settings_dict.setdefault('OPTIONS', {})
+        options['RETRY'] = {'BASE_DELAY': 0.01, 'MAX_RETRIES': 2}
+        self.addCleanup(options.pop, 'RETRY')
+        self.addCleanup(retry.reset_retry_policies)
+        retry.reset_retry_policies()
+        self.sleeps = []  # type: List[float]
+        patcher = mock.patch('salesforce.dbapi.driver.time.sleep', self.sleeps.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_query_retry_after(self) -> None:
+        self.mock_add_expected([
+            MockJsonRequest(QUERY_URL, resp=error('SERVER_UNAVAILABLE'), status_code=503,
+                            response_headers={'Retry-After': '2'}),
+            MockJsonRequest(QUERY_URL, resp=EMPTY_RESULT),
+        ])
+        self.assertEqual(list(Contact.objects.db_manager(sf_alias).only('last_name')), [])
+        self.assertEqual(self.sleeps, [2.0])
+        stats = retry.retry_statistics()[sf_alias]
+        self.assertEqual((stats['retries'], stats['recovered'], stats['reasons']), (1, 1, {'SERVER_UNAVAILABLE': 1}))
+
+    def test_lock_contention_of_collections(self) -> None:
+        obj = Contact(pk='003A00000000001AAA', last_name='a')
+        obj._state.db = sf_alias  # pylint:disable=protected-access
+        req = json.dumps({'records': [{'LastName': 'a', 'id': obj.pk, 'attributes': {'type': 'Contact'}}],
+                          'allOrNone': True})
+        self.mock_add_expected([
+            MockJsonRequest('PATCH ' + COLLECTIONS_URL, req=req,
+                            resp=json.dumps([{'success': False, 'errors': [LOCK_ERROR]}])),
+            MockJsonRequest('PATCH ' + COLLECTIONS_URL, req=req,
+                            resp=json.dumps([{'id': obj.pk, 'success': True, 'errors': []}])),
+        ])
+        Contact.objects.db_manager(sf_alias).bulk_update([obj], ['last_name'], all_or_none=True)
+        self.assertEqual(len(self.sleeps), 1)
+
+    def test_post_not_retried(self) -> None:
+        self.mock_add_expected([
+            MockJsonRequest('POST ' + COLLECTIONS_URL,
+                            req=json.dumps({'records': [{'LastName': 'a', 'attributes': {'type': 'Contact'}}],
+                                            'allOrNone': True}),
+                            resp=error('UNKNOWN_EXCEPTION'), status_code=500),
+        ])
+        with self.assertRaises(SalesforceError):
+            connections[sf_alias].connection.sobject_collections_request(
+                'POST', [{'type_': 'Contact', 'LastName': 'a'}])
+        self.assertEqual(self.sleeps, [])
+
+    def test_gave_up(self) -> None:
+        self.mock_add_expected([
+            MockJsonRequest(QUERY_URL, resp=error('SERVER_UNAVAILABLE'), status_code=503)
+            for _ in range(3)
+        ])
+        with self.assertRaises(SalesforceError), self.assertLogs('salesforce.dbapi.retry', 'WARNING'):
+            list(Contact.objects.db_manager(sf_alias).only('last_name'))
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertEqual(retry.retry_statistics()[sf_alias]['gave_up'], 1)